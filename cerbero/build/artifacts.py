@@ -0,0 +1,514 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import hashlib
+import json
+import os
+import re
+import shutil
+import tarfile
+import tempfile
+import urllib.error
+import urllib.request
+
+from cerbero.build import source
+from cerbero.build.statusstore import StatusStore
+from cerbero.enums import CERBERO_VERSION
+from cerbero.errors import FatalError
+from cerbero.utils import _, shell
+from cerbero.utils import messages as m
+
+
+# Bump it when the contents of the artifacts or the way the keys are
+# computed change, to stop using the old artifacts
+ARTIFACT_FORMAT_VERSION = 2
+ARTIFACT_SUFFIX = '.tar.gz'
+MANIFEST_NAME = '.cerbero-artifact.json'
+# Properties of the configuration that change the output of the builds
+CONFIG_FINGERPRINT_PROPERTIES = [
+    'platform',
+    'target_platform',
+    'target_subsystem',
+    'arch',
+    'target_arch',
+    'target_distro',
+    'target_distro_version',
+    'prefix',
+    'lib_suffix',
+    'toolchain_version',
+    'min_osx_sdk_version',
+    'osx_target_sdk_version',
+    'ios_min_version',
+    'tvos_min_version',
+    'msvc_version',
+    'meson_properties',
+    'universal_archs',
+]
+# Variables of the build environment that select the toolchain and its flags
+TOOLCHAIN_ENV_VARS = [
+    'CC',
+    'CXX',
+    'CPP',
+    'OBJC',
+    'OBJCXX',
+    'LD',
+    'AR',
+    'AS',
+    'NM',
+    'RANLIB',
+    'STRIP',
+    'OBJCOPY',
+    'CFLAGS',
+    'CXXFLAGS',
+    'CPPFLAGS',
+    'OBJCFLAGS',
+    'CCASFLAGS',
+    'LDFLAGS',
+]
+HTTP_TIMEOUT = 60
+
+
+def config_fingerprint(config):
+    """
+    Hashes the properties of a configuration that change the output of the
+    builds, including the variants
+
+    @param config: the configuration
+    @type config: L{cerbero.config.Config}
+    @return: the fingerprint
+    @rtype: str
+    """
+    values = {p: getattr(config, p, None) for p in CONFIG_FINGERPRINT_PROPERTIES}
+    values['variants'] = {v: getattr(config.variants, v) for v in config.variants.bools() + config.variants.mappings()}
+    data = json.dumps(values, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def build_tools_versions(config):
+    """
+    Lists the build tools of a configuration that are built, with their
+    versions and the hashes of their recipes
+
+    @param config: the configuration
+    @type config: L{cerbero.config.Config}
+    @return: recipe name -> (built version, recipe hash)
+    @rtype: dict
+    """
+    build_tools_config = config.build_tools_config
+    if build_tools_config is None or not build_tools_config.cache_file:
+        return {}
+    path = os.path.join(build_tools_config.home_dir, build_tools_config.cache_file)
+    if not os.path.isfile(path):
+        return {}
+    try:
+        status = StatusStore(path).load()
+    except Exception as e:
+        m.warning('Could not read the status of the build tools: {}'.format(e))
+        return {}
+    return {name: (s.built_version, s.file_hash) for name, s in status.items() if not s.needs_build}
+
+
+def toolchain_fingerprint(config):
+    """
+    Hashes the toolchain of a configuration: the compilers and flags of its
+    build environment, the version reported by the C compiler and the build
+    tools, so that upgrading the compiler or a build tool like meson doesn't
+    reuse binaries built with the old one
+
+    @param config: the configuration
+    @type config: L{cerbero.config.Config}
+    @return: the fingerprint
+    @rtype: str
+    """
+    env = config.env
+    values = {v: env.get(v) for v in TOOLCHAIN_ENV_VARS}
+    cc = (env.get('CC') or '').split()
+    if cc:
+        # Compilers that don't support --version, like cl.exe, print their
+        # version in the error
+        values['cc_version'] = shell.check_output(cc + ['--version'], env=env, fail=False, quiet=True)
+    values['build_tools'] = build_tools_versions(config)
+    data = json.dumps(values, sort_keys=True, default=str)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def can_cache(recipe):
+    """
+    Whether the sources of a recipe are fully described by the recipe, so
+    that its artifact can be looked up before fetching it. Tarballs are
+    checked against their checksums and git recipes need to be pinned to a
+    commit, while the contents of branches, local directories and svn
+    checkouts can change without the recipe changing.
+
+    @param recipe: the recipe
+    @type recipe: L{cerbero.build.recipe.Recipe}
+    @rtype: bool
+    """
+    if isinstance(recipe, source.GitCache):
+        return re.fullmatch('[0-9a-f]{40}', recipe.commit or '') is not None
+    return isinstance(recipe, (source.BaseTarball, source.CustomSource))
+
+
+class ArtifactKeys(object):
+    """
+    Computes the keys of the artifacts of the recipes. The key of a recipe
+    is a hash of its checksum (the recipe file and its patches), its built
+    version, the version of cerbero, the fingerprints of the configuration and
+    of its toolchain and the keys of its dependencies, including the runtime
+    dependencies that all the recipes are built against, so it changes
+    whenever anything that was used to build it changes.
+
+    The keys run the toolchain to find its version the first time they are
+    computed, so they should be computed in an executor.
+    """
+
+    def __init__(self, cookbook):
+        self.cookbook = cookbook
+        self.fingerprint = config_fingerprint(cookbook.get_config())
+        self._toolchain_fingerprint = None
+        self._keys = {}
+
+    @property
+    def toolchain_fingerprint(self):
+        if self._toolchain_fingerprint is None:
+            self._toolchain_fingerprint = toolchain_fingerprint(self.cookbook.get_config())
+        return self._toolchain_fingerprint
+
+    def get(self, recipe_name):
+        """
+        @param recipe_name: name of the recipe
+        @type recipe_name: str
+        @return: the key of the artifact of the recipe, or None if it can't be
+                 computed, see L{can_cache}
+        @rtype: str
+        """
+        if recipe_name in self._keys:
+            return self._keys[recipe_name]
+        recipe = self.cookbook.get_recipe(recipe_name)
+        if not can_cache(recipe):
+            return None
+        deps = []
+        for dep in self.cookbook.get_dependency_graph().adjacency[recipe.name]:
+            dep_key = self.get(dep)
+            if dep_key is None:
+                return None
+            deps.append(dep_key)
+        try:
+            built_version = recipe.built_version()
+            checksum = recipe.get_checksum()
+        except Exception:
+            return None
+        if isinstance(checksum, bytes):
+            checksum = checksum.hex()
+        h = hashlib.sha256()
+        values = [
+            str(ARTIFACT_FORMAT_VERSION),
+            CERBERO_VERSION,
+            recipe.name,
+            checksum,
+            built_version,
+            self.fingerprint,
+            self.toolchain_fingerprint,
+        ]
+        for value in values + sorted(deps):
+            h.update(str(value).encode('utf-8'))
+            h.update(b'\0')
+        self._keys[recipe_name] = h.hexdigest()
+        return self._keys[recipe_name]
+
+
+def pack_artifact(filename, prefix, files, info):
+    """
+    Writes the files of a recipe in an artifact
+
+    @param filename: path of the artifact
+    @type filename: str
+    @param prefix: prefix the files are relative to
+    @type prefix: str
+    @param files: files installed by the recipe
+    @type files: list
+    @param info: information about the artifact, saved in its manifest
+    @type info: dict
+    """
+    info = dict(info, files=sorted(files))
+    manifest = json.dumps(info, sort_keys=True).encode('utf-8')
+    with tarfile.open(filename, 'w:gz', compresslevel=6) as tar:
+        tarinfo = tarfile.TarInfo(MANIFEST_NAME)
+        tarinfo.size = len(manifest)
+        with tempfile.TemporaryFile() as f:
+            f.write(manifest)
+            f.seek(0)
+            tar.addfile(tarinfo, f)
+        for f in sorted(files):
+            tar.add(os.path.join(prefix, f), arcname=f, recursive=False)
+
+
+def unpack_artifact(filename, prefix, check=None):
+    """
+    Extracts an artifact in the prefix
+
+    @param filename: path of the artifact
+    @type filename: str
+    @param prefix: prefix where the files are extracted
+    @type prefix: str
+    @param check: called with the list of files of the artifact before
+                  extracting it, nothing is extracted if it returns False
+    @type check: callable
+    @return: the information saved in the manifest of the artifact, or None
+             if L{check} returned False
+    @rtype: dict
+    """
+    with tarfile.open(filename, 'r:*') as tar:
+        members = tar.getmembers()
+        manifest = tar.extractfile(MANIFEST_NAME)
+        if manifest is None:
+            raise FatalError(_('Artifact %s has no manifest') % filename)
+        info = json.loads(manifest.read().decode('utf-8'))
+        if check is not None and not check(info['files']):
+            return None
+        files = set(info['files'])
+        for member in members:
+            if member.name not in files or os.path.isabs(member.name) or '..' in member.name.split('/'):
+                continue
+            dest = os.path.join(prefix, member.name)
+            # Don't write through a symlink or a file installed by another recipe
+            if os.path.islink(dest) or (os.path.lexists(dest) and not os.path.isdir(dest)):
+                os.remove(dest)
+            if hasattr(tarfile, 'tar_filter'):
+                tar.extract(member, prefix, filter='tar')
+            else:
+                tar.extract(member, prefix)
+    return info
+
+
+class LocalArtifactCache(object):
+    """
+    Artifacts stored in a local directory, removing the least recently used
+    ones when the size of the directory goes over a limit
+
+    @ivar path: directory with the artifacts
+    @type path: str
+    @ivar max_size: maximum size of the artifacts in bytes, or None for no limit
+    @type max_size: int
+    """
+
+    def __init__(self, path, max_size=None):
+        self.path = path
+        self.max_size = max_size
+
+    def _path(self, key):
+        return os.path.join(self.path, key[:2], key + ARTIFACT_SUFFIX)
+
+    def fetch(self, key, filename):
+        """
+        Copies an artifact from the cache
+
+        @param key: key of the artifact
+        @type key: str
+        @param filename: where the artifact is copied
+        @type filename: str
+        @return: whether the artifact was found in the cache
+        @rtype: bool
+        """
+        path = self._path(key)
+        try:
+            shutil.copyfile(path, filename)
+        except FileNotFoundError:
+            return False
+        # Used as the last access time for the eviction
+        os.utime(path)
+        return True
+
+    def store(self, key, filename):
+        """
+        Adds an artifact to the cache and evicts the least recently used ones
+        if needed
+
+        @param key: key of the artifact
+        @type key: str
+        @param filename: path of the artifact
+        @type filename: str
+        """
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = '{}.{}.tmp'.format(path, os.getpid())
+        shutil.copyfile(filename, tmp)
+        os.replace(tmp, path)
+        self.evict(keep=path)
+
+    def entries(self):
+        """
+        @return: (path, size, last use) of the artifacts, the least recently
+                 used first
+        @rtype: list
+        """
+        entries = []
+        if not os.path.isdir(self.path):
+            return entries
+        for d in os.scandir(self.path):
+            if not d.is_dir():
+                continue
+            for f in os.scandir(d.path):
+                if not f.name.endswith(ARTIFACT_SUFFIX):
+                    continue
+                try:
+                    st = f.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((f.path, st.st_size, st.st_mtime))
+        return sorted(entries, key=lambda e: e[2])
+
+    def evict(self, keep=None):
+        """
+        Removes the least recently used artifacts until the cache fits in
+        L{max_size}
+
+        @param keep: path of an artifact that is never removed
+        @type keep: str
+        @return: the paths of the removed artifacts
+        @rtype: list
+        """
+        removed = []
+        if self.max_size is None:
+            return removed
+        entries = self.entries()
+        size = sum(e[1] for e in entries)
+        for path, entry_size, unused_mtime in entries:
+            if size <= self.max_size:
+                break
+            if path == keep:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            size -= entry_size
+            removed.append(path)
+        return removed
+
+
+class HttpArtifactCache(object):
+    """
+    Artifacts stored in an HTTP server, fetched with GET and stored with PUT
+
+    @ivar url: base URL of the artifacts
+    @type url: str
+    """
+
+    def __init__(self, url):
+        self.url = url.rstrip('/')
+
+    def _url(self, key):
+        return '{}/{}/{}{}'.format(self.url, key[:2], key, ARTIFACT_SUFFIX)
+
+    def fetch(self, key, filename):
+        try:
+            with urllib.request.urlopen(self._url(key), timeout=HTTP_TIMEOUT) as resp, open(filename, 'wb') as f:
+                shutil.copyfileobj(resp, f)
+        except urllib.error.HTTPError as e:
+            if e.code == 404:
+                return False
+            m.warning('Could not fetch artifact {}: {}'.format(self._url(key), e))
+            return False
+        except (urllib.error.URLError, OSError) as e:
+            m.warning('Could not fetch artifact {}: {}'.format(self._url(key), e))
+            return False
+        return True
+
+    def store(self, key, filename):
+        with open(filename, 'rb') as f:
+            req = urllib.request.Request(
+                self._url(key),
+                data=f,
+                method='PUT',
+                headers={'Content-Length': str(os.path.getsize(filename))},
+            )
+            try:
+                urllib.request.urlopen(req, timeout=HTTP_TIMEOUT).close()
+            except (urllib.error.URLError, OSError) as e:
+                m.warning('Could not upload artifact {}: {}'.format(self._url(key), e))
+
+
+class ArtifactCache(object):
+    """
+    Cache of the files installed by the recipes. Artifacts are looked up in
+    the local cache first and then in the remote one, if any, and stored in
+    the local one and, if enabled, uploaded to the remote one.
+
+    @ivar local: the local cache
+    @type local: L{LocalArtifactCache}
+    @ivar remote: the remote cache
+    @type remote: L{HttpArtifactCache}
+    @ivar upload: whether new artifacts are uploaded to the remote cache
+    @type upload: bool
+    """
+
+    def __init__(self, local, remote=None, upload=False):
+        self.local = local
+        self.remote = remote
+        self.upload = upload
+
+    @classmethod
+    def from_config(cls, config):
+        """
+        @return: the artifact cache of the configuration, or None if disabled
+        @rtype: L{ArtifactCache}
+        """
+        if not config.artifacts_cache_dir:
+            return None
+        local = LocalArtifactCache(config.artifacts_cache_dir, config.artifacts_cache_max_size)
+        remote = None
+        if config.artifacts_cache_url:
+            remote = HttpArtifactCache(config.artifacts_cache_url)
+        return cls(local, remote, config.artifacts_cache_upload)
+
+    def restore(self, key, prefix, check=None):
+        """
+        Extracts the artifact with the given key in the prefix
+
+        @param check: called with the list of files of the artifact before
+                      extracting it, the artifact is not used if it returns
+                      False
+        @type check: callable
+        @return: the information saved in the manifest of the artifact, or
+                 None if it was not found or not used
+        @rtype: dict
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'artifact' + ARTIFACT_SUFFIX)
+            if not self.local.fetch(key, filename):
+                if self.remote is None or not self.remote.fetch(key, filename):
+                    return None
+                self.local.store(key, filename)
+            try:
+                return unpack_artifact(filename, prefix, check)
+            except (tarfile.TarError, KeyError, ValueError) as e:
+                m.warning('Ignoring invalid artifact {}: {}'.format(key, e))
+                return None
+
+    def save(self, key, prefix, files, info):
+        """
+        Creates the artifact with the given key from the files installed in
+        the prefix
+        """
+        with tempfile.TemporaryDirectory() as tmpdir:
+            filename = os.path.join(tmpdir, 'artifact' + ARTIFACT_SUFFIX)
+            pack_artifact(filename, prefix, files, info)
+            self.local.store(key, filename)
+            if self.remote is not None and self.upload:
+                self.remote.store(key, filename)
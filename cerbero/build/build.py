@@ -16,6 +16,7 @@
 # Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 # Boston, MA 02111-1307, USA.
 
+import hashlib
 import os
 import re
 import shutil
@@ -26,6 +27,7 @@ from itertools import chain
 
 from cerbero.enums import Platform, Subsystem, Architecture, Distro, DistroVersion, LibraryType
 from cerbero.errors import FatalError, InvalidRecipeError
+from cerbero.build.governor import get_jobserver
 from cerbero.utils import shell, default_cargo_build_jobs
 from cerbero.utils import messages as m
 
@@ -317,6 +319,12 @@ class Build(object):
     # for which patterns
     symbolicate_manually = False
     symbolication_patterns = {}
+    # Whether the install step can be done in a staging root with DESTDIR.
+    # Recipes opt in, since install scripts can skip themselves when DESTDIR
+    # is set, like the ones updating the schemas and modules caches of glib
+    allow_staged_install = False
+    # The staging root where the install step must install the files
+    destdir = None
 
     def __init__(self):
         self._properties_keys = []
@@ -375,6 +383,23 @@ class Build(object):
             return self.config.num_of_cpus
         return None
 
+    def uses_jobserver(self):
+        """
+        Whether the compile step draws its jobs from the jobserver shared by
+        the recipes being built instead of using L{num_of_cpus} jobs
+        """
+        return False
+
+    def install_env(self):
+        """
+        Environment of the install step, which installs in L{destdir} if set
+        """
+        if not self.destdir:
+            return self.env
+        env = self.env.copy()
+        env['DESTDIR'] = self.destdir
+        return env
+
 
 class CustomBuild(Build, ModifyEnvBase):
     def __init__(self):
@@ -483,16 +508,30 @@ class MakefilesBase(Build, ModifyEnvBase):
 
         await shell.async_call(configure_cmd, configure_dir, logfile=self.logfile, env=self.env)
 
+    def uses_jobserver(self):
+        ncpu = self.num_of_cpus()
+        if not ncpu or get_jobserver() is None or not self.make:
+            return False
+        return os.path.basename(self.make[0]) in ('make', 'gmake') and '-j%d' % ncpu in self.make
+
     @modify_environment
     async def compile(self):
         make_dir = self.get_make_dir()
         os.makedirs(make_dir, exist_ok=True)
 
-        await shell.async_call(self.make, make_dir, logfile=self.logfile, env=self.env)
+        if self.uses_jobserver():
+            # make only joins the jobserver if -j is not passed explicitly
+            jobserver = get_jobserver()
+            make = [x for x in self.make if x != '-j%d' % self.num_of_cpus()]
+            await shell.async_call(
+                make, make_dir, logfile=self.logfile, env=jobserver.env(self.env), pass_fds=jobserver.fds
+            )
+        else:
+            await shell.async_call(self.make, make_dir, logfile=self.logfile, env=self.env)
 
     @modify_environment
     async def install(self):
-        await shell.async_call(self.make_install, self.get_make_dir(), logfile=self.logfile, env=self.env)
+        await shell.async_call(self.make_install, self.get_make_dir(), logfile=self.logfile, env=self.install_env())
 
     @modify_environment
     def clean(self):
@@ -833,6 +872,29 @@ pkg-config = {PKG_CONFIG}
 {extra_binaries}
 """
 
+# Saved in the build dir after a successful setup, see Meson.configure()
+MESON_FINGERPRINT_FILE = 'cerbero-setup.fingerprint'
+
+
+def configure_fingerprint(cmd, files):
+    """
+    Hashes the command line used to configure a build dir and the contents
+    of the files it uses
+
+    @param cmd: the command line
+    @type cmd: list
+    @param files: file name -> contents
+    @type files: dict
+    @return: the fingerprint
+    @rtype: str
+    """
+    h = hashlib.sha256()
+    for arg in cmd:
+        h.update(str(arg).encode('utf-8') + b'\0')
+    for name in sorted(files):
+        h.update(name.encode('utf-8') + b'\0' + files[name].encode('utf-8') + b'\0')
+    return h.hexdigest()
+
 
 class Meson(Build, ModifyEnvBase):
     """
@@ -1191,15 +1253,26 @@ class Meson(Build, ModifyEnvBase):
             f.write(contents)
         return fpath
 
+    def _meson_build_dir_is_current(self, fingerprint):
+        """
+        Whether the build dir was set up with the same command line and
+        native/cross files and can be reused as is. Ninja regenerates the
+        build files by itself when the meson.build files change.
+        """
+        if not self.config.meson_incremental_configure:
+            return False
+        if not os.path.isfile(Path(self.build_dir, 'meson-private', 'coredata.dat')):
+            return False
+        try:
+            with open(Path(self.build_dir, MESON_FINGERPRINT_FILE), 'r', encoding='utf-8') as f:
+                return f.read().strip() == fingerprint
+        except OSError:
+            return False
+
     @modify_environment
     async def configure(self):
-        if os.path.exists(self.build_dir):
-            # Only remove if it's not empty
-            if os.listdir(self.build_dir):
-                shutil.rmtree(self.build_dir)
-                os.makedirs(self.build_dir)
-        else:
-            os.makedirs(self.build_dir)
+        # The build dir is only wiped once we know it can't be reused
+        os.makedirs(self.build_dir, exist_ok=True)
         # Explicitly enable/disable introspection, same as Autotools
         self._set_option({'introspection', 'gir'}, 'gi')
         # Control python support using the variant
@@ -1248,18 +1321,21 @@ class Meson(Build, ModifyEnvBase):
             meson_cmd.append('-Db_vscrt=' + self.config.variants.vscrt)
 
         # Get platform config in the form of a meson native/cross file
+        meson_files = {}
         contents = self._get_meson_target_file_contents()
         # If cross-compiling, write contents to the cross file and get contents for
         # a native file that will cause all native compiler detection to fail.
         #
         # Else, write contents to a native file.
         if self.config.cross_compiling():
-            meson_cmd += ['--cross-file', self._write_meson_file(contents, 'meson-cross-file.txt')]
+            meson_files['meson-cross-file.txt'] = contents
+            meson_cmd += ['--cross-file', Path(self.build_dir, 'meson-cross-file.txt').as_posix()]
             if self.meson_needs_build_machine_compiler:
                 contents = self._get_meson_native_file_contents()
             else:
                 contents = self._get_meson_dummy_file_contents()
-        meson_cmd += ['--native-file', self._write_meson_file(contents, 'meson-native-file.txt')]
+        meson_files['meson-native-file.txt'] = contents
+        meson_cmd += ['--native-file', Path(self.build_dir, 'meson-native-file.txt').as_posix()]
 
         if 'default_library' in self.meson_options:
             raise RuntimeError('Do not set `default_library` in self.meson_options, use self.library_type instead')
@@ -1279,7 +1355,20 @@ class Meson(Build, ModifyEnvBase):
         # https://gitlab.freedesktop.org/gstreamer/cerbero/issues/48
         self.unset_toolchain_env()
 
+        fingerprint = configure_fingerprint(meson_cmd, meson_files)
+        if self._meson_build_dir_is_current(fingerprint):
+            m.action('Reusing the build dir of {}, its setup did not change'.format(self.name), logfile=self.logfile)
+            return
+        # Only remove if it's not empty
+        if os.listdir(self.build_dir):
+            shutil.rmtree(self.build_dir)
+            os.makedirs(self.build_dir)
+        for fname, contents in meson_files.items():
+            self._write_meson_file(contents, fname)
+
         await shell.async_call(meson_cmd, self.build_dir, logfile=self.logfile, env=self.env)
+        with open(Path(self.build_dir, MESON_FINGERPRINT_FILE), 'w', encoding='utf-8') as f:
+            f.write(fingerprint)
 
     @modify_environment
     async def compile(self):
@@ -1287,7 +1376,7 @@ class Meson(Build, ModifyEnvBase):
 
     @modify_environment
     async def install(self):
-        await shell.async_call(self.make_install, self.build_dir, logfile=self.logfile, env=self.env)
+        await shell.async_call(self.make_install, self.build_dir, logfile=self.logfile, env=self.install_env())
 
     @modify_environment
     def clean(self):
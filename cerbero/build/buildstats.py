@@ -0,0 +1,241 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import json
+import os
+import statistics
+import tempfile
+import threading
+import time
+
+from cerbero.utils import _
+from cerbero.utils import messages as m
+
+
+BUILD_STATS_FILENAME = 'build-stats.json'
+
+
+class StepStats(object):
+    """
+    Timings of a build step of a recipe across builds
+
+    @ivar last: duration of the last run, in seconds
+    @type last: float
+    @ivar average: moving average of the duration, in seconds
+    @type average: float
+    @ivar count: number of runs recorded
+    @type count: int
+    @ivar timestamp: time of the last run
+    @type timestamp: float
+    """
+
+    # Weight of the last run in the moving average
+    SMOOTHING = 0.5
+
+    def __init__(self, last=0.0, average=0.0, count=0, timestamp=0.0):
+        self.last = last
+        self.average = average
+        self.count = count
+        self.timestamp = timestamp
+
+    def add(self, duration):
+        if self.count == 0:
+            self.average = duration
+        else:
+            self.average = self.SMOOTHING * duration + (1 - self.SMOOTHING) * self.average
+        self.last = duration
+        self.count += 1
+        self.timestamp = time.time()
+
+    def to_dict(self):
+        return {'last': self.last, 'average': self.average, 'count': self.count, 'timestamp': self.timestamp}
+
+    @classmethod
+    def from_dict(cls, d):
+        return cls(d.get('last', 0.0), d.get('average', 0.0), d.get('count', 0), d.get('timestamp', 0.0))
+
+
+class BuildStats(object):
+    """
+    Stores how long each build step of each recipe took in previous builds
+    of a configuration, so that they can be used for scheduling the build and
+    estimating how long it will take.
+
+    The stats of all the configurations are stored in the same file in the
+    cerbero home dir, keyed by the name of the configuration cache file.
+    Recorded durations are kept in memory until L{save} is called, which can
+    be done from another thread.
+
+    @ivar config_key: key used for the stats of the current configuration
+    @type config_key: str
+    @ivar stats: recipe name -> step name -> L{StepStats}
+    @type stats: dict
+    """
+
+    def __init__(self, config, load=True):
+        self.path = os.path.join(config.home_dir, BUILD_STATS_FILENAME)
+        self.config_key = self.get_config_key(config)
+        self.stats = {}
+        if load:
+            self.stats = self._load().get(self.config_key, {})
+        self._dirty = False
+        # Protects the stats while they are copied for saving, and the file
+        # while it is written
+        self._lock = threading.Lock()
+        self._save_lock = threading.Lock()
+
+    @staticmethod
+    def get_config_key(config):
+        if config.cache_file is None:
+            return 'default'
+        return os.path.splitext(os.path.basename(config.cache_file))[0]
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError) as ex:
+            m.warning(_('Could not load the build stats from %s: %s') % (self.path, ex))
+            return {}
+        ret = {}
+        for config_key, recipes in data.items():
+            ret[config_key] = {
+                recipe: {step: StepStats.from_dict(s) for step, s in steps.items()} for recipe, steps in recipes.items()
+            }
+        return ret
+
+    def all_configs(self):
+        """
+        Gets the stats of all the configurations
+
+        @return: config key -> recipe name -> step name -> L{StepStats}
+        @rtype: dict
+        """
+        ret = self._load()
+        ret[self.config_key] = self.stats
+        return ret
+
+    def record(self, recipe_name, step, duration):
+        """
+        Records the duration of a build step, see L{save}
+
+        @param recipe_name: name of the recipe
+        @type recipe_name: str
+        @param step: name of the step
+        @type step: str
+        @param duration: duration of the step in seconds
+        @type duration: float
+        """
+        with self._lock:
+            self.stats.setdefault(recipe_name, {}).setdefault(step, StepStats()).add(duration)
+            self._dirty = True
+
+    def save(self):
+        """
+        Saves the stats if durations were recorded since they were last saved
+        """
+        with self._save_lock:
+            with self._lock:
+                if not self._dirty:
+                    return
+                stats = {
+                    recipe: {step: s.to_dict() for step, s in steps.items()} for recipe, steps in self.stats.items()
+                }
+                self._dirty = False
+            self._write(stats)
+
+    def _write(self, stats):
+        # Other configurations may be building at the same time, so only
+        # replace our own entry, and write atomically so that a crash can't
+        # leave a truncated file behind.
+        data = {}
+        for config_key, recipes in self._load().items():
+            data[config_key] = {
+                recipe: {step: s.to_dict() for step, s in steps.items()} for recipe, steps in recipes.items()
+            }
+        data[self.config_key] = stats
+        try:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(self.path), prefix=BUILD_STATS_FILENAME)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f, indent=1, sort_keys=True)
+            os.replace(tmp, self.path)
+        except OSError as ex:
+            m.warning(_('Could not save the build stats: %s') % ex)
+
+    def step_duration(self, recipe_name, step):
+        """
+        Gets the expected duration of a step of a recipe
+
+        @return: the duration in seconds or None if it was never built
+        @rtype: float
+        """
+        s = self.stats.get(recipe_name, {}).get(step)
+        if s is None:
+            return None
+        return s.average
+
+    def recipe_duration(self, recipe_name, steps=None):
+        """
+        Gets the expected duration of building a recipe
+
+        @param steps: only take into account these steps
+        @type steps: list
+        @return: the duration in seconds or None if it was never built
+        @rtype: float
+        """
+        recipe_stats = self.stats.get(recipe_name)
+        if not recipe_stats:
+            return None
+        return sum(s.average for step, s in recipe_stats.items() if steps is None or step in steps)
+
+    def recipes_durations(self, recipe_names, steps=None):
+        """
+        Gets the expected duration of building each recipe of a list.
+        Recipes that were never built get the median of the known ones.
+
+        @return: recipe name -> duration in seconds
+        @rtype: dict
+        """
+        durations = {r: self.recipe_duration(r, steps) for r in recipe_names}
+        known = [d for d in durations.values() if d]
+        default = statistics.median(known) if known else 1
+        return {r: d or default for r, d in durations.items()}
+
+    def steps_durations(self, recipe_names, steps):
+        """
+        Gets the expected duration of each step of a list of recipes.
+        Steps without stats get the median of the known ones for that step.
+
+        @return: recipe name -> step name -> duration in seconds
+        @rtype: dict
+        """
+        defaults = {}
+        for step in steps:
+            known = [self.step_duration(r, step) for r in recipe_names]
+            known = [d for d in known if d is not None]
+            defaults[step] = statistics.median(known) if known else 1
+        ret = {}
+        for r in recipe_names:
+            ret[r] = {}
+            for step in steps:
+                d = self.step_duration(r, step)
+                ret[r][step] = defaults[step] if d is None else d
+        return ret
@@ -17,8 +17,12 @@
 # Boston, MA 02111-1307, USA.
 
 from collections import defaultdict
+from hashlib import sha256
+import importlib.util
+import marshal
 import os
-import pickle
+import sqlite3
+import tempfile
 import time
 import traceback
 
@@ -33,7 +37,9 @@ from cerbero.config import (
     LibraryType,
 )
 from cerbero.build.build import BuildType
+from cerbero.build.depgraph import DependencyGraph
 from cerbero.build.source import SourceType
+from cerbero.build.statusstore import StatusStore
 from cerbero.errors import FatalError, RecipeNotFoundError, InvalidRecipeError
 from cerbero.utils import _, shell, parse_file, imp_load_source
 from cerbero.utils import messages as m
@@ -43,6 +49,8 @@ from cerbero.build import recipe as crecipe
 
 COOKBOOK_NAME = 'cookbook'
 USER_COOKBOOK_FILE = os.path.join(USER_CONFIG_DIR, COOKBOOK_NAME)
+RECIPES_CODE_CACHE_NAME = 'recipes-code.cache'
+RECIPES_CHECKSUMS_CACHE_NAME = 'recipes-checksums.cache'
 
 
 class RecipeStatus(object):
@@ -88,6 +96,82 @@ class RecipeStatus(object):
         )
 
 
+class RecipesCodeCache(object):
+    """
+    Persistent cache of the compiled code of the recipe files, so that
+    loading the cookbook doesn't need to compile every recipe each time.
+
+    Entries are keyed on the recipe file path and validated with the hash of
+    its contents, and the whole cache is discarded when the Python bytecode
+    format changes.
+
+    @ivar path: path of the cache file
+    @type path: str
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._entries = {}  # filepath -> (sha256 of the source, code)
+        self._used = set()
+        self._dirty = False
+        self._load()
+
+    def _load(self):
+        if not os.path.isfile(self.path):
+            return
+        try:
+            with open(self.path, 'rb') as f:
+                if f.read(len(importlib.util.MAGIC_NUMBER)) != importlib.util.MAGIC_NUMBER:
+                    return
+                self._entries = marshal.load(f)
+        except (OSError, EOFError, ValueError, TypeError):
+            self._entries = {}
+
+    def get_code(self, filepath):
+        """
+        Gets the compiled code of a recipe file, compiling it if the file is
+        not in the cache or was modified
+
+        @param filepath: path of the recipe file
+        @type filepath: str
+        @return: the compiled code
+        @rtype: code
+        """
+        with open(filepath, 'rb') as f:
+            source = f.read()
+        digest = sha256(source).digest()
+        self._used.add(filepath)
+        entry = self._entries.get(filepath)
+        if entry is not None and entry[0] == digest:
+            return entry[1]
+        code = compile(source.decode('utf-8'), filepath, 'exec')
+        self._entries[filepath] = (digest, code)
+        self._dirty = True
+        return code
+
+    def save(self):
+        """
+        Saves the cache if it changed, dropping the entries of the recipe
+        files that were not used
+        """
+        unused = set(self._entries) - self._used
+        if not self._dirty and not unused:
+            return
+        for filepath in unused:
+            del self._entries[filepath]
+        try:
+            dirname = os.path.dirname(self.path)
+            os.makedirs(dirname, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=dirname, prefix=RECIPES_CODE_CACHE_NAME)
+            with os.fdopen(fd, 'wb') as f:
+                f.write(importlib.util.MAGIC_NUMBER)
+                marshal.dump(self._entries, f)
+            os.replace(tmp, self.path)
+            self._dirty = False
+        except OSError as ex:
+            m.warning(_('Could not save the recipes code cache: %s') % ex)
+
+
 class CookBook(object):
     """
     Stores a list of recipes and their build status saving it's state to a
@@ -106,7 +190,9 @@ class CookBook(object):
         self.set_config(config)
         self.recipes = {}  # recipe_name -> recipe
         self._invalid_recipes = {}  # recipe -> error
+        self._graph = None
         self._mtimes = {}
+        self._code_cache = None
 
         if not load:
             return
@@ -151,9 +237,9 @@ class CookBook(object):
         """
         Reloads the recipes list and updates the cookbook
         """
-        self._load_recipes(skip_errors, reset_status)
+        updated = self._load_recipes(skip_errors, reset_status)
         self._load_manifest()
-        self.save()
+        self._save_status(updated)
 
     def get_recipes_list(self):
         """
@@ -174,6 +260,7 @@ class CookBook(object):
         @type  recipe: L{cerbero.build.cookbook.Recipe}
         """
         self.recipes[recipe.name] = recipe
+        self._graph = None
 
     def get_recipe(self, name):
         """
@@ -201,7 +288,7 @@ class CookBook(object):
         status.steps.append(step)
         status.touch()
         self.status[recipe_name] = status
-        self.save()
+        self._save_status([recipe_name])
 
     def update_build_status(self, recipe_name, built_version):
         """
@@ -217,7 +304,7 @@ class CookBook(object):
         status.built_version = built_version
         status.touch()
         self.status[recipe_name] = status
-        self.save()
+        self._save_status([recipe_name])
 
     def recipe_built_version(self, recipe_name):
         """
@@ -251,7 +338,55 @@ class CookBook(object):
         """
         if recipe_name in self.status:
             del self.status[recipe_name]
-            self.save()
+            try:
+                self._status_store().delete(recipe_name)
+            except (OSError, sqlite3.Error) as ex:
+                m.warning(_('Could not cache the CookBook: %s') % ex)
+
+    def get_recipe_files(self, recipe_name):
+        """
+        Gets the files installed by a recipe, recorded when its install step
+        is staged
+
+        @param recipe_name: name of the recipe
+        @type recipe_name: str
+        @return: the files relative to the prefix, or None if unknown
+        @rtype: list
+        """
+        try:
+            return self._status_store().get_files(recipe_name)
+        except (OSError, sqlite3.Error) as ex:
+            m.warning(_('Could not read the files installed by %s: %s') % (recipe_name, ex))
+            return None
+
+    def set_recipe_files(self, recipe_name, files):
+        """
+        Records the files installed by a recipe
+
+        @param recipe_name: name of the recipe
+        @type recipe_name: str
+        @param files: the files relative to the prefix
+        @type files: list
+        """
+        try:
+            self._status_store().set_files(recipe_name, files)
+        except (OSError, sqlite3.Error) as ex:
+            m.warning(_('Could not cache the CookBook: %s') % ex)
+
+    def get_files_owners(self, files):
+        """
+        Finds which recipes installed some files
+
+        @param files: files relative to the prefix
+        @type files: list
+        @return: file -> name of the recipe that installed it
+        @rtype: dict
+        """
+        try:
+            return self._status_store().get_files_owners(files)
+        except (OSError, sqlite3.Error) as ex:
+            m.warning(_('Could not read the installed files: %s') % ex)
+            return {}
 
     def recipe_needs_build(self, recipe_name):
         """
@@ -264,6 +399,18 @@ class CookBook(object):
         """
         return self._recipe_status(recipe_name).needs_build
 
+    def get_dependency_graph(self):
+        """
+        Gets the index of the dependencies between the recipes, which is
+        created again when recipes are added
+
+        @return: the dependency graph
+        @rtype: L{cerbero.build.depgraph.DependencyGraph}
+        """
+        if self._graph is None:
+            self._graph = DependencyGraph(self.recipes)
+        return self._graph
+
     def list_recipe_deps(self, recipe_name):
         """
         List the dependencies that needs to be built in the correct build
@@ -275,19 +422,23 @@ class CookBook(object):
         @rtype: list
         """
         recipe = self.get_recipe(recipe_name)
-        return self._find_deps(recipe, {}, [])
+        graph = self.get_dependency_graph()
+        return [graph.recipes[x] for x in graph.ordered_deps(recipe.name)]
 
-    def list_recipe_reverse_deps(self, recipe_name):
+    def list_recipe_reverse_deps(self, recipe_name, recursive=False):
         """
         List the dependencies that depends on this recipe
 
         @param recipe_name: name of the recipe
         @type recipe_name: str
+        @param recursive: also list the recipes that depend on it indirectly
+        @type recursive: bool
         @return: list of reverse dependencies L{cerbero.recipe.Recipe}
         @rtype: list
         """
         recipe = self.get_recipe(recipe_name)
-        return [r for r in list(self.recipes.values()) if recipe.name in r.list_deps()]
+        graph = self.get_dependency_graph()
+        return [graph.recipes[x] for x in graph.reverse_deps(recipe.name, recursive)]
 
     def get_closest_recipe(self, name):
         """
@@ -317,62 +468,39 @@ class CookBook(object):
 
         return recipe_name
 
-    def _runtime_deps(self):
-        return [x.name for x in list(self.recipes.values()) if x.runtime_dep]
-
     def _cache_file(self, config):
         if config.cache_file is not None:
             return os.path.join(config.home_dir, config.cache_file)
         else:
             return USER_COOKBOOK_FILE
 
+    def _status_store(self):
+        return StatusStore(self._cache_file(self.get_config()))
+
     def _restore_cache(self):
         self.status = {}
-        cachefile = self._cache_file(self.get_config())
-        if not os.path.isfile(cachefile):
-            # From-scratch build
-            return
         try:
-            with open(cachefile, 'rb') as f:
-                self.status = pickle.load(f)
+            self.status = self._status_store().load()
         except Exception:
             m.warning(_('Could not recover status'))
 
-    def save(self):
+    def _save_status(self, recipe_names):
+        if not recipe_names:
+            return
         try:
-            cache_file = self._cache_file(self.get_config())
-            os.makedirs(os.path.dirname(cache_file), exist_ok=True)
-            with open(cache_file, 'wb') as f:
-                pickle.dump(self.status, f)
-        except IOError as ex:
+            self._status_store().update({r: self.status[r] for r in recipe_names if r in self.status})
+        except (OSError, sqlite3.Error) as ex:
             m.warning(_('Could not cache the CookBook: %s') % ex)
 
-    def _find_deps(self, recipe, state=None, ordered=None):
-        if state is None:
-            state = {}
-        if ordered is None:
-            ordered = []
-        if state.get(recipe, 'clean') == 'processed':
-            return
-        if state.get(recipe, 'clean') == 'in-progress':
-            raise FatalError(_('Dependency Cycle: {0}'.format(recipe.name)))
-        state[recipe] = 'in-progress'
-        recipe_deps = recipe.list_deps()
-        if not recipe.runtime_dep:
-            recipe_deps = self._runtime_deps() + recipe_deps
-        for recipe_name in recipe_deps:
-            try:
-                recipedep = self.get_recipe(recipe_name)
-            except RecipeNotFoundError:
-                raise FatalError(_('Recipe %s has a unknown dependency %s' % (recipe.name, recipe_name)))
-            try:
-                self._find_deps(recipedep, state, ordered)
-            except FatalError:
-                m.error('Error finding deps of "{0}"'.format(recipe.name))
-                raise
-        state[recipe] = 'processed'
-        ordered.append(recipe)
-        return ordered
+    def save(self):
+        """
+        Saves the status of all the recipes. Recipes whose status was reset
+        are removed from the store by L{reset_recipe_status}
+        """
+        try:
+            self._status_store().update(self.status)
+        except (OSError, sqlite3.Error) as ex:
+            m.warning(_('Could not cache the CookBook: %s') % ex)
 
     def _recipe_status(self, recipe_name):
         recipe = self.get_recipe(recipe_name)
@@ -385,7 +513,9 @@ class CookBook(object):
 
     def _load_recipes(self, skip_errors, reset_status):
         self.recipes = {}
+        self._graph = None
         recipes = defaultdict(dict)
+        self._code_cache = RecipesCodeCache(os.path.join(self._config.home_dir, RECIPES_CODE_CACHE_NAME))
         recipes_repos = self._config.get_recipes_repos()
         for reponame, (repodir, priority) in recipes_repos.items():
             new_recipes = self._load_recipes_from_dir(repodir, skip_errors)
@@ -401,11 +531,15 @@ class CookBook(object):
             if overridden:
                 m.warning(f'Overriding recipes during priority {key}: {overridden}')
             self.recipes.update(new_recipes)
+        self._code_cache.save()
 
         if not reset_status:
-            return
+            return []
 
-        # Check for updates in the recipe file to reset the status
+        # Check for updates in the recipe file to reset the status, and
+        # return the recipes whose status needs to be saved
+        updated = []
+        modified = []
         for recipe in list(self.recipes.values()):
             # Set the offline property, used by the recipe while performing the
             # fetch build step
@@ -416,6 +550,7 @@ class CookBook(object):
             # filepath attribute was added afterwards
             if not hasattr(st, 'filepath') or not getattr(st, 'filepath'):
                 st.filepath = recipe.__file__
+                updated.append(recipe.name)
             # if filepath has changed, force using file_hash(), this will
             # allow safe relocation of the recipes.
             if recipe.__file__ != st.filepath:
@@ -425,18 +560,31 @@ class CookBook(object):
             # inherited from a different file, f.ex. recipes/custom.py
             if recipe.built_version() != st.built_version:
                 self.reset_recipe_status(recipe.name)
+            elif recipe.get_mtime() > st.mtime:
+                modified.append(recipe)
+
+        # The mtime is different, check the file hash now. Hash the files of
+        # all the modified recipes at once, the checksums are cached.
+        checksums_cache = os.path.join(self._config.home_dir, RECIPES_CHECKSUMS_CACHE_NAME)
+        if modified:
+            shell.load_files_checksum_cache(checksums_cache)
+            shell.files_checksums(
+                [r._get_files_dependencies() for r in modified if not isinstance(r, crecipe.SystemRecipe)]
+            )
+        for recipe in modified:
+            st = self.status[recipe.name]
+            # Use getattr as file_hash we added later
+            saved_hash = getattr(st, 'file_hash', 0)
+            current_hash = recipe.get_checksum()
+            if saved_hash == current_hash:
+                # Update the status with the mtime
+                st.touch()
+                updated.append(recipe.name)
             else:
-                rmtime = recipe.get_mtime()
-                if rmtime > st.mtime:
-                    # The mtime is different, check the file hash now
-                    # Use getattr as file_hash we added later
-                    saved_hash = getattr(st, 'file_hash', 0)
-                    current_hash = recipe.get_checksum()
-                    if saved_hash == current_hash:
-                        # Update the status with the mtime
-                        st.touch()
-                    else:
-                        self.reset_recipe_status(recipe.name)
+                self.reset_recipe_status(recipe.name)
+        if modified:
+            shell.save_files_checksum_cache(checksums_cache)
+        return updated
 
     def _load_recipes_from_dir(self, repo, skip_errors):
         recipes = {}
@@ -491,8 +639,9 @@ class CookBook(object):
         }
         d_keys = set(list(d.keys()))
         try:
+            code = self._get_recipe_code(filepath)
             new_d = d.copy()
-            parse_file(filepath, new_d)
+            parse_file(filepath, new_d, code)
             # List new objects parsed added to the globals dict
             diff_keys = [x for x in set(new_d.keys()) - d_keys]
             # Find all objects inheriting from Recipe
@@ -500,7 +649,7 @@ class CookBook(object):
                 if self._config.target_arch != Architecture.UNIVERSAL:
                     recipe = self._load_recipe_from_class(new_d[recipe_cls_key], self._config, filepath)
                 else:
-                    recipe = self._load_universal_recipe(d, new_d[recipe_cls_key], recipe_cls_key, filepath)
+                    recipe = self._load_universal_recipe(d, new_d[recipe_cls_key], recipe_cls_key, filepath, code=code)
 
                 if recipe is not None:
                     recipes.append(recipe)
@@ -526,7 +675,12 @@ class CookBook(object):
         except InvalidRecipeError as e:
             self._invalid_recipes[recipe_cls.name] = e
 
-    def _load_universal_recipe(self, globals_dict, recipe_cls, recipe_cls_key, filepath, custom=None):
+    def _get_recipe_code(self, filepath):
+        if self._code_cache is None:
+            return None
+        return self._code_cache.get_code(filepath)
+
+    def _load_universal_recipe(self, globals_dict, recipe_cls, recipe_cls_key, filepath, custom=None, code=None):
         if Platform.is_apple(self._config.target_platform):
             recipe = crecipe.UniversalMergedRecipe(self._config)
         else:
@@ -538,7 +692,7 @@ class CookBook(object):
             # dictionary are reused in new instances
             if recipe_cls is None:
                 parsed_dict = dict(globals_dict)
-                parse_file(filepath, parsed_dict)
+                parse_file(filepath, parsed_dict, code)
                 recipe_cls = parsed_dict[recipe_cls_key]
             r = self._load_recipe_from_class(recipe_cls, conf, filepath)
             if r is not None:
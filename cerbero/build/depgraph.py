@@ -0,0 +1,174 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+from collections import defaultdict
+
+from cerbero.errors import FatalError
+from cerbero.utils import _
+from cerbero.utils import messages as m
+
+
+class DependencyGraph(object):
+    """
+    Index of the dependencies between the recipes of a cookbook, built once
+    and queried many times by the oven, the packages and the commands.
+
+    The dependencies of each recipe are resolved the first time they are
+    needed and kept, in build order and as a bitset of the recipes they
+    include, so resolving the dependencies of a recipe reuses the ones of
+    its own dependencies instead of walking the whole tree again.
+
+    The graph must not be modified, the cookbook creates a new one when
+    recipes are added.
+
+    @ivar names: names of the recipes, in the order they were added
+    @type names: list
+    @ivar deps: recipe name -> dependencies listed by the recipe
+    @type deps: dict
+    @ivar adjacency: recipe name -> dependencies used to order the build,
+                     which include the runtime dependencies
+    @type adjacency: dict
+    """
+
+    def __init__(self, recipes):
+        """
+        @param recipes: recipe name -> recipe
+        @type recipes: dict
+        """
+        self.recipes = dict(recipes)
+        self.names = list(self.recipes)
+        self._index = {name: i for i, name in enumerate(self.names)}
+        runtime_deps = [r.name for r in self.recipes.values() if r.runtime_dep]
+        self.deps = {}
+        self.adjacency = {}
+        self._reverse = defaultdict(list)
+        self._reverse_adjacency = defaultdict(list)
+        for name, recipe in self.recipes.items():
+            deps = recipe.list_deps()
+            self.deps[name] = tuple(deps)
+            if not recipe.runtime_dep:
+                deps = runtime_deps + deps
+            self.adjacency[name] = tuple(deps)
+            for dep in set(self.deps[name]):
+                self._reverse[dep].append(name)
+            for dep in set(deps):
+                self._reverse_adjacency[dep].append(name)
+        self._ordered = {}
+        self._closure = {}
+
+    def _resolve(self, name, in_progress):
+        if name in self._ordered:
+            return
+        if name in in_progress:
+            raise FatalError(_('Dependency Cycle: {0}'.format(name)))
+        in_progress.add(name)
+        ordered = []
+        closure = 0
+        for dep in self.adjacency[name]:
+            if dep not in self._index:
+                raise FatalError(_('Recipe %s has a unknown dependency %s' % (name, dep)))
+            try:
+                self._resolve(dep, in_progress)
+            except FatalError:
+                m.error('Error finding deps of "{0}"'.format(name))
+                raise
+            dep_closure = self._closure[dep]
+            new = dep_closure & ~closure
+            if new:
+                # Same order as walking the dependency, skipping the recipes
+                # already added by the previous dependencies
+                ordered.extend(n for n in self._ordered[dep] if new >> self._index[n] & 1)
+                closure |= dep_closure
+        in_progress.discard(name)
+        ordered.append(name)
+        self._ordered[name] = tuple(ordered)
+        self._closure[name] = closure | 1 << self._index[name]
+
+    def ordered_deps(self, name):
+        """
+        @param name: name of the recipe
+        @type name: str
+        @return: the names of all the recipes needed to build the recipe, in
+                 build order and ending with the recipe itself
+        @rtype: tuple
+        """
+        self._resolve(name, set())
+        return self._ordered[name]
+
+    def closure(self, name):
+        """
+        @param name: name of the recipe
+        @type name: str
+        @return: bitset with the bits of the recipes returned by
+                 L{ordered_deps} set, see L{bit}
+        @rtype: int
+        """
+        self._resolve(name, set())
+        return self._closure[name]
+
+    def bit(self, name):
+        """
+        @return: the bit of a recipe in the bitsets returned by L{closure}
+        @rtype: int
+        """
+        return 1 << self._index[name]
+
+    def depends_on(self, name, dep):
+        """
+        @return: whether a recipe needs another one to be built
+        @rtype: bool
+        """
+        return name != dep and bool(self.closure(name) & self.bit(dep))
+
+    def reverse_deps(self, name, recursive=False):
+        """
+        @param name: name of the recipe
+        @type name: str
+        @param recursive: also list the recipes that depend on it indirectly,
+                          including through the runtime dependencies
+        @type recursive: bool
+        @return: the names of the recipes that depend on the recipe, in the
+                 order they were added
+        @rtype: list
+        """
+        if not recursive:
+            return list(self._reverse.get(name, []))
+        found = 0
+        pending = [name]
+        while pending:
+            for rdep in self._reverse_adjacency.get(pending.pop(), []):
+                b = self.bit(rdep)
+                if not found & b:
+                    found |= b
+                    pending.append(rdep)
+        found &= ~self.bit(name)
+        return [n for n in self.names if found & self.bit(n)]
+
+    def topological_order(self):
+        """
+        @return: the names of all the recipes, each one after its dependencies
+        @rtype: list
+        """
+        ordered = []
+        seen = 0
+        for name in self.names:
+            new = self.closure(name) & ~seen
+            if new:
+                ordered.extend(n for n in self._ordered[name] if new & self.bit(n))
+                seen |= new
+        return ordered
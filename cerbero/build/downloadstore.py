@@ -0,0 +1,293 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+"""
+Store of the downloaded tarballs, keyed by their sha256, shared by all the
+configurations.
+
+The tarballs are placed in the download directories with a reflink when the
+filesystem supports it, a hard link otherwise, and a copy as a last resort,
+so each configuration doesn't need its own copy of the same archive. The
+paths where a blob was placed are recorded next to it, and blobs that are
+not used anymore can be evicted with L{DownloadStore.gc}.
+
+    sha256/<first 2 characters>/<checksum>   the blobs
+    refs/<checksum>                          the paths using them
+"""
+
+import os
+import shutil
+import sys
+
+REFLINK = 'reflink'
+HARDLINK = 'hardlink'
+COPY = 'copy'
+
+# ioctl(2) number of FICLONE in linux/fs.h
+FICLONE = 0x40049409
+
+
+def reflink(src, dest):
+    """
+    Clones @src into @dest, sharing their data blocks until one of them is
+    modified. Only supported by some filesystems (btrfs, xfs, APFS...)
+
+    @param src: path of the file
+    @type src: str
+    @param dest: path of the clone, which must not exist
+    @type dest: str
+    @return: whether the file could be cloned
+    @rtype: bool
+    """
+    if sys.platform.startswith('linux'):
+        import fcntl
+
+        with open(src, 'rb') as s:
+            with open(dest, 'wb') as d:
+                try:
+                    fcntl.ioctl(d.fileno(), FICLONE, s.fileno())
+                except OSError:
+                    d.close()
+                    os.remove(dest)
+                    return False
+        shutil.copystat(src, dest)
+        return True
+    if sys.platform == 'darwin':
+        import ctypes
+
+        libc = ctypes.CDLL(None, use_errno=True)
+        return libc.clonefile(os.fsencode(src), os.fsencode(dest), 0) == 0
+    return False
+
+
+def place_file(src, dest):
+    """
+    Places @src in @dest with a reflink, a hard link or a copy, whatever
+    works first. @dest is replaced atomically if it exists.
+
+    @param src: path of the file
+    @type src: str
+    @param dest: where to place it
+    @type dest: str
+    @return: how the file was placed, L{REFLINK}, L{HARDLINK} or L{COPY}
+    @rtype: str
+    """
+    tmp = '%s.%d.tmp' % (dest, os.getpid())
+    if os.path.lexists(tmp):
+        os.remove(tmp)
+    try:
+        if reflink(src, tmp):
+            method = REFLINK
+        else:
+            try:
+                os.link(src, tmp)
+                method = HARDLINK
+            except OSError:
+                # Different filesystems, unsupported or forbidden hard links
+                shutil.copy2(src, tmp)
+                method = COPY
+        os.replace(tmp, dest)
+    except BaseException:
+        if os.path.lexists(tmp):
+            os.remove(tmp)
+        raise
+    return method
+
+
+class DownloadStore(object):
+    """
+    Content-addressed store of downloaded files
+
+    @ivar path: root of the store
+    @type path: str
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def blob_path(self, checksum):
+        """
+        @param checksum: sha256 of the file
+        @type checksum: str
+        @return: path of the blob with this checksum, which might not exist
+        @rtype: str
+        """
+        return os.path.join(self.path, 'sha256', checksum[:2], checksum)
+
+    def _refs_path(self, checksum):
+        return os.path.join(self.path, 'refs', checksum)
+
+    def get(self, checksum):
+        """
+        @param checksum: sha256 of the file
+        @type checksum: str
+        @return: the path of the blob, or None if the store doesn't have it
+        @rtype: str
+        """
+        blob = self.blob_path(checksum)
+        return blob if os.path.isfile(blob) else None
+
+    def add(self, path, checksum, reference=True):
+        """
+        Adds a file to the store. The checksum of the file must have been
+        verified already.
+
+        @param path: path of the file
+        @type path: str
+        @param checksum: sha256 of the file
+        @type checksum: str
+        @param reference: whether @path uses the blob, so that it's not
+                          evicted while @path exists
+        @type reference: bool
+        """
+        blob = self.blob_path(checksum)
+        if not os.path.isfile(blob):
+            os.makedirs(os.path.dirname(blob), exist_ok=True)
+            place_file(path, blob)
+        if reference:
+            self.add_reference(checksum, path)
+
+    def place(self, checksum, dest):
+        """
+        Places the blob with this checksum in @dest
+
+        @param checksum: sha256 of the file
+        @type checksum: str
+        @param dest: where to place the blob
+        @type dest: str
+        @return: how the file was placed, L{REFLINK}, L{HARDLINK} or L{COPY}
+        @rtype: str
+        """
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        method = place_file(self.blob_path(checksum), dest)
+        self.add_reference(checksum, dest)
+        return method
+
+    def remove(self, checksum):
+        """
+        Evicts a blob, f.ex. when it's corrupted. The files placed from it
+        are kept.
+
+        @param checksum: sha256 of the file
+        @type checksum: str
+        """
+        for path in (self.blob_path(checksum), self._refs_path(checksum)):
+            if os.path.exists(path):
+                os.remove(path)
+
+    def add_reference(self, checksum, path):
+        """
+        Records that @path uses the blob with this checksum
+
+        @param checksum: sha256 of the file
+        @type checksum: str
+        @param path: path of the file using the blob
+        @type path: str
+        """
+        path = os.path.abspath(path)
+        refs_path = self._refs_path(checksum)
+        if path in self._read_references(refs_path):
+            return
+        os.makedirs(os.path.dirname(refs_path), exist_ok=True)
+        # A single short append is atomic, several processes can record
+        # references at the same time
+        with open(refs_path, 'a', encoding='utf-8') as f:
+            f.write(path + '\n')
+
+    @staticmethod
+    def _read_references(refs_path):
+        try:
+            with open(refs_path, 'r', encoding='utf-8') as f:
+                return [line for line in f.read().splitlines() if line]
+        except FileNotFoundError:
+            return []
+
+    def references(self, checksum):
+        """
+        @param checksum: sha256 of the file
+        @type checksum: str
+        @return: the recorded paths that still have the content of the blob
+        @rtype: list
+        """
+        blob = self.blob_path(checksum)
+        try:
+            size = os.path.getsize(blob)
+        except FileNotFoundError:
+            return []
+        refs = []
+        for path in self._read_references(self._refs_path(checksum)):
+            try:
+                # A hard link of the blob, or a reflink or copy of it, unless
+                # it was replaced by something else
+                if os.path.samefile(path, blob) or os.path.getsize(path) == size:
+                    refs.append(path)
+            except OSError:
+                pass
+        return refs
+
+    def blobs(self):
+        """
+        @return: the checksums of all the blobs in the store
+        @rtype: list
+        """
+        checksums = []
+        root = os.path.join(self.path, 'sha256')
+        if not os.path.isdir(root):
+            return checksums
+        for prefix in sorted(os.listdir(root)):
+            for name in sorted(os.listdir(os.path.join(root, prefix))):
+                # Skip the temporary files of interrupted insertions
+                if not name.endswith('.tmp'):
+                    checksums.append(name)
+        return checksums
+
+    def gc(self, dry_run=False):
+        """
+        Evicts the blobs that are not used anymore: none of the paths where
+        they were placed have them, and they have no other hard links.
+
+        @param dry_run: only list the blobs that would be evicted
+        @type dry_run: bool
+        @return: the evicted checksums and their sizes
+        @rtype: list
+        """
+        evicted = []
+        for checksum in self.blobs():
+            blob = self.blob_path(checksum)
+            st = os.stat(blob)
+            refs = self.references(checksum)
+            if refs or st.st_nlink > 1:
+                if not dry_run:
+                    self._write_references(checksum, refs)
+                continue
+            evicted.append((checksum, st.st_size))
+            if not dry_run:
+                self.remove(checksum)
+        return evicted
+
+    def _write_references(self, checksum, refs):
+        refs_path = self._refs_path(checksum)
+        if refs == self._read_references(refs_path):
+            return
+        if not refs:
+            os.remove(refs_path)
+            return
+        tmp = '%s.%d.tmp' % (refs_path, os.getpid())
+        with open(tmp, 'w', encoding='utf-8') as f:
+            f.write(''.join(path + '\n' for path in refs))
+        os.replace(tmp, refs_path)
@@ -18,9 +18,8 @@
 
 import os
 import re
-import glob
 import shutil
-import inspect
+from contextlib import contextmanager
 from functools import partial
 import shlex
 from pathlib import Path
@@ -32,14 +31,39 @@ from cerbero.tools import dsymutil
 from cerbero.utils import shell
 from cerbero.utils import messages as m
 from cerbero.errors import FatalError
+from cerbero.build import prefixindex
 from cerbero.build.build import BuildType
 
+# Results of the searches in the prefix while listing several sets of files
+# with cached_searches()
+_SEARCH_CACHE = None
+
+
+@contextmanager
+def cached_searches():
+    """
+    Memoizes the searches of files in the prefix, so that listing the
+    runtime, debug and devel files of the same recipes does not repeat the
+    globbing and the directory walks for each set. The prefix must not
+    change while it's active.
+    """
+    global _SEARCH_CACHE
+    if _SEARCH_CACHE is not None:
+        yield
+        return
+    _SEARCH_CACHE = {}
+    try:
+        with prefixindex.frozen():
+            yield
+    finally:
+        _SEARCH_CACHE = None
+
 
 def find_shlib_regex(config, libname, prefix, libdir, ext, regex):
     # Use globbing to find all files that look like they might match
     # this library to narrow down our exact search
     fpath = os.path.join(libdir, '*{0}*{1}*'.format(libname, ext))
-    found = glob.glob(Path(prefix, fpath).as_posix())
+    found = prefixindex.get_index(config, prefix).glob(fpath, include_hidden=False)
     # Find which of those actually match via an exact regex
     # Ideally Python should provide a function for regex file 'globbing'
     matches = []
@@ -74,9 +98,10 @@ def find_dll_implib(config, libname, prefix, libdir, ext, regex):
     implibdir = 'lib'
     implibs = ['lib{}.dll.a'.format(libname), libname + '.lib', 'lib{}.lib'.format(libname), libname + '.dll.a']
     implib_notfound = []
+    index = prefixindex.get_index(config, prefix)
     for implib in implibs:
         path = Path(prefix, implibdir, implib).as_posix()
-        if not os.path.exists(path):
+        if not index.exists(Path(implibdir, implib).as_posix()):
             implib_notfound.append(implib)
             continue
         dllname = get_implib_dllname(config, path)
@@ -93,20 +118,19 @@ def find_dll_implib(config, libname, prefix, libdir, ext, regex):
     # name. This is to cover cases like libgcc_s_sjlj-1.dll which don't have an
     # import library since they're only used at runtime.
     dllname = 'lib{}.dll'.format(libname)
-    path = Path(prefix, libdir, dllname).as_posix()
-    if os.path.exists(path):
+    if index.exists(Path(libdir, dllname).as_posix()):
         return [Path(libdir, dllname).as_posix()]
     else:
         # MinGW convention -- libfoo-1.0-0.dll, strip prefix and suffix
         # and glob for soversion
         libname = libname.removeprefix('lib').removesuffix('.dll')
-        glob = set(Path(prefix, libdir).glob(f'lib{libname}-*.dll'))
+        glob = set(index.glob(Path(libdir, f'lib{libname}-*.dll').as_posix()))
         if len(glob) == 1:
-            return list(f.as_posix() for f in glob)
+            return [Path(prefix, f).as_posix() for f in glob]
         # zlib convention e.g. when buildtools
-        glob = set(Path(prefix, libdir).glob(f'{libname}-*.dll'))
+        glob = set(index.glob(Path(libdir, f'{libname}-*.dll').as_posix()))
         if len(glob) == 1:
-            return list(f.as_posix() for f in glob)
+            return [Path(prefix, f).as_posix() for f in glob]
     if len(implib_notfound) == len(implibs):
         m.warning('No import libraries found for {!r}'.format(libname))
     else:
@@ -118,6 +142,7 @@ def find_dll_implib(config, libname, prefix, libdir, ext, regex):
 
 def find_pdb_implib(config, libname, prefix, debugext):
     dlls = find_dll_implib(config, libname, prefix, 'bin', None, None)
+    index = prefixindex.get_index(config, prefix)
     pdbs = []
     for dll in dlls:
         pdb = [
@@ -125,7 +150,7 @@ def find_pdb_implib(config, libname, prefix, debugext):
             dll[:-4] + debugext,  # .debuginfo, .pdb
         ]
         for f in pdb:
-            if Path(prefix, f).exists():
+            if index.exists(f):
                 pdbs.append(f)
     return pdbs
 
@@ -266,12 +291,14 @@ class FilesProvider(object):
         Search for arbitrary files doing the extension replacements, globbing, and listing
         directories
         """
+        index = prefixindex.get_index(self.config)
         # fill directories
-        if os.path.isdir(Path(self.config.prefix, file).as_posix()):
-            found = self._ls_dir(Path(self.config.prefix, file).as_posix())
-        else:
-            found = shell.ls_files([file], self.config.prefix)
-        return found
+        if index.isdir(file):
+            return index.walk_files(file)
+        found = set()
+        for f in file.split():
+            found.update(index.glob(f))
+        return list(found)
 
     def _search_library(self, file):
         """
@@ -350,7 +377,7 @@ class FilesProvider(object):
         for f, searchfunc in files.items():
             if not searchfunc:
                 searchfunc = self._search_file
-            validated = searchfunc(f)
+            validated = self._search(searchfunc, f)
             if validated:
                 vfs.extend(validated)
             elif not with_symbols:
@@ -371,6 +398,15 @@ class FilesProvider(object):
                 m.warning(msg)
         return vfs
 
+    def _search(self, searchfunc, f):
+        if _SEARCH_CACHE is None:
+            return searchfunc(f)
+        # Search functions depend on the extensions of the recipe
+        key = (id(self), searchfunc.__name__, f)
+        if key not in _SEARCH_CACHE:
+            _SEARCH_CACHE[key] = searchfunc(f)
+        return _SEARCH_CACHE[key]
+
     def _dylib_plugins(self):
         if self.btype not in (BuildType.MESON, BuildType.CARGO_C):
             return False
@@ -594,7 +630,10 @@ class FilesProvider(object):
     def _files_categories(self):
         """Get the list of categories available"""
         categories = []
-        for name, value in inspect.getmembers(self):
+        for name in dir(self):
+            if not name.startswith(('files_', 'platform_files_')):
+                continue
+            value = getattr(self, name, None)
             if not isinstance(value, (dict, list)):
                 continue
             if name.startswith('files_'):
@@ -746,16 +785,17 @@ class FilesProvider(object):
         return libs
 
     def _pyfile_get_name(self, f) -> Optional[List[str]]:
-        if os.path.exists(Path(self.config.prefix, f).as_posix()):
+        index = prefixindex.get_index(self.config)
+        if index.exists(f):
             return [f]
         for py_prefix in self.py_prefixes:
             original_path = Path(py_prefix, f).as_posix()
-            if os.path.exists(Path(self.config.prefix, original_path).as_posix()):
+            if index.exists(original_path):
                 return [original_path]
             elif '*' in f:
-                fs = glob.glob(Path(self.config.prefix, original_path).as_posix(), recursive=True)
+                fs = index.glob(original_path, include_hidden=False)
                 if fs:
-                    return [os.path.relpath(f, start=self.config.prefix) for f in fs]
+                    return [os.path.normpath(f) for f in fs]
             elif os.path.isabs(f):
                 # A files_* entry is not made relative properly
                 raise RuntimeError(f'An absolute path "{f}"was supplied, please set relative paths only')
@@ -767,7 +807,7 @@ class FilesProvider(object):
             splitedext = os.path.splitext(f)
             for ex in ['', 'm']:
                 f = splitedext[0] + '.' + cpythonname + ex + splitedext[1]
-                if os.path.exists(Path(self.config.prefix, f).as_posix()):
+                if index.exists(f):
                     return [f]
         return None
 
@@ -907,15 +947,6 @@ class FilesProvider(object):
 
         return (devel_libs, pdbs)
 
-    def _ls_dir(self, dirpath):
-        files = []
-        for root, dirnames, filenames in os.walk(dirpath):
-            _root = root.split(self.config.prefix)[1]
-            if _root[0] == '/':
-                _root = _root[1:]
-            files.extend([Path(_root, x).as_posix() for x in filenames])
-        return files
-
 
 class UniversalFilesProvider(FilesProvider):
     wrapped_list_funcs = ['debug_files_list', 'devel_files_list', 'dist_files_list', 'files_list_by_categories']
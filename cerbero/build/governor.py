@@ -0,0 +1,255 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import asyncio
+import contextlib
+import os
+import re
+import time
+
+from cerbero.utils import determine_free_ram, determine_total_ram
+
+
+# How often waiting jobs check again the system load and free memory
+POLL_INTERVAL = 2
+# Jobs admitted because the system is idle can use up to this many times
+# the number of jobs of the build
+MAX_OVERCOMMIT = 2
+# The system is considered idle when the load is below this ratio of jobs
+IDLE_LOAD_RATIO = 0.75
+# The load average lags behind, give it time to account for the last job
+# admitted because the system was idle before admitting another one
+LOAD_SETTLE_TIME = 30
+# Minimum free memory needed to start a new job
+MIN_FREE_RAM = 512 << 20
+MIN_FREE_RAM_RATIO = 0.05
+# Options of MAKEFLAGS replaced by the ones of the jobserver
+JOBS_FLAGS_RE = re.compile(r'-j\d*$|--jobserver-(auth|fds)=')
+
+_JOBSERVER = None
+
+
+def system_load():
+    """
+    @return: the 1 minute load average, or None if not available
+    @rtype: float
+    """
+    try:
+        return os.getloadavg()[0]
+    except (AttributeError, OSError):
+        return None
+
+
+class JobGovernor(object):
+    """
+    Decides when the configure, compile and install steps of the recipes
+    can start, based on the jobs they use, the system load and the free
+    memory.
+
+    Each running step holds a weight, which is the number of jobs it was
+    told to use (the -j passed to make or ninja for parallel compiles, 1
+    otherwise). New steps are admitted while the weights fit in the number
+    of jobs of the build. When they don't, a step can still be admitted if
+    the system is idle, for instance while a parallel compile is in a long
+    serial tail, up to L{MAX_OVERCOMMIT} times the number of jobs. Steps are
+    never admitted while the free memory is too low, unless nothing else is
+    running.
+
+    @ivar jobs: number of jobs of the build
+    @type jobs: int
+    @ivar running: step identifier -> weight of the running steps
+    @type running: dict
+    """
+
+    def __init__(self, jobs, load=system_load, free_ram=determine_free_ram, total_ram=None):
+        """
+        @param jobs: number of jobs of the build
+        @type jobs: int
+        @param load: returns the system load, or None if unknown
+        @type load: callable
+        @param free_ram: returns the free memory in bytes, or None if unknown
+        @type free_ram: callable
+        @param total_ram: total memory in bytes
+        @type total_ram: int
+        """
+        self.jobs = max(jobs, 1)
+        self.running = {}
+        self._load = load
+        self._free_ram = free_ram
+        total_ram = total_ram or determine_total_ram()
+        self.min_free_ram = max(MIN_FREE_RAM, int(total_ram * MIN_FREE_RAM_RATIO))
+        self._last_idle_admission = None
+        self._cond = None
+
+    def used(self):
+        """
+        @return: the sum of the weights of the running steps
+        @rtype: int
+        """
+        return sum(self.running.values())
+
+    def can_admit(self, weight):
+        """
+        Checks if a step with the given weight can start now
+
+        @param weight: the number of jobs the step will use
+        @type weight: int
+        @return: whether the step can start and whether it was only admitted
+                 because the system is idle
+        @rtype: tuple
+        """
+        if not self.running:
+            return True, False
+        free_ram = self._free_ram()
+        if free_ram is not None and free_ram < self.min_free_ram:
+            return False, False
+        used = self.used()
+        if used + weight <= self.jobs:
+            return True, False
+        if used + weight > self.jobs * MAX_OVERCOMMIT:
+            return False, False
+        load = self._load()
+        if load is None or load + weight > self.jobs * IDLE_LOAD_RATIO:
+            return False, False
+        if self._last_idle_admission is not None and time.monotonic() - self._last_idle_admission < LOAD_SETTLE_TIME:
+            return False, False
+        return True, True
+
+    @contextlib.asynccontextmanager
+    async def slot(self, name, weight=1):
+        """
+        Waits until a step can start and holds its weight while it runs
+
+            async with governor.slot('glib.compile', 8):
+                await recipe.compile()
+
+        @param name: unique identifier of the step
+        @type name: str
+        @param weight: the number of jobs the step will use
+        @type weight: int
+        """
+        weight = max(min(weight, self.jobs), 1)
+        if self._cond is None:
+            self._cond = asyncio.Condition()
+        async with self._cond:
+            while True:
+                admit, idle = self.can_admit(weight)
+                if admit:
+                    break
+                try:
+                    await asyncio.wait_for(self._cond.wait(), POLL_INTERVAL)
+                except asyncio.TimeoutError:
+                    pass
+            if idle:
+                self._last_idle_admission = time.monotonic()
+            self.running[name] = weight
+        try:
+            yield
+        finally:
+            async with self._cond:
+                del self.running[name]
+                self._cond.notify_all()
+
+
+class Jobserver(object):
+    """
+    A GNU make jobserver shared by all the recipes built concurrently.
+
+    The token pool is a pipe, passed to make through MAKEFLAGS and the
+    inherited file descriptors, so that all the make processes draw from the
+    same pool instead of each one spawning as many jobs as CPUs.
+
+    @ivar tokens: number of jobs of the pool
+    @type tokens: int
+    """
+
+    def __init__(self, tokens):
+        """
+        @param tokens: number of jobs of the pool
+        @type tokens: int
+        """
+        self.tokens = max(tokens, 1)
+        self._r, self._w = os.pipe()
+        # Each client runs one job with its implicit token
+        os.write(self._w, b'+' * (self.tokens - 1))
+
+    @staticmethod
+    def is_supported():
+        # Windows can't pass pipes to child processes by file descriptor
+        return os.name == 'posix'
+
+    @property
+    def fds(self):
+        """
+        @return: the file descriptors that must be passed to the clients
+        @rtype: tuple
+        """
+        return (self._r, self._w)
+
+    def makeflags(self, makeflags=None):
+        """
+        @param makeflags: MAKEFLAGS of the environment, whose options are
+                          kept except the ones setting the jobs
+        @type makeflags: str
+        @return: the MAKEFLAGS that make clients use to join the pool
+        @rtype: str
+        """
+        flags = ' -j{} --jobserver-auth={},{}'.format(self.tokens, self._r, self._w)
+        if not makeflags:
+            return flags
+        # Variable definitions go last, after a '--'
+        match = re.search(r'(^|\s)--(\s|$)', makeflags)
+        options, variables = makeflags, ''
+        if match:
+            options, variables = makeflags[: match.start()], ' ' + makeflags[match.start() :].lstrip()
+        options = ' '.join(o for o in options.split() if not JOBS_FLAGS_RE.match(o))
+        return options + flags + variables
+
+    def env(self, env):
+        """
+        @param env: the environment of the client
+        @type env: dict
+        @return: a copy of @env that makes make join the pool
+        @rtype: dict
+        """
+        env = env.copy()
+        env['MAKEFLAGS'] = self.makeflags(env.get('MAKEFLAGS'))
+        return env
+
+    def close(self):
+        os.close(self._r)
+        os.close(self._w)
+
+
+def set_jobserver(jobserver):
+    """
+    Sets the jobserver used by the build systems that support it
+
+    @param jobserver: the jobserver, or None to disable it
+    @type jobserver: L{Jobserver}
+    """
+    global _JOBSERVER
+    _JOBSERVER = jobserver
+
+
+def get_jobserver():
+    """
+    @return: the jobserver of the current build, or None
+    @rtype: L{Jobserver}
+    """
+    return _JOBSERVER
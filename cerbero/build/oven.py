@@ -16,23 +16,34 @@
 # Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 # Boston, MA 02111-1307, USA.
 
+import os
 import sys
+import tarfile
+import time
 import tempfile
 import shutil
 import pathlib
 import traceback
 import asyncio
-import collections
 from subprocess import CalledProcessError
 
-from cerbero.enums import LibraryType, Platform
+from cerbero.enums import LibraryType
 from cerbero.errors import BuildStepError, FatalError, AbortedError
-from cerbero.build.recipe import Recipe, BuildSteps
+from cerbero.build.recipe import Recipe, BuildSteps, run_step
+from cerbero.build.buildstats import BuildStats
+from cerbero.build.scheduler import BuildScheduler
+from cerbero.build.governor import JobGovernor, Jobserver, set_jobserver
+from cerbero.build import staging
+from cerbero.build.artifacts import ArtifactCache, ArtifactKeys
 from cerbero.utils import N_, shell, run_tasks, determine_num_of_cpus
 from cerbero.utils import messages as m
 from cerbero.utils.shell import BuildStatusPrinter
 
 
+# Steps started by the governor depending on the jobs they use
+GOVERNED_STEPS = [BuildSteps.CONFIGURE, BuildSteps.COMPILE, BuildSteps.INSTALL]
+
+
 class RecoveryActions(object):
     """
     Enumeration factory for recovery actions after an error
@@ -109,14 +120,13 @@ class Oven(object):
         shell.DRY_RUN = dry_run
         self.jobs = jobs or determine_num_of_cpus()
         self.steps_filter = steps_filter
-        self._build_lock = asyncio.Semaphore(2)
+        self.build_stats = BuildStats(self.config)
+        self._governor = JobGovernor(self.jobs)
+        self._artifacts = ArtifactCache.from_config(self.config)
+        self._artifact_keys = ArtifactKeys(cookbook) if self._artifacts else None
         # Add a separate lock for Rust tasks that will
         # be required if only one concurrent job is allowed.
         self._architecture_lock = asyncio.Semaphore(1)
-        # Can't install in parallel because of the risk of two recipes writing
-        # to the same file at the same time. TODO: Need to use DESTDIR + prefix
-        # merging + file list tracking for collision detection before we can
-        # enable this.
         self._install_lock = asyncio.Lock()
 
     def resolve_tree(self):
@@ -165,8 +175,10 @@ class Oven(object):
         built_recipes = set()  # recipes we have successfully built
         building_recipes = set()  # recipes that are queued or are in progress
 
+        graph = self.cookbook.get_dependency_graph()
+
         def all_deps_without_recipe(recipe_name):
-            return set((dep.name for dep in self.cookbook.list_recipe_deps(recipe_name) if recipe_name != dep.name))
+            return set(graph.ordered_deps(recipe_name)) - {recipe_name}
 
         all_deps = set()
         for recipe in recipes:
@@ -189,58 +201,21 @@ class Oven(object):
             deps = all_deps_without_recipe(r)
             recipe_deps[r] = deps
 
-        # precompute the reverse deps for each recipe
-        def rdeps(recipe):
-            ret = []
-            for r, deps in recipe_deps.items():
-                if recipe in deps:
-                    ret.append(r)
-            return ret
-
-        recipe_rdeps = {}
-        for r in recipe_deps.keys():
-            recipe_rdeps[r] = rdeps(r)
-
-        def find_recipe_dep_path(from_name, to_name):
-            # returns a list of recipe names in reverse order that describes
-            # the path for building @from_name
-            # None if there is no path
-            if from_name == to_name:
-                return [to_name]
-            for dep in recipe_deps[from_name]:
-                val = find_recipe_dep_path(dep, to_name)
-                if val:
-                    return [from_name] + val
-
-        def find_longest_path(to_recipes):
-            # return the longest path from the targets to one of @to_recipes
-            def yield_path_lengths():
-                for f in recipe_targets:
-                    for t in to_recipes:
-                        path = find_recipe_dep_path(f, t)
-                        if path:
-                            yield len(path)
-
-            return max((length for length in yield_path_lengths()))
-
-        def find_buildable_recipes():
-            # This is a dumb algorithm that only looks for all available
-            # recipes that can be built.  We use a priority queue for
-            # the smarts.
-            for recipe in recipes:
-                if recipe.name in built_recipes:
-                    continue
-                if recipe.name in building_recipes:
-                    continue
+        # the scheduler computes all the priorities once and tracks which
+        # recipes are unblocked every time one of them is built. Recipes are
+        # weighted by how long they took to build in previous runs.
+        costs = self.build_stats.recipes_durations(recipe_deps.keys())
+        scheduler = BuildScheduler(recipe_deps, costs=costs, built=built_recipes)
+        self._build_status_printer.set_estimates(
+            self.build_stats.steps_durations([r.name for r in recipes], self._build_status_printer.steps)
+        )
+        recipes_by_name = {r.name: r for r in recipes}
 
-                if len(recipe_deps[recipe.name]) == 0:
-                    yield recipe
+        def find_buildable_recipes(names):
+            for name in names:
+                if name in building_recipes or name not in recipes_by_name:
                     continue
-
-                built_deps = set((dep for dep in recipe_deps[recipe.name] if dep in built_recipes))
-                if len(built_deps) > 0 and built_deps == set(recipe_deps[recipe.name]):
-                    # we have a new dep buildable
-                    yield recipe
+                yield recipes_by_name[name]
 
         class MutableInt:
             def __init__(self):
@@ -254,8 +229,7 @@ class Oven(object):
             def __init__(self, recipe, count, step):
                 self.recipe = recipe
                 self.step = step
-                self.inverse_priority = find_longest_path((recipe.name,))
-                self.inverse_priority *= len(recipe_rdeps[recipe.name]) + 1
+                self.inverse_priority = scheduler.priority(recipe.name)
                 self.count = count
 
                 if step is not None:
@@ -285,7 +259,8 @@ class Oven(object):
         def add_buildable_recipes(recipe):
             built_recipes.add(recipe.name)
             building_recipes.remove(recipe.name)
-            for buildable in find_buildable_recipes():
+            # done() already pops the recipes it unblocked
+            for buildable in find_buildable_recipes(scheduler.done(recipe.name)):
                 building_recipes.add(buildable.name)
                 default_queue.put_nowait(RecipeStepPriority(buildable, 0, 'init'))
 
@@ -300,24 +275,16 @@ class Oven(object):
                 if step == 'init':
                     counter.i += 1
                     count = counter.i
-                    if self._cook_start_recipe(recipe, count):
+                    if await self._cook_start_recipe(recipe, count):
                         add_buildable_recipes(recipe)
                         q.task_done()
                         continue
                     step = recipe_next_step(recipe, step)
 
-                lock = locks[step]
-                if step == BuildSteps.COMPILE[1]:
-                    if not hasattr(recipe, 'allow_parallel_build') or not recipe.allow_parallel_build:
-                        # only allow a limited number of recipes that can fill all
-                        # CPU cores to execute concurrently.  Any recipe that does
-                        # not support parallel builds will always be executed
-                        lock = None
-
                 async def build_recipe_steps(step):
                     # run the steps
                     while step in steps:
-                        await self._cook_recipe_step_with_prompt(recipe, step, count)
+                        await self._cook_governed_recipe_step(recipe, step, count)
                         step = recipe_next_step(recipe, step)
                     return step
 
@@ -326,11 +293,7 @@ class Oven(object):
                         recipe._lock = self._architecture_lock
                     else:
                         recipe._lock = None
-                    if lock:
-                        async with lock:
-                            step = await build_recipe_steps(step)
-                    else:
-                        step = await build_recipe_steps(step)
+                    step = await build_recipe_steps(step)
                 except RetryRecipeError:
                     step = 'init'
                 except SkipRecipeError:
@@ -341,7 +304,7 @@ class Oven(object):
                     if skip:
                         self._build_status_printer.remove_recipe(recipe.name)
                     else:
-                        self._cook_finish_recipe(recipe, counter.i)
+                        await self._cook_finish_recipe(recipe, counter.i)
                     add_buildable_recipes(recipe)
                     next_queue = None
                 else:
@@ -358,89 +321,38 @@ class Oven(object):
         default_queue = asyncio.PriorityQueue()
         queues = {step: default_queue for step in all_steps}
 
-        # find the install steps for ensuring consistency between all of them
-        install_steps = []
-        step = BuildSteps.INSTALL[1]
-        while step:
-            install_steps.append(step)
-            step = recipe_next_step(next(iter(recipes)), step)
-
-        # allocate jobs
-        job_allocation = collections.defaultdict(lambda: 0)
-        if self.jobs > 4:
-            queues[BuildSteps.COMPILE[1]] = asyncio.PriorityQueue()
-            job_allocation[BuildSteps.COMPILE[1]] = 1
-        if self.jobs > 7:
-            install_queue = asyncio.PriorityQueue()
-            for step in install_steps:
-                queues[step] = install_queue
-            job_allocation[BuildSteps.INSTALL[1]] = 1
-        if self.jobs > 8:
-            job_allocation[BuildSteps.EXTRACT[1]] = 1
-            queues[BuildSteps.EXTRACT[1]] = asyncio.PriorityQueue()
-        if self.jobs > 9:
-            # Two jobs is the same allocation as fetch-package/bootstrap, which
-            # is a good idea to avoid getting bottlenecked if one of the
-            # download mirrors is slow.
-            job_allocation[BuildSteps.FETCH[1]] = 2
-            if self.config.platform == Platform.WINDOWS:
-                # XXX: reduce this to 1 when we eliminate all major make-based
-                # recipes. The remaining ones are: libiconv, openssl.
-                job_allocation[BuildSteps.COMPILE[1]] = 2
-            else:
-                job_allocation[BuildSteps.COMPILE[1]] = 1
-            queues[BuildSteps.FETCH[1]] = asyncio.PriorityQueue()
+        # configure, compile and install are run by their own jobs, which
+        # the governor only lets start when the jobs they use fit in the
+        # machine. The rest of the steps are run by the general jobs, and
+        # both together never run more than the jobs of the build.
+        tasks = []
+        governed_steps = [s[1] for s in GOVERNED_STEPS]
+        general_jobs = self.jobs
+        if self.jobs > 1:
+            general_jobs = self.jobs // 2
+            governed_queue = asyncio.PriorityQueue()
+            for step in governed_steps:
+                queues[step] = governed_queue
+            for _ in range(self.jobs - general_jobs):
+                tasks.append(asyncio.ensure_future(cook_recipe_worker(governed_queue, governed_steps)))
+            general_steps = set(all_steps) - set(governed_steps)
+        else:
+            general_steps = set(all_steps)
+        for _ in range(general_jobs):
+            tasks.append(asyncio.ensure_future(cook_recipe_worker(default_queue, general_steps)))
 
-        # async locks used to synchronize step execution
-        locks = collections.defaultdict(lambda: None)
+        jobserver = None
+        if self.jobs > 1 and Jobserver.is_supported():
+            jobserver = Jobserver(self.jobs)
+        set_jobserver(jobserver)
 
-        # create the jobs
-        tasks = []
-        used_jobs = 0
-        used_steps = []
-        install_done = False
-        for step, count in job_allocation.items():
-            if count <= 0:
-                continue
-            if step in install_steps:
-                # special case install as that also needs to be sequential
-                # through all the steps after
-                if install_done:
-                    continue
-                tasks.append(asyncio.ensure_future(cook_recipe_worker(queues[step], install_steps)))
-                used_steps.extend(install_steps)
-                install_done = True
-            else:
-                for _ in range(count):
-                    tasks.append(asyncio.ensure_future(cook_recipe_worker(queues[step], [step])))
-                used_steps.append(step)
-            used_jobs += count
-        general_jobs = self.jobs - used_jobs
-        assert general_jobs > 0
-
-        if job_allocation[BuildSteps.INSTALL[1]] == 0 and general_jobs > 1:
-            locks[BuildSteps.INSTALL[1]] = self._install_lock
-        if job_allocation[BuildSteps.COMPILE[1]] > 2 or job_allocation[BuildSteps.COMPILE[1]] == 0 and general_jobs > 2:
-            locks[BuildSteps.COMPILE[1]] = self._build_lock
-
-        job_allocation_msg = ', '.join(
-            [str(step) + ': ' + str(count) for step, count in job_allocation.items() if count > 0]
-        )
-        if used_jobs > 0:
-            job_allocation_msg += ', and '
         m.output(
-            'Building using '
-            + str(self.jobs)
-            + ' job(s) with the following job subdivisions: '
-            + job_allocation_msg
-            + str(self.jobs - used_jobs)
-            + ' general job(s)',
+            'Building using {} job(s), the {} steps are started depending on the load of the system{}'.format(
+                self.jobs, ', '.join(governed_steps), ' and share a make jobserver' if jobserver else ''
+            ),
             sys.stdout,
         )
 
-        for _ in range(self.jobs - used_jobs):
-            tasks.append(asyncio.ensure_future(cook_recipe_worker(default_queue, set(all_steps) - set(used_steps))))
-
         async def recipes_done():
             async def heartbeat_output():
                 while True:
@@ -452,12 +364,15 @@ class Oven(object):
             while built_recipes & recipe_targets != recipe_targets:
                 for q in queues.values():
                     await q.join()
+                # join() doesn't suspend on empty queues, let the loop run
+                # other tasks so that the build can still be cancelled
+                await asyncio.sleep(0)
 
             heartbeat_task.cancel()
 
         # push the initial set of recipes that have no dependencies to start
         # building
-        for recipe in find_buildable_recipes():
+        for recipe in find_buildable_recipes(scheduler.pop_ready()):
             building_recipes.add(recipe.name)
             default_queue.put_nowait(RecipeStepPriority(recipe, 0, 'init'))
 
@@ -466,6 +381,78 @@ class Oven(object):
             m.output(N_('All done!'), sys.stdout)
         except Exception as e:
             raise e
+        finally:
+            set_jobserver(None)
+            if jobserver:
+                jobserver.close()
+            # Saves the steps of the recipes that didn't finish
+            await self._save_build_stats()
+
+    def _step_weight(self, recipe, step):
+        """
+        Number of jobs used by a step of a recipe
+        """
+        if step != BuildSteps.COMPILE[1] or not getattr(recipe, 'allow_parallel_build', False):
+            return 1
+        # The compiles using the jobserver can take all its tokens, which
+        # are as many as the jobs of the build
+        if getattr(recipe, 'uses_jobserver', lambda: False)():
+            return self.jobs
+        return getattr(recipe, 'num_of_cpus', lambda: None)() or 1
+
+    def _step_needs_cook(self, recipe, step):
+        if self.steps_filter is not None and step not in self.steps_filter:
+            return False
+        return self.force or not self.cookbook.step_done(recipe.name, step)
+
+    async def _cook_governed_recipe_step(self, recipe, step, count):
+        if self._tracks_installed_files() and self._is_post_install_step(recipe, step):
+            if self._step_needs_cook(recipe, step):
+                await self._cook_post_install_step(recipe, step, count)
+                return
+        if step not in [s[1] for s in GOVERNED_STEPS] or not self._step_needs_cook(recipe, step):
+            await self._cook_recipe_step_with_prompt(recipe, step, count)
+            return
+        # Installs that can't be staged write directly to the prefix, they
+        # can't run in parallel because of the risk of two recipes writing to
+        # the same file at the same time.
+        if step == BuildSteps.INSTALL[1] and not self._can_stage(recipe):
+            async with self._install_lock:
+                await self._cook_admitted_recipe_step(recipe, step, count)
+        else:
+            await self._cook_admitted_recipe_step(recipe, step, count)
+
+    def _tracks_installed_files(self):
+        return self.missing_files or self._use_artifacts()
+
+    def _is_post_install_step(self, recipe, step):
+        steps = [s[1] for s in recipe.steps]
+        if BuildSteps.INSTALL[1] not in steps:
+            return False
+        return step in steps[steps.index(BuildSteps.INSTALL[1]) + 1 :]
+
+    async def _cook_post_install_step(self, recipe, step, count):
+        """
+        Runs a step after the install, which can create files in the prefix
+        (licenses, library files, debug symbols...), holding the install lock
+        so that the files created while it runs are the ones of the recipe.
+        """
+        loop = asyncio.get_event_loop()
+        async with self._install_lock:
+            with tempfile.NamedTemporaryFile() as stamp:
+                await self._cook_recipe_step_with_prompt(recipe, step, count)
+                post_install_files = getattr(recipe, '_oven_post_install_files', None)
+                if post_install_files is None:
+                    return
+                files = await loop.run_in_executor(None, shell.find_newer_files, self.config.prefix, stamp.name)
+                # Files of other recipes updated by the step, like shared
+                # caches, stay with their owners
+                owners = self.cookbook.get_files_owners(files)
+                post_install_files.update(f for f in files if owners.get(f, recipe.name) == recipe.name)
+
+    async def _cook_admitted_recipe_step(self, recipe, step, count):
+        async with self._governor.slot('{}:{}'.format(recipe.name, step), self._step_weight(recipe, step)):
+            await self._cook_recipe_step_with_prompt(recipe, step, count)
 
     async def _cook_recipe_step_with_prompt(self, recipe, step, count):
         try:
@@ -519,9 +506,13 @@ class Oven(object):
                 raise FatalError(N_('Step %s not found') % step)
 
             self._build_status_printer.update_recipe_step(count, recipe.name, step)
-            ret = stepfunc()
-            if asyncio.iscoroutine(ret):
-                await ret
+            start = time.monotonic()
+            if step == BuildSteps.INSTALL[1] and self._can_stage(recipe):
+                await self._cook_staged_install(recipe, stepfunc)
+            else:
+                await run_step(stepfunc)
+            if not shell.DRY_RUN:
+                self.build_stats.record(recipe.name, step, time.monotonic() - start)
             self._build_status_printer.remove_recipe(recipe.name)
             # update status successfully
             self.cookbook.update_step_status(recipe.name, step)
@@ -544,7 +535,40 @@ class Oven(object):
         except Exception:
             raise BuildStepError(recipe, step, traceback.format_exc())
 
-    def _cook_start_recipe(self, recipe, count):
+    def _can_stage(self, recipe):
+        return not shell.DRY_RUN and staging.can_stage(recipe)
+
+    async def _cook_staged_install(self, recipe, stepfunc):
+        """
+        Installs a recipe in its staging root and merges it in the prefix,
+        recording the files it installed
+        """
+        stage = staging.StagedInstall(recipe)
+        stage.prepare()
+        recipe.destdir = stage.destdir
+        try:
+            await run_step(stepfunc)
+        finally:
+            recipe.destdir = None
+        loop = asyncio.get_event_loop()
+        # Merges must not overlap with the installs done directly in the prefix
+        async with self._install_lock:
+            files = await loop.run_in_executor(None, stage.files)
+            collisions = stage.collisions(files, self.cookbook.get_files_owners(files))
+            if collisions:
+                stage.clean()
+                raise FatalError(
+                    N_('The following files were already installed by other recipes:\n%s')
+                    % '\n'.join('{} ({})'.format(f, owner) for f, owner in sorted(collisions.items()))
+                )
+            await loop.run_in_executor(None, stage.merge, files)
+            self.cookbook.set_recipe_files(recipe.name, files)
+        if self._tracks_installed_files():
+            # All the files of the recipe are known if the steps after the
+            # install are run too, see _cook_post_install_step()
+            recipe._oven_post_install_files = set()
+
+    async def _cook_start_recipe(self, recipe, count):
         # A Recipe depending on a static library that has been rebuilt
         # also needs to be rebuilt to pick up the latest build.
         if recipe.library_type != LibraryType.STATIC:
@@ -555,22 +579,98 @@ class Oven(object):
             self._build_status_printer.already_built(count, recipe.name)
             return True
 
+        if await self._restore_artifact(recipe):
+            self._build_status_printer.already_built(count, recipe.name, N_('restored from the artifacts cache'))
+            return True
+
         if self.missing_files:
             # create a temp file that will be used to find newer files
-            recipe._oven_missing_files_tmp_file = tempfile.NamedTemporaryFile()
+            recipe._oven_stamp_file = tempfile.NamedTemporaryFile()
+        recipe._oven_post_install_files = None
 
         recipe.force = self.force
         return False
 
-    def _cook_finish_recipe(self, recipe, count):
+    async def _cook_finish_recipe(self, recipe, count):
         self._build_status_printer.built(count, recipe.name)
         self.cookbook.update_build_status(recipe.name, recipe.built_version())
         if recipe.library_type == LibraryType.STATIC:
             self._static_libraries_built.append(recipe.name)
+        await self._save_artifact(recipe)
+        await self._save_build_stats()
 
         if self.missing_files:
-            self._print_missing_files(recipe, recipe._oven_missing_files_tmp_file)
-            recipe._oven_missing_files_tmp_file.close()
+            self._print_missing_files(recipe, recipe._oven_stamp_file)
+        stamp = getattr(recipe, '_oven_stamp_file', None)
+        if stamp is not None:
+            stamp.close()
+            recipe._oven_stamp_file = None
+        recipe._oven_post_install_files = None
+
+    async def _save_build_stats(self):
+        loop = asyncio.get_event_loop()
+        await loop.run_in_executor(None, self.build_stats.save)
+
+    def _use_artifacts(self):
+        # Artifacts are only usable if all the steps are run
+        return self._artifacts is not None and not shell.DRY_RUN and self.steps_filter is None
+
+    async def _restore_artifact(self, recipe):
+        """
+        Installs the files of a recipe from the artifacts cache
+
+        @return: whether the recipe was restored from the cache
+        @rtype: bool
+        """
+        if not self._use_artifacts() or self.force:
+            return False
+        loop = asyncio.get_event_loop()
+        key = await loop.run_in_executor(None, self._artifact_keys.get, recipe.name)
+        if key is None:
+            return False
+
+        def check_owners(files):
+            # Don't overwrite the files of other recipes
+            owners = self.cookbook.get_files_owners(files)
+            return all(owner == recipe.name for owner in owners.values())
+
+        async with self._install_lock:
+            info = await loop.run_in_executor(None, self._artifacts.restore, key, self.config.prefix, check_owners)
+            if info is None:
+                return False
+            self.cookbook.set_recipe_files(recipe.name, info['files'])
+        for unused_name, step in recipe.steps:
+            self.cookbook.update_step_status(recipe.name, step)
+        self.cookbook.update_build_status(recipe.name, info['built_version'])
+        if recipe.library_type == LibraryType.STATIC:
+            self._static_libraries_built.append(recipe.name)
+        return True
+
+    async def _save_artifact(self, recipe):
+        """
+        Adds the files installed by a recipe to the artifacts cache, with the
+        ones created by the steps after the install. Only the recipes whose
+        install was staged and whose steps after the install were all run in
+        this build have a known set of files.
+        """
+        if not self._use_artifacts() or getattr(recipe, '_oven_post_install_files', None) is None:
+            return
+        loop = asyncio.get_event_loop()
+        key = await loop.run_in_executor(None, self._artifact_keys.get, recipe.name)
+        if key is None:
+            return
+        staged_files = self.cookbook.get_recipe_files(recipe.name)
+        if staged_files is None:
+            return
+        files = set(staged_files) | recipe._oven_post_install_files
+        files = sorted(f for f in files if os.path.lexists(os.path.join(self.config.prefix, f)))
+        # The restored recipe owns the files of the artifact, own them now too
+        self.cookbook.set_recipe_files(recipe.name, files)
+        info = {'name': recipe.name, 'key': key, 'built_version': recipe.built_version()}
+        try:
+            await loop.run_in_executor(None, self._artifacts.save, key, self.config.prefix, files, info)
+        except (OSError, tarfile.TarError) as e:
+            m.warning('Could not add {} to the artifacts cache: {}'.format(recipe.name, e))
 
     def _handle_build_step_error(self, recipe, step, trace, arch):
         if step in [BuildSteps.FETCH, BuildSteps.EXTRACT]:
@@ -580,9 +680,27 @@ class Oven(object):
             self.cookbook.reset_recipe_status(recipe.name)
         raise BuildStepError(recipe, step, trace=trace, arch=arch)
 
+    def _installed_files(self, recipe, tmp):
+        """
+        Finds the files installed by a recipe, including the ones created by
+        the steps after the install (licenses, debug symbols, library
+        files...)
+
+        @param tmp: file created before the recipe was built, used to find
+                    the files if the install was not staged
+        @type tmp: file
+        @return: paths relative to the prefix
+        @rtype: set
+        """
+        staged_files = self.cookbook.get_recipe_files(recipe.name)
+        post_install_files = getattr(recipe, '_oven_post_install_files', None)
+        if staged_files is not None and post_install_files is not None:
+            return set(staged_files) | post_install_files
+        return set(shell.find_newer_files(recipe.config.prefix, tmp.name))
+
     def _print_missing_files(self, recipe, tmp):
         recipe_files = set(recipe.files_list())
-        installed_files = set(shell.find_newer_files(recipe.config.prefix, tmp.name))
+        installed_files = self._installed_files(recipe, tmp)
         not_in_recipe = list(installed_files - recipe_files)
         not_installed = list(recipe_files - installed_files)
 
@@ -0,0 +1,415 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+"""
+Index of the files of a prefix, used by the files providers to resolve the
+files of the recipes without globbing and walking the prefix for each
+pattern.
+
+The index is a tree of directory listings, filled lazily the first time a
+directory is looked up. A listing is read again when the mtime of its
+directory changes, which happens whenever an entry is added, removed or
+renamed in it, so installing recipes in the prefix doesn't need to
+invalidate anything. While L{frozen} is active, each directory is only
+checked once.
+"""
+
+import atexit
+import fnmatch
+import glob
+import os
+import pickle
+import re
+import stat
+import threading
+import time
+from contextlib import contextmanager
+from functools import lru_cache
+from pathlib import Path
+
+import cerbero.utils.messages as m
+from cerbero.utils import _
+
+FILE = 0
+DIR = 1
+# Symbolic links are resolved when they are looked up
+LINK = 2
+
+INDEX_VERSION = 1
+# Listings of directories modified less than this ago are not trusted, since
+# another entry could be added in the same mtime tick
+RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+CASE_INSENSITIVE = os.path.normcase('A') == 'a'
+
+_INDEXES = {}
+_INDEXES_LOCK = threading.Lock()
+_FROZEN = 0
+
+
+@lru_cache(maxsize=4096)
+def _compile(part):
+    """
+    @return: the matcher of a pattern component and its longest literal
+             chunk, which is checked first to skip most names quickly
+    @rtype: tuple
+    """
+    if CASE_INSENSITIVE:
+        part = part.lower()
+    literal = max(re.split(r'[*?\[\]]', part), key=len)
+    return re.compile(fnmatch.translate(part)).match, literal
+
+
+@contextmanager
+def frozen():
+    """
+    Checks each directory only once while active. The prefix must not change
+    meanwhile.
+    """
+    global _FROZEN
+    if _FROZEN == 0:
+        for index in list(_INDEXES.values()):
+            index._checked.clear()
+    _FROZEN += 1
+    try:
+        yield
+    finally:
+        _FROZEN -= 1
+
+
+class FilesystemIndex(object):
+    """
+    Answers the queries of L{PrefixIndex} with the filesystem, used when the
+    index is disabled
+    """
+
+    def __init__(self, prefix):
+        self.prefix = str(prefix)
+
+    def exists(self, path):
+        return os.path.exists(os.path.join(self.prefix, path))
+
+    def isdir(self, path):
+        return os.path.isdir(os.path.join(self.prefix, path))
+
+    def glob(self, pattern, include_hidden=True):
+        if include_hidden:
+            prefix = Path(self.prefix)
+            return [p.relative_to(prefix).as_posix() for p in prefix.glob(pattern)]
+        found = glob.glob(Path(self.prefix, pattern).as_posix(), recursive=True)
+        return [Path(os.path.relpath(f, self.prefix)).as_posix() for f in found]
+
+    def walk_files(self, path):
+        files = []
+        for root, dirnames, filenames in os.walk(os.path.join(self.prefix, path)):
+            reldir = os.path.relpath(root, self.prefix)
+            files.extend([Path(reldir, x).as_posix() for x in filenames])
+        return files
+
+
+class PrefixIndex(object):
+    """
+    Lists the files of a prefix from memory, see the module documentation.
+
+    Paths are relative to the prefix and use forward slashes. The results
+    match the ones of L{FilesystemIndex}.
+
+    @ivar prefix: path of the prefix
+    @type prefix: str
+    @ivar dirs: relative path of a directory -> (mtime in ns or None if it
+                must be listed again, name -> FILE, DIR or LINK)
+    @type dirs: dict
+    """
+
+    def __init__(self, prefix):
+        self.prefix = str(prefix)
+        self.dirs = {}
+        self.dirty = False
+        self._checked = set()
+        self._lock = threading.RLock()
+
+    def _path(self, reldir):
+        return os.path.join(self.prefix, reldir) if reldir else self.prefix
+
+    def _entries(self, reldir):
+        """
+        @return: the entries of a directory, or None if it's not one
+        @rtype: dict
+        """
+        with self._lock:
+            cached = self.dirs.get(reldir)
+            if cached is not None and _FROZEN and reldir in self._checked:
+                return cached[1]
+            try:
+                st = os.stat(self._path(reldir))
+            except OSError:
+                st = None
+            if st is None or not stat.S_ISDIR(st.st_mode):
+                if self.dirs.pop(reldir, None) is not None:
+                    self.dirty = True
+                return None
+            if cached is None or cached[0] is None or cached[0] != st.st_mtime_ns:
+                entries = {}
+                try:
+                    with os.scandir(self._path(reldir)) as it:
+                        for entry in it:
+                            if entry.is_symlink():
+                                entries[entry.name] = LINK
+                            elif entry.is_dir(follow_symlinks=False):
+                                entries[entry.name] = DIR
+                            else:
+                                entries[entry.name] = FILE
+                except OSError:
+                    return None
+                mtime = st.st_mtime_ns
+                if time.time_ns() - mtime < RACY_WINDOW_NS:
+                    mtime = None
+                cached = (mtime, entries)
+                self.dirs[reldir] = cached
+                self.dirty = True
+            if _FROZEN:
+                self._checked.add(reldir)
+            return cached[1]
+
+    def _kind(self, path):
+        parent, _, name = path.rpartition('/')
+        entries = self._entries(parent)
+        if entries is None:
+            return None
+        if CASE_INSENSITIVE and name not in entries:
+            for n in entries:
+                if n.lower() == name.lower():
+                    return entries[n]
+        return entries.get(name)
+
+    @staticmethod
+    def _parts(path):
+        return [p for p in str(path).replace('\\', '/').split('/') if p not in ('', '.')]
+
+    @staticmethod
+    def _unindexed(path):
+        # Paths out of the prefix or going up are resolved by the filesystem
+        return os.path.isabs(path) or '..' in PrefixIndex._parts(path)
+
+    def _normpath(self, path):
+        return '/'.join(self._parts(path))
+
+    def exists(self, path):
+        """
+        @return: whether @path exists, following symbolic links
+        @rtype: bool
+        """
+        if self._unindexed(path):
+            return FilesystemIndex(self.prefix).exists(path)
+        path = self._normpath(path)
+        if not path:
+            return self._entries('') is not None
+        kind = self._kind(path)
+        if kind == LINK:
+            return os.path.exists(self._path(path))
+        return kind is not None
+
+    def isdir(self, path):
+        """
+        @return: whether @path is a directory, following symbolic links
+        @rtype: bool
+        """
+        if self._unindexed(path):
+            return FilesystemIndex(self.prefix).isdir(path)
+        path = self._normpath(path)
+        if not path:
+            return self._entries('') is not None
+        kind = self._kind(path)
+        if kind == LINK:
+            return os.path.isdir(self._path(path))
+        return kind == DIR
+
+    def glob(self, pattern, include_hidden=True):
+        """
+        Lists the paths matching a glob pattern, with the semantics of
+        pathlib.Path.glob(), or of glob.glob() if @include_hidden is False
+
+        @param pattern: the pattern, relative to the prefix
+        @type pattern: str
+        @param include_hidden: whether wildcards match names starting with a
+                               dot
+        @type include_hidden: bool
+        @return: the relative paths of the matches
+        @rtype: list
+        """
+        if self._unindexed(pattern):
+            return FilesystemIndex(self.prefix).glob(pattern, include_hidden)
+        parts = self._parts(pattern)
+        if not parts:
+            return []
+        # Go straight to the first directory with a wildcard, its parents
+        # don't need to be listed
+        i = 0
+        while i < len(parts) - 1 and not glob.has_magic(parts[i]):
+            i += 1
+        results = []
+        self._glob('/'.join(parts[:i]), parts[i:], include_hidden, results)
+        return list(dict.fromkeys(results))
+
+    def _join(self, reldir, name):
+        return reldir + '/' + name if reldir else name
+
+    def _is_dir_entry(self, reldir, name, kind):
+        if kind == LINK:
+            return os.path.isdir(self._path(self._join(reldir, name)))
+        return kind == DIR
+
+    def _glob(self, reldir, parts, include_hidden, results):
+        part, rest = parts[0], parts[1:]
+        if part == '**':
+            # Matches zero or more directories, and only directories when
+            # it's the last component
+            if rest:
+                self._glob(reldir, rest, include_hidden, results)
+            elif reldir:
+                results.append(reldir)
+            entries = self._entries(reldir) or {}
+            for name, kind in list(entries.items()):
+                if kind != DIR or (not include_hidden and name.startswith('.')):
+                    continue
+                self._glob(self._join(reldir, name), parts, include_hidden, results)
+            return
+        entries = self._entries(reldir)
+        if entries is None:
+            return
+        if not glob.has_magic(part) and not CASE_INSENSITIVE:
+            kind = entries.get(part)
+            if kind is None:
+                return
+            path = self._join(reldir, part)
+            if rest:
+                if self._is_dir_entry(reldir, part, kind):
+                    self._glob(path, rest, include_hidden, results)
+            elif kind != LINK or not include_hidden or os.path.exists(self._path(path)):
+                # Only glob.glob() returns broken symbolic links
+                results.append(path)
+            return
+        match, literal = _compile(part)
+        for name, kind in list(entries.items()):
+            key = name.lower() if CASE_INSENSITIVE else name
+            if literal and literal not in key:
+                continue
+            if not include_hidden and name.startswith('.') and not part.startswith('.'):
+                continue
+            if not match(key):
+                continue
+            if rest:
+                if self._is_dir_entry(reldir, name, kind):
+                    self._glob(self._join(reldir, name), rest, include_hidden, results)
+            else:
+                results.append(self._join(reldir, name))
+
+    def walk_files(self, path):
+        """
+        Lists the files of a directory recursively, like os.walk() does
+        without following the symbolic links to directories
+
+        @return: the relative paths of the files
+        @rtype: list
+        """
+        if self._unindexed(path):
+            return FilesystemIndex(self.prefix).walk_files(path)
+        files = []
+        stack = [self._normpath(path)]
+        while stack:
+            reldir = stack.pop()
+            entries = self._entries(reldir)
+            if entries is None:
+                continue
+            for name, kind in list(entries.items()):
+                child = self._join(reldir, name)
+                if kind == DIR:
+                    stack.append(child)
+                elif kind == FILE or not os.path.isdir(self._path(child)):
+                    files.append(child)
+        return files
+
+    def load(self, path):
+        """
+        Loads the listings saved with L{save}, which are checked like the
+        ones read from the prefix
+        """
+        try:
+            with open(path, 'rb') as f:
+                data = pickle.load(f)
+        except FileNotFoundError:
+            return
+        except Exception as ex:
+            m.warning(_('Could not load the prefix index from %s: %s') % (path, ex))
+            return
+        if data.get('version') != INDEX_VERSION or data.get('prefix') != self.prefix:
+            return
+        with self._lock:
+            for reldir, listing in data['dirs'].items():
+                self.dirs.setdefault(reldir, listing)
+
+    def save(self, path):
+        """
+        Saves the listings to reuse them in another process
+        """
+        with self._lock:
+            if not self.dirty:
+                return
+            dirs = {k: v for k, v in self.dirs.items() if v[0] is not None}
+            self.dirty = False
+        tmp = path + '.tmp'
+        try:
+            with open(tmp, 'wb') as f:
+                pickle.dump({'version': INDEX_VERSION, 'prefix': self.prefix, 'dirs': dirs}, f)
+            os.replace(tmp, path)
+        except OSError as ex:
+            m.warning(_('Could not save the prefix index to %s: %s') % (path, ex))
+
+
+def index_path(config):
+    """
+    @return: the path where the index of the prefix of @config is persisted
+    @rtype: str
+    """
+    name = os.path.splitext(os.path.basename(config.cache_file or 'default'))[0]
+    return os.path.join(config.home_dir, name + '.prefix-index')
+
+
+def get_index(config, prefix=None):
+    """
+    Gets the index shared by all the recipes for a prefix
+
+    @param config: the configuration
+    @type config: L{cerbero.config.Config}
+    @param prefix: the prefix, config.prefix by default
+    @type prefix: str
+    @return: a L{PrefixIndex}, or a L{FilesystemIndex} if the index is
+             disabled
+    """
+    prefix = str(prefix or config.prefix)
+    if not config.prefix_index:
+        return FilesystemIndex(prefix)
+    with _INDEXES_LOCK:
+        index = _INDEXES.get(prefix)
+        if index is None:
+            index = PrefixIndex(prefix)
+            _INDEXES[prefix] = index
+            if config.prefix_index_persist and prefix == str(config.prefix):
+                path = index_path(config)
+                index.load(path)
+                atexit.register(index.save, path)
+        return index
@@ -20,9 +20,9 @@ import os
 import logging
 import shutil
 import inspect
+import time
 import asyncio
 from functools import reduce
-from itertools import chain
 from pathlib import Path
 import re
 
@@ -116,6 +116,23 @@ def log_step_output(recipe, stepfunc):
         return wrapped
 
 
+async def run_step(stepfunc):
+    """
+    Runs a build step function. Synchronous step functions, like most
+    post-install steps, are run in a thread so that the event loop can keep
+    running the steps of other recipes in the meantime.
+
+    @param stepfunc: the step function
+    @type stepfunc: callable
+    """
+    if asyncio.iscoroutinefunction(stepfunc):
+        return await stepfunc()
+    ret = await asyncio.get_event_loop().run_in_executor(None, stepfunc)
+    if asyncio.iscoroutine(ret):
+        ret = await ret
+    return ret
+
+
 class MetaRecipe(type):
     """This metaclass modifies the base classes of a Recipe, adding 2 new
     base classes based on the class attributes 'stype' and 'btype'.
@@ -177,10 +194,12 @@ class BuildSteps(object):
 
     @classmethod
     def all_names(cls):
-        # In 3.13, __static_attributes__ is a new tuple attribute. Just ignore
-        # all attributes starting with __.
-        members = inspect.getmembers(cls, lambda x: isinstance(x, tuple) and x and not x[0].startswith('__'))
-        return tuple(e[1][1] for e in members)
+        if '_all_names' not in cls.__dict__:
+            # In 3.13, __static_attributes__ is a new tuple attribute. Just ignore
+            # all attributes starting with __.
+            members = inspect.getmembers(cls, lambda x: isinstance(x, tuple) and x and not x[0].startswith('__'))
+            cls._all_names = tuple(e[1][1] for e in members)
+        return cls._all_names
 
 
 class Recipe(FilesProvider, metaclass=MetaRecipe):
@@ -347,9 +366,11 @@ SOFTWARE LICENSE COMPLIANCE.\n\n"""
         Decorate build step functions with a function that sets self.logfile
         for each build step for this recipe
         """
-        steps = BuildSteps.all_names()
-        for name, func in inspect.getmembers(self, inspect.ismethod):
-            if name not in steps:
+        # Only look up the step names, inspect.getmembers() would evaluate
+        # every attribute of the recipe
+        for name in BuildSteps.all_names():
+            func = getattr(self, name, None)
+            if not inspect.ismethod(func):
                 continue
             setattr(self, name, log_step_output(self, func))
 
@@ -607,7 +628,7 @@ SOFTWARE LICENSE COMPLIANCE.\n\n"""
                 lib.name, lib.major, lib.minor, lib.micro, lib.libdir, self.config.target_platform, deps=dep_libs
             ).save()
 
-    def relocate_osx_libraries(self):
+    async def relocate_osx_libraries(self):
         """
         Make OSX libraries relocatable
         """
@@ -625,9 +646,9 @@ SOFTWARE LICENSE COMPLIANCE.\n\n"""
         # remove duplicates by symbolic links so we relocate libs only
         # once.
         for f in set([get_real_path(x) for x in self.files_list() if file_is_relocatable(x)]):
-            relocator.relocate_file(f)
+            await relocator.relocate_file(f)
 
-    def code_sign(self):
+    async def code_sign(self):
         """
         Codesign OSX build-tools binaries
         """
@@ -641,7 +662,7 @@ SOFTWARE LICENSE COMPLIANCE.\n\n"""
             return fp.split('/')[0] in ['bin']
 
         for f in set([get_real_path(x) for x in self.files_list() if file_is_bin(x)]):
-            shell.new_call(['codesign', '-f', '-s', '-', f], logfile=self.logfile, env=self.env)
+            await shell.async_new_call(['codesign', '-f', '-s', '-', f], logfile=self.logfile, env=self.env)
 
     def _symbolicable_files(self):
         """
@@ -650,7 +671,7 @@ SOFTWARE LICENSE COMPLIANCE.\n\n"""
         """
         return self.symbolicable_files()
 
-    def symbolicate(self):
+    async def symbolicate(self):
         """
         Generate symbols for dylibs and binaries
         """
@@ -662,18 +683,29 @@ SOFTWARE LICENSE COMPLIANCE.\n\n"""
             # No devel package on Android, Studio does its own stripping
             return
 
+        start = time.monotonic()
         auto_sym, manual_sym = self.symbolicable_files()
         auto_sym = dsymutil.symbolicable_files(auto_sym, self.config.prefix, self.config.target_platform)
         manual_sym = dsymutil.symbolicable_files(manual_sym, self.config.prefix, self.config.target_platform)
 
         if Platform.is_apple(self.config.target_platform):
             # generate dSYM for those we can, fish out the rest
-            dsymutil.symbolicate_macho_files(auto_sym, logfile=self.logfile, env=self.env)
+            total = len(auto_sym)
+            done = await dsymutil.symbolicate_macho_files(auto_sym, logfile=self.logfile, env=self.env)
         elif not self.using_msvc():
             # these are embedded automatically into the ELF/PE
-            dsymutil.symbolicate_gnu_files(chain(auto_sym, manual_sym), logfile=self.logfile, env=self.env)
+            total = len(auto_sym) + len(manual_sym)
+            done = await dsymutil.symbolicate_gnu_files(auto_sym + manual_sym, logfile=self.logfile, env=self.env)
             # Clear them, already symbolicated
             manual_sym = []
+        else:
+            total = done = 0
+        if total:
+            m.log(
+                f'Symbolicated {done} of {total} files in {time.monotonic() - start:.1f}s, '
+                f'{total - done} were already current',
+                logfile=self.logfile,
+            )
 
         if manual_sym:
             # for non-GNU platforms, we must fish out the dSYM/pdb
@@ -1141,9 +1173,7 @@ class BaseUniversalRecipe(object, metaclass=MetaUniversalRecipe):
             # Call the step function
             stepfunc = getattr(recipe, step)
             try:
-                ret = stepfunc()
-                if asyncio.iscoroutine(ret):
-                    await ret
+                await run_step(stepfunc)
             except FatalError as e:
                 e.arch = arch
                 raise e
@@ -1217,22 +1247,22 @@ class UniversalMergedRecipe(BaseUniversalRecipe, UniversalMergedFilesProvider):
     # This prevents getattr() from yielding over to the proxy recipe
     # (which will only handle arm64 due to alphabetical sorting).
 
-    def code_sign(self):
+    async def code_sign(self):
         for _arch, recipe in self._recipes.items():
-            recipe.code_sign()
+            await recipe.code_sign()
 
-    def relocate_osx_libraries(self):
+    async def relocate_osx_libraries(self):
         for _arch, recipe in self._recipes.items():
-            recipe.relocate_osx_libraries()
+            await recipe.relocate_osx_libraries()
 
-    def symbolicate(self):
+    async def symbolicate(self):
         if BuildSteps.DSYMUTIL in self.skip_steps:
             return
 
         archs = {k: Path(v.config.prefix) for k, v in self._recipes.items()}
 
         for _, recipe in self._recipes.items():
-            recipe.symbolicate()
+            await recipe.symbolicate()
 
         if len(archs) == 1:
             return
@@ -1247,7 +1277,7 @@ class UniversalMergedRecipe(BaseUniversalRecipe, UniversalMergedFilesProvider):
 
         # We must generate the dSYM from the fat binary
         # https://issues.chromium.org/issues/41243372#comment7
-        dsymutil.symbolicate_macho_files(auto_sym, logfile=self.logfile, env=self.env)
+        await dsymutil.symbolicate_macho_files(auto_sym, logfile=self.logfile, env=self.env)
         # The foo.dSYM/Contents/Resources/DWARF member must be
         # lipo'd, the rest can be copied in place
         # NOTE: the name of gst-dots-viewer (and other rustc-only, Meson-built
@@ -1285,7 +1315,7 @@ class UniversalMergedRecipe(BaseUniversalRecipe, UniversalMergedFilesProvider):
             dwarf_name = dwarf_dir.relative_to(output_dir)
             input_pairs = zip(*[f.joinpath(dwarf_name).glob('*') for f in symbol_srcs])
             for inputs in input_pairs:
-                shell.new_call(
+                await shell.async_new_call(
                     ['lipo', *inputs, '-create', '-output', canonical_name],
                     cmd_dir=dwarf_dir,
                     env=self.env,
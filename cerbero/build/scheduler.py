@@ -0,0 +1,170 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+from cerbero.errors import FatalError
+from cerbero.utils import _
+
+
+class BuildScheduler(object):
+    """
+    Schedules the recipes of a build as a DAG.
+
+    All the metrics used for prioritizing recipes are computed once when the
+    scheduler is created, and the recipes unblocked by a finished one are
+    found by decrementing an in-degree counter on its reverse dependencies,
+    so each completion is O(number of reverse dependencies).
+
+    @ivar deps: recipe name -> set of dependency names
+    @type deps: dict
+    @ivar rdeps: recipe name -> set of reverse dependency names
+    @type rdeps: dict
+    @ivar levels: recipe name -> topological level (0 for no dependencies)
+    @type levels: dict
+    @ivar critical_path: recipe name -> cost of the most expensive chain of
+                         recipes going from it to any of the final targets
+    @type critical_path: dict
+    @ivar priorities: recipe name -> scheduling priority
+    @type priorities: dict
+    @ivar targets: recipes that no other recipe depends on
+    @type targets: set
+    """
+
+    def __init__(self, deps, costs=None, built=None):
+        """
+        @param deps: recipe name -> iterable of dependency names
+        @type deps: dict
+        @param costs: recipe name -> estimated cost of building the recipe.
+                      Recipes without a cost are weighted 1.
+        @type costs: dict
+        @param built: recipes that are already built and must not be
+                      scheduled again
+        @type built: iterable
+        """
+        self.deps = {}
+        for name, ndeps in deps.items():
+            self.deps[name] = set(d for d in ndeps if d != name)
+        for name, ndeps in list(self.deps.items()):
+            for dep in ndeps:
+                self.deps.setdefault(dep, set())
+        self.rdeps = {name: set() for name in self.deps}
+        for name, ndeps in self.deps.items():
+            for dep in ndeps:
+                self.rdeps[dep].add(name)
+        self.costs = costs or {}
+        self.targets = set(name for name, rdeps in self.rdeps.items() if not rdeps)
+        self.order = self._topological_order()
+        self.levels = self._compute_levels()
+        self.critical_path = self._compute_critical_path()
+        self.priorities = {name: self.critical_path[name] * (len(self.rdeps[name]) + 1) for name in self.deps}
+        self._built = set()
+        self._pending = {name: len(ndeps) for name, ndeps in self.deps.items()}
+        self._ready = set(name for name, count in self._pending.items() if count == 0)
+        for name in built or []:
+            self._mark_built(name)
+
+    def cost(self, name):
+        return self.costs.get(name) or 1
+
+    def _topological_order(self):
+        pending = {name: len(ndeps) for name, ndeps in self.deps.items()}
+        current = sorted(name for name, count in pending.items() if count == 0)
+        order = []
+        while current:
+            order.extend(current)
+            unblocked = []
+            for name in current:
+                for rdep in self.rdeps[name]:
+                    pending[rdep] -= 1
+                    if pending[rdep] == 0:
+                        unblocked.append(rdep)
+            current = sorted(unblocked)
+        if len(order) != len(self.deps):
+            cycle = sorted(name for name, count in pending.items() if count != 0)
+            raise FatalError(_('Dependency Cycle: {0}'.format(', '.join(cycle))))
+        return order
+
+    def _compute_levels(self):
+        levels = {}
+        for name in self.order:
+            levels[name] = max((levels[dep] + 1 for dep in self.deps[name]), default=0)
+        return levels
+
+    def _compute_critical_path(self):
+        weights = {}
+        for name in reversed(self.order):
+            weights[name] = self.cost(name) + max((weights[r] for r in self.rdeps[name]), default=0)
+        return weights
+
+    def priority(self, name):
+        """
+        Gets the scheduling priority of a recipe, higher is more urgent.
+        Recipes on the critical path and recipes blocking many others go
+        first.
+
+        @param name: name of the recipe
+        @type name: str
+        @return: the priority of the recipe
+        @rtype: float
+        """
+        return self.priorities[name]
+
+    def is_built(self, name):
+        return name in self._built
+
+    def pop_ready(self):
+        """
+        Gets the recipes that can be built now and that haven't been
+        returned yet
+
+        @return: list of recipe names sorted by priority
+        @rtype: list
+        """
+        ready = sorted(self._ready, key=lambda x: (-self.priority(x), x))
+        self._ready.clear()
+        return ready
+
+    def done(self, name):
+        """
+        Marks a recipe as built
+
+        @param name: name of the recipe
+        @type name: str
+        @return: the recipes that became buildable because of it
+        @rtype: list
+        """
+        self._mark_built(name)
+        return self.pop_ready()
+
+    def _mark_built(self, name):
+        if name in self._built:
+            return
+        self._built.add(name)
+        self._ready.discard(name)
+        for rdep in self.rdeps[name]:
+            self._pending[rdep] -= 1
+            if self._pending[rdep] == 0 and rdep not in self._built:
+                self._ready.add(rdep)
+
+    def all_built(self, names=None):
+        """
+        Whether all the recipes in @names (all the targets by default) are
+        already built
+        """
+        if names is None:
+            names = self.targets
+        return all(name in self._built for name in names)
@@ -28,9 +28,11 @@ import asyncio
 from hashlib import sha256
 
 from cerbero.config import Distro, DistroVersion, Platform, DEFAULT_MIRRORS
-from cerbero.utils import git, svn, shell, N_
+from cerbero.utils import git, svn, shell, run_tasks, N_
 from cerbero.errors import FatalError, CommandError, InvalidRecipeError
 from cerbero.build.build import BuildType
+from cerbero.build.downloadstore import DownloadStore
+from cerbero.build.sourcecache import SourceTreeCache, source_tree_key
 import cerbero.utils.messages as m
 
 URL_TEMPLATES = {
@@ -174,7 +176,8 @@ class Source(object):
         for subproj_name, _ in downloads:
             subprojects.append(subproj_name)
         m.log(f'Downloading meson subprojects: {", ".join(subprojects)}', logfile=logfile)
-        for subproj_name, ((url, fallback_url), fpath, fhash) in downloads:
+
+        async def download(url, fallback_url, fpath, fhash):
             fallback_urls = self.get_fallback_urls(fpath)
             if fallback_url:
                 # Our mirror implementation assumes that the basename is the same
@@ -184,6 +187,12 @@ class Source(object):
             )
             self.verify(fpath, fhash)
 
+        # Concurrency is bounded by the shell semaphores
+        tasks = []
+        for subproj_name, ((url, fallback_url), fpath, fhash) in downloads:
+            tasks.append(asyncio.ensure_future(download(url, fallback_url, fpath, fhash)))
+        await run_tasks(tasks)
+
     async def meson_subprojects_extract(self, offline):
         logfile = get_logfile(self)
         subproj_dir = os.path.join(self.src_dir, 'subprojects')
@@ -359,6 +368,9 @@ class BaseTarball(object):
 
     async def fetch(self, redownload=False):
         fname = self._get_download_path(self.tarball_name)
+        store = self._get_download_store()
+        if store and not redownload and self._fetch_from_store(store, fname):
+            return
         if self.offline:
             if not os.path.isfile(fname):
                 msg = 'Offline mode: tarball {!r} not found in local sources ({})'
@@ -367,6 +379,10 @@ class BaseTarball(object):
             m.action(N_('Found %s at %s') % (self.url, fname), logfile=get_logfile(self))
             return
         os.makedirs(self.download_dir, exist_ok=True)
+        if redownload and os.path.exists(fname):
+            # The file can be a hard link of a blob of the store, which must
+            # not be overwritten in place
+            os.remove(fname)
         await shell.download(
             self.url,
             fname,
@@ -374,8 +390,45 @@ class BaseTarball(object):
             overwrite=redownload,
             logfile=get_logfile(self),
             fallback_urls=self.get_fallback_urls(self.url),
+            checksum=self.tarball_checksum if isinstance(self.tarball_checksum, str) else None,
+            segments=self.config.download_segments,
+            native=self.config.native_downloads,
         )
         self.verify(fname, self.tarball_checksum)
+        if store:
+            store.add(fname, self.tarball_checksum)
+
+    def _get_download_store(self):
+        """
+        @return: the store of the downloads, or None if it's disabled or the
+                 checksum of the tarball is unknown
+        @rtype: L{cerbero.build.downloadstore.DownloadStore}
+        """
+        if not self.config.download_store or not isinstance(self.tarball_checksum, str):
+            return None
+        return DownloadStore(self.config.download_store_dir)
+
+    def _fetch_from_store(self, store, fname):
+        """
+        Places the tarball from the store in @fname if it's not there yet
+
+        @return: whether @fname has the tarball
+        @rtype: bool
+        """
+        if os.path.isfile(fname) or not store.get(self.tarball_checksum):
+            return False
+        method = store.place(self.tarball_checksum, fname)
+        if self._checksum(fname) != self.tarball_checksum:
+            movedto = fname + '.failed-checksum'
+            os.replace(fname, movedto)
+            store.remove(self.tarball_checksum)
+            m.action(
+                N_('Checksum failed, tarball %s from the download store moved to %s') % (fname, movedto),
+                logfile=get_logfile(self),
+            )
+            return False
+        m.action(N_('Found %s in the download store (%s)') % (self.url, method), logfile=get_logfile(self))
+        return True
 
     @staticmethod
     def _checksum(fname):
@@ -451,17 +504,30 @@ class Tarball(BaseTarball, Source):
         fname = self._get_download_path(self.tarball_name)
         os.makedirs(self.download_dir, exist_ok=True)
 
+        store = self._get_download_store()
         cached_file = os.path.join(self.config.cached_sources, self.package_name, self.tarball_name)
-        if (
+        if store and not redownload and self._fetch_from_store(store, fname):
+            pass
+        elif (
             not redownload
             and os.path.isfile(cached_file)
             and self.verify(cached_file, self.tarball_checksum, fatal=False)
         ):
-            m.action(
-                N_('Copying cached tarball from %s to %s instead of %s') % (cached_file, fname, self.url),
-                logfile=get_logfile(self),
-            )
-            shutil.copy(cached_file, fname)
+            if store:
+                # The cached sources are only a source of blobs, they don't
+                # keep them in the store
+                store.add(cached_file, self.tarball_checksum, reference=False)
+                method = store.place(self.tarball_checksum, fname)
+                m.action(
+                    N_('Placed cached tarball %s in %s (%s) instead of %s') % (cached_file, fname, method, self.url),
+                    logfile=get_logfile(self),
+                )
+            else:
+                m.action(
+                    N_('Copying cached tarball from %s to %s instead of %s') % (cached_file, fname, self.url),
+                    logfile=get_logfile(self),
+                )
+                shutil.copy(cached_file, fname)
         else:
             await super().fetch(redownload=redownload)
         if issubclass(self.btype, BuildType.CARGO):
@@ -477,10 +543,14 @@ class Tarball(BaseTarball, Source):
                     await self.extract_impl(fetching=True)
                     self._extract_done.add(self.src_dir)
 
-    async def extract_impl(self, fetching=False):
-        m.action(N_('Extracting tarball to %s') % self.src_dir, logfile=get_logfile(self))
-        if os.path.exists(self.src_dir):
-            shutil.rmtree(self.src_dir)
+    async def extract_patched_tree(self, init_git=True):
+        """
+        Extracts the tarball in the source dir and applies the patches
+
+        @param init_git: whether to turn the source dir into a git repository
+                         even if the patches don't need it
+        @type init_git: bool
+        """
         unpack_dir = self.config.sources
         if self.tarball_is_bomb:
             unpack_dir = self.src_dir
@@ -491,14 +561,47 @@ class Tarball(BaseTarball, Source):
             # Since we just extracted this, a Windows anti-virus might still
             # have a lock on files inside it.
             shell.windows_proof_rename(extracted, self.src_dir)
-        git.init_directory(self.src_dir, logfile=get_logfile(self))
-        for patch in self.patches:
-            if not os.path.isabs(patch):
-                patch = self.relative_path(patch)
+        if init_git or (self.patches and self.strip == 1):
+            # The patches are applied with `git am`
+            git.init_directory(self.src_dir, logfile=get_logfile(self))
+        for patch in self._patches_paths():
             if self.strip == 1:
-                git.apply_patch(patch, self.src_dir, logfile=get_logfile(self))
+                await git.async_apply_patch(patch, self.src_dir, logfile=get_logfile(self))
             else:
-                shell.apply_patch(patch, self.src_dir, self.strip, logfile=get_logfile(self))
+                await shell.async_apply_patch(patch, self.src_dir, self.strip, logfile=get_logfile(self))
+
+    def _patches_paths(self):
+        return [p if os.path.isabs(p) else self.relative_path(p) for p in self.patches]
+
+    def _get_source_tree_cache(self):
+        """
+        @return: the cache of patched trees and the key of the tree of the
+                 recipe, or (None, None) if it's disabled or the checksum of
+                 the tarball is unknown
+        @rtype: tuple
+        """
+        if not self.config.source_tree_cache or not isinstance(self.tarball_checksum, str):
+            return None, None
+        key = source_tree_key(
+            self.tarball_checksum, self._patches_paths(), self.strip, self.tarball_dirname, self.tarball_is_bomb
+        )
+        return SourceTreeCache(self.config.source_tree_cache_dir), key
+
+    async def extract_impl(self, fetching=False):
+        m.action(N_('Extracting tarball to %s') % self.src_dir, logfile=get_logfile(self))
+        if os.path.exists(self.src_dir):
+            shutil.rmtree(self.src_dir)
+        cache, key = self._get_source_tree_cache()
+        if cache and cache.has(key):
+            cloned = await asyncio.to_thread(cache.place, key, self.src_dir)
+            m.log(
+                'Copied the patched tree from %s (%s)' % (cache.tree_path(key), 'reflinks' if cloned else 'copies'),
+                logfile=get_logfile(self),
+            )
+        else:
+            await self.extract_patched_tree(cache is None)
+            if cache:
+                await asyncio.to_thread(cache.add, key, self.src_dir)
         if issubclass(self.btype, BuildType.CARGO):
             await self.cargo_vendor(not fetching or self.offline)
         elif self.btype == BuildType.MESON and self.meson_subprojects:
@@ -569,7 +672,8 @@ class GitCache(Source):
                 git.add_remote(self.repo_dir, remote, url, logfile=get_logfile(self))
             # fetch remote branches
             if not self.offline:
-                await git.fetch(self.repo_dir, fail=False, logfile=get_logfile(self))
+                async with shell.host_semaphore(self.remotes['origin']):
+                    await git.fetch(self.repo_dir, fail=False, logfile=get_logfile(self))
         if checkout:
             await git.checkout(self.repo_dir, self.commit, logfile=get_logfile(self))
             if self.use_submodules:
@@ -627,9 +731,9 @@ class Git(GitCache):
                 patch = self.relative_path(patch)
 
             if self.strip == 1:
-                git.apply_patch(patch, self.src_dir, logfile=get_logfile(self))
+                await git.async_apply_patch(patch, self.src_dir, logfile=get_logfile(self))
             else:
-                shell.apply_patch(patch, self.src_dir, self.strip, logfile=get_logfile(self))
+                await shell.async_apply_patch(patch, self.src_dir, self.strip, logfile=get_logfile(self))
         if issubclass(self.btype, BuildType.CARGO):
             await self.cargo_vendor(not fetching or self.offline)
         elif self.btype == BuildType.MESON and self.meson_subprojects:
@@ -729,7 +833,7 @@ class Svn(Source):
         for patch in self.patches:
             if not os.path.isabs(patch):
                 patch = self.relative_path(patch)
-            shell.apply_patch(patch, self.src_dir, self.strip, logfile=get_logfile(self))
+            await shell.async_apply_patch(patch, self.src_dir, self.strip, logfile=get_logfile(self))
 
     def built_version(self):
         return '%s+svn~%s' % (self.version, svn.revision(self.repo_dir))
@@ -0,0 +1,170 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+"""
+Cache of extracted and patched source trees, shared by all the
+configurations.
+
+A tree is keyed on everything that determines its content: the checksum of
+the tarball and the patches applied on top of it. Extracting a tarball whose
+tree is in the cache is a copy of the tree, which shares the data blocks
+with the cache when the filesystem supports reflinks.
+
+Files are never hard linked, since the build steps of some recipes modify
+the sources in place.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+
+from cerbero.build.downloadstore import reflink
+
+# Bump when the way trees are extracted or patched changes
+CACHE_VERSION = 1
+
+
+def source_tree_key(tarball_checksum, patches, strip=1, tarball_dirname=None, tarball_is_bomb=False):
+    """
+    @param tarball_checksum: sha256 of the tarball
+    @type tarball_checksum: str
+    @param patches: paths of the patches applied on the tree, in order
+    @type patches: list
+    @param strip: number passed to the --strip 'patch' option
+    @type strip: int
+    @param tarball_dirname: the directory that the tarball contents extract to
+    @type tarball_dirname: str
+    @param tarball_is_bomb: whether the tarball extracts into the current dir
+    @type tarball_is_bomb: bool
+    @return: the key of the patched tree in the cache
+    @rtype: str
+    """
+    series = []
+    for patch in patches:
+        with open(patch, 'rb') as f:
+            series.append(hashlib.sha256(f.read()).hexdigest())
+    key = [CACHE_VERSION, tarball_checksum, series, strip, tarball_dirname, tarball_is_bomb]
+    return hashlib.sha256(json.dumps(key).encode('utf-8')).hexdigest()
+
+
+class _Cloner(object):
+    """
+    Copies files with a reflink, until the filesystem refuses one, and with a
+    regular copy after that
+    """
+
+    def __init__(self):
+        self.reflinks = True
+
+    def __call__(self, src, dest):
+        if self.reflinks:
+            if reflink(src, dest):
+                return dest
+            self.reflinks = False
+        return shutil.copy2(src, dest)
+
+
+def copy_tree(src, dest, ignore=None):
+    """
+    Copies a tree keeping the symbolic links and the mtimes, cloning the
+    files when the filesystem supports it
+
+    @param src: path of the tree
+    @type src: str
+    @param dest: path of the copy, which must not exist
+    @type dest: str
+    @param ignore: names to skip in the root of @src
+    @type ignore: list
+    @return: whether the files were cloned
+    @rtype: bool
+    """
+    ignore = set(ignore or [])
+
+    def _ignore(path, names):
+        if ignore and os.path.abspath(path) == os.path.abspath(src):
+            return [n for n in names if n in ignore]
+        return []
+
+    cloner = _Cloner()
+    shutil.copytree(src, dest, symlinks=True, ignore=_ignore, copy_function=cloner)
+    return cloner.reflinks
+
+
+class SourceTreeCache(object):
+    """
+    Cache of patched source trees
+
+    @ivar path: root of the cache
+    @type path: str
+    """
+
+    def __init__(self, path):
+        self.path = path
+
+    def tree_path(self, key):
+        """
+        @param key: key of the tree, see L{source_tree_key}
+        @type key: str
+        @return: path of the tree in the cache, which might not exist
+        @rtype: str
+        """
+        return os.path.join(self.path, key)
+
+    def has(self, key):
+        return os.path.isdir(self.tree_path(key))
+
+    def add(self, key, src_dir):
+        """
+        Adds a copy of a tree, without its git repository
+
+        @param key: key of the tree, see L{source_tree_key}
+        @type key: str
+        @param src_dir: path of the tree
+        @type src_dir: str
+        """
+        dest = self.tree_path(key)
+        if os.path.isdir(dest):
+            return
+        os.makedirs(self.path, exist_ok=True)
+        tmp = '%s.%d.tmp' % (dest, os.getpid())
+        if os.path.exists(tmp):
+            shutil.rmtree(tmp)
+        try:
+            copy_tree(src_dir, tmp, ignore=['.git'])
+            os.replace(tmp, dest)
+        except OSError:
+            # Another process added the same tree in the meantime
+            if os.path.exists(tmp):
+                shutil.rmtree(tmp)
+            if not os.path.isdir(dest):
+                raise
+
+    def place(self, key, dest):
+        """
+        Copies a tree of the cache in @dest
+
+        @param key: key of the tree, see L{source_tree_key}
+        @type key: str
+        @param dest: where to copy the tree, which must not exist
+        @type dest: str
+        @return: whether the files were cloned instead of copied
+        @rtype: bool
+        """
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        return copy_tree(self.tree_path(key), dest)
@@ -0,0 +1,173 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import errno
+import filecmp
+import os
+import shutil
+
+from cerbero.build import build
+from cerbero.enums import Platform
+from cerbero.errors import FatalError
+from cerbero.utils import _
+
+
+STAGING_DIR = '.staging'
+# Build systems that are known to honour DESTDIR in their install step
+STAGED_BUILD_TYPES = (build.Autotools, build.CMake, build.Meson)
+
+
+def can_stage(recipe):
+    """
+    Whether the install step of a recipe can be done in a staging root with
+    DESTDIR. Only the recipes that opt in with C{allow_staged_install} and
+    use the install step of a build system that supports DESTDIR can be
+    staged, not the ones overriding it, which can write anywhere in the
+    prefix.
+
+    @param recipe: the recipe
+    @type recipe: L{cerbero.build.recipe.Recipe}
+    @rtype: bool
+    """
+    # DESTDIR can't be prepended to a prefix with a drive letter
+    if recipe.config.platform == Platform.WINDOWS:
+        return False
+    if not getattr(recipe, 'allow_staged_install', False):
+        return False
+    if not isinstance(recipe, STAGED_BUILD_TYPES):
+        return False
+    for cls in type(recipe).__mro__:
+        if 'install' in cls.__dict__:
+            return cls in (build.MakefilesBase, build.Meson)
+    return False
+
+
+def _has_files(path):
+    for dirpath, dirnames, filenames in os.walk(path):
+        if filenames or any(os.path.islink(os.path.join(dirpath, d)) for d in dirnames):
+            return True
+    return False
+
+
+class StagedInstall(object):
+    """
+    Installs a recipe in its own staging root and merges the result in the
+    prefix, which lets recipes install in parallel and tells exactly which
+    files each recipe installed.
+
+    @ivar destdir: the DESTDIR used for the install step
+    @type destdir: str
+    @ivar root: where the prefix is inside L{destdir}
+    @type root: str
+    """
+
+    def __init__(self, recipe):
+        self.recipe_name = recipe.name
+        self.prefix = os.path.abspath(recipe.config.prefix)
+        self.destdir = os.path.join(recipe.config.sources, STAGING_DIR, recipe.name)
+        self.root = os.path.join(self.destdir, self.prefix.lstrip(os.sep))
+
+    def prepare(self):
+        """
+        Creates an empty staging root
+        """
+        self.clean()
+        os.makedirs(self.destdir)
+
+    def clean(self):
+        shutil.rmtree(self.destdir, ignore_errors=True)
+
+    def files(self):
+        """
+        @return: the files installed in the staging root, relative to the prefix
+        @rtype: list
+        """
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            reldir = os.path.relpath(dirpath, self.root)
+            # Symlinks to directories are moved as files
+            for d in list(dirnames):
+                if os.path.islink(os.path.join(dirpath, d)):
+                    dirnames.remove(d)
+                    filenames.append(d)
+            for f in filenames:
+                files.append(os.path.normpath(os.path.join(reldir, f)))
+        return sorted(files)
+
+    def collisions(self, files, owners):
+        """
+        Finds the files that were already installed by another recipe with a
+        different content
+
+        @param files: files installed in the staging root
+        @type files: list
+        @param owners: file -> recipe that installed it
+        @type owners: dict
+        @return: file -> recipe that installed it, for each collision
+        @rtype: dict
+        """
+        collisions = {}
+        for f in files:
+            owner = owners.get(f)
+            if owner is None or owner == self.recipe_name:
+                continue
+            staged = os.path.join(self.root, f)
+            installed = os.path.join(self.prefix, f)
+            if os.path.islink(staged) and os.path.islink(installed):
+                if os.readlink(staged) == os.readlink(installed):
+                    continue
+            elif os.path.isfile(installed) and not os.path.islink(installed):
+                if filecmp.cmp(staged, installed, shallow=False):
+                    continue
+            elif not os.path.lexists(installed):
+                continue
+            collisions[f] = owner
+        return collisions
+
+    def merge(self, files):
+        """
+        Moves the files of the staging root to the prefix and removes the
+        staging root
+
+        @param files: files installed in the staging root
+        @type files: list
+        """
+        for f in files:
+            src = os.path.join(self.root, f)
+            dst = os.path.join(self.prefix, f)
+            os.makedirs(os.path.dirname(dst), exist_ok=True)
+            if os.path.islink(dst) or (os.path.lexists(dst) and not os.path.isdir(dst)):
+                os.remove(dst)
+            elif os.path.isdir(dst) and os.path.islink(src):
+                # A symlink to a directory replacing a directory, only if
+                # that doesn't remove the files installed in it
+                if _has_files(dst):
+                    raise FatalError(_('Can not replace the directory %s with a symlink, it is not empty') % dst)
+                shutil.rmtree(dst)
+            try:
+                os.replace(src, dst)
+            except OSError as e:
+                # The staging root is in another filesystem
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.move(src, dst)
+        # Empty directories are part of the install too
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            reldir = os.path.relpath(dirpath, self.root)
+            os.makedirs(os.path.join(self.prefix, reldir), exist_ok=True)
+        self.clean()
@@ -0,0 +1,281 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import json
+import os
+import pickle
+import sqlite3
+import tempfile
+
+from cerbero.utils import _
+from cerbero.utils import messages as m
+
+
+SQLITE_MAGIC = b'SQLite format 3\x00'
+# How long to wait for other cerbero processes holding a write lock
+LOCK_TIMEOUT = 60
+
+
+class StatusStore(object):
+    """
+    Stores the build status of the recipes of a L{cerbero.build.cookbook.CookBook}
+    in an sqlite database, one row per recipe.
+
+    Each status update only rewrites the row of the recipe it affects inside
+    a transaction, so an interrupted build can't corrupt the status of the
+    other recipes, and other cerbero processes can read the status while a
+    build is running.
+
+    It also records the files installed by each recipe whose install step
+    was staged, see L{cerbero.build.staging}.
+
+    Status files written by older versions of cerbero with pickle are
+    converted on first access.
+    """
+
+    SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS status ('
+        'recipe TEXT PRIMARY KEY, steps TEXT, needs_build INTEGER, mtime REAL, '
+        'filepath TEXT, built_version TEXT, file_hash BLOB)'
+    )
+
+    FILES_SCHEMA = (
+        'CREATE TABLE IF NOT EXISTS files (path TEXT PRIMARY KEY, recipe TEXT)',
+        'CREATE INDEX IF NOT EXISTS files_recipe ON files (recipe)',
+    )
+
+    def __init__(self, path):
+        self.path = path
+
+    @staticmethod
+    def _is_pickle(path):
+        with open(path, 'rb') as f:
+            header = f.read(len(SQLITE_MAGIC))
+        return header and header != SQLITE_MAGIC
+
+    def _connect(self, path=None):
+        conn = sqlite3.connect(path or self.path, timeout=LOCK_TIMEOUT)
+        conn.execute(self.SCHEMA)
+        for schema in self.FILES_SCHEMA:
+            conn.execute(schema)
+        return conn
+
+    def _migrate(self):
+        try:
+            with open(self.path, 'rb') as f:
+                status = pickle.load(f)
+        except Exception:
+            m.warning(_('Could not recover status'))
+            status = {}
+        m.message(_('Converting the recipes status in %s to the new format') % self.path)
+        self.replace(status)
+
+    def _ensure(self):
+        if os.path.isfile(self.path) and self._is_pickle(self.path):
+            self._migrate()
+        else:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+
+    @staticmethod
+    def _to_row(recipe_name, status):
+        return (
+            recipe_name,
+            json.dumps(status.steps),
+            int(status.needs_build),
+            status.mtime,
+            getattr(status, 'filepath', None),
+            status.built_version,
+            getattr(status, 'file_hash', 0),
+        )
+
+    @staticmethod
+    def _from_row(row):
+        # Imported here to avoid a circular import with cerbero.build.cookbook
+        from cerbero.build.cookbook import RecipeStatus
+
+        recipe_name, steps, needs_build, mtime, filepath, built_version, file_hash = row
+        return recipe_name, RecipeStatus(
+            filepath,
+            steps=json.loads(steps),
+            needs_build=bool(needs_build),
+            mtime=mtime,
+            built_version=built_version,
+            file_hash=file_hash,
+        )
+
+    def load(self):
+        """
+        Loads the status of all the recipes
+
+        @return: recipe name -> L{cerbero.build.cookbook.RecipeStatus}
+        @rtype: dict
+        """
+        if not os.path.isfile(self.path):
+            return {}
+        self._ensure()
+        conn = self._connect()
+        try:
+            return dict(self._from_row(r) for r in conn.execute('SELECT * FROM status'))
+        finally:
+            conn.close()
+
+    def get(self, recipe_name):
+        """
+        Loads the status of a single recipe
+
+        @return: the status or None if the recipe has no status
+        @rtype: L{cerbero.build.cookbook.RecipeStatus}
+        """
+        if not os.path.isfile(self.path):
+            return None
+        self._ensure()
+        conn = self._connect()
+        try:
+            row = conn.execute('SELECT * FROM status WHERE recipe = ?', (recipe_name,)).fetchone()
+        finally:
+            conn.close()
+        if row is None:
+            return None
+        return self._from_row(row)[1]
+
+    def update(self, status):
+        """
+        Saves the status of some recipes in a single transaction, leaving the
+        status of the other recipes untouched
+
+        @param status: recipe name -> L{cerbero.build.cookbook.RecipeStatus}
+        @type status: dict
+        """
+        self._ensure()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.executemany(
+                    'INSERT OR REPLACE INTO status VALUES (?, ?, ?, ?, ?, ?, ?)',
+                    [self._to_row(name, s) for name, s in status.items()],
+                )
+        finally:
+            conn.close()
+
+    def delete(self, recipe_name):
+        """
+        Removes the status of a recipe
+
+        @param recipe_name: name of the recipe
+        @type recipe_name: str
+        """
+        if not os.path.isfile(self.path):
+            return
+        self._ensure()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM status WHERE recipe = ?', (recipe_name,))
+        finally:
+            conn.close()
+
+    def get_files(self, recipe_name):
+        """
+        Loads the files installed by a recipe
+
+        @param recipe_name: name of the recipe
+        @type recipe_name: str
+        @return: the files relative to the prefix, or None if they were not
+                 recorded
+        @rtype: list
+        """
+        if not os.path.isfile(self.path):
+            return None
+        self._ensure()
+        conn = self._connect()
+        try:
+            rows = conn.execute('SELECT path FROM files WHERE recipe = ? ORDER BY path', (recipe_name,)).fetchall()
+        finally:
+            conn.close()
+        return [r[0] for r in rows] or None
+
+    def get_files_owners(self, files):
+        """
+        Finds which recipes installed some files
+
+        @param files: files relative to the prefix
+        @type files: list
+        @return: file -> name of the recipe that installed it
+        @rtype: dict
+        """
+        if not files or not os.path.isfile(self.path):
+            return {}
+        self._ensure()
+        conn = self._connect()
+        owners = {}
+        try:
+            # Stay below the maximum number of host parameters of sqlite
+            for i in range(0, len(files), 500):
+                chunk = files[i : i + 500]
+                query = 'SELECT path, recipe FROM files WHERE path IN ({})'.format(','.join('?' * len(chunk)))
+                owners.update(conn.execute(query, chunk))
+        finally:
+            conn.close()
+        return owners
+
+    def set_files(self, recipe_name, files):
+        """
+        Records the files installed by a recipe, replacing the ones recorded
+        before. A file can only belong to a single recipe.
+
+        @param recipe_name: name of the recipe
+        @type recipe_name: str
+        @param files: files relative to the prefix
+        @type files: list
+        """
+        self._ensure()
+        conn = self._connect()
+        try:
+            with conn:
+                conn.execute('DELETE FROM files WHERE recipe = ?', (recipe_name,))
+                conn.executemany('INSERT OR REPLACE INTO files VALUES (?, ?)', [(f, recipe_name) for f in files])
+        finally:
+            conn.close()
+
+    def replace(self, status):
+        """
+        Replaces the status of all the recipes. The new database is written
+        to a temporary file and moved in place, so readers either see the old
+        or the new status.
+
+        @param status: recipe name -> L{cerbero.build.cookbook.RecipeStatus}
+        @type status: dict
+        """
+        dirname = os.path.dirname(self.path)
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dirname, prefix=os.path.basename(self.path))
+        os.close(fd)
+        try:
+            conn = self._connect(tmp)
+            try:
+                with conn:
+                    conn.executemany(
+                        'INSERT INTO status VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        [self._to_row(name, s) for name, s in status.items()],
+                    )
+            finally:
+                conn.close()
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.remove(tmp)
+            raise
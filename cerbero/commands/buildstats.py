@@ -0,0 +1,95 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import datetime
+
+from cerbero.commands import Command, register_command
+from cerbero.build.buildstats import BuildStats
+from cerbero.utils import _, N_, ArgparseArgument
+from cerbero.utils import messages as m
+
+
+class ShowBuildStats(Command):
+    doc = N_('List the slowest recipes and build steps of previous builds')
+    name = 'build-stats'
+
+    def __init__(self):
+        Command.__init__(
+            self,
+            [
+                ArgparseArgument('recipes', nargs='*', help=_('only show these recipes')),
+                ArgparseArgument(
+                    '--steps', action='store_true', default=False, help=_('list build steps instead of recipes')
+                ),
+                ArgparseArgument(
+                    '--all-configs',
+                    action='store_true',
+                    default=False,
+                    help=_('show the stats of all the configurations, not only the current one'),
+                ),
+                ArgparseArgument(
+                    '-n', '--limit', type=int, default=20, help=_('number of entries to show, 0 to show all')
+                ),
+            ],
+        )
+
+    def run(self, config, args):
+        build_stats = BuildStats(config)
+        if args.all_configs:
+            all_stats = build_stats.all_configs()
+        else:
+            all_stats = {build_stats.config_key: build_stats.stats}
+
+        rows = []
+        for config_key, recipes in all_stats.items():
+            for recipe_name, steps in recipes.items():
+                if args.recipes and recipe_name not in args.recipes:
+                    continue
+                if args.steps:
+                    for step, s in steps.items():
+                        rows.append((s.average, s.last, s.count, config_key, '%s:%s' % (recipe_name, step)))
+                else:
+                    average = sum(s.average for s in steps.values())
+                    last = sum(s.last for s in steps.values())
+                    count = max(s.count for s in steps.values())
+                    rows.append((average, last, count, config_key, recipe_name))
+
+        if not rows:
+            m.message(_('No build stats found'))
+            return
+
+        rows.sort(reverse=True)
+        if args.limit > 0:
+            rows = rows[: args.limit]
+
+        def fmt(seconds):
+            return str(datetime.timedelta(seconds=int(seconds)))
+
+        name_len = max(len(r[4]) for r in rows)
+        header = '%-*s  %10s  %10s  %5s' % (name_len, _('name'), _('average'), _('last'), _('runs'))
+        if args.all_configs:
+            header += '  ' + _('config')
+        m.message(header)
+        for average, last, count, config_key, name in rows:
+            line = '%-*s  %10s  %10s  %5d' % (name_len, name, fmt(average), fmt(last), count)
+            if args.all_configs:
+                line += '  ' + config_key
+            m.message(line)
+
+
+register_command(ShowBuildStats)
@@ -20,16 +20,16 @@ import os
 import sys
 import json
 import tempfile
-import pickle
 import shutil
 import shlex
 from hashlib import sha256
 from pathlib import Path
 
 from cerbero.commands import Command, register_command
+from cerbero.build.statusstore import StatusStore
 from cerbero.enums import Platform, Distro
 from cerbero.errors import FatalError
-from cerbero.utils import N_, ArgparseArgument, git, shell, run_until_complete
+from cerbero.utils import N_, ArgparseArgument, filetype, git, shell, run_until_complete
 from cerbero.utils import messages as m
 from cerbero.utils.tar import Tar
 
@@ -201,10 +201,7 @@ class FetchCache(BaseCache):
         fileext = os.path.splitext(filename)[1]
         if '.dylib' in fileext:
             return True
-        filedesc = shell.check_output(['file', '-bh', filename])
-        if fileext == '.a' and 'ar archive' in filedesc:
-            return False
-        return filedesc.startswith('Mach-O')
+        return filetype.is_macho(filename)
 
     @staticmethod
     def _list_shared_libraries(object_file):
@@ -253,13 +250,8 @@ class FetchCache(BaseCache):
         prefix. Currently, this is just Meson in build-tools.
         """
         cache_file = Path(config.home_dir, config.build_tools_cache).as_posix()
-        with open(cache_file, 'rb+') as f:
-            p = pickle.load(f)
-            # Reset the recipe status
-            del p['meson']
-            f.seek(0)
-            f.truncate(0)
-            pickle.dump(p, f)
+        # Reset the recipe status
+        StatusStore(cache_file).delete('meson')
 
     def relocate_prefix(self, config):
         """
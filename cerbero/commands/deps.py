@@ -53,7 +53,8 @@ class Deps(Command):
         if all_deps:
             recipes = cookbook.list_recipe_deps(recipe_name)
         else:
-            recipes = [cookbook.get_recipe(x) for x in cookbook.get_recipe(recipe_name).list_deps()]
+            recipe = cookbook.get_recipe(recipe_name)
+            recipes = [cookbook.get_recipe(x) for x in cookbook.get_dependency_graph().deps[recipe.name]]
 
         if len(recipes) == 0:
             m.message(_('%s has 0 dependencies') % recipe_name)
@@ -71,7 +72,7 @@ class Deps(Command):
                     already_shown = []
                 m.message('%s%s' % (' ' * 3 * level, recipe.name))
                 already_shown.append(recipe)
-                for r in [cookbook.get_recipe(x) for x in recipe.list_deps()]:
+                for r in [cookbook.get_recipe(x) for x in cookbook.get_dependency_graph().deps[recipe.name]]:
                     if r not in already_shown:
                         print_dep(cookbook, r, level + 1, already_shown)
                     elif not r.name == recipe.name:
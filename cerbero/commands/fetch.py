@@ -17,6 +17,7 @@
 # Boston, MA 02111-1307, USA.
 
 import asyncio
+import concurrent.futures
 
 from cerbero.commands import Command, register_command
 from cerbero.build.cookbook import CookBook
@@ -30,6 +31,8 @@ from cerbero.utils import (
     shell,
     determine_num_of_cpus,
     run_until_complete,
+    run_tasks,
+    CerberoSemaphore,
 )
 from cerbero.utils import messages as m
 from cerbero.utils.shell import BuildStatusPrinter
@@ -73,10 +76,19 @@ class Fetch(Command):
                 help=_('number of async jobs'),
             )
         )
+        args.append(
+            ArgparseArgument(
+                '--jobs-per-host',
+                action='store',
+                type=int,
+                default=shell.MAX_CALLS_PER_HOST,
+                help=_('maximum number of concurrent downloads from the same host'),
+            )
+        )
         Command.__init__(self, args)
 
     @staticmethod
-    async def fetch(cookbook, recipes, no_deps, reset_rdeps, full_reset, print_only, jobs):
+    async def fetch(cookbook, recipes, no_deps, reset_rdeps, full_reset, print_only, jobs, jobs_per_host=None):
         fetch_recipes = []
         if not recipes:
             fetch_recipes = cookbook.get_recipes_list()
@@ -88,38 +100,50 @@ class Fetch(Command):
             % (jobs, ' '.join([x.name for x in fetch_recipes]))
         )
         shell.set_max_non_cpu_bound_calls(jobs)
+        if jobs_per_host:
+            shell.set_max_calls_per_host(jobs_per_host)
         to_rebuild = []
         printer = BuildStatusPrinter(('fetch',), cookbook.get_config().interactive)
         printer.total = len(fetch_recipes)
 
-        async def fetch_print_wrapper(recipe_name, stepfunc):
-            printer.update_recipe_step(printer.count, recipe_name, 'fetch')
-            await stepfunc()
-            printer.count += 1
-            printer.remove_recipe(recipe_name)
+        # Bounds the number of recipes being fetched at the same time, the
+        # network operations are further limited by the shell semaphores
+        semaphore = CerberoSemaphore(jobs)
+
+        async def fetch_print_wrapper(recipe):
+            async with semaphore:
+                printer.update_recipe_step(printer.count, recipe.name, 'fetch')
+                stepfunc = getattr(recipe, 'fetch')
+                if asyncio.iscoroutinefunction(stepfunc):
+                    await stepfunc()
+                else:
+                    stepfunc()
+                printer.count += 1
+                printer.remove_recipe(recipe.name)
 
+        tasks = []
         for recipe in fetch_recipes:
             if print_only:
                 # For now just print tarball URLs
                 if isinstance(recipe, Tarball):
                     m.message('TARBALL: {} {}'.format(recipe.url, recipe.tarball_name))
                 continue
-            stepfunc = getattr(recipe, 'fetch')
-            if asyncio.iscoroutinefunction(stepfunc):
-                await fetch_print_wrapper(recipe.name, stepfunc)
-            else:
-                printer.update_recipe_step(printer.count, recipe.name, 'fetch')
-                stepfunc()
-                printer.count += 1
-                printer.remove_recipe(recipe.name)
+            tasks.append(asyncio.ensure_future(fetch_print_wrapper(recipe)))
+        await run_tasks(tasks)
 
         m.message('All async fetch jobs finished')
 
         # Checking the current built version against the fetched one
-        # needs to be done *after* actually fetching
-        for recipe in fetch_recipes:
+        # needs to be done *after* actually fetching. Getting the current
+        # version means running git for each recipe, so do it in threads and
+        # only update the cookbook from here.
+        loop = asyncio.get_event_loop()
+        with concurrent.futures.ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+            current_versions = await asyncio.gather(
+                *[loop.run_in_executor(executor, recipe.built_version) for recipe in fetch_recipes]
+            )
+        for recipe, cv in zip(fetch_recipes, current_versions):
             bv = cookbook.recipe_built_version(recipe.name)
-            cv = recipe.built_version()
             if bv != cv:
                 # On different versions, only reset recipe if:
                 #  * forced
@@ -167,7 +191,14 @@ class FetchRecipes(Fetch):
             else:
                 recipes.append(recipe)
         task = self.fetch(
-            cookbook, recipes, args.no_deps, args.reset_rdeps, args.full_reset, args.print_only, args.jobs
+            cookbook,
+            recipes,
+            args.no_deps,
+            args.reset_rdeps,
+            args.full_reset,
+            args.print_only,
+            args.jobs,
+            args.jobs_per_host,
         )
         return run_until_complete(task)
 
@@ -198,6 +229,7 @@ class FetchPackage(Fetch):
             args.full_reset,
             args.print_only,
             args.jobs,
+            args.jobs_per_host,
         )
         return run_until_complete(task)
 
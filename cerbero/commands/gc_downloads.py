@@ -0,0 +1,54 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+from cerbero.build.downloadstore import DownloadStore
+from cerbero.commands import Command, register_command
+from cerbero.utils import _, N_, ArgparseArgument
+import cerbero.utils.messages as m
+
+
+class GCDownloads(Command):
+    doc = N_('Evicts the tarballs of the download store that are not used by any download dir')
+    name = 'gc-downloads'
+
+    def __init__(self):
+        Command.__init__(
+            self,
+            [
+                ArgparseArgument(
+                    '--dry-run',
+                    action='store_true',
+                    default=False,
+                    help=_('only list the tarballs that would be evicted'),
+                ),
+            ],
+        )
+
+    def run(self, config, args):
+        store = DownloadStore(config.download_store_dir)
+        evicted = store.gc(dry_run=args.dry_run)
+        for checksum, size in evicted:
+            m.action(_('Unused tarball: %s (%.1f MiB)') % (store.blob_path(checksum), size / 1048576))
+        size = sum(size for checksum, size in evicted)
+        if args.dry_run:
+            m.message(_('%d tarballs would be evicted, %.1f MiB') % (len(evicted), size / 1048576))
+        else:
+            m.message(_('%d tarballs evicted, %.1f MiB freed') % (len(evicted), size / 1048576))
+
+
+register_command(GCDownloads)
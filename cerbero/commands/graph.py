@@ -106,7 +106,7 @@ class Graph(Command):
             already_parsed = []
         already_parsed.append(name)
         if graph_type == GraphType.RECIPE:
-            deps = self.cookbook.get_recipe(name).list_deps()
+            deps = self.cookbook.get_dependency_graph().deps[self.cookbook.get_recipe(name).name]
         elif graph_type == GraphType.PACKAGE:
             deps = [p.name for p in self.package_store.get_package_deps(name)]
         elif graph_type == GraphType.PACKAGE_RECIPES:
@@ -32,6 +32,12 @@ class RDeps(Command):
             self,
             [
                 ArgparseArgument('recipe', nargs=1, help=_('name of the recipe')),
+                ArgparseArgument(
+                    '--all',
+                    action='store_true',
+                    default=False,
+                    help=_('list all reverse dependencies, including the indirect ones'),
+                ),
             ],
         )
 
@@ -39,7 +45,7 @@ class RDeps(Command):
         cookbook = CookBook(config)
         recipe_name = args.recipe[0]
 
-        recipes = cookbook.list_recipe_reverse_deps(recipe_name)
+        recipes = cookbook.list_recipe_reverse_deps(recipe_name, args.all)
         if len(recipes) == 0:
             m.error(_('%s has 0 reverse dependencies') % recipe_name)
             return
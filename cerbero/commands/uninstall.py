@@ -0,0 +1,71 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+import os
+
+from cerbero.commands import Command, register_command
+from cerbero.build.cookbook import CookBook
+from cerbero.errors import FatalError
+from cerbero.utils import _, N_, ArgparseArgument
+from cerbero.utils import messages as m
+
+
+class Uninstall(Command):
+    doc = N_('Removes the files installed by a recipe from the prefix')
+    name = 'uninstall'
+
+    def __init__(self):
+        Command.__init__(
+            self,
+            [
+                ArgparseArgument('recipe', nargs='+', help=_('name of the recipe(s) to uninstall')),
+            ],
+        )
+
+    def run(self, config, args):
+        cookbook = CookBook(config)
+        for recipe_name in args.recipe:
+            recipe = cookbook.get_recipe(recipe_name)
+            files = cookbook.get_recipe_files(recipe.name)
+            if files is None:
+                raise FatalError(
+                    _('The files installed by %s were not recorded, it must be rebuilt first') % recipe.name
+                )
+            self.uninstall(config.prefix, files)
+            cookbook.set_recipe_files(recipe.name, [])
+            cookbook.reset_recipe_status(recipe.name)
+            m.message(_('Removed %d files installed by %s') % (len(files), recipe.name))
+
+    @staticmethod
+    def uninstall(prefix, files):
+        dirs = set()
+        for f in files:
+            path = os.path.join(prefix, f)
+            if os.path.islink(path) or os.path.isfile(path):
+                os.remove(path)
+            dirs.add(os.path.dirname(path))
+        # Remove the directories left empty, deepest first
+        for d in sorted(dirs, key=len, reverse=True):
+            while d.startswith(os.path.join(prefix, '')):
+                try:
+                    os.rmdir(d)
+                except OSError:
+                    break
+                d = os.path.dirname(d)
+
+
+register_command(Uninstall)
@@ -29,7 +29,7 @@ from cerbero.enums import Architecture, Subsystem, Platform, Distro, DistroVersi
 from cerbero.errors import FatalError, ConfigurationError
 from cerbero.utils import _, system_info, validate_packager, shell
 from cerbero.utils import to_unixpath, to_winepath, parse_file, detect_qt5, detect_qt6
-from cerbero.utils import merge_str_env, merge_env_value_env
+from cerbero.utils import merge_str_env, merge_env_value_env, EnvValue
 from cerbero.utils import messages as m
 from cerbero.ide.pkgconfig import PkgConfig
 from cerbero.ide.vs.env import get_vs_year_version
@@ -203,6 +203,16 @@ class Variants(object):
     def bools(self):
         return sorted(self.__bool_variants)
 
+    def fingerprint(self):
+        """
+        @return: the values of all the variants, to know when they change
+        @rtype: tuple
+        """
+        values = self.__dict__
+        return tuple(values.get(v) for v in self.__bool_variants) + tuple(
+            values.get(v) for v in self.__mapping_variants
+        )
+
     def mappings(self):
         return sorted(self.__mapping_variants)
 
@@ -333,6 +343,22 @@ class Config(object):
         'qt6_qmake_path',
         'system_build_tools',
         'cmake_system_version',
+        'artifacts_cache_dir',
+        'artifacts_cache_url',
+        'artifacts_cache_max_size',
+        'artifacts_cache_upload',
+        'meson_incremental_configure',
+        'wheel_use_pip',
+        'deb_direct_writer',
+        'deb_compression',
+        'prefix_index',
+        'prefix_index_persist',
+        'download_store',
+        'download_store_dir',
+        'native_downloads',
+        'download_segments',
+        'source_tree_cache',
+        'source_tree_cache_dir',
     ]
 
     _deprecated_properties = [
@@ -349,6 +375,12 @@ class Config(object):
         self.py_prefix = ''
         self.py_plat_prefix = ''
         self.py_win_prefix = ''
+        # Fingerprint of the environment set up by do_setup_env()
+        self._setup_env_fingerprint = None
+        # (prefix, libdir, fingerprint) -> (config_env, environment)
+        self._env_cache = {}
+        # Environment and its values converted to EnvValue objects
+        self._env_values = (None, None)
 
         for a in self._properties:
             setattr(self, a, None)
@@ -534,6 +566,11 @@ class Config(object):
             self.allow_system_recipes = False
 
     def do_setup_env(self):
+        # The cookbook sets up the environment before loading each recipe,
+        # only do it again if something it depends on changed
+        fingerprint = (self._env_fingerprint(), self.config_env)
+        if fingerprint == self._setup_env_fingerprint:
+            return
         self._create_paths()
 
         self.rel_libdir = 'lib%s' % self.lib_suffix
@@ -541,6 +578,38 @@ class Config(object):
         self.libdir = libdir
 
         self.env = self.get_env(self.prefix, libdir)
+        self._setup_env_fingerprint = (fingerprint[0], self.config_env.copy())
+
+    def _env_fingerprint(self):
+        """
+        @return: the values the environment is computed from, other than
+                 config_env
+        @rtype: tuple
+        """
+        build_tools = None
+        if not self._is_build_tools_config and self.build_tools_config is not None:
+            build_tools = (self.build_tools_config.prefix, getattr(self.build_tools_config, 'libdir', None))
+        return (
+            self.prefix,
+            self.lib_suffix,
+            self.toolchain_prefix,
+            self.extra_lib_path,
+            self.sources,
+            self.logs,
+            self.build_tools_prefix,
+            self.cargo_home,
+            self.rustup_home,
+            self.platform,
+            self.arch,
+            self.target_platform,
+            self.target_arch,
+            self.distro_version,
+            self.target_distro_version,
+            isinstance(self.universal_archs, dict),
+            tuple(self.py_prefixes),
+            self.variants.fingerprint(),
+            build_tools,
+        )
 
     def get_wine_runtime_env(self, prefix, env):
         """
@@ -569,8 +638,27 @@ class Config(object):
         env['WINEDEBUG'] = 'fixme-all'
         return env
 
-    @lru_cache(maxsize=None)
     def get_env(self, prefix, libdir):
+        """
+        Returns the environment for a prefix, computed once for each
+        configuration, architecture and variants
+
+        @param prefix: the prefix
+        @type prefix: str
+        @param libdir: the libdir of the prefix
+        @type libdir: str
+        @return: the environment, which must not be modified
+        @rtype: dict
+        """
+        key = (prefix, libdir, self._env_fingerprint())
+        cached = self._env_cache.get(key)
+        # The configuration files can modify config_env in place
+        if cached is None or cached[0] != self.config_env:
+            cached = (self.config_env.copy(), self._get_env(prefix, libdir))
+            self._env_cache[key] = cached
+        return cached[1]
+
+    def _get_env(self, prefix, libdir):
         # Get paths for environment variables
         includedir = Path(prefix, 'include').as_posix()
         bindir = Path(prefix, 'bin').as_posix()
@@ -751,6 +839,36 @@ class Config(object):
         self.set_property('extra_bootstrap_packages', {})
         self.set_property('override_bootstrap_packages', {})
         self.set_property('bash_completions', set())
+        # Per-recipe cache of the installed files, disabled unless a
+        # directory is set
+        self.set_property('artifacts_cache_dir', None)
+        self.set_property('artifacts_cache_url', None)
+        self.set_property('artifacts_cache_max_size', 20 << 30)
+        self.set_property('artifacts_cache_upload', False)
+        # Reuse the Meson build dirs whose setup did not change
+        self.set_property('meson_incremental_configure', False)
+        # Build the wheels from setuptools projects with `pip wheel` instead
+        # of writing them directly
+        self.set_property('wheel_use_pip', False)
+        # Write the .deb packages directly instead of building them with
+        # dpkg-buildpackage, and the compression of their tarballs
+        self.set_property('deb_direct_writer', False)
+        self.set_property('deb_compression', 'xz')
+        # Resolve the files of the recipes with an index of the prefix, and
+        # save it in the home dir to reuse it in the next runs
+        self.set_property('prefix_index', True)
+        self.set_property('prefix_index_persist', False)
+        # Keep a single copy of each downloaded tarball, keyed by its
+        # checksum, and link it in the download dirs
+        self.set_property('download_store', True)
+        # Download the tarballs with Python instead of curl or wget, resuming
+        # the interrupted transfers, and split the big ones in up to this
+        # number of parts downloaded in parallel
+        self.set_property('native_downloads', True)
+        self.set_property('download_segments', 4)
+        # Keep the extracted and patched source trees, without their git
+        # repository, to copy them instead of extracting the tarballs again
+        self.set_property('source_tree_cache', False)
         # Increase open-files limits
         set_nofile_ulimit()
 
@@ -893,6 +1011,12 @@ class Config(object):
         self.build_tools_config.prefix = self.build_tools_prefix
         self.build_tools_config.home_dir = self.home_dir
         self.build_tools_config.local_sources = self.local_sources
+        self.build_tools_config.download_store = self.download_store
+        self.build_tools_config.download_store_dir = self.download_store_dir
+        self.build_tools_config.native_downloads = self.native_downloads
+        self.build_tools_config.download_segments = self.download_segments
+        self.build_tools_config.source_tree_cache = self.source_tree_cache
+        self.build_tools_config.source_tree_cache_dir = self.source_tree_cache_dir
         # We want build tools to use the VS specified by the user manually
         self.build_tools_config.vs_install_path = self.vs_install_path
         self.build_tools_config.vs_install_version = self.vs_install_version
@@ -1079,6 +1203,8 @@ class Config(object):
         self.set_property('cache_file', platform_arch + '.cache')
         self.set_property('install_dir', self.prefix)
         self.set_property('local_sources', self._default_local_sources_dir())
+        self.set_property('download_store_dir', Path(self.local_sources, '.store').as_posix())
+        self.set_property('source_tree_cache_dir', Path(self.local_sources, '.trees').as_posix())
         self.set_property('rust_prefix', Path(self.home_dir, 'rust').as_posix())
         self.set_property('rustup_home', Path(self.rust_prefix, 'rustup').as_posix())
         self.set_property('cargo_home', Path(self.rust_prefix, 'cargo').as_posix())
@@ -1165,8 +1291,10 @@ class Config(object):
             cache_dir = Path.home() / '.cache'
         return (cache_dir / 'cerbero-sources').as_posix()
 
+    # The perl in the PATH is the same for all the configurations
+    @staticmethod
     @lru_cache()
-    def _perl_version(self):
+    def _perl_version():
         try:
             version = shell.check_output('perl -e \'print "$]";\'')
         except FatalError:
@@ -1252,7 +1380,27 @@ class Config(object):
         else:
             build_env = {}
 
-        return merge_env_value_env(build_env, in_env or self.env)
+        return merge_env_value_env(build_env, self._get_env_values(in_env or self.env))
+
+    def _get_env_values(self, env):
+        """
+        Converts the values of an environment to EnvValue objects. Recipes
+        only change a few variables of the configuration's environment, so
+        the values it shares with it are only converted once and copied.
+        """
+        base_env, base_values = self._env_values
+        if base_env is not self.env:
+            base_env = self.env
+            base_values = {k: EnvValue.from_key(k, v) for k, v in base_env.items()}
+            self._env_values = (base_env, base_values)
+        values = {}
+        for k, v in env.items():
+            if base_env.get(k) == v:
+                # Copied by merge_env_value_env()
+                values[k] = base_values[k]
+            else:
+                values[k] = EnvValue.from_key(k, v)
+        return values
 
     # config helpers for recipes with Python dependencies:
 
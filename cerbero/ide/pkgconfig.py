@@ -17,11 +17,558 @@
 # Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 # Boston, MA 02111-1307, USA.
 
+"""
+pkg-config wrapper, resolving the packages in process from the .pc files, with
+the semantics of pkg-config: variable expansion, Requires and
+Requires.private, the search path, the sysroot and the filtering of the
+system directories. Parsed files are cached while they don't change.
+"""
+
 import os
+import re
+import shlex
+import time
 
-from cerbero.errors import FatalError
+from cerbero.enums import Platform
+from cerbero.errors import CommandError, FatalError
 from cerbero.utils import shell
 
+# Flag types, like in pkg-config
+CFLAGS_I = 'I'
+CFLAGS_OTHER = 'cflags'
+LIBS_L = 'L'
+LIBS_l = 'l'
+LIBS_OTHER = 'libs'
+
+# Default search paths of the system directories filtered out of the flags,
+# the defaults of pkg-config
+SYSTEM_INCLUDE_PATH = '/usr/include'
+SYSTEM_LIBRARY_PATH = os.pathsep.join(['/usr/lib', '/lib'])
+# Files and directories modified less than this ago are not cached, since
+# they could change again in the same mtime tick
+RACY_WINDOW_NS = 2 * 1000 * 1000 * 1000
+OPERATORS = ('<', '<=', '=', '!=', '>=', '>')
+
+_VAR_RE = re.compile(r'\$\$|\$\{([^}]*)\}?')
+_TAG_RE = re.compile(r'[A-Za-z0-9_.]*')
+_NEWLINE_RE = re.compile(r'\r\n|\n\r|\r|\n')
+_MODULE_RE = re.compile(r'([^\s<>=!]\S*)(?:\s*([<>=!]+)\s*(\S*))?')
+_VERSION_SEGMENT_RE = re.compile(r'[^A-Za-z0-9]*(?:([0-9]+)|([A-Za-z]+))')
+# Characters escaped by pkg-config in the redefined prefix
+_UNSAFE_SHELL_RE = re.compile(r'[^$()+,\-./0-9:=@A-Z^_a-z~]')
+
+# path -> (mtime, size, parsed file) of the .pc files
+_PC_FILES = {}
+# directory -> (mtime, names of the .pc files in it)
+_PC_DIRS = {}
+# pkg-config executable -> its default search path
+_DEFAULT_PATHS = {}
+
+
+def version_compare(a, b):
+    """
+    Compares two versions like pkg-config does, with the rpm algorithm
+
+    @return: -1, 0 or 1 if @a is older, the same or newer than @b
+    @rtype: int
+    """
+    if a == b:
+        return 0
+    i = j = 0
+    while i < len(a) and j < len(b):
+        ma = _VERSION_SEGMENT_RE.match(a, i)
+        mb = _VERSION_SEGMENT_RE.match(b, j)
+        if not ma or not mb:
+            # Only separators left in one of them
+            i = len(a) if not ma else i
+            j = len(b) if not mb else j
+            break
+        i, j = ma.end(), mb.end()
+        num_a, alpha_a = ma.groups()
+        num_b, alpha_b = mb.groups()
+        # Numeric segments are always newer than alpha ones
+        if num_a is not None and num_b is None:
+            return 1
+        if num_a is None and num_b is not None:
+            return -1
+        if num_a is not None:
+            seg_a, seg_b = int(num_a), int(num_b)
+        else:
+            seg_a, seg_b = alpha_a, alpha_b
+        if seg_a != seg_b:
+            return 1 if seg_a > seg_b else -1
+    if i >= len(a) and j >= len(b):
+        return 0
+    return -1 if i >= len(a) else 1
+
+
+def _version_test(version, operator, required):
+    cmp = version_compare(version, required)
+    return {
+        '<': cmp < 0,
+        '<=': cmp <= 0,
+        '=': cmp == 0,
+        '!=': cmp != 0,
+        '>=': cmp >= 0,
+        '>': cmp > 0,
+    }[operator]
+
+
+def _escape_shell(value):
+    return _UNSAFE_SHELL_RE.sub(r'\\\g<0>', value)
+
+
+def _split_path(path):
+    return [d for d in path.split(os.pathsep) if d] if path else []
+
+
+def _read_lines(data):
+    """
+    Splits a .pc file in lines, removing the comments and joining the lines
+    continued with a backslash
+    """
+    if '\\' not in data:
+        return [line.split('#', 1)[0] for line in _NEWLINE_RE.split(data)]
+    lines = []
+    line = []
+    comment = False
+    i = 0
+    while i < len(data):
+        c = data[i]
+        i += 1
+        if c == '\\' and not comment:
+            nc = data[i : i + 1]
+            i += 1
+            if nc == '#':
+                line.append('#')
+            elif nc in ('\r', '\n'):
+                # Line continuation
+                if data[i : i + 1] in ('\r', '\n') and data[i : i + 1] != nc:
+                    i += 1
+            else:
+                line.append('\\' + nc)
+        elif c == '#':
+            comment = True
+        elif c in ('\r', '\n'):
+            if data[i : i + 1] in ('\r', '\n') and data[i : i + 1] != c:
+                i += 1
+            lines.append(''.join(line))
+            line = []
+            comment = False
+        elif not comment:
+            line.append(c)
+    lines.append(''.join(line))
+    return lines
+
+
+class PkgConfigFile(object):
+    """
+    A parsed .pc file, with its variables expanded
+
+    @ivar key: name of the package, the name of the file without .pc
+    @type key: str
+    @ivar variables: name -> expanded value of the variables
+    @type variables: dict
+    @ivar requires: (name, operator, version) of the public dependencies
+    @type requires: list
+    @ivar requires_private: (name, operator, version) of the private ones
+    @type requires_private: list
+    @ivar cflags: (type, flag) of the Cflags
+    @type cflags: list
+    @ivar libs: (type, flag, private) of the Libs and Libs.private
+    @type libs: list
+    """
+
+    def __init__(self, path, global_variables=None, define_prefix=False):
+        """
+        @param path: path of the .pc file
+        @type path: str
+        @param global_variables: variables defined for all the packages, like
+                                 pc_sysrootdir, which take precedence
+        @type global_variables: dict
+        @param define_prefix: redefine the prefix from the location of the
+                              file, like pkg-config does on Windows
+        @type define_prefix: bool
+        """
+        self.path = path
+        self.key = os.path.basename(path)[:-3]
+        self.global_variables = global_variables or {}
+        self.variables = {'pcfiledir': os.path.dirname(path)}
+        self.name = None
+        self.description = None
+        self.version = None
+        self.url = None
+        self.requires = []
+        self.requires_private = []
+        self.cflags = []
+        self.libs = []
+        self._orig_prefix = None
+        self._define_prefix = define_prefix
+        self._seen = set()
+        with open(path, 'r', encoding='utf-8', errors='replace', newline='') as f:
+            data = f.read()
+        for line in _read_lines(data):
+            self._parse_line(line)
+        if self.name is None:
+            raise FatalError("Package '%s' has no Name: field" % self.key)
+        if self.version is None:
+            raise FatalError("Package '%s' has no Version: field" % self.key)
+        if self.description is None:
+            raise FatalError("Package '%s' has no Description: field" % self.key)
+
+    def get_variable(self, name):
+        if name in self.global_variables:
+            return self.global_variables[name]
+        return self.variables.get(name)
+
+    def _sub(self, value):
+        def replace(match):
+            if match.group(1) is None:
+                return '$'
+            # Undefined variables are expanded to an empty string
+            return self.get_variable(match.group(1)) or ''
+
+        return _VAR_RE.sub(replace, value.strip())
+
+    def _parse_line(self, line):
+        line = line.strip()
+        if not line:
+            return
+        tag = _TAG_RE.match(line).group(0)
+        rest = line[len(tag) :].lstrip()
+        if rest.startswith(':'):
+            self._parse_field(tag, rest[1:].strip())
+        elif rest.startswith('='):
+            self._parse_variable(tag, rest[1:].strip())
+
+    def _parse_variable(self, name, value):
+        if name in self.variables:
+            # pkg-config ignores duplicated definitions
+            return
+        if self._define_prefix and name == 'prefix':
+            pcfiledir = self.variables['pcfiledir']
+            if os.path.basename(pcfiledir).lower() == 'pkgconfig':
+                self._orig_prefix = value
+                prefix = os.path.dirname(os.path.dirname(pcfiledir))
+                self.variables[name] = _escape_shell(prefix.replace('\\', '/'))
+                return
+        elif self._define_prefix and self._orig_prefix:
+            rest = value[len(self._orig_prefix) :]
+            if value.startswith(self._orig_prefix) and rest[:1] in ('/', '\\'):
+                value = self.variables['prefix'] + rest
+        self.variables[name] = self._sub(value)
+
+    def _parse_field(self, tag, value):
+        if tag == 'CFlags':
+            tag = 'Cflags'
+        if tag in self._seen:
+            # pkg-config only uses the first occurrence
+            return
+        self._seen.add(tag)
+        if tag in ('Name', 'Description', 'Version', 'URL'):
+            setattr(self, tag.lower(), self._sub(value))
+        elif tag == 'Requires':
+            self.requires = self._parse_modules(tag, self._sub(value))
+        elif tag == 'Requires.private':
+            self.requires_private = self._parse_modules(tag, self._sub(value))
+        elif tag == 'Cflags':
+            self.cflags = self._parse_cflags(self._split_args(tag, value))
+        elif tag in ('Libs', 'Libs.private'):
+            private = tag == 'Libs.private'
+            self.libs += [(t, f, private) for t, f in self._parse_libs(self._split_args(tag, value))]
+
+    def _parse_modules(self, tag, value):
+        modules = []
+        for segment in value.split(','):
+            for match in _MODULE_RE.finditer(segment):
+                name, operator, version = match.groups()
+                if operator is not None:
+                    if operator not in OPERATORS:
+                        raise FatalError(
+                            "Unknown version comparison operator '%s' after package name '%s' in %s"
+                            % (operator, name, self.path)
+                        )
+                    if not version:
+                        raise FatalError(
+                            "Comparison operator but no version after package name '%s' in %s" % (name, self.path)
+                        )
+                modules.append((name, operator, version))
+        return modules
+
+    def _split_args(self, tag, value):
+        try:
+            return shlex.split(self._sub(value))
+        except ValueError as e:
+            raise FatalError("Couldn't parse %s field of %s into an argument vector: %s" % (tag, self.path, e))
+
+    @staticmethod
+    def _parse_cflags(args):
+        flags = []
+        i = 0
+        while i < len(args):
+            arg = args[i].strip()
+            if arg.startswith('-I'):
+                flags.append((CFLAGS_I, '-I' + arg[2:].lstrip()))
+            elif arg in ('-idirafter', '-isystem') and i + 1 < len(args):
+                # These are -I flags since they control the search path
+                i += 1
+                flags.append((CFLAGS_I, '%s %s' % (arg, args[i].strip())))
+            elif arg:
+                flags.append((CFLAGS_OTHER, arg))
+            i += 1
+        return flags
+
+    @staticmethod
+    def _parse_libs(args):
+        flags = []
+        i = 0
+        while i < len(args):
+            arg = args[i].strip()
+            # -lib: is used by the C# compiler for libs, it's not a -l flag
+            if arg.startswith('-l') and not arg.startswith('-lib:'):
+                flags.append((LIBS_l, '-l' + arg[2:].lstrip()))
+            elif arg.startswith('-L'):
+                flags.append((LIBS_L, '-L' + arg[2:].lstrip()))
+            elif arg in ('-framework', '-Wl,-framework') and i + 1 < len(args):
+                # Keep -framework Foo together as one option
+                i += 1
+                flags.append((LIBS_OTHER, '%s %s' % (arg, args[i].strip())))
+            elif arg:
+                flags.append((LIBS_OTHER, arg))
+            i += 1
+        return flags
+
+    @staticmethod
+    def load(path, global_variables=None, define_prefix=False):
+        """
+        Parses a .pc file, or returns the parsed file from the cache if it
+        didn't change since then
+
+        @return: the parsed file
+        @rtype: L{PkgConfigFile}
+        """
+        st = os.stat(path)
+        key = (path, define_prefix, tuple(sorted((global_variables or {}).items())))
+        cached = _PC_FILES.get(key)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        pc = PkgConfigFile(path, global_variables, define_prefix)
+        if time.time_ns() - st.st_mtime_ns > RACY_WINDOW_NS:
+            _PC_FILES[key] = (st.st_mtime_ns, st.st_size, pc)
+        return pc
+
+
+def _list_pc_dir(path):
+    """
+    @return: the names of the packages of the .pc files in a directory
+    @rtype: frozenset
+    """
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except OSError:
+        return frozenset()
+    cached = _PC_DIRS.get(path)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    try:
+        names = frozenset(f[:-3] for f in os.listdir(path) if f.endswith('.pc') and len(f) > 3)
+    except OSError:
+        names = frozenset()
+    if time.time_ns() - mtime > RACY_WINDOW_NS:
+        _PC_DIRS[path] = (mtime, names)
+    return names
+
+
+def _default_search_path(env):
+    cmd = env.get('PKG_CONFIG', PkgConfig.cmd)
+    if cmd not in _DEFAULT_PATHS:
+        # Compiled in pkg-config, only needed when PKG_CONFIG_LIBDIR is unset
+        try:
+            out = shell.check_output('%s --variable pc_path pkg-config' % cmd, env=env, quiet=True)
+        except (CommandError, FatalError):
+            out = ''
+        _DEFAULT_PATHS[cmd] = _split_path(out.strip())
+    return _DEFAULT_PATHS[cmd]
+
+
+class PkgConfigResolver(object):
+    """
+    Resolves packages and their flags from the .pc files, with the search
+    paths, the sysroot and the system directories of an environment, like
+    pkg-config does, without running it
+
+    @ivar search_dirs: directories where the .pc files are looked up, in
+                       order: PKG_CONFIG_PATH and then PKG_CONFIG_LIBDIR or
+                       the default search path of pkg-config
+    @type search_dirs: list
+    """
+
+    def __init__(self, env=None):
+        """
+        @param env: environment, os.environ by default
+        @type env: dict
+        """
+        env = os.environ if env is None else env
+        self.search_dirs = _split_path(env.get('PKG_CONFIG_PATH'))
+        if 'PKG_CONFIG_LIBDIR' in env:
+            self.search_dirs += _split_path(env['PKG_CONFIG_LIBDIR'])
+        else:
+            self.search_dirs += _default_search_path(env)
+        self.sysroot = env.get('PKG_CONFIG_SYSROOT_DIR') or ''
+        self.global_variables = {
+            'pc_sysrootdir': self.sysroot or '/',
+            'pc_top_builddir': env.get('PKG_CONFIG_TOP_BUILD_DIR', '$(top_builddir)'),
+        }
+        self.define_prefix = shell.PLATFORM == Platform.WINDOWS
+        self.disable_uninstalled = 'PKG_CONFIG_DISABLE_UNINSTALLED' in env
+        self.system_include_dirs = set()
+        if 'PKG_CONFIG_ALLOW_SYSTEM_CFLAGS' not in env:
+            for var in ('C_INCLUDE_PATH', 'CPLUS_INCLUDE_PATH'):
+                self.system_include_dirs.update(_split_path(env.get(var)))
+            self.system_include_dirs.update(_split_path(env.get('PKG_CONFIG_SYSTEM_INCLUDE_PATH', SYSTEM_INCLUDE_PATH)))
+        self.system_library_dirs = set()
+        if 'PKG_CONFIG_ALLOW_SYSTEM_LIBS' not in env:
+            self.system_library_dirs.update(_split_path(env.get('PKG_CONFIG_SYSTEM_LIBRARY_PATH', SYSTEM_LIBRARY_PATH)))
+        self._packages = {}
+        self._positions = {}
+
+    def _locate(self, name):
+        if name.endswith('.pc') and os.path.isfile(name):
+            return name, 0
+        if not self.disable_uninstalled and not name.endswith('-uninstalled'):
+            path, position = self._locate(name + '-uninstalled')
+            if path:
+                return path, position
+        for position, d in enumerate(self.search_dirs, 1):
+            if name in _list_pc_dir(d):
+                return os.path.join(d, name + '.pc'), position
+        return None, None
+
+    def get(self, name, required_by=None):
+        """
+        Finds and parses a package and all its dependencies, checking that
+        their versions match the requirements
+
+        @param name: name of the package
+        @type name: str
+        @return: the parsed file of the package
+        @rtype: L{PkgConfigFile}
+        """
+        pc = self._packages.get(name)
+        if pc is not None:
+            return pc
+        path, position = self._locate(name)
+        if path is None:
+            if required_by:
+                raise FatalError("Package '%s', required by '%s', not found" % (name, required_by.key))
+            raise FatalError('Package %s was not found in the pkg-config search path' % name)
+        pc = PkgConfigFile.load(path, self.global_variables, self.define_prefix)
+        self._packages[name] = pc
+        self._positions[pc.path] = position
+        for req_name, operator, version in pc.requires + pc.requires_private:
+            req = self.get(req_name, pc)
+            if operator and not _version_test(req.version, operator, version):
+                raise FatalError(
+                    "Package '%s' requires '%s %s %s' but version of %s is %s"
+                    % (pc.key, req_name, operator, version, req.key, req.version)
+                )
+        return pc
+
+    def _expand(self, names, private, in_path_order):
+        """
+        Lists the packages and their dependencies in the order pkg-config
+        merges their flags: each package before the ones it requires
+        """
+        visited = set()
+        expanded = []
+
+        def visit(pc):
+            if pc.path in visited:
+                return
+            visited.add(pc.path)
+            requires = pc.requires + pc.requires_private if private else pc.requires
+            for req in reversed(requires):
+                visit(self.get(req[0]))
+            expanded.append(pc)
+
+        for pc in reversed([self.get(n) for n in names]):
+            visit(pc)
+        expanded.reverse()
+        if in_path_order:
+            expanded.sort(key=lambda pc: self._positions[pc.path])
+        return expanded
+
+    def _is_system_dir_flag(self, flag_type, flag):
+        if flag_type == CFLAGS_I and flag.startswith('-I'):
+            return flag[2:] in self.system_include_dirs
+        if flag_type == LIBS_L:
+            return flag[2:] in self.system_library_dirs
+        return False
+
+    def flags(self, names, flag_type, static=False):
+        """
+        Lists the flags of a type of the packages and their dependencies
+
+        @param names: names of the packages
+        @type names: list
+        @param flag_type: one of CFLAGS_I, CFLAGS_OTHER, LIBS_L, LIBS_l and
+                          LIBS_OTHER
+        @type flag_type: str
+        @param static: include the flags for static linking
+        @type static: bool
+        @return: the flags, as pkg-config would print them
+        @rtype: list
+        """
+        is_cflags = flag_type in (CFLAGS_I, CFLAGS_OTHER)
+        # Requires.private are always used for the cflags
+        private = is_cflags or static
+        in_path_order = flag_type in (CFLAGS_I, LIBS_L)
+        flags = []
+        for pc in self._expand(names, private, in_path_order):
+            if is_cflags:
+                pc_flags = pc.cflags
+            else:
+                pc_flags = [(t, f) for t, f, private_lib in pc.libs if static or not private_lib]
+            for t, f in pc_flags:
+                if t != flag_type or self._is_system_dir_flag(t, f):
+                    continue
+                # Only consecutive duplicates are removed
+                if flags and flags[-1] == f:
+                    continue
+                flags.append(f)
+        if self.sysroot and flag_type in (CFLAGS_I, LIBS_L):
+            flags = [self._add_sysroot(f) for f in flags]
+        return flags
+
+    def _add_sysroot(self, flag):
+        if flag.startswith('-I') or flag.startswith('-L'):
+            return flag[:2] + self.sysroot + flag[2:]
+        option, path = flag.split(' ', 1)
+        return '%s %s%s' % (option, self.sysroot, path)
+
+    def include_dirs(self, names):
+        dirs = []
+        for flag in self.flags(names, CFLAGS_I):
+            dirs.append(flag[2:] if flag.startswith('-I') else flag.split(' ', 1)[1])
+        return dirs
+
+    def variable(self, names, variable):
+        values = [self.get(n).get_variable(variable) for n in names]
+        return ' '.join(v for v in values if v)
+
+    def list_all(self):
+        """
+        @return: the names of all the packages in the search path
+        @rtype: list
+        """
+        names = []
+        seen = set()
+        for d in self.search_dirs:
+            for name in sorted(_list_pc_dir(d) - seen):
+                names.append(name)
+                seen.add(name)
+        return names
+
 
 class PkgConfig(object):
     """
@@ -29,6 +576,9 @@ class PkgConfig(object):
     """
 
     cmd = 'pkg-config'
+    # Resolve the packages with L{PkgConfigResolver} instead of running the
+    # pkg-config executable
+    native = True
 
     def __init__(self, libs, inherit=True, env=None):
         if isinstance(libs, str):
@@ -36,6 +586,7 @@ class PkgConfig(object):
         self.env = os.environ.copy() if env is None else env.copy()
         self.libs = libs
         self.inherit = inherit
+        self.resolver = PkgConfigResolver(self.env) if self.native else None
         if not inherit:
             requires = self.requires()
             if requires == []:
@@ -44,32 +595,52 @@ class PkgConfig(object):
                 self.deps_pkgconfig = PkgConfig(requires, env=env)
 
     def include_dirs(self):
-        res = self._exec('--cflags-only-I', '-I')
+        if self.resolver:
+            res = self.resolver.include_dirs(self.libs)
+        else:
+            res = self._exec('--cflags-only-I', '-I')
         return self._remove_deps(PkgConfig.include_dirs, res)
 
     def cflags(self):
-        res = self._exec('--cflags-only-other', ' ')
+        if self.resolver:
+            res = self.resolver.flags(self.libs, CFLAGS_OTHER)
+        else:
+            res = self._exec('--cflags-only-other', ' ')
         return self._remove_deps(PkgConfig.cflags, res)
 
     def libraries_dirs(self):
-        res = self._exec('--libs-only-L', '-L')
+        if self.resolver:
+            res = [f[2:] for f in self.resolver.flags(self.libs, LIBS_L)]
+        else:
+            res = self._exec('--libs-only-L', '-L')
         return self._remove_deps(PkgConfig.libraries_dirs, res)
 
     def libraries(self):
-        res = self._exec('--libs-only-l', '-l')
+        if self.resolver:
+            res = [f[2:] for f in self.resolver.flags(self.libs, LIBS_l)]
+        else:
+            res = self._exec('--libs-only-l', '-l')
         return self._remove_deps(PkgConfig.libraries, res)
 
     def static_libraries(self):
-        res = self._exec('--libs-only-l --static', '-l')
+        if self.resolver:
+            res = [f[2:] for f in self.resolver.flags(self.libs, LIBS_l, static=True)]
+        else:
+            res = self._exec('--libs-only-l --static', '-l')
         return self._remove_deps(PkgConfig.libraries, res)
 
     def modversion(self):
+        if self.resolver:
+            versions = [self.resolver.get(lib).version for lib in self.libs]
+            return versions[0] if len(self.libs) == 1 else versions
         res = self._exec('--modversion', ' ')
         out = self._remove_deps(PkgConfig.cflags, res)
         modversion = out[0] if len(self.libs) == 1 else out[0].split('\n')
         return modversion
 
     def requires(self):
+        if self.resolver:
+            return [name for lib in self.libs for name, _, _ in self.resolver.get(lib).requires]
         res = []
         for x in self._exec('--print-requires', '\n'):
             # take care of requires expressed with version requirements
@@ -79,19 +650,27 @@ class PkgConfig(object):
         return res
 
     def prefix(self):
+        if self.resolver:
+            return self.resolver.variable(self.libs, 'prefix')
         return self._exec('--variable=prefix')
 
     @staticmethod
     def list_all(env=None):
+        if PkgConfig.native:
+            return PkgConfigResolver(env).list_all()
         res = PkgConfig._call('%s --list-all' % PkgConfig.cmd, '\n', env=env)
         return [x.split(' ', 1)[0] for x in res]
 
     @staticmethod
     def list_all_include_dirs(env=None):
         include_dirs = []
+        # The packages and their dependencies are only parsed once
+        resolver = PkgConfigResolver(env) if PkgConfig.native else None
         for pc in PkgConfig.list_all(env=env):
-            pkgconfig = PkgConfig(pc, env=env)
-            d = pkgconfig.include_dirs()
+            if resolver:
+                d = resolver.include_dirs([pc])
+            else:
+                d = PkgConfig(pc, env=env).include_dirs()
             for p in d:
                 if not os.path.isabs(p):
                     raise FatalError('pkg-config file %s contains relative include dir %s' % (pc, p))
@@ -19,6 +19,7 @@
 import os
 
 import cerbero.utils.messages as m
+from cerbero.build.filesprovider import cached_searches
 from cerbero.errors import EmptyPackageError, MissingPackageFilesError
 from cerbero.utils import _
 
@@ -77,3 +78,24 @@ class PackagerBase(object):
         if len(real_files) == 0:
             raise EmptyPackageError(self.package.name)
         return real_files
+
+    def files_lists(self, package_types, force):
+        """
+        Lists the files of several package types in one go, sharing the
+        searches in the prefix between them
+
+        @param package_types: the package types to list
+        @type package_types: list
+        @param force: only warn about missing files
+        @type force: bool
+        @return: package type -> list of files, empty when there are none
+        @rtype: dict
+        """
+        lists = {}
+        with cached_searches():
+            for package_type in package_types:
+                try:
+                    lists[package_type] = self.files_list(package_type, force)
+                except EmptyPackageError:
+                    lists[package_type] = []
+        return lists
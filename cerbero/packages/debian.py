@@ -26,6 +26,7 @@ from fnmatch import fnmatch
 
 from cerbero.errors import EmptyPackageError
 from cerbero.packages import PackageType
+from cerbero.packages.debwriter import DebWriter, debian_architecture
 from cerbero.packages.linux import LinuxPackager
 from cerbero.packages.package import MetaPackage, App
 from cerbero.utils import shell, _
@@ -180,6 +181,127 @@ class DebianPackager(LinuxPackager):
         else:
             self.license = ''
 
+    def pack(self, output_dir, devel=True, force=False, keep_temp=False, pack_deps=True, tmpdir=None):
+        if not self.config.deb_direct_writer:
+            return LinuxPackager.pack(self, output_dir, devel, force, keep_temp, pack_deps, tmpdir)
+
+        self.install_dir = self.package.get_install_dir()
+        self.devel = devel
+        self.force = force
+        self._empty_packages = []
+
+        # The temporary dir is shared with the dependencies to know which
+        # ones were already packed
+        own_tmpdir = tmpdir is None
+        if own_tmpdir:
+            tmpdir = tempfile.mkdtemp(dir=self.config.home_dir)
+        try:
+            if not (isinstance(self.package, App) and self.package.embed_deps) and pack_deps:
+                self.pack_deps(output_dir, tmpdir, force)
+            m.action(_('Creating package for %s') % self.package.name)
+            paths = self._write_debs(output_dir, tmpdir)
+            open(os.path.join(tmpdir, self.package.name + '-stamp'), 'w').close()
+        finally:
+            if own_tmpdir and not keep_temp:
+                shutil.rmtree(tmpdir)
+        return paths
+
+    def _write_debs(self, output_dir, tmpdir):
+        """
+        Writes the binary packages with L{DebWriter} instead of building
+        them with dpkg-buildpackage
+        """
+        is_meta = isinstance(self.package, MetaPackage)
+        runtime_files = self._direct_files_list(PackageType.RUNTIME)
+        devel_files = self._direct_files_list(PackageType.DEVEL) if self.devel else []
+        if not is_meta and not runtime_files and not devel_files:
+            raise EmptyPackageError(self.package.name)
+        self.package.has_runtime_package = bool(runtime_files) or is_meta
+        self.package.has_devel_package = bool(devel_files) or is_meta
+
+        name = self.package_prefix + self.package.name
+        version = '%s-1' % self.package.version
+        arch = debian_architecture(self.config.target_arch)
+        scripts = {}
+        for script, resource in (
+            ('postinst', self.package.resources_postinstall),
+            ('postrm', self.package.resources_postremove),
+        ):
+            if os.path.exists(resource):
+                with open(resource, 'rb') as f:
+                    scripts[script] = f.read()
+        longdesc = self.package.longdesc if self.package.longdesc != 'default' else self.package.shortdesc
+        copyright = self._deb_copyright().encode('utf-8')
+
+        debs = []
+        if self.package.has_runtime_package:
+            if is_meta:
+                requires, recommends, suggests = self.get_meta_requires(PackageType.RUNTIME, '')
+            else:
+                requires, recommends, suggests = self._get_requires(PackageType.RUNTIME).split(', '), [], []
+            control = {
+                'Package': name,
+                'Version': version,
+                'Architecture': arch,
+                'Maintainer': self.packager,
+                'Section': 'libs',
+                'Priority': 'optional',
+                'Depends': ', '.join(x for x in requires if x),
+                'Recommends': ', '.join(recommends),
+                'Suggests': ', '.join(suggests),
+                'Homepage': self.package.url if self.package.url != 'default' else '',
+                'Description': '%s\n%s' % (self.package.shortdesc, longdesc),
+            }
+            debs.append((name, control, runtime_files, scripts))
+        if self.package.has_devel_package:
+            shortdesc = 'Development files for %s' % name
+            if is_meta:
+                requires, recommends, suggests = self.get_meta_requires(PackageType.DEVEL, '-dev')
+            else:
+                requires, recommends, suggests = self._get_requires(PackageType.DEVEL).split(', '), [], []
+                if self.package.has_runtime_package:
+                    # Pin the runtime package that get_requires() adds
+                    requires = [r for r in requires if r != name] + ['%s (= %s)' % (name, version)]
+            control = {
+                'Package': name + '-dev',
+                'Version': version,
+                'Architecture': arch,
+                'Maintainer': self.packager,
+                'Section': 'libdevel',
+                'Priority': 'optional',
+                'Depends': ', '.join(x for x in requires if x),
+                'Recommends': ', '.join(recommends),
+                'Suggests': ', '.join(suggests),
+                'Homepage': self.package.url if self.package.url != 'default' else '',
+                'Description': '%s\n%s' % (shortdesc, shortdesc),
+            }
+            debs.append((name + '-dev', control, devel_files, {}))
+
+        paths = []
+        for deb_name, control, files, deb_scripts in debs:
+            path = os.path.join(output_dir, '%s_%s_%s.deb' % (deb_name, version, arch))
+            m.action(_('Writing %s') % path)
+            writer = DebWriter(path, self.config.deb_compression, tmpdir)
+            try:
+                writer.add_files(self.install_dir, self.config.prefix, files)
+                writer.add_bytes('/usr/share/doc/%s/copyright' % deb_name, copyright)
+                writer.write(control, deb_scripts)
+            except BaseException:
+                writer.abort()
+                if os.path.exists(path):
+                    os.remove(path)
+                raise
+            paths.append(path)
+        return paths
+
+    def _direct_files_list(self, package_type):
+        if isinstance(self.package, MetaPackage):
+            return []
+        try:
+            return self.files_list(package_type)
+        except EmptyPackageError:
+            return []
+
     def create_tree(self, tmpdir):
         # create a tmp dir to use as topdir
         if tmpdir is None:
@@ -0,0 +1,295 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Collabora Ltd. <http://www.collabora.co.uk/>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+"""
+Writes binary .deb packages directly from a list of files, without a
+debian source tree and without dpkg-buildpackage.
+
+A .deb is an ar archive with three members: debian-binary, control.tar.*
+with the control file, the maintainer scripts and the md5sums, and
+data.tar.* with the files, which is streamed through a multithreaded
+compressor when one is available.
+"""
+
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import time
+
+from cerbero.enums import Architecture
+from cerbero.errors import FatalError
+
+DEB_FORMAT_VERSION = b'2.0\n'
+AR_MAGIC = b'!<arch>\n'
+COMPRESSIONS = ('xz', 'zst', 'gz')
+# Commands used to compress with all the cores, the lzma and gzip modules
+# are used when they are not available
+COMPRESSORS = {
+    'xz': ['xz', '-T0', '-6', '-c'],
+    'zst': ['zstd', '-T0', '-q', '-c'],
+    'gz': ['pigz', '-9', '-n', '-c'],
+}
+DEBIAN_ARCHITECTURES = {
+    Architecture.X86: 'i386',
+    Architecture.X86_64: 'amd64',
+    Architecture.ARM: 'armel',
+    Architecture.ARMv7: 'armhf',
+    Architecture.ARM64: 'arm64',
+    Architecture.RISCV64: 'riscv64',
+}
+CHUNK_SIZE = 1 << 20
+
+
+def debian_architecture(arch):
+    """
+    @param arch: the cerbero architecture
+    @type arch: L{cerbero.enums.Architecture}
+    @return: the name of @arch for dpkg
+    @rtype: str
+    """
+    try:
+        return DEBIAN_ARCHITECTURES[arch]
+    except KeyError:
+        raise FatalError('Architecture %s is not supported by dpkg' % arch)
+
+
+class _HashingReader(object):
+    """Computes the md5 of a file while tarfile reads it"""
+
+    def __init__(self, f):
+        self.f = f
+        self.md5 = hashlib.md5()
+
+    def read(self, size=-1):
+        data = self.f.read(size)
+        self.md5.update(data)
+        return data
+
+
+class DebWriter(object):
+    """
+    Writes a binary package
+
+        writer = DebWriter('foo_1.0-1_amd64.deb', compression='xz')
+        writer.add_files('/opt/foo', '/home/user/cerbero/dist/linux_x86_64', files)
+        writer.write({'Package': 'foo', 'Version': '1.0-1', ...})
+
+    @ivar path: path of the package
+    @type path: str
+    @ivar md5sums: path in the package -> md5 of the regular files added
+    @type md5sums: dict
+    @ivar installed_size: size of the files added, in bytes
+    @type installed_size: int
+    """
+
+    def __init__(self, path, compression='xz', tmpdir=None):
+        """
+        @param path: path of the package
+        @type path: str
+        @param compression: compression of the tarballs, one of L{COMPRESSIONS}
+        @type compression: str
+        @param tmpdir: directory for the data tarball while it's written
+        @type tmpdir: str
+        """
+        if compression not in COMPRESSIONS:
+            raise FatalError('Unsupported compression for .deb packages: %s' % compression)
+        self.path = path
+        self.compression = compression
+        self.md5sums = {}
+        self.installed_size = 0
+        self._dirs = set()
+        self._data = tempfile.TemporaryFile(dir=tmpdir)
+        self._compressor = None
+        cmd = COMPRESSORS[compression]
+        if shutil.which(cmd[0]):
+            self._compressor = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=self._data)
+            self._tar = tarfile.open(
+                fileobj=self._compressor.stdin, mode='w|', format=tarfile.GNU_FORMAT, copybufsize=CHUNK_SIZE
+            )
+        elif compression == 'zst':
+            self._data.close()
+            raise FatalError('zstd is required to write .deb packages compressed with zstd')
+        else:
+            self._tar = tarfile.open(
+                fileobj=self._data, mode='w|' + compression, format=tarfile.GNU_FORMAT, copybufsize=CHUNK_SIZE
+            )
+
+    def _tarinfo(self, tarinfo):
+        tarinfo.uid = tarinfo.gid = 0
+        tarinfo.uname = tarinfo.gname = 'root'
+        return tarinfo
+
+    def _add_parents(self, arcname):
+        parent = os.path.dirname(arcname)
+        if parent in self._dirs or parent in ('.', ''):
+            return
+        self._add_parents(parent)
+        tarinfo = self._tarinfo(tarfile.TarInfo(parent + '/'))
+        tarinfo.type = tarfile.DIRTYPE
+        tarinfo.mode = 0o755
+        tarinfo.mtime = int(time.time())
+        self._tar.addfile(tarinfo)
+        self._dirs.add(parent)
+
+    def add_file(self, path, source):
+        """
+        Adds a file, a symbolic link or an empty directory
+
+        @param path: absolute path of the file once installed
+        @type path: str
+        @param source: path of the file in the filesystem
+        @type source: str
+        """
+        arcname = '.' + path if path.startswith('/') else './' + path
+        self._add_parents(arcname)
+        tarinfo = self._tarinfo(self._tar.gettarinfo(source, arcname))
+        if tarinfo.isreg():
+            with open(source, 'rb') as f:
+                reader = _HashingReader(f)
+                self._tar.addfile(tarinfo, reader)
+            self.md5sums[arcname[2:]] = reader.md5.hexdigest()
+            self.installed_size += tarinfo.size
+        elif tarinfo.isdir():
+            if arcname in self._dirs:
+                return
+            self._dirs.add(arcname)
+            self._tar.addfile(tarinfo)
+        else:
+            self._tar.addfile(tarinfo)
+
+    def add_files(self, install_dir, prefix, files):
+        """
+        Adds files of a prefix
+
+        @param install_dir: where the files of the prefix are installed
+        @type install_dir: str
+        @param prefix: path of the prefix
+        @type prefix: str
+        @param files: paths of the files, relative to @prefix
+        @type files: list
+        """
+        for f in files:
+            self.add_file(os.path.join(install_dir, f), os.path.join(prefix, f))
+
+    def add_bytes(self, path, data, mode=0o644):
+        """
+        Adds a file from its content
+
+        @param path: absolute path of the file once installed
+        @type path: str
+        @param data: content of the file
+        @type data: bytes
+        """
+        arcname = '.' + path
+        self._add_parents(arcname)
+        tarinfo = self._tarinfo(tarfile.TarInfo(arcname))
+        tarinfo.size = len(data)
+        tarinfo.mode = mode
+        tarinfo.mtime = int(time.time())
+        self._tar.addfile(tarinfo, io.BytesIO(data))
+        self.md5sums[arcname[2:]] = hashlib.md5(data).hexdigest()
+        self.installed_size += len(data)
+
+    def abort(self):
+        """
+        Discards the package
+        """
+        if self._compressor:
+            self._compressor.kill()
+            self._compressor.wait()
+        self._data.close()
+
+    def _close_data(self):
+        self._tar.close()
+        if self._compressor:
+            self._compressor.stdin.close()
+            if self._compressor.wait() != 0:
+                raise FatalError('Failed to compress the data of %s' % self.path)
+        self._data.flush()
+
+    def _control_tar(self, control, scripts):
+        f = io.BytesIO()
+        mode = 'w:gz' if self.compression == 'gz' else 'w:xz'
+        # dpkg doesn't support control.tar.zst before 1.21.18, and the
+        # control tarball is small enough for lzma
+        with tarfile.open(fileobj=f, mode=mode, format=tarfile.GNU_FORMAT) as tar:
+            members = [('control', control.encode('utf-8'), 0o644)]
+            md5sums = ''.join('%s  %s\n' % (md5, path) for path, md5 in sorted(self.md5sums.items()))
+            if md5sums:
+                members.append(('md5sums', md5sums.encode('utf-8'), 0o644))
+            for name, content in sorted(scripts.items()):
+                members.append((name, content, 0o755))
+            for name, content, mode in members:
+                tarinfo = self._tarinfo(tarfile.TarInfo('./' + name))
+                tarinfo.size = len(content)
+                tarinfo.mode = mode
+                tarinfo.mtime = int(time.time())
+                tar.addfile(tarinfo, io.BytesIO(content))
+        return f.getvalue()
+
+    @staticmethod
+    def _ar_header(name, size):
+        header = '%-16s%-12d%-6d%-6d%-8s%-10d`\n' % (name, int(time.time()), 0, 0, '100644', size)
+        return header.encode('ascii')
+
+    def write(self, control, scripts=None):
+        """
+        Writes the package with all the files added
+
+        @param control: fields of the control file, in order, without
+                        Installed-Size, which is computed
+        @type control: dict
+        @param scripts: name -> content of the maintainer scripts (postinst,
+                        postrm...)
+        @type scripts: dict
+        """
+        try:
+            self._close_data()
+            # The description goes last, like dpkg-gencontrol does
+            fields = {k: v for k, v in control.items() if k != 'Description'}
+            fields['Installed-Size'] = str((self.installed_size + 1023) // 1024)
+            fields['Description'] = control.get('Description')
+            lines = []
+            for key, value in fields.items():
+                if value in (None, ''):
+                    continue
+                if key == 'Description':
+                    # Continuation lines of multiline fields start with a space
+                    value = '\n '.join(line or '.' for line in value.splitlines())
+                lines.append('%s: %s\n' % (key, value))
+            control_tar = self._control_tar(''.join(lines), scripts or {})
+            suffix = '.' + self.compression
+            data_size = self._data.seek(0, io.SEEK_END)
+            self._data.seek(0)
+            with open(self.path, 'wb') as f:
+                f.write(AR_MAGIC)
+                for name, content in (('debian-binary', DEB_FORMAT_VERSION), ('control.tar' + suffix, control_tar)):
+                    f.write(self._ar_header(name, len(content)))
+                    f.write(content)
+                    if len(content) % 2:
+                        f.write(b'\n')
+                f.write(self._ar_header('data.tar' + suffix, data_size))
+                shutil.copyfileobj(self._data, f, CHUNK_SIZE)
+                if data_size % 2:
+                    f.write(b'\n')
+        finally:
+            self._data.close()
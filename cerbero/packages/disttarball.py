@@ -17,9 +17,10 @@
 # Boston, MA 02111-1307, USA.
 
 import os
+from concurrent.futures import ThreadPoolExecutor
 
 import cerbero.utils.messages as m
-from cerbero.utils import _
+from cerbero.utils import _, determine_num_of_cpus
 from cerbero.utils.tar import Tar
 from cerbero.enums import Platform
 from cerbero.errors import EmptyPackageError
@@ -41,26 +42,21 @@ class DistTarball(PackagerBase):
     def pack(
         self, output_dir, devel=True, force=False, keep_temp=False, split=True, package_prefix='', strip_binaries=False
     ):
-        try:
-            dist_files = self.files_list(PackageType.RUNTIME, force)
-        except EmptyPackageError:
+        package_types = [PackageType.RUNTIME, PackageType.DEBUG]
+        if devel:
+            package_types.append(PackageType.DEVEL)
+        # Resolve all the splits at once, the searches in the prefix are
+        # shared between them
+        files = self.files_lists(package_types, force)
+        dist_files = files[PackageType.RUNTIME]
+        debug_files = files[PackageType.DEBUG]
+        devel_files = files.get(PackageType.DEVEL, [])
+        if not dist_files:
             m.warning(_('The runtime package is empty'))
-            dist_files = []
-
-        try:
-            debug_files = self.files_list(PackageType.DEBUG, force)
-        except EmptyPackageError:
+        if not debug_files:
             m.warning(_('The debug package is empty'))
-            debug_files = []
-
-        if devel:
-            try:
-                devel_files = self.files_list(PackageType.DEVEL, force)
-            except EmptyPackageError:
-                m.warning(_('The development package is empty'))
-                devel_files = []
-        else:
-            devel_files = []
+        if devel and not devel_files:
+            m.warning(_('The development package is empty'))
 
         if not split:
             dist_files += debug_files
@@ -69,19 +65,27 @@ class DistTarball(PackagerBase):
         if not dist_files and not debug_files and not devel_files:
             raise EmptyPackageError(self.package.name)
 
-        filenames = []
+        tarballs = []
         if dist_files:
-            runtime = self._create_tarball(output_dir, PackageType.RUNTIME, dist_files, force, package_prefix)
-            filenames.append(runtime)
-
+            tarballs.append((PackageType.RUNTIME, dist_files))
         if split and debug_files:
-            debug = self._create_tarball(output_dir, PackageType.DEBUG, debug_files, force, package_prefix)
-            filenames.append(debug)
-
+            tarballs.append((PackageType.DEBUG, debug_files))
         if split and devel and len(devel_files) != 0:
-            devel = self._create_tarball(output_dir, PackageType.DEVEL, devel_files, force, package_prefix)
-            filenames.append(devel)
-        return filenames
+            tarballs.append((PackageType.DEVEL, devel_files))
+
+        if len(tarballs) == 1:
+            package_type, files = tarballs[0]
+            return [self._create_tarball(output_dir, package_type, files, force, package_prefix)]
+
+        # The splits don't share files, write them concurrently and divide
+        # the cores between their compressors
+        threads = max(1, determine_num_of_cpus() // len(tarballs))
+        with ThreadPoolExecutor(max_workers=len(tarballs)) as executor:
+            futures = [
+                executor.submit(self._create_tarball, output_dir, package_type, files, force, package_prefix, threads)
+                for package_type, files in tarballs
+            ]
+            return [f.result() for f in futures]
 
     def _get_ext(self, ext=None):
         if ext is not None:
@@ -113,9 +117,9 @@ class DistTarball(PackagerBase):
             ext,
         )
 
-    def _create_tarball(self, output_dir, package_type, files, force, package_prefix):
+    def _create_tarball(self, output_dir, package_type, files, force, package_prefix, threads=0):
         filename = os.path.join(output_dir, self._get_name(package_type))
-        Tar(filename).configure(self.config, self.prefix).pack(files, package_prefix, force)
+        Tar(filename).configure(self.config, self.prefix, threads=threads).pack(files, package_prefix, force)
         return filename
 
 
@@ -298,8 +298,10 @@ class Package(PackageBase):
         recipes = [x.split(':')[0] for x in self._files]
         if use_devel:
             recipes.extend([x.split(':')[0] for x in self._files_devel])
-        for recipe in recipes:
-            deps.extend([r.name for r in self.cookbook.list_recipe_deps(recipe)])
+        graph = self.cookbook.get_dependency_graph()
+        # Several entries usually come from the same recipe
+        for recipe in remove_list_duplicates(recipes):
+            deps.extend(graph.ordered_deps(self.cookbook.get_recipe(recipe).name))
         for name in self.deps:
             p = self.store.get_package(name)
             deps += p.recipes_dependencies(use_devel)
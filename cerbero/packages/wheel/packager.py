@@ -1,3 +1,4 @@
+import concurrent.futures
 import functools
 import json
 import keyword
@@ -9,10 +10,11 @@ import sys
 import tempfile
 
 from cerbero.enums import Architecture, License, Platform
-from cerbero.utils import messages as m, shell
+from cerbero.utils import filetype, messages as m, shell
 from cerbero.packages import PackagerBase
 from cerbero.packages.package import SDKPackage
 from cerbero.tools import dsymutil
+from cerbero.packages.wheel import writer
 
 
 @functools.lru_cache()
@@ -73,6 +75,7 @@ class WheelPackager(PackagerBase):
         self.platform = config.target_platform
         self.abi_desc = ' '.join(config._get_toolchain_target_platform_arch(readable=True))
         self.wheel_version = self._get_wheel_version()
+        self._python_info_cache = None
 
     def _get_wheel_version(self):
         """
@@ -127,7 +130,7 @@ class WheelPackager(PackagerBase):
             platform += '+debug'
         return '-'.join((self.package.name, platform, self.config.target_arch, self.wheel_version))
 
-    def _create_wheel(
+    def _wheel_info(
         self,
         package_name,
         files_list=(),
@@ -137,10 +140,15 @@ class WheelPackager(PackagerBase):
         features=None,
         desc='',
     ):
-        # Set project up
-        m.action(f'Creating setuptools project for {package_name}')
+        """
+        Describes a wheel
+
+        @return: the metadata of the wheel, with the keys of
+                 gstreamer_vendor.json, and the lines to append to its
+                 entrypoints.py
+        @rtype: tuple
+        """
         base_tree = Path(self.config.data_dir) / 'wheel'
-        output_dir = self.output_dir / package_name
 
         longdesc = ''
         if package_name in ('gstreamer', 'gstreamer_bundle'):
@@ -161,18 +169,9 @@ class WheelPackager(PackagerBase):
                 '[gstreamer_meta](/project/gstreamer-meta/) packages.'
             )
 
-        # Copy files manually (the last one needs to match the package name)
-        shutil.copy(base_tree / 'setup.py', output_dir)
-        shutil.copy(base_tree / 'pyproject.toml', output_dir)
-        shutil.copytree(base_tree / package_name, output_dir / package_name, dirs_exist_ok=True)
-        m.action(f'Generating MANIFEST.in for {package_name}')
-        with (output_dir / 'MANIFEST.in').open('w', encoding='utf-8', newline='\n') as f:
-            f.write(f'graft {package_name}\n')
-
         scripts = []
         entrypoints = []
         if files_list:
-            m.action(f'Copying distribution payload for {package_name}')
             for filepath in files_list:
                 source = Path(self.config.prefix, filepath)
                 dirpath, filename = os.path.split(filepath)
@@ -189,11 +188,7 @@ class WheelPackager(PackagerBase):
 
         if entrypoints:
             entrypoints = ['\n', '\n', *entrypoints]
-            m.action('Filling up entrypoints in the Python module')
-            with (output_dir / package_name / 'entrypoints.py').open('a', encoding='utf-8', newline='\n') as f:
-                f.writelines(entrypoints)
 
-        m.action(f'Generating metadata JSON for {package_name}')
         package_info = {
             'package_name': package_name,
             'version': self.wheel_version,
@@ -219,24 +214,157 @@ class WheelPackager(PackagerBase):
             # A fancy way of saying "metapackage"
             'needs_environment': not files_list,
         }
+        return package_info, entrypoints
+
+    def _python_env(self):
+        # Need to set PYTHONPATH correctly on (at least) macOS to use the
+        # specified Python inside the venv for pip, but on Windows that
+        # completely breaks Python and it can't find pip.
+        return self.config.env if self.config.platform != Platform.WINDOWS else None
+
+    def _python_info(self):
+        # What the tags of the wheels depend on, from the Python that runs pip
+        if self._python_info_cache is None:
+            python_exe = os.path.join(self.config.build_tools_prefix, 'bin', 'python')
+            output = shell.check_output([python_exe, '-c', writer.PYTHON_INFO_SCRIPT], env=self._python_env())
+            self._python_info_cache = json.loads(output)
+        return self._python_info_cache
+
+    def _create_wheel(self, package_name, package_info, entrypoints):
+        """
+        Creates a setuptools project for a wheel, with its payload already
+        copied in, and builds it with `pip wheel`
+        """
+        # Set project up
+        m.action(f'Creating setuptools project for {package_name}')
+        base_tree = Path(self.config.data_dir) / 'wheel'
+        output_dir = self.output_dir / package_name
+
+        # Copy files manually (the last one needs to match the package name)
+        shutil.copy(base_tree / 'setup.py', output_dir)
+        shutil.copy(base_tree / 'pyproject.toml', output_dir)
+        shutil.copytree(base_tree / package_name, output_dir / package_name, dirs_exist_ok=True)
+        m.action(f'Generating MANIFEST.in for {package_name}')
+        with (output_dir / 'MANIFEST.in').open('w', encoding='utf-8', newline='\n') as f:
+            f.write(f'graft {package_name}\n')
+
+        if entrypoints:
+            m.action('Filling up entrypoints in the Python module')
+            with (output_dir / package_name / 'entrypoints.py').open('a', encoding='utf-8', newline='\n') as f:
+                f.writelines(entrypoints)
+
+        m.action(f'Generating metadata JSON for {package_name}')
         with (output_dir / 'gstreamer_vendor.json').open('w', encoding='utf-8', newline='\n') as f:
             f.write(json.dumps(package_info))
 
         # Execute on the chosen output directory
         m.action(f'Building {package_name} in {self.output_dir}')
         python_exe = os.path.join(self.config.build_tools_prefix, 'bin', 'python')
-        # Need to set PYTHONPATH correctly on (at least) macOS to use the
-        # specified Python inside the venv for pip, but on Windows that
-        # completely breaks Python and it can't find pip.
-        python_env = self.config.env if self.config.platform != Platform.WINDOWS else None
         shell.new_call(
             [python_exe, '-m', 'pip', 'wheel', f'--find-links={self.output_dir.as_posix()}', output_dir],
             cmd_dir=self.output_dir,
-            env=python_env,
+            env=self._python_env(),
         )
 
+    def _write_wheel(self, package_name, package_info, entrypoints, payload):
+        """
+        Writes a wheel directly from the prefix
+
+        @param payload: path in the wheel -> path of the file to add
+        @type payload: dict
+        @return: the path of the wheel
+        @rtype: L{Path}
+        """
+        base_tree = Path(self.config.data_dir) / 'wheel'
+        files = dict(payload)
+        for source in (base_tree / package_name).rglob('*'):
+            if source.is_file() and '__pycache__' not in source.parts:
+                files[source.relative_to(base_tree).as_posix()] = source
+        if entrypoints:
+            entrypoints_py = f'{package_name}/entrypoints.py'
+            with open(files[entrypoints_py], 'r', encoding='utf-8') as f:
+                content = f.read() + ''.join(entrypoints)
+            files[entrypoints_py] = content.encode('utf-8')
+        python_info = self._python_info()
+        if package_info['needs_environment']:
+            name, content = writer.import_shim(package_name, python_info)
+            files[name] = content
+        binaries = [
+            f for arcname, f in files.items() if arcname.endswith(('.dylib', '.so')) and not isinstance(f, bytes)
+        ]
+        tag = writer.wheel_tag(package_name, python_info, binaries)
+        m.action(f'Writing {package_name} wheel in {self.output_dir}')
+        return writer.write_wheel(self.output_dir, package_info, tag, files)
+
+    def _wheel_payload(self, package_name, files_list):
+        """
+        @return: path in the wheel -> path in the prefix of the files of
+                 @files_list, with the directories expanded
+        @rtype: dict
+        """
+        payload = {}
+        for filepath in files_list:
+            source = os.path.join(self.config.prefix, filepath)
+            if os.path.isfile(source):
+                payload[f'{package_name}/{filepath}'] = source
+            elif os.path.isdir(source):
+                for dirpath, _dirnames, filenames in os.walk(source, followlinks=True):
+                    for f in filenames:
+                        path = os.path.join(dirpath, f)
+                        if os.path.isfile(path):
+                            relpath = os.path.relpath(path, self.config.prefix).replace(os.sep, '/')
+                            payload[f'{package_name}/{relpath}'] = path
+        return payload
+
+    def _copy_payload(self, output_dir, payload):
+        for arcname, source in payload.items():
+            dest = output_dir / arcname
+            dest.parent.mkdir(parents=True, exist_ok=True)
+            shutil.copy(source, dest, follow_symlinks=False)
+
+    def _wheel_rpaths(self, package_name, filepath, dependencies):
+        """
+        @return: the arguments of install_name_tool that add the rpaths the
+                 file needs to find the libraries of the other wheels, if any
+        @rtype: list
+        """
+        source = Path(self.config.prefix, filepath)
+        dirpath = os.path.dirname(filepath)
+        rpath_args = []
+        if source.suffix not in ('.so', '.dylib') and os.path.basename(dirpath) != 'bin':
+            return rpath_args
+        # We should not modify this, it's codesigned and copied as-is from the Vulkan SDK
+        if source.name == 'libMoltenVK.dylib':
+            return rpath_args
+        if os.path.islink(source) or not os.path.isfile(source):
+            return rpath_args
+        if not dsymutil.is_macho_file(source):
+            return rpath_args
+        # Add rpath from the gi loader to other wheels that ship
+        # libs that have typelibs
+        if package_name == 'gstreamer_libs':
+            if 'girepository' in source.name or 'gmodule' in source.name:
+                for whl in ('gstreamer_gtk',):
+                    relpath = os.path.relpath(f'{whl}/lib', f'{package_name}/{dirpath}')
+                    rpath_args += ['-add_rpath', f'@loader_path/{relpath}']
+            return rpath_args
+        # We need to route an RPATH from, say,
+        # ~/Library/Python/3.9/lib/python/site-packages/gstreamer_python/{dirpath}
+        # to
+        # ~/Library/Python/3.9/lib/python/site-packages/gstreamer_libs/lib
+        relpath = os.path.relpath('gstreamer_libs/lib', f'{package_name}/{dirpath}')
+        rpath_args += ['-add_rpath', f'@loader_path/{relpath}']
+        for dep in dependencies:
+            pkg = dep.split('~=')[0].strip()
+            if pkg == 'gstreamer_libs':
+                # Already added above
+                continue
+            relpath = os.path.relpath(f'{pkg}/lib', f'{package_name}/{dirpath}')
+            rpath_args += ['-add_rpath', f'@loader_path/{relpath}']
+        return rpath_args
+
     def get_file_type(self, filepath):
-        return shell.check_output(['file', '-bh', filepath])[:-1]  # remove trailing \n
+        return filetype.sniff(filepath)
 
     def _create_wheels(self):
         packagedeps = self.store.get_package_deps(self.package, True)
@@ -468,6 +596,7 @@ class WheelPackager(PackagerBase):
         features = {}
         output_dir = self.output_dir / package_name
         output_dir.mkdir(parents=True, exist_ok=True)
+        payload = {}
         if self.config.variants.visualstudio:
             m.action('Filling redistributable wheel with Visual C++ Runtime')
             vc_tools_redist_dir = self.config.msvc_env_for_toolchain['VCToolsRedistDir']
@@ -480,21 +609,26 @@ class WheelPackager(PackagerBase):
             license = License.Proprietary.acronym
 
             for source in files_list:
-                dest = output_dir / package_name / 'bin'
-                dest.mkdir(parents=True, exist_ok=True)
-                shutil.copy(source, dest)
+                payload[f'{package_name}/bin/{os.path.basename(source)}'] = source
+            if self.config.wheel_use_pip:
+                self._copy_payload(output_dir, payload)
 
         classifiers = self._get_classifiers(license)
-
-        self._create_wheel(
-            package_name,
-            files_list,
-            license,
-            classifiers,
-            dependencies,
-            features,
-            'Platform-specific runtime redist for GStreamer',
-        )
+        wheels = [
+            (
+                package_name,
+                payload,
+                self._wheel_info(
+                    package_name,
+                    files_list,
+                    license,
+                    classifiers,
+                    dependencies,
+                    features,
+                    'Platform-specific runtime redist for GStreamer',
+                ),
+            )
+        ]
 
         package_dependencies['gstreamer_libs'].append(f'{package_name} ~= {self.wheel_version}')
 
@@ -507,58 +641,43 @@ class WheelPackager(PackagerBase):
 
             output_dir = self.output_dir / package_name
             output_dir.mkdir(parents=True, exist_ok=True)
-
-            for filepath in files_list:
-                source = Path(self.config.prefix, filepath)
-                dirpath = os.path.dirname(filepath)
-                dest = output_dir / package_name / dirpath
-                dest.mkdir(parents=True, exist_ok=True)
-                if os.path.isfile(source):
-                    shutil.copy(source, dest, follow_symlinks=False)
-                elif os.path.isdir(source):
-                    shell.copy_dir(source, dest, follow_symlinks=False)
-                rpath_args = []
-                if self.config.target_platform == Platform.DARWIN:
-                    if source.suffix not in ('.so', '.dylib') and dest.name != 'bin':
-                        continue
-                    # We should not modify this, it's codesigned and copied as-is from the Vulkan SDK
-                    if source.name == 'libMoltenVK.dylib':
-                        continue
-                    destpath = dest / source.name
-                    if os.path.islink(destpath):
+            payload = self._wheel_payload(package_name, files_list)
+
+            # Only the files that get new rpaths are copied when writing the
+            # wheels directly, the rest is read from the prefix
+            if self.config.wheel_use_pip:
+                self._copy_payload(output_dir, payload)
+            if self.config.target_platform == Platform.DARWIN:
+                for filepath in files_list:
+                    rpath_args = self._wheel_rpaths(package_name, filepath, dependencies)
+                    if not rpath_args:
                         continue
-                    if not dsymutil.is_macho_file(destpath):
-                        continue
-                    # Add rpath from the gi loader to other wheels that ship
-                    # libs that have typelibs
-                    if package_name == 'gstreamer_libs':
-                        if 'girepository' in source.name or 'gmodule' in source.name:
-                            for whl in ('gstreamer_gtk',):
-                                relpath = os.path.relpath(f'{whl}/lib', f'{package_name}/{dirpath}')
-                                rpath_args += ['-add_rpath', f'@loader_path/{relpath}']
-                            shell.new_call(['install_name_tool'] + rpath_args + [destpath], env=self.config.env)
-                        continue
-                    # We need to route an RPATH from, say,
-                    # ~/Library/Python/3.9/lib/python/site-packages/gstreamer_python/{dirpath}
-                    # to
-                    # ~/Library/Python/3.9/lib/python/site-packages/gstreamer_libs/lib
-                    relpath = os.path.relpath('gstreamer_libs/lib', f'{package_name}/{dirpath}')
-                    rpath_args += ['-add_rpath', f'@loader_path/{relpath}']
-                    for dep in dependencies:
-                        pkg = dep.split('~=')[0].strip()
-                        if pkg == 'gstreamer_libs':
-                            # Already added above
-                            continue
-                        relpath = os.path.relpath(f'{pkg}/lib', f'{package_name}/{dirpath}')
-                        rpath_args += ['-add_rpath', f'@loader_path/{relpath}']
+                    arcname = f'{package_name}/{filepath}'
+                    destpath = output_dir / arcname
+                    if not self.config.wheel_use_pip:
+                        destpath.parent.mkdir(parents=True, exist_ok=True)
+                        shutil.copy(payload[arcname], destpath)
+                        payload[arcname] = destpath
                     shell.new_call(['install_name_tool'] + rpath_args + [destpath], env=self.config.env)
 
             classifiers = self._get_classifiers(license)
-            self._create_wheel(
+            info = self._wheel_info(
                 package_name, files_list, license, classifiers, dependencies, features, package_desc[package_name]
             )
-
-        return list(self.output_dir.glob('**/gstreamer*.whl'))
+            wheels.append((package_name, payload, info))
+
+        if self.config.wheel_use_pip:
+            for package_name, _payload, (package_info, entrypoints) in wheels:
+                self._create_wheel(package_name, package_info, entrypoints)
+            return list(self.output_dir.glob('**/gstreamer*.whl'))
+
+        # Compressing is done by zlib without holding the GIL
+        with concurrent.futures.ThreadPoolExecutor(max_workers=self.config.num_of_cpus) as executor:
+            futures = [
+                executor.submit(self._write_wheel, package_name, package_info, entrypoints, payload)
+                for package_name, payload, (package_info, entrypoints) in wheels
+            ]
+            return [f.result() for f in futures]
 
     def pack(self, output_dir, devel=False, force=False, keep_temp=False):
         """
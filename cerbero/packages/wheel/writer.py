@@ -0,0 +1,412 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+"""
+Writes wheels directly from the files of the prefix, without staging them in
+a setuptools project and running `pip wheel`.
+
+The result matches what data/wheel/setup.py produces: the same tags, the
+same metadata and the same layout, with the payload under the package
+directory and the dist-info directory last.
+"""
+
+import base64
+import hashlib
+import os
+import stat
+import struct
+import time
+import zipfile
+from pathlib import Path
+
+# Wheels whose setup.py distribution has no libraries and no extensions
+PURE_WHEELS = ('gstreamer', 'gstreamer_bundle', 'gstreamer_meta')
+# Wheels that link to the Python C API and can't use the stable ABI
+EXT_MODULE_WHEELS = ('gstreamer_python',)
+# Wheels that keep the platform tag of the interpreter on macOS
+MACOS_PLATFORM_WHEELS = PURE_WHEELS + ('gstreamer_gtk',)
+MACOS_UNIVERSAL_PLATFORM = 'macosx_10_13_universal2'
+LIMITED_API = 'cp39'
+
+IMPORT_SHIM = 'import sys; import gstreamer_libs; gstreamer_libs.setup_python_environment();\n'
+IMPORT_SHIM_PY3_15 = 'gstreamer_libs:setup_python_environment\n'
+
+GENERATOR = 'cerbero'
+CHUNK_SIZE = 1 << 20
+# Zip files can't store dates before 1980
+MIN_DATE = (1980, 1, 1, 0, 0, 0)
+
+# Prints what the tags of a wheel depend on, for the interpreter that would
+# have run `pip wheel`
+PYTHON_INFO_SCRIPT = """import json, os, platform, struct, sys, sysconfig
+print(json.dumps({
+    'version': list(sys.version_info[:2]),
+    'platform': sysconfig.get_platform(),
+    'system': platform.system(),
+    'gil_disabled': bool(sysconfig.get_config_var('Py_GIL_DISABLED')),
+    'pointer_size': struct.calcsize('P'),
+    'deployment_target': os.environ.get('MACOSX_DEPLOYMENT_TARGET'),
+}))"""
+
+# Platforms of the 64-bit interpreters that bdist_wheel renames when the
+# interpreter is a 32-bit build
+PLATFORMS_32BIT = {'linux-x86_64': 'linux-i686', 'linux-aarch64': 'linux-armv7l'}
+
+# Mach-O headers, see <mach-o/loader.h> and <mach-o/fat.h>
+FAT_MAGIC = 0xCAFEBABE
+FAT_MAGIC_64 = 0xCAFEBABF
+MH_MAGIC = 0xFEEDFACE
+MH_MAGIC_64 = 0xFEEDFACF
+LC_VERSION_MIN_MACOSX = 0x24
+LC_BUILD_VERSION = 0x32
+CPU_TYPE_ARM64 = 0x0100000C
+
+
+def platform_tag(platform):
+    """
+    @param platform: the platform as returned by sysconfig.get_platform()
+    @type platform: str
+    @return: the platform tag of a wheel for @platform
+    @rtype: str
+    """
+    return platform.replace('-', '_').replace('.', '_')
+
+
+def _macho_min_version(f, offset):
+    f.seek(offset)
+    magic = f.read(4)
+    for order in ('<', '>'):
+        if struct.unpack(order + 'I', magic)[0] in (MH_MAGIC, MH_MAGIC_64):
+            break
+    else:
+        return None
+    is_64 = struct.unpack(order + 'I', magic)[0] == MH_MAGIC_64
+    ncmds = struct.unpack(order + 'iiIIII', f.read(24))[3]
+    if is_64:
+        f.seek(4, os.SEEK_CUR)
+    for _ in range(ncmds):
+        pos = f.tell()
+        cmd, cmdsize = struct.unpack(order + 'II', f.read(8))
+        if cmd == LC_VERSION_MIN_MACOSX:
+            version = struct.unpack(order + 'I', f.read(4))[0]
+        elif cmd == LC_BUILD_VERSION:
+            version = struct.unpack(order + 'II', f.read(8))[1]
+        else:
+            f.seek(pos + cmdsize)
+            continue
+        # X.Y.Z encoded in nibbles xxxx.yy.zz
+        return (version >> 16, (version >> 8) & 0xFF, version & 0xFF)
+    return None
+
+
+def macho_min_macos_version(path):
+    """
+    Reads the minimum macOS version of a Mach-O binary like the wheel
+    package does. For universal binaries, the highest of the versions of the
+    architectures is used, ignoring the 11.0 of arm64, which is the lowest
+    version supported by that architecture.
+
+    @param path: path of the binary
+    @type path: str
+    @return: the version as a tuple, or None if it's not a Mach-O binary or
+             it has no minimum version
+    @rtype: tuple
+    """
+    with open(path, 'rb') as f:
+        try:
+            magic = f.read(4)
+            if len(magic) < 4:
+                return None
+            fat_magic = struct.unpack('>I', magic)[0]
+            if fat_magic not in (FAT_MAGIC, FAT_MAGIC_64):
+                return _macho_min_version(f, 0)
+            # The fat headers are always big endian
+            nfat_arch = struct.unpack('>I', f.read(4))[0]
+            arch_format = '>iiQQII' if fat_magic == FAT_MAGIC_64 else '>iiIII'
+            archs = [struct.unpack(arch_format, f.read(struct.calcsize(arch_format))) for _ in range(nfat_arch)]
+            versions = []
+            for arch in archs:
+                version = _macho_min_version(f, arch[2])
+                if version is None:
+                    continue
+                if arch[0] == CPU_TYPE_ARM64 and len(archs) != 1 and version == (11, 0, 0):
+                    continue
+                versions.append(version)
+            return max(versions) if versions else None
+        except struct.error:
+            # Truncated file
+            return None
+
+
+def _macos_version(version):
+    """
+    Versions in the platform tags only have a major number since macOS 11
+    """
+    version = tuple(int(x) for x in version.split('.')[:2])
+    if len(version) < 2:
+        version += (0,)
+    if version[0] > 10:
+        version = (version[0], 0)
+    return version
+
+
+def wheel_platform(python_info, binaries=()):
+    """
+    Computes the platform tag bdist_wheel would give to a binary wheel. On
+    macOS, the version in the tag is raised to the deployment target and to
+    the minimum version required by the binaries of the wheel.
+
+    @param python_info: the output of L{PYTHON_INFO_SCRIPT}
+    @type python_info: dict
+    @param binaries: paths of the .dylib and .so files of the wheel
+    @type binaries: list
+    @return: the platform tag
+    @rtype: str
+    """
+    platform = python_info['platform']
+    if platform.startswith('macosx'):
+        prefix, version, arch = platform.split('-')
+        version = _macos_version(version)
+        # A deployment target lower than the version Python was built for
+        # is ignored
+        if python_info.get('deployment_target'):
+            version = max(version, _macos_version(python_info['deployment_target']))
+        for path in binaries:
+            min_version = macho_min_macos_version(path)
+            if min_version is not None:
+                version = max(version, _macos_version('{}.{}'.format(*min_version)))
+        platform = '{}-{}.{}-{}'.format(prefix, version[0], version[1], arch)
+    elif python_info.get('pointer_size') == 4:
+        platform = PLATFORMS_32BIT.get(platform, platform)
+    return platform_tag(platform)
+
+
+def wheel_tag(package_name, python_info, binaries=()):
+    """
+    Computes the tag setup.py would give to a wheel
+
+    @param package_name: name of the wheel
+    @type package_name: str
+    @param python_info: the output of L{PYTHON_INFO_SCRIPT}
+    @type python_info: dict
+    @param binaries: paths of the .dylib and .so files of the wheel
+    @type binaries: list
+    @return: the python, ABI and platform tags joined with dashes
+    @rtype: str
+    """
+    if package_name in PURE_WHEELS:
+        return 'py3-none-any'
+    impl = 'cp{}{}'.format(*python_info['version'])
+    abi = impl + ('t' if python_info['gil_disabled'] else '')
+    if package_name in EXT_MODULE_WHEELS:
+        return f'{impl}-{abi}-{wheel_platform(python_info, binaries)}'
+    if python_info['system'] == 'Darwin' and package_name not in MACOS_PLATFORM_WHEELS:
+        plat = MACOS_UNIVERSAL_PLATFORM
+    else:
+        plat = wheel_platform(python_info, binaries)
+    if python_info['gil_disabled']:
+        return f'{impl}-{abi}-{plat}'
+    return f'{LIMITED_API}-abi3-{plat}'
+
+
+def import_shim(package_name, python_info):
+    """
+    @return: the name and the content of the file that sets up the
+             environment of the wheels when Python starts
+    @rtype: tuple
+    """
+    if tuple(python_info['version']) >= (3, 15):
+        return f'{package_name}.start', IMPORT_SHIM_PY3_15.encode('utf-8-sig')
+    return f'{package_name}.pth', IMPORT_SHIM.encode('utf-8')
+
+
+def metadata(info):
+    """
+    @param info: the description of the wheel, with the keys of
+                 gstreamer_vendor.json
+    @type info: dict
+    @return: the content of the METADATA file
+    @rtype: str
+    """
+    lines = [
+        'Metadata-Version: 2.1',
+        f'Name: {info["package_name"]}',
+        f'Version: {info["version"]}',
+        f'Summary: {info["description"]}',
+        f'Home-page: {info["url"]}',
+        f'Author: {info["vendor"]}',
+        f'License: {info["spdx_license"]}',
+    ]
+    lines += [f'Classifier: {c}' for c in info['classifiers']]
+    lines.append(f'Requires-Python: {info["python_version"]}')
+    lines += [f'Requires-Dist: {d}' for d in info['install_requires']]
+    for extra, deps in (info['extras_require'] or {}).items():
+        lines.append(f'Provides-Extra: {extra}')
+        lines += [f'Requires-Dist: {d}; extra == "{extra}"' for d in deps]
+    lines.append(f'Description-Content-Type: {info["long_description_content_type"]}')
+    return '\n'.join(lines) + '\n\n' + info['long_description']
+
+
+def entry_points(info):
+    """
+    @return: the content of the entry_points.txt file, or None if the wheel
+             has no entry points
+    @rtype: str
+    """
+    if not info['entrypoints']:
+        return None
+    content = ''
+    for group, entries in info['entrypoints'].items():
+        content += f'[{group}]\n' + ''.join(f'{e}\n' for e in entries) + '\n'
+    return content
+
+
+def _record_hash(digest):
+    return 'sha256=' + base64.urlsafe_b64encode(digest).rstrip(b'=').decode('ascii')
+
+
+class WheelWriter(object):
+    """
+    Writes the files of a wheel, computing the hashes of its RECORD while
+    they are compressed
+
+    @ivar path: path of the wheel
+    @type path: L{Path}
+    """
+
+    def __init__(self, path, dist_info):
+        """
+        @param path: path of the wheel
+        @type path: L{Path}
+        @param dist_info: name of the .dist-info directory of the wheel
+        @type dist_info: str
+        """
+        self.path = Path(path)
+        self.dist_info = dist_info
+        self._zip = zipfile.ZipFile(self.path, 'w', compression=zipfile.ZIP_DEFLATED)
+        self._records = []
+
+    def _zipinfo(self, arcname, mode, mtime):
+        date = max(MIN_DATE, time.localtime(mtime)[:6])
+        zinfo = zipfile.ZipInfo(arcname, date_time=date)
+        zinfo.compress_type = zipfile.ZIP_DEFLATED
+        zinfo.external_attr = (stat.S_IFREG | (mode & 0o777)) << 16
+        return zinfo
+
+    def add_file(self, arcname, source):
+        """
+        Adds a file of the filesystem, following symbolic links like
+        setuptools does, since wheels can't store them
+
+        @param arcname: path of the file in the wheel
+        @type arcname: str
+        @param source: path of the file
+        @type source: str
+        """
+        st = os.stat(source)
+        zinfo = self._zipinfo(arcname, st.st_mode, st.st_mtime)
+        digest = hashlib.sha256()
+        size = 0
+        with open(source, 'rb') as src, self._zip.open(
+            zinfo, 'w', force_zip64=st.st_size >= zipfile.ZIP64_LIMIT
+        ) as dst:
+            while True:
+                chunk = src.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                digest.update(chunk)
+                dst.write(chunk)
+                size += len(chunk)
+        self._records.append((arcname, _record_hash(digest.digest()), size))
+
+    def add_bytes(self, arcname, data, mode=0o644):
+        """
+        Adds a file from its content
+
+        @param arcname: path of the file in the wheel
+        @type arcname: str
+        @param data: content of the file
+        @type data: bytes
+        """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        self._zip.writestr(self._zipinfo(arcname, mode, time.time()), data)
+        self._records.append((arcname, _record_hash(hashlib.sha256(data).digest()), len(data)))
+
+    def abort(self):
+        """
+        Closes and removes an incomplete wheel
+        """
+        self._zip.close()
+        self.path.unlink()
+
+    def close(self):
+        """
+        Writes the RECORD of the wheel and closes it
+        """
+        record = f'{self.dist_info}/RECORD'
+        lines = [f'{name},{digest},{size}' for name, digest, size in self._records]
+        lines.append(f'{record},,')
+        self._zip.writestr(self._zipinfo(record, 0o644, time.time()), '\n'.join(lines) + '\n')
+        self._zip.close()
+
+
+def write_wheel(output_dir, info, tag, files):
+    """
+    Writes a wheel
+
+    @param output_dir: directory where the wheel is written
+    @type output_dir: L{Path}
+    @param info: the description of the wheel, with the keys of
+                 gstreamer_vendor.json
+    @type info: dict
+    @param tag: the tag of the wheel, see L{wheel_tag}
+    @type tag: str
+    @param files: path in the wheel -> path of the file in the filesystem,
+                  or its content as bytes
+    @type files: dict
+    @return: the path of the wheel
+    @rtype: L{Path}
+    """
+    name = info['package_name']
+    version = info['version']
+    dist_info = f'{name}-{version}.dist-info'
+    path = Path(output_dir, f'{name}-{version}-{tag}.whl')
+    writer = WheelWriter(path, dist_info)
+    try:
+        for arcname in sorted(files):
+            source = files[arcname]
+            if isinstance(source, bytes):
+                writer.add_bytes(arcname, source)
+            else:
+                writer.add_file(arcname, source)
+        writer.add_bytes(f'{dist_info}/METADATA', metadata(info))
+        root_is_purelib = 'true' if tag.endswith('-none-any') else 'false'
+        writer.add_bytes(
+            f'{dist_info}/WHEEL',
+            f'Wheel-Version: 1.0\nGenerator: {GENERATOR}\nRoot-Is-Purelib: {root_is_purelib}\nTag: {tag}\n',
+        )
+        eps = entry_points(info)
+        if eps:
+            writer.add_bytes(f'{dist_info}/entry_points.txt', eps)
+        writer.add_bytes(f'{dist_info}/top_level.txt', f'{name}\n')
+        writer.close()
+    except BaseException:
+        writer.abort()
+        raise
+    return path
@@ -1,21 +1,18 @@
 # SPDX-FileCopyrightText: 2024 L. E. Segovia <amy@centricular.com>
 # SPDX-License-Ref: LGPL-2.1-or-later
+import asyncio
 import functools
 import glob
 import os
 from pathlib import Path
 
 from cerbero.enums import Platform
-from cerbero.utils import shell
+from cerbero.utils import filetype, run_tasks, shell
 
 
-@functools.lru_cache()
 def is_macho_file(fp: Path) -> bool:
     # All files must be checked since .so and .dylib can have .dSYM bundles
-    filedesc = shell.check_output(['file', '-bh', fp.resolve().as_posix()])
-    # gst-ptp-helper is setuid
-    filedesc = filedesc.removeprefix('setuid ')
-    return filedesc.startswith('Mach-O') and 'dSYM companion' not in filedesc
+    return filetype.is_macho(fp.resolve())
 
 
 def symbolicable_files(files_list, prefix, target_platform: Platform):
@@ -35,10 +32,8 @@ def symbolicable_files(files_list, prefix, target_platform: Platform):
     def is_windows_executable(fp: Path) -> bool:
         return fp.suffix in ['.pyd', '.dll', '.exe']
 
-    @functools.lru_cache()
     def is_elf_file(fp: Path) -> bool:
-        filedesc = shell.check_output(['file', '-bh', fp.resolve().as_posix()])
-        return filedesc.startswith('ELF ')
+        return filetype.is_elf(fp.resolve())
 
     files = []
     for f in files_list:
@@ -58,28 +53,106 @@ def symbolicable_files(files_list, prefix, target_platform: Platform):
         return list(filter(is_elf_file, files))
 
 
-def symbolicate_macho_files(files, logfile=None, env=None):
-    for f in files:
-        abspath = f.resolve()
+def _symbols_are_current(binary: Path, symbols: Path) -> bool:
+    # The symbols file gets the mtime of the binary it was extracted from, any
+    # rebuild or reinstall of the binary changes it
+    try:
+        return os.stat(symbols).st_mtime_ns == os.stat(binary).st_mtime_ns
+    except OSError:
+        return False
+
+
+def _mark_symbols_current(binary: Path, symbols: Path):
+    st = os.stat(binary)
+    try:
+        os.utime(symbols, ns=(st.st_atime_ns, st.st_mtime_ns))
+    except FileNotFoundError:
+        pass
+
+
+async def _run_pipelines(pipelines):
+    """
+    Runs the per-file pipelines concurrently, the commands they spawn are
+    bounded by the CPU-bound semaphore of cerbero.utils.shell
+
+    @return: the number of files that were symbolicated
+    @rtype: int
+    """
+    if not pipelines:
+        return 0
+    tasks = [asyncio.ensure_future(p) for p in pipelines]
+    await run_tasks(tasks)
+    return sum(1 for t in tasks if t.result())
+
+
+def macho_symbols_file(f: Path) -> Path:
+    """
+    @return: the DWARF file of the dSYM bundle generated for @f
+    @rtype: Path
+    """
+    return f.parent / f'{f.name}.dSYM' / 'Contents' / 'Resources' / 'DWARF' / f.name
+
+
+async def symbolicate_macho_files(files, logfile=None, env=None):
+    """
+    Generates the dSYM bundle of each file, skipping the ones whose bundle
+    was generated from the current binary
+
+    @return: the number of files that were symbolicated
+    @rtype: int
+    """
+    files = [f.resolve() for f in files]
+    for abspath in files:
         if '.dSYM' in str(abspath):
             raise RuntimeError('Cannot symbolicate symbols')
-        shell.new_call(['dsymutil', abspath], cmd_dir=abspath.parent, logfile=logfile, env=env)
 
+    async def symbolicate(abspath):
+        dwarf = macho_symbols_file(abspath)
+        if _symbols_are_current(abspath, dwarf):
+            return False
+        await shell.async_new_call(['dsymutil', abspath], cmd_dir=abspath.parent, logfile=logfile, env=env)
+        _mark_symbols_current(abspath, dwarf)
+        return True
+
+    return await _run_pipelines([symbolicate(f) for f in files])
 
-def symbolicate_gnu_files(files, logfile=None, env=None):
+
+def gnu_symbols_file(f: Path) -> Path:
+    """
+    @return: the separate debug info file for @f
+    @rtype: Path
+    """
+    if f.suffix == '.exe':  # emulate GNU
+        return f.with_suffix('.debuginfo')
+    return f.with_suffix(f.suffix + '.debuginfo')
+
+
+async def symbolicate_gnu_files(files, logfile=None, env=None):
+    """
+    Moves the debug info of each file to a separate file linked with
+    .gnu_debuglink, skipping the ones that were already stripped and whose
+    debug info file is current
+
+    @return: the number of files that were symbolicated
+    @rtype: int
+    """
+    files = list(files)
+    for f in files:
+        if f.suffix == '.debuginfo':
+            raise RuntimeError('Cannot symbolicate symbols')
+    if not files:
+        return 0
     objcopy_cmd = env.get('OBJCOPY', 'objcopy') if env else 'objcopy'
     compress_flags = []
-    test_flags_output = shell.check_output([objcopy_cmd, '--help'], env=env)
+    test_flags_output = await shell.async_check_output([objcopy_cmd, '--help'], env=env)
     if '--compress-debug-sections' in test_flags_output:
         compress_flags = ['--compress-debug-sections']
-    for f in files:
-        if f.suffix == '.debuginfo':
-            raise RuntimeError('Cannot symbolicate symbols')
-        elif f.suffix == '.exe':  # emulate GNU
-            dwp = f.with_suffix('.debuginfo')
-        else:
-            dwp = f.with_suffix(f.suffix + '.debuginfo')
-        shell.new_call(
+
+    async def symbolicate(f):
+        dwp = gnu_symbols_file(f)
+        if _symbols_are_current(f, dwp):
+            return False
+        await shell.async_new_call(
             [objcopy_cmd, *compress_flags, '--only-keep-debug', f.name, dwp.name],
             cmd_dir=f.parent.as_posix(),
             logfile=logfile,
@@ -88,14 +161,19 @@ def symbolicate_gnu_files(files, logfile=None, env=None):
         # I don't like adding the gnu-debuginfo section *after*
         # generating the stripped binary, but if I do it the
         # other way around, Windows refuses to execute the binary.
-        tmpfile = f.with_suffix('.tmp-cerbero-sym')
-        shell.new_call(
+        # The whole name is kept so that files run concurrently don't clash
+        tmpfile = f.with_name(f.name + '.tmp-cerbero-sym')
+        await shell.async_new_call(
             [objcopy_cmd, '--strip-debug', f.name, tmpfile.name], cmd_dir=f.parent.as_posix(), logfile=logfile, env=env
         )
-        shell.new_call(
+        await shell.async_new_call(
             [objcopy_cmd, f'--add-gnu-debuglink={dwp.name}', tmpfile.name],
             cmd_dir=f.parent.as_posix(),
             logfile=logfile,
             env=env,
         )
         os.replace(tmpfile, f)
+        _mark_symbols_current(f, dwp)
+        return True
+
+    return await _run_pipelines([symbolicate(f) for f in files])
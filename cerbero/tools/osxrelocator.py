@@ -20,7 +20,7 @@
 import os
 
 from cerbero.errors import FatalError
-from cerbero.utils import shell
+from cerbero.utils import filetype, shell, run_until_complete
 
 
 INT_CMD = 'install_name_tool'
@@ -55,28 +55,28 @@ class OSXRelocator(object):
         self.use_relative_paths = True
         self.logfile = None
 
-    def relocate(self):
-        self.parse_dir(self.root)
+    async def relocate(self):
+        await self.parse_dir(self.root)
 
-    def relocate_dir(self, dirname):
-        self.parse_dir(os.path.join(self.root, dirname))
+    async def relocate_dir(self, dirname):
+        await self.parse_dir(os.path.join(self.root, dirname))
 
-    def relocate_file(self, object_file, original_file=None):
-        self.change_libs_path(object_file, original_file)
+    async def relocate_file(self, object_file, original_file=None):
+        await self.change_libs_path(object_file, original_file)
 
-    def change_id(self, object_file, id=None):
+    async def change_id(self, object_file, id=None):
         """
         Changes the `LC_ID_DYLIB` of the given object file.
         @object_file: Path to the object file
         @id: New ID; if None, it'll be `@rpath/<basename>`
         """
         id = id or object_file.replace(self.install_prefix, '@rpath')
-        if not self._is_mach_o_file(object_file):
+        if not await self._is_mach_o_file(object_file):
             return
         cmd = [INT_CMD, '-id', id, object_file]
-        shell.new_call(cmd, fail=False, logfile=self.logfile)
+        await shell.async_new_call(cmd, fail=False, logfile=self.logfile)
 
-    def change_libs_path(self, object_file, original_file=None):
+    async def change_libs_path(self, object_file, original_file=None):
         """
         Sanitizes the `LC_LOAD_DYLIB` and `LC_RPATH` load commands,
         setting the former to be of the form `@rpath/libyadda.dylib`,
@@ -88,7 +88,7 @@ class OSXRelocator(object):
         creating a fat binary from copy of the original file in a temporary
         location.
         """
-        if not self._is_mach_o_file(object_file):
+        if not await self._is_mach_o_file(object_file):
             return
         if original_file is None:
             original_file = object_file
@@ -98,11 +98,11 @@ class OSXRelocator(object):
         # it's too late -- unless one wants to run through all load commands
         # If the library isn't a dylib, it's a framework, in which case
         # assert that it's already rpath'd
-        dylib_id = self.get_dylib_id(object_file)
+        dylib_id = await self.get_dylib_id(object_file)
         is_dylib = dylib_id is not None
         is_framework = is_dylib and not any([object_file.endswith(i) for i in ('.dylib', '.so')])
         if not is_framework:
-            self.change_id(object_file, id='@rpath/{}'.format(os.path.basename(original_file)))
+            await self.change_id(object_file, id='@rpath/{}'.format(os.path.basename(original_file)))
         elif '@rpath' not in dylib_id:
             raise FatalError(f'Cannot relocate a fixed location framework: {dylib_id}')
         # With that out of the way, we need to sort out how many parents
@@ -135,18 +135,17 @@ class OSXRelocator(object):
         # Make them unique
         rpaths = list(set(rpaths))
         # Remove absolute RPATHs, we don't want or need these
-        existing_rpaths = list(set(self.list_rpaths(object_file)))
-        for p in filter(
-            lambda p: p.startswith('/') and not p.startswith('/Applications/Xcode.app'), self.list_rpaths(object_file)
-        ):
+        current_rpaths = await self.list_rpaths(object_file)
+        existing_rpaths = list(set(current_rpaths))
+        for p in filter(lambda p: p.startswith('/') and not p.startswith('/Applications/Xcode.app'), current_rpaths):
             cmd = [INT_CMD, '-delete_rpath', p, object_file]
-            shell.new_call(cmd, fail=False, logfile=self.logfile)
+            await shell.async_new_call(cmd, fail=False, logfile=self.logfile)
         # Add relative RPATHs
         for p in filter(lambda p: p not in existing_rpaths, rpaths):
             cmd = [INT_CMD, '-add_rpath', p, object_file]
-            shell.new_call(cmd, fail=False, logfile=self.logfile)
+            await shell.async_new_call(cmd, fail=False, logfile=self.logfile)
         # Change dependencies' paths from absolute to @rpath/
-        for lib in self.list_shared_libraries(object_file):
+        for lib in await self.list_shared_libraries(object_file):
             # Is it an absolute Python path that requires recasting?
             if is_absolute_python_framework(lib):
                 # -change <lib> @rpath/libpythonX.YY.dylib
@@ -162,27 +161,27 @@ class OSXRelocator(object):
             if is_absolute_python_framework(lib):
                 p = f"{lib.removesuffix('/Python')}/lib"
                 cmd = [INT_CMD, '-add_rpath', p, object_file]
-                shell.new_call(cmd, fail=False, logfile=self.logfile)
+                await shell.async_new_call(cmd, fail=False, logfile=self.logfile)
             cmd = [INT_CMD, '-change', lib, new_lib, object_file]
-            shell.new_call(cmd, fail=False, logfile=self.logfile)
+            await shell.async_new_call(cmd, fail=False, logfile=self.logfile)
 
-    def parse_dir(self, dir_path, filters=None):
+    async def parse_dir(self, dir_path, filters=None):
         for dirpath, dirnames, filenames in os.walk(dir_path):
             for f in filenames:
                 if filters is not None and os.path.splitext(f)[1] not in filters:
                     continue
-                self.change_libs_path(os.path.join(dirpath, f))
+                await self.change_libs_path(os.path.join(dirpath, f))
             if not self.recursive:
                 break
 
     @staticmethod
-    def get_dylib_id(object_file):
-        res = shell.check_output([OTOOL_CMD, '-D', object_file]).splitlines()
+    async def get_dylib_id(object_file):
+        res = (await shell.async_check_output([OTOOL_CMD, '-D', object_file])).splitlines()
         return res[-1] if len(res) > 1 else None
 
     @staticmethod
-    def list_shared_libraries(object_file):
-        res = shell.check_output([OTOOL_CMD, '-L', object_file]).splitlines()
+    async def list_shared_libraries(object_file):
+        res = (await shell.async_check_output([OTOOL_CMD, '-L', object_file])).splitlines()
         # We don't use the first line
         libs = res[1:]
         # Remove the first character tabulation
@@ -192,8 +191,8 @@ class OSXRelocator(object):
         return libs
 
     @staticmethod
-    def list_rpaths(object_file):
-        res = shell.check_output([OTOOL_CMD, '-l', object_file]).splitlines()
+    async def list_rpaths(object_file):
+        res = (await shell.async_check_output([OTOOL_CMD, '-l', object_file])).splitlines()
         i = iter(res)
         paths = []
         for line in i:
@@ -212,18 +211,13 @@ class OSXRelocator(object):
             return path[:-1]
         return path
 
-    def _is_mach_o_file(self, filename):
+    async def _is_mach_o_file(self, filename):
         fileext = os.path.splitext(filename)[1]
 
         if '.dylib' in fileext:
             return True
 
-        filedesc = shell.check_output(['file', '-bh', filename])
-
-        if fileext == '.a' and 'ar archive' in filedesc:
-            return False
-
-        return filedesc.startswith('Mach-O') and 'companion' not in filedesc
+        return filetype.is_macho(filename)
 
 
 class Main(object):
@@ -252,7 +246,7 @@ class Main(object):
             parser.print_usage()
             exit(1)
         relocator = OSXRelocator(args[1], args[2], options.recursive)
-        relocator.relocate_file(args[0])
+        run_until_complete(relocator.relocate_file(args[0]))
         exit(0)
 
 
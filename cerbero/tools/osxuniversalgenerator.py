@@ -32,7 +32,8 @@ if __name__ == '__main__':
     parent = os.path.dirname(parent)
     sys.path.append(parent)
 
-from cerbero.utils import shell, run_tasks, run_until_complete
+from cerbero.utils import filetype, shell, run_tasks, run_until_complete
+from cerbero.utils.filetype import FileType
 from cerbero.tools.osxrelocator import OSXRelocator
 
 
@@ -44,31 +45,18 @@ def get_parent_prefix(f, dirs):
             yield (dir_)
 
 
-file_types = [
-    ('Mach-O', 'merge'),
-    ('ar archive', 'merge'),
-    ('libtool archive', 'skip'),
-    ('libtool library', 'copy-la'),
-    ('symbolic link', 'link'),
-    ('data', 'copy'),
-    ('text', 'copy'),
-    ('document', 'copy'),
-    ('catalog', 'copy'),
-    ('python', 'copy'),
-    ('image', 'copy'),
-    ('icon', 'copy'),
-    ('FORTRAN', 'copy'),
-    ('LaTeX', 'copy'),
-    ('Zip', 'copy'),
-    ('empty', 'copy'),
-    ('PEM certificate', 'copy'),
-    ('data', 'copy'),
-    ('GVariant Database', 'copy'),
-    ('Font', 'copy'),
-    ('OpenType', 'copy'),
-    ('TrueType', 'copy'),
-    ('directory', 'recurse'),
-]
+file_actions = {
+    FileType.MACHO: 'merge',
+    FileType.MACHO_FAT: 'merge',
+    FileType.AR: 'merge',
+    FileType.LIBTOOL_LA: 'copy-la',
+    FileType.SYMLINK: 'link',
+    FileType.DIRECTORY: 'recurse',
+    FileType.EMPTY: 'copy',
+    FileType.TEXT: 'copy',
+    FileType.SCRIPT: 'copy',
+    FileType.DATA: 'copy',
+}
 
 
 class OSXUniversalGenerator(object):
@@ -90,7 +78,6 @@ class OSXUniversalGenerator(object):
     """
 
     LIPO_CMD = 'lipo'
-    FILE_CMD = 'file'
 
     def __init__(self, output_root, logfile=None):
         """
@@ -110,10 +97,13 @@ class OSXUniversalGenerator(object):
             await self.do_merge(f, dirs)
 
     def merge_dirs(self, input_roots, output_root=None):
+        run_until_complete(self.async_merge_dirs(input_roots, output_root))
+
+    async def async_merge_dirs(self, input_roots, output_root=None):
         if output_root is None:
             output_root = self.output_root
         os.makedirs(output_root, exist_ok=True)
-        self.parse_dirs(input_roots)
+        await self.async_parse_dirs(input_roots)
 
     async def create_universal_file(self, output, inputlist, dirs):
         tmp_inputs = []
@@ -126,14 +116,14 @@ class OSXUniversalGenerator(object):
             shutil.copy(f, tmp.name)
             prefix_to_replace = [d for d in dirs if d in f][0]
             relocator = OSXRelocator(self.output_root, prefix_to_replace, False, logfile=self.logfile)
-            relocator.relocate_file(tmp.name, f)
+            await relocator.relocate_file(tmp.name, f)
         cmd = [self.LIPO_CMD, '-create'] + [f.name for f in tmp_inputs] + ['-output', output]
-        shell.new_call(cmd)
+        await shell.async_new_call(cmd)
         for tmp in tmp_inputs:
             tmp.close()
 
-    def get_file_type(self, filepath):
-        return shell.check_output([self.FILE_CMD, '-bh', filepath])[:-1]  # remove trailing \n
+    async def get_file_type(self, filepath):
+        return filetype.sniff(filepath)
 
     async def _detect_merge_action(self, files_list):
         actions = []
@@ -141,27 +131,20 @@ class OSXUniversalGenerator(object):
             if not os.path.exists(f):
                 continue  # TODO what can we do here? fontconfig has
                 # some random generated filenames it seems
-            ftype = self.get_file_type(f)
-            action = ''
-            for ft in file_types:
-                if ft[0] in ftype:
-                    if ft[0] == 'text' and f.endswith('.pc'):
-                        action = 'copy-pc'
-                    else:
-                        action = ft[1]
-                    break
-            if not action:
-                # Sometimes `file` barfs on header files, so fallback to a copy
-                if f.endswith('.h'):
-                    action = 'copy'
-                else:
-                    raise Exception('Unexpected file type %s %s' % (str(ftype), f))
+            ftype = await self.get_file_type(f)
+            if ftype.type == FileType.TEXT and f.endswith('.pc'):
+                action = 'copy-pc'
+            elif ftype.type in file_actions:
+                action = file_actions[ftype.type]
+            else:
+                # Binaries for other platforms can't be merged with lipo
+                raise Exception('Unexpected file type %s %s' % (ftype.type, f))
             actions.append(action)
         if len(actions) == 0:
             return 'skip'  # we should skip this one, the file doesn't exist
         all_same = all(x == actions[0] for x in actions)
         if not all_same:
-            raise Exception('Different file types found: %s : %s' % (str(ftype), str(files_list)))
+            raise Exception('Different file types found: %s : %s' % (ftype.type, str(files_list)))
         return actions[0]
 
     async def do_merge(self, filepath, dirs):
@@ -185,11 +168,14 @@ class OSXUniversalGenerator(object):
         elif action == 'skip':
             pass  # just pass
         elif action == 'recurse':
-            self.merge_dirs(full_filepaths, output_file)
+            await self.async_merge_dirs(full_filepaths, output_file)
         else:
             raise Exception('unexpected action %s' % action)
 
     def parse_dirs(self, dirs, filters=None):
+        run_until_complete(self.async_parse_dirs(dirs, filters))
+
+    async def async_parse_dirs(self, dirs, filters=None):
         self.missing = []
 
         queue = asyncio.Queue()
@@ -225,13 +211,10 @@ class OSXUniversalGenerator(object):
                 current_file = os.path.join(current_dir, f)
                 queue.put_nowait((current_file, dirs))
 
-        async def parse_dirs_main():
-            tasks = []
-            for i in range(4):
-                tasks.append(asyncio.ensure_future(parse_dirs_worker()))
-            await run_tasks(tasks, queue_done())
-
-        run_until_complete(parse_dirs_main())
+        tasks = []
+        for i in range(4):
+            tasks.append(asyncio.ensure_future(parse_dirs_worker()))
+        await run_tasks(tasks, queue_done())
 
     def _copy(self, src, dest):
         os.makedirs(os.path.dirname(dest), exist_ok=True)
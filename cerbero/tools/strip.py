@@ -17,6 +17,7 @@
 # Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 # Boston, MA 02111-1307, USA.
 
+import asyncio
 import os
 from cerbero.config import Platform
 from cerbero.utils import shell, run_until_complete, messages as m
@@ -54,15 +55,15 @@ class Strip(object):
             cmd += ['--strip-unneeded', path]
 
         try:
-            # async_call() is not adapted for EnvValues in env
-            await shell.async_call(cmd, env={'PATH': self.build_env['PATH'].get()})
+            # async_new_call() is not adapted for EnvValues in env
+            await shell.async_new_call(cmd, env={'PATH': self.build_env['PATH'].get()})
         except Exception as e:
             m.warning(e)
 
     def strip_file(self, path):
         run_until_complete(self.async_strip_file(path))
 
-    def strip_dir(self, dir_path):
+    async def async_strip_dir(self, dir_path):
         if not self.strip_cmd:
             m.warning('Strip command is not defined')
             return
@@ -71,4 +72,7 @@ class Strip(object):
         for dirpath, dirnames, filenames in os.walk(dir_path):
             for f in filenames:
                 tasks.append(self.async_strip_file(os.path.join(dirpath, f)))
-        run_until_complete(tasks)
+        await asyncio.gather(*tasks)
+
+    def strip_dir(self, dir_path):
+        run_until_complete(self.async_strip_dir(dir_path))
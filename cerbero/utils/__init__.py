@@ -174,6 +174,19 @@ def determine_total_ram() -> int:
     return 4 << 30  # Assume 4GB
 
 
+def determine_free_ram():
+    """Memory available for new processes in this system, in bytes, or None if unknown"""
+
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    return int(line.split()[1]) * 1024
+    except (OSError, ValueError, IndexError):
+        pass
+    return None
+
+
 def to_winpath(path):
     if path.startswith('/'):
         ppath = pathlib.PurePath(path)
@@ -491,11 +504,13 @@ def remove_list_duplicates(seq):
     return [x for x in seq if x not in seen and not seen_add(x)]
 
 
-def parse_file(filename, dict):
+def parse_file(filename, dict, code=None):
     if '__file__' not in dict:
         dict['__file__'] = filename
     try:
-        exec(compile(open(filename, encoding='utf-8').read(), filename, 'exec'), dict)
+        if code is None:
+            code = compile(open(filename, encoding='utf-8').read(), filename, 'exec')
+        exec(code, dict)
     except Exception as ex:
         import traceback
 
@@ -928,6 +943,12 @@ class EnvValue(list):
     def get(self):
         return str.join(self.sep, self)
 
+    def copy(self):
+        new = self.__class__.__new__(self.__class__)
+        new.sep = self.sep
+        new.extend(self)
+        return new
+
     @staticmethod
     def from_key(key, value):
         if EnvVar.is_path(key):
@@ -1034,12 +1055,16 @@ def merge_env_value_env(old_env, new_env):
 
     Changed values from `old_env` are checked for being `EnvValue` type.
 
-    Values from `new_env` are converted to `EnvValue` using `EnvValue.from_key(k, new_v)`.
+    Values from `new_env` are converted to `EnvValue` using `EnvValue.from_key(k, new_v)`,
+    or copied if they already are `EnvValue` objects.
     """
     ret_env = {}
     # Set/merge new values
     for k, new_v in new_env.items():
-        new_v = EnvValue.from_key(k, new_v)
+        if isinstance(new_v, EnvValue):
+            new_v = new_v.copy()
+        else:
+            new_v = EnvValue.from_key(k, new_v)
         if k not in old_env:
             ret_env[k] = new_v
             continue
@@ -0,0 +1,415 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+"""
+HTTP downloads without curl or wget.
+
+All the mirrors of a file are probed at the same time and the download
+starts from the first one that answers. Large files are split in segments
+downloaded in parallel when the server supports ranges. Each segment is
+written to a partial file next to the destination, and a transfer that
+fails is resumed from where it stopped, on the same mirror first and then
+on the next ones. Partial files left by an interrupted run are resumed too.
+
+The sha256 of the file is computed while it's written, and a file that
+doesn't match the expected checksum is never moved to its destination.
+"""
+
+import asyncio
+import glob
+import hashlib
+import http.client
+import os
+import re
+import ssl
+import threading
+import time
+import urllib.error
+import urllib.request
+
+CHUNK_SIZE = 1 << 16
+# Seconds without receiving anything before a transfer is considered stalled
+TIMEOUT = 20
+# Attempts on each mirror before moving to the next one
+RETRIES = 3
+RETRY_DELAY = 1
+# Files are not split in segments smaller than this
+MIN_SEGMENT_SIZE = 8 << 20
+
+CONTENT_RANGE_RE = re.compile(r'bytes (\d+)-(\d+)/(\d+|\*)')
+
+
+class DownloadError(Exception):
+    """
+    Raised when a file couldn't be downloaded from any of its mirrors
+
+    @ivar errors: list of (url, exception) of the last failure of each mirror
+    @type errors: list
+    """
+
+    def __init__(self, errors):
+        Exception.__init__(self, errors)
+        self.errors = errors
+
+
+class CertificateError(DownloadError):
+    """
+    Raised when no mirror could be used because the certificates couldn't
+    be verified, which happens when Python doesn't find the CA certificates
+    of the system
+    """
+
+
+class ChecksumError(Exception):
+    pass
+
+
+class _Probe(object):
+    def __init__(self, origin, url, size, ranges):
+        # The URL of the mirror and the one it redirects to
+        self.origin = origin
+        self.url = url
+        self.size = size
+        self.ranges = ranges
+
+
+class Downloader(object):
+    """
+    Downloads a file from a list of mirrors
+
+        d = Downloader(['https://a.org/foo.tar.xz', 'https://b.org/foo.tar.xz'], '/tmp/foo.tar.xz',
+                       checksum='...', segments=4)
+        await d.download()
+
+    @ivar urls: URLs of the file, in order of preference
+    @type urls: list
+    @ivar dest: path of the file
+    @type dest: str
+    @ivar summary: where and how the file was downloaded, for the logs
+    @type summary: str
+    """
+
+    def __init__(self, urls, dest, check_cert=True, checksum=None, segments=1, user_agent=None, host_semaphore=None):
+        """
+        @param urls: URLs of the file, in order of preference
+        @type urls: list
+        @param dest: path of the file
+        @type dest: str
+        @param check_cert: whether to check certificates or not
+        @type check_cert: bool
+        @param checksum: expected sha256 of the file
+        @type checksum: str
+        @param segments: maximum number of segments downloaded in parallel
+        @type segments: int
+        @param user_agent: User-Agent header of the requests
+        @type user_agent: str
+        @param host_semaphore: function returning an asynchronous context
+                               manager bounding the requests to the host of
+                               an URL
+        @type host_semaphore: function
+        """
+        self.urls = list(urls)
+        self.dest = dest
+        self.checksum = checksum
+        self.segments = max(1, segments)
+        self.user_agent = user_agent
+        self.host_semaphore = host_semaphore
+        self.summary = None
+        if check_cert:
+            self._context = ssl.create_default_context()
+        else:
+            self._context = ssl._create_unverified_context()
+        self._errors = {}
+
+    def _open(self, url, start=None, end=None):
+        headers = {}
+        if self.user_agent:
+            headers['User-Agent'] = self.user_agent
+        if start is not None:
+            headers['Range'] = 'bytes=%d-%s' % (start, '' if end is None else end)
+        request = urllib.request.Request(url, headers=headers)
+        return urllib.request.urlopen(request, timeout=TIMEOUT, context=self._context)
+
+    def _probe(self, url):
+        """
+        Asks for the first byte to know the size of the file and whether the
+        server supports ranges
+        """
+        with self._open(url, 0, 0) as resp:
+            if resp.status == 206:
+                match = CONTENT_RANGE_RE.match(resp.headers.get('Content-Range', ''))
+                size = int(match.group(3)) if match and match.group(3) != '*' else None
+                return _Probe(url, resp.geturl(), size, size is not None)
+            length = resp.headers.get('Content-Length')
+            return _Probe(url, resp.geturl(), int(length) if length else None, False)
+
+    async def _semaphore_call(self, url, func, *args, stop=None):
+        """
+        Runs @func in a thread. If @stop is given and the call is cancelled,
+        @stop is set and the thread is waited for, so that it doesn't keep
+        writing files in the background.
+        """
+        if self.host_semaphore is None:
+            return await _thread_call(func, args, stop)
+        async with self.host_semaphore(url):
+            return await _thread_call(func, args, stop)
+
+    async def _race(self):
+        """
+        Probes all the mirrors at the same time
+
+        @return: the probe of the first mirror that answered and the URLs
+                 to try, starting with it
+        @rtype: tuple
+        """
+        tasks = {asyncio.ensure_future(self._semaphore_call(url, self._probe, url)): url for url in self.urls}
+        pending = set(tasks)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                probes = []
+                for task in done:
+                    if task.exception() is not None:
+                        self._errors[tasks[task]] = task.exception()
+                    else:
+                        probes.append(task.result())
+                if probes:
+                    probe = probes[0]
+                    # Start with the URL after the redirections, and keep
+                    # the other mirrors that didn't fail to fall back to
+                    urls = [probe.url] + [u for u in self.urls if u != probe.url and u not in self._errors]
+                    return probe, urls
+        finally:
+            for task in pending:
+                task.cancel()
+        self._raise()
+
+    def _raise(self):
+        errors = list(self._errors.items())
+        if errors and all(_is_certificate_error(e) for url, e in errors):
+            raise CertificateError(errors)
+        raise DownloadError(errors)
+
+    def _fetch(self, url, part, start, end, hasher, stop):
+        """
+        Downloads bytes @start to @end of the file in @part, resuming it if
+        it has some already. @end is None when the size is unknown. Stops
+        as soon as @stop is set.
+        """
+        have = os.path.getsize(part) if os.path.exists(part) else 0
+        if end is not None and have > end - start + 1:
+            # Left by a download of another version of the file
+            os.remove(part)
+            have = 0
+        if end is not None and start + have > end:
+            if hasher is not None:
+                hasher.reset(part)
+            return
+        if have == 0 and start == 0 and end is None:
+            resp = self._open(url)
+        else:
+            resp = self._open(url, start + have, end)
+        with resp:
+            if resp.status == 206:
+                match = CONTENT_RANGE_RE.match(resp.headers.get('Content-Range', ''))
+                if not match or int(match.group(1)) != start + have:
+                    raise urllib.error.URLError('Unexpected Content-Range %r' % resp.headers.get('Content-Range'))
+                mode = 'ab'
+            elif start == 0:
+                # The server ignored the range, start again from the beginning
+                mode = 'wb'
+            else:
+                raise urllib.error.URLError('The server of %s does not support ranges' % url)
+            if hasher is not None:
+                hasher.reset(part if mode == 'ab' and have else None)
+            with open(part, mode) as f:
+                while True:
+                    if stop.is_set():
+                        return
+                    data = resp.read(CHUNK_SIZE)
+                    if not data:
+                        break
+                    f.write(data)
+                    if hasher is not None:
+                        hasher.update(data)
+            length = os.path.getsize(part)
+        if end is not None and length != end - start + 1:
+            raise urllib.error.URLError('Transfer closed with %d bytes remaining' % (end - start + 1 - length))
+
+    async def _fetch_segment(self, urls, part, start, end, hasher, stop):
+        errors = []
+        for url in urls:
+            attempt = 0
+            while attempt < RETRIES:
+                have = os.path.getsize(part) if os.path.exists(part) else 0
+                try:
+                    await self._semaphore_call(url, self._fetch, url, part, start, end, hasher, stop, stop=stop)
+                    return
+                except (OSError, http.client.HTTPException, ValueError) as ex:
+                    # Timeouts, dropped connections, truncated responses...
+                    errors.append((url, ex))
+                    self._errors[url] = ex
+                    if isinstance(ex, urllib.error.HTTPError) and ex.code < 500 and ex.code != 429:
+                        # Not found, forbidden... no need to try again
+                        break
+                    if os.path.exists(part) and os.path.getsize(part) > have:
+                        # Only the transfers that didn't get anything count
+                        # as failures, the others are resumed
+                        attempt = 0
+                        continue
+                    attempt += 1
+                    await asyncio.sleep(RETRY_DELAY * attempt)
+        raise DownloadError(errors)
+
+    def _parts(self, count):
+        if count == 1:
+            return [self.dest + '.partial']
+        return ['%s.part%d-%d' % (self.dest, i, count) for i in range(count)]
+
+    def _remove_parts(self, keep=()):
+        pattern = glob.escape(self.dest)
+        for path in glob.glob(pattern + '.partial') + glob.glob(pattern + '.part*-*'):
+            if path not in keep:
+                os.remove(path)
+
+    def _segment_count(self, probe):
+        if not probe.ranges or probe.size is None:
+            return 1
+        return max(1, min(self.segments, probe.size // MIN_SEGMENT_SIZE))
+
+    def _assemble(self, parts):
+        """
+        Concatenates the segments in a temporary file, computing its
+        checksum on the way
+        """
+        h = hashlib.sha256()
+        tmp = self.dest + '.partial'
+        with open(tmp, 'wb') as out:
+            for part in parts:
+                with open(part, 'rb') as f:
+                    for block in iter(lambda: f.read(1 << 20), b''):
+                        h.update(block)
+                        out.write(block)
+        return tmp, h.hexdigest()
+
+    async def _download(self, probe, urls):
+        count = self._segment_count(probe)
+        parts = self._parts(count)
+        self._remove_parts(keep=parts)
+        stop = threading.Event()
+        if count == 1:
+            hasher = _ResumableHash()
+            await self._fetch_segment(urls, parts[0], 0, None if probe.size is None else probe.size - 1, hasher, stop)
+            tmp, checksum = parts[0], hasher.hexdigest()
+        else:
+            size = probe.size
+            step = (size + count - 1) // count
+            ranges = [(i * step, min(size, (i + 1) * step) - 1) for i in range(count)]
+            tasks = [
+                asyncio.ensure_future(self._fetch_segment(urls, p, s, e, None, stop))
+                for p, (s, e) in zip(parts, ranges)
+            ]
+            try:
+                await asyncio.gather(*tasks)
+            except BaseException:
+                # Stop the other segments before giving up, they must not
+                # keep writing their partial files once the download failed
+                stop.set()
+                for task in tasks:
+                    task.cancel()
+                await asyncio.gather(*tasks, return_exceptions=True)
+                raise
+            tmp, checksum = await asyncio.to_thread(self._assemble, parts)
+        if self.checksum is not None and checksum != self.checksum:
+            # Resumed data could come from another version of the file,
+            # don't reuse any of it
+            self._remove_parts()
+            raise ChecksumError('Checksum is {!r} instead of {!r}'.format(checksum, self.checksum))
+        os.replace(tmp, self.dest)
+        self._remove_parts()
+        return count
+
+    async def download(self):
+        """
+        Downloads the file
+
+        @raise DownloadError: if none of the mirrors worked
+        """
+        start_time = time.monotonic()
+        os.makedirs(os.path.dirname(os.path.abspath(self.dest)), exist_ok=True)
+        while True:
+            probe, urls = await self._race()
+            try:
+                count = await self._download(probe, urls)
+                break
+            except ChecksumError as ex:
+                # Try the next mirror, if any
+                self._errors[probe.origin] = ex
+                self.urls.remove(probe.origin)
+                if not self.urls:
+                    self._raise()
+        self.summary = '%s in %d segment(s), %.1f s' % (urls[0], count, time.monotonic() - start_time)
+
+    def discard(self):
+        """
+        Removes the partial files, so that the next download starts again
+        from the beginning
+        """
+        self._remove_parts()
+
+
+class _ResumableHash(object):
+    """
+    sha256 of a partial file being written, which starts with the data
+    already in the file when the transfer is resumed
+    """
+
+    def __init__(self):
+        self._h = hashlib.sha256()
+
+    def reset(self, resumed=None):
+        self._h = hashlib.sha256()
+        if resumed is not None:
+            with open(resumed, 'rb') as f:
+                for block in iter(lambda: f.read(1 << 20), b''):
+                    self._h.update(block)
+
+    def update(self, data):
+        self._h.update(data)
+
+    def hexdigest(self):
+        return self._h.hexdigest()
+
+
+async def _thread_call(func, args, stop):
+    future = asyncio.ensure_future(asyncio.to_thread(func, *args))
+    if stop is None:
+        return await future
+    try:
+        return await asyncio.shield(future)
+    except asyncio.CancelledError:
+        # Threads can't be cancelled, wait until this one sees @stop
+        stop.set()
+        await asyncio.gather(future, return_exceptions=True)
+        raise
+
+
+def _is_certificate_error(ex):
+    if isinstance(ex, urllib.error.URLError) and not isinstance(ex, urllib.error.HTTPError):
+        ex = ex.reason
+    return isinstance(ex, ssl.SSLCertVerificationError)
@@ -0,0 +1,246 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+"""
+Detects the format of the files of a prefix from their magic bytes and
+headers, like `file -bh` does for the formats cerbero cares about, without
+spawning a process for each file.
+"""
+
+import collections
+import os
+import stat
+import struct
+
+
+class FileType:
+    """Enumeration of the formats detected by L{sniff}"""
+
+    MISSING = 'missing'
+    DIRECTORY = 'directory'
+    SYMLINK = 'symbolic link'
+    EMPTY = 'empty'
+    ELF = 'ELF'
+    MACHO = 'Mach-O'
+    MACHO_FAT = 'Mach-O universal binary'
+    PE = 'PE'
+    AR = 'ar archive'
+    LIBTOOL_LA = 'libtool library file'
+    SCRIPT = 'script'
+    TEXT = 'text'
+    DATA = 'data'
+
+
+# Format of the file and, for binaries, their kind ('executable', 'shared',
+# 'dylib', 'dsym'...) and architectures
+FileInfo = collections.namedtuple('FileInfo', ['type', 'subtype', 'archs'])
+
+# path -> (stat key, FileInfo)
+FILE_TYPE_CACHE = {}
+# Enough for the headers of all the formats, except PE files with a large
+# DOS stub, whose header is read separately
+HEADER_SIZE = 512
+
+ELF_MAGIC = b'\x7fELF'
+ELF_TYPES = {1: 'relocatable', 2: 'executable', 3: 'shared', 4: 'core'}
+ELF_MACHINES = {3: 'x86', 8: 'mips', 20: 'ppc', 21: 'ppc64', 40: 'arm', 62: 'x86_64', 183: 'arm64', 243: 'riscv'}
+
+MACHO_MAGICS = {
+    b'\xfe\xed\xfa\xce': '>',
+    b'\xce\xfa\xed\xfe': '<',
+    b'\xfe\xed\xfa\xcf': '>',
+    b'\xcf\xfa\xed\xfe': '<',
+}
+MACHO_FAT_MAGICS = {b'\xca\xfe\xba\xbe': 20, b'\xca\xfe\xba\xbf': 32}
+# Java class files share the magic of fat binaries, but they have a version
+# where fat binaries have their number of architectures
+MACHO_FAT_MAX_ARCHS = 30
+MACHO_TYPES = {1: 'object', 2: 'executable', 6: 'dylib', 7: 'dylinker', 8: 'bundle', 9: 'stub', 10: 'dsym'}
+MACHO_CPUS = {7: 'x86', 0x01000007: 'x86_64', 12: 'arm', 0x0100000C: 'arm64', 0x0200000C: 'arm64_32', 18: 'ppc'}
+
+PE_MACHINES = {0x14C: 'x86', 0x8664: 'x86_64', 0x1C4: 'armv7', 0xAA64: 'arm64'}
+PE_DLL = 0x2000
+
+AR_MAGICS = (b'!<arch>\n', b'!<thin>\n')
+
+
+def _stat_key(st):
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime_ns, st.st_mode)
+
+
+def _sniff_elf(header):
+    if len(header) < 20:
+        return FileInfo(FileType.DATA, None, ())
+    endian = '<' if header[5] == 1 else '>'
+    e_type, e_machine = struct.unpack_from(endian + 'HH', header, 16)
+    return FileInfo(FileType.ELF, ELF_TYPES.get(e_type), (ELF_MACHINES.get(e_machine, str(e_machine)),))
+
+
+def _sniff_macho(header):
+    if len(header) < 16:
+        return FileInfo(FileType.DATA, None, ())
+    endian = MACHO_MAGICS[header[:4]]
+    cputype, unused_subtype, filetype = struct.unpack_from(endian + 'iII', header, 4)
+    return FileInfo(FileType.MACHO, MACHO_TYPES.get(filetype), (MACHO_CPUS.get(cputype, str(cputype)),))
+
+
+def _sniff_macho_fat(f, header):
+    nfat_arch = struct.unpack_from('>I', header, 4)[0]
+    if nfat_arch == 0 or nfat_arch > MACHO_FAT_MAX_ARCHS:
+        return None
+    entry_size = MACHO_FAT_MAGICS[header[:4]]
+    archs = []
+    offsets = []
+    for i in range(nfat_arch):
+        pos = 8 + i * entry_size
+        if pos + entry_size > len(header):
+            break
+        cputype = struct.unpack_from('>i', header, pos)[0]
+        if entry_size == 20:
+            offset = struct.unpack_from('>I', header, pos + 8)[0]
+        else:
+            offset = struct.unpack_from('>Q', header, pos + 8)[0]
+        archs.append(MACHO_CPUS.get(cputype, str(cputype)))
+        offsets.append(offset)
+    if not archs:
+        return None
+    # The kind of the binary is the one of its slices
+    f.seek(offsets[0])
+    slice_header = f.read(16)
+    if slice_header[:4] in MACHO_MAGICS:
+        subtype = _sniff_macho(slice_header).subtype
+    elif slice_header[:8] in AR_MAGICS:
+        subtype = 'archive'
+    else:
+        subtype = None
+    return FileInfo(FileType.MACHO_FAT, subtype, tuple(archs))
+
+
+def _sniff_pe(f, header):
+    if len(header) < 0x40:
+        return None
+    pe_offset = struct.unpack_from('<I', header, 0x3C)[0]
+    if pe_offset + 24 <= len(header):
+        coff = header[pe_offset : pe_offset + 24]
+    else:
+        f.seek(pe_offset)
+        coff = f.read(24)
+    if len(coff) < 24 or coff[:4] != b'PE\0\0':
+        return None
+    machine = struct.unpack_from('<H', coff, 4)[0]
+    characteristics = struct.unpack_from('<H', coff, 22)[0]
+    subtype = 'dll' if characteristics & PE_DLL else 'executable'
+    return FileInfo(FileType.PE, subtype, (PE_MACHINES.get(machine, hex(machine)),))
+
+
+def _sniff_text(header):
+    if b'\0' in header:
+        return FileInfo(FileType.DATA, None, ())
+    if header.startswith(b'#!'):
+        interpreter = header[2:].split(b'\n', 1)[0].strip().split(b' ')[0]
+        return FileInfo(FileType.SCRIPT, os.path.basename(interpreter.decode('utf-8', 'replace')), ())
+    if b'libtool library file' in header.split(b'\n', 2)[0]:
+        return FileInfo(FileType.LIBTOOL_LA, None, ())
+    try:
+        header.decode('utf-8')
+    except UnicodeDecodeError as e:
+        # A multi-byte character cut at the end of the header
+        if e.start < len(header) - 3:
+            return FileInfo(FileType.DATA, None, ())
+    return FileInfo(FileType.TEXT, None, ())
+
+
+def _sniff_file(path):
+    with open(path, 'rb') as f:
+        header = f.read(HEADER_SIZE)
+        if not header:
+            return FileInfo(FileType.EMPTY, None, ())
+        if header[:4] == ELF_MAGIC:
+            return _sniff_elf(header)
+        if header[:4] in MACHO_MAGICS:
+            return _sniff_macho(header)
+        if header[:4] in MACHO_FAT_MAGICS:
+            info = _sniff_macho_fat(f, header)
+            if info:
+                return info
+        if header[:8] in AR_MAGICS:
+            return FileInfo(FileType.AR, None, ())
+        if header[:2] == b'MZ':
+            info = _sniff_pe(f, header)
+            if info:
+                return info
+    return _sniff_text(header)
+
+
+def sniff(path):
+    """
+    Detects the format of a file. Symbolic links are not followed, like
+    `file -h` does. The result is cached until the file changes.
+
+    @param path: path of the file
+    @type path: str
+    @return: the format of the file
+    @rtype: L{FileInfo}
+    """
+    path = os.fspath(path)
+    try:
+        st = os.lstat(path)
+    except OSError:
+        return FileInfo(FileType.MISSING, None, ())
+    if stat.S_ISLNK(st.st_mode):
+        return FileInfo(FileType.SYMLINK, None, ())
+    if stat.S_ISDIR(st.st_mode):
+        return FileInfo(FileType.DIRECTORY, None, ())
+    if not stat.S_ISREG(st.st_mode):
+        return FileInfo(FileType.DATA, None, ())
+    key = _stat_key(st)
+    cached = FILE_TYPE_CACHE.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    try:
+        info = _sniff_file(path)
+    except OSError:
+        return FileInfo(FileType.MISSING, None, ())
+    FILE_TYPE_CACHE[path] = (key, info)
+    return info
+
+
+def is_elf(path):
+    """
+    @return: whether the file is an ELF binary
+    @rtype: bool
+    """
+    return sniff(path).type == FileType.ELF
+
+
+def is_macho(path):
+    """
+    @return: whether the file is a Mach-O binary, thin or universal, that is
+             not a static library or a dSYM companion file
+    @rtype: bool
+    """
+    info = sniff(path)
+    return info.type in (FileType.MACHO, FileType.MACHO_FAT) and info.subtype not in ('dsym', 'archive')
+
+
+def is_pe(path):
+    """
+    @return: whether the file is a PE executable or DLL
+    @rtype: bool
+    """
+    return sniff(path).type == FileType.PE
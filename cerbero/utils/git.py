@@ -17,6 +17,7 @@
 # Boston, MA 02111-1307, USA.
 
 import os
+import re
 import shutil
 import time
 import cerbero.utils.messages as m
@@ -31,6 +32,14 @@ if shell.PLATFORM == Platform.WINDOWS:
 else:
     GIT = 'git'
 
+# Full SHA-1 or SHA-256 object names
+OBJECT_NAME_RE = re.compile(r'^([0-9a-f]{40}|[0-9a-f]{64})$')
+# Names that could need git's full revision parsing (ranges, reflogs, ...)
+REVISION_SYNTAX_RE = re.compile(r'[~^:@{}\\\s?*\[]|\.\.')
+PSEUDO_REF_RE = re.compile(r'^[A-Z_]+$')
+# packed-refs path -> ((mtime, size), {refname: object name})
+_packed_refs_cache = {}
+
 
 def ensure_user_is_set(git_dir, logfile=None):
     # Set the user configuration for this repository
@@ -206,6 +215,113 @@ async def checkout(git_dir, commit, logfile=None):
     return await shell.async_call(cmd, git_dir, logfile=logfile, cpu_bound=False)
 
 
+def _git_dirs(git_dir):
+    dotgit = os.path.join(git_dir, '.git')
+    if os.path.isdir(dotgit):
+        gitdir = dotgit
+    elif os.path.isfile(dotgit):
+        # worktrees and submodules have a .git file pointing to the git dir
+        with open(dotgit, 'r', encoding='utf-8') as f:
+            line = f.readline().strip()
+        if not line.startswith('gitdir: '):
+            return None
+        gitdir = os.path.join(git_dir, line[len('gitdir: ') :])
+    else:
+        return None
+    commondir = gitdir
+    commondir_file = os.path.join(gitdir, 'commondir')
+    if os.path.isfile(commondir_file):
+        with open(commondir_file, 'r', encoding='utf-8') as f:
+            commondir = os.path.join(gitdir, f.readline().strip())
+    return gitdir, commondir
+
+
+def _packed_refs(commondir):
+    path = os.path.join(commondir, 'packed-refs')
+    try:
+        st = os.stat(path)
+    except OSError:
+        return {}
+    key = (st.st_mtime_ns, st.st_size)
+    cached = _packed_refs_cache.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    refs = {}
+    with open(path, 'r', encoding='utf-8') as f:
+        for line in f:
+            # Skip the header and the peeled tags
+            if line.startswith(('#', '^')):
+                continue
+            parts = line.split()
+            if len(parts) == 2:
+                refs[parts[1]] = parts[0]
+    _packed_refs_cache[path] = (key, refs)
+    return refs
+
+
+def _read_ref(gitdir, commondir, refname, depth=0):
+    if depth > 5:
+        return None
+    for d in (gitdir, commondir):
+        path = os.path.join(d, *refname.split('/'))
+        if not os.path.isfile(path):
+            continue
+        with open(path, 'r', encoding='utf-8') as f:
+            value = f.readline().strip()
+        if value.startswith('ref: '):
+            return _read_ref(gitdir, commondir, value[len('ref: ') :], depth + 1)
+        if OBJECT_NAME_RE.match(value):
+            return value
+        return None
+    return _packed_refs(commondir).get(refname)
+
+
+def resolve_ref(git_dir, commit):
+    """
+    Resolves a commit name to a commit hash reading the refs of the
+    repository directly, which is much cheaper than running git.
+    Only plain ref names (HEAD, branches, tags, remote branches) are
+    supported, following the same lookup order as git rev-parse.
+
+    @param git_dir: path of the git repository
+    @type git_dir: str
+    @param commit: the commit name
+    @type commit: str
+    @return: the commit hash or None if it can't be resolved this way
+    @rtype: str
+    """
+    if OBJECT_NAME_RE.match(commit):
+        return commit
+    if not commit or commit.startswith(('-', '/')) or REVISION_SYNTAX_RE.search(commit):
+        return None
+    # Pseudo refs other than HEAD, like FETCH_HEAD, have their own format
+    if commit != 'HEAD' and PSEUDO_REF_RE.match(commit):
+        return None
+    try:
+        dirs = _git_dirs(git_dir)
+        if dirs is None:
+            return None
+        if commit == 'HEAD':
+            candidates = ['HEAD']
+        else:
+            candidates = [
+                'refs/' + commit,
+                'refs/tags/' + commit,
+                'refs/heads/' + commit,
+                'refs/remotes/' + commit,
+                'refs/remotes/' + commit + '/HEAD',
+            ]
+            if commit.startswith('refs/'):
+                candidates.insert(0, commit)
+        for refname in candidates:
+            sha = _read_ref(*dirs, refname)
+            if sha is not None:
+                return sha
+    except (OSError, UnicodeDecodeError):
+        pass
+    return None
+
+
 def get_hash(git_dir, commit, logfile=None):
     """
     Get a commit hash from a valid commit.
@@ -222,6 +338,10 @@ def get_hash(git_dir, commit, logfile=None):
         # can get called from built_version() when the directory isn't git.
         # Return a fixed string + unix time to trigger a full fetch.
         return 'not-git-' + str(time.time())
+    # Avoid spawning git for the common case of resolving a branch or a tag
+    sha = resolve_ref(git_dir, commit)
+    if sha is not None:
+        return sha
     return shell.check_output(
         [GIT, 'rev-parse', commit], cmd_dir=git_dir, fail=False, quiet=True, logfile=logfile
     ).rstrip()
@@ -319,3 +439,15 @@ def apply_patch(patch, git_dir, logfile=None):
     @type patch: str
     """
     shell.new_call([GIT, 'am', '--ignore-whitespace', patch], git_dir, logfile=logfile)
+
+
+async def async_apply_patch(patch, git_dir, logfile=None):
+    """
+    Applies a commit patch usign 'git am' without blocking the event loop
+
+    @param git_dir: path of the git repository
+    @type git_dir: str
+    @param patch: path of the patch file
+    @type patch: str
+    """
+    await shell.async_new_call([GIT, 'am', '--ignore-whitespace', patch], git_dir, logfile=logfile, cpu_bound=False)
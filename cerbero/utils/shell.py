@@ -25,16 +25,21 @@ import re
 import zipfile
 import tempfile
 import time
+import datetime
 import glob
 import shutil
 import hashlib
 import collections
+import concurrent.futures
+import json
+import urllib.parse
 from pathlib import Path
 
 from cerbero.enums import CERBERO_VERSION, Platform, Distro
 from cerbero.utils import _, system_info, split_version, to_winpath, CerberoSemaphore
 from cerbero.utils import messages as m
 from cerbero.utils.tar import Tar
+from cerbero.utils.download import CertificateError, DownloadError, Downloader
 from cerbero.errors import CommandError, FatalError
 
 
@@ -46,6 +51,12 @@ PLATFORM = _info[0]
 DISTRO = _info[3]
 CPU_BOUND_SEMAPHORE = CerberoSemaphore(_info[5])
 NON_CPU_BOUND_SEMAPHORE = CerberoSemaphore(2)
+# Maximum number of concurrent network operations against the same host, to
+# avoid being throttled or banned by mirrors when fetching many recipes
+MAX_CALLS_PER_HOST = 4
+HOST_SEMAPHORES = {}
+# tuple of paths -> (stat of each file, checksum), see files_checksum()
+FILES_CHECKSUM_CACHE = {}
 DRY_RUN = False
 
 
@@ -100,6 +111,30 @@ def set_max_non_cpu_bound_calls(number):
     NON_CPU_BOUND_SEMAPHORE = CerberoSemaphore(number)
 
 
+def set_max_calls_per_host(number):
+    global MAX_CALLS_PER_HOST
+    MAX_CALLS_PER_HOST = number
+    HOST_SEMAPHORES.clear()
+
+
+def host_semaphore(url):
+    """
+    Get the semaphore limiting the concurrent network operations against the
+    host of @url
+
+    @param url: URL or git remote (such as git@host:path)
+    @type url: str
+    """
+    host = urllib.parse.urlsplit(url).hostname
+    if host is None and '@' in url:
+        # scp-like git remote
+        host = url.split('@', 1)[1].split(':', 1)[0]
+    host = host or ''
+    if host not in HOST_SEMAPHORES:
+        HOST_SEMAPHORES[host] = CerberoSemaphore(MAX_CALLS_PER_HOST)
+    return HOST_SEMAPHORES[host]
+
+
 def call(cmd, cmd_dir='.', fail=True, verbose=False, logfile=None, env=None):
     """
     Run a shell command
@@ -241,7 +276,7 @@ def new_call(
     return 0
 
 
-async def async_call(cmd, cmd_dir='.', fail=True, logfile=None, cpu_bound=True, env=None):
+async def async_call(cmd, cmd_dir='.', fail=True, logfile=None, cpu_bound=True, env=None, pass_fds=()):
     """
     Run a shell command
 
@@ -249,6 +284,8 @@ async def async_call(cmd, cmd_dir='.', fail=True, logfile=None, cpu_bound=True,
     @type cmd: str
     @param cmd_dir: directory where the command will be run
     @param cmd_dir: str
+    @param pass_fds: file descriptors inherited by the command
+    @type pass_fds: tuple
     """
     global CPU_BOUND_SEMAPHORE, NON_CPU_BOUND_SEMAPHORE
     semaphore = CPU_BOUND_SEMAPHORE if cpu_bound else NON_CPU_BOUND_SEMAPHORE
@@ -273,7 +310,13 @@ async def async_call(cmd, cmd_dir='.', fail=True, logfile=None, cpu_bound=True,
         # of on exit. Ensures that we get continuous output in log files.
         env['PYTHONUNBUFFERED'] = '1'
         proc = await asyncio.create_subprocess_exec(
-            *cmd, cwd=cmd_dir, stderr=subprocess.STDOUT, stdout=stream, stdin=subprocess.DEVNULL, env=env
+            *cmd,
+            cwd=cmd_dir,
+            stderr=subprocess.STDOUT,
+            stdout=stream,
+            stdin=subprocess.DEVNULL,
+            env=env,
+            pass_fds=pass_fds,
         )
         await proc.wait()
         if proc.returncode != 0 and fail:
@@ -320,6 +363,116 @@ async def async_call_output(cmd, cmd_dir=None, logfile=None, cpu_bound=True, env
         return output
 
 
+async def async_new_call(cmd, cmd_dir=None, fail=True, logfile=None, env=None, cpu_bound=True, input=None):
+    """
+    Asynchronous version of L{new_call} that doesn't block the event loop
+    while the command runs. Output is written to @logfile, and errors are
+    reported the same way.
+
+    @param cmd: the command to run
+    @type cmd: list
+    @param cmd_dir: directory where the command will be run
+    @type cmd_dir: str
+    @param fail: whether or not to raise an exception if the command fails
+    @type fail: bool
+    @param cpu_bound: whether the command is limited by the CPU or by I/O
+    @type cpu_bound: bool
+    @param input: data passed to the stdin of the command
+    @type input: bytes
+    @return: the return code of the command
+    @rtype: int
+    """
+    semaphore = CPU_BOUND_SEMAPHORE if cpu_bound else NON_CPU_BOUND_SEMAPHORE
+
+    async with semaphore:
+        cmd = _cmd_string_to_array(cmd, env)
+        if logfile:
+            if input:
+                logfile.write(f'Running command {cmd!r} with stdin {input} in {cmd_dir}\n')
+            else:
+                logfile.write(f'Running command {cmd!r} in {cmd_dir}\n')
+            logfile.flush()
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd,
+                cwd=cmd_dir,
+                env=env,
+                stdout=logfile,
+                stderr=subprocess.STDOUT,
+                stdin=subprocess.PIPE if input else subprocess.DEVNULL,
+            )
+            await proc.communicate(input)
+            returncode = proc.returncode
+        except (FileNotFoundError, PermissionError) as e:
+            if not fail:
+                stream = logfile or sys.stderr
+                if isinstance(e, FileNotFoundError):
+                    stream.write('{}: file not found\n'.format(cmd[0]))
+                else:
+                    stream.write('{!r}: permission error\n'.format(cmd))
+            returncode = -1
+        if returncode != 0:
+            if not fail:
+                return returncode
+            msg = ''
+            if logfile:
+                msg = 'Output in logfile {}'.format(logfile.name)
+            raise CommandError(msg, cmd, returncode)
+        return 0
+
+
+async def async_check_output(cmd, cmd_dir=None, fail=True, logfile=None, env=None, quiet=False, cpu_bound=True):
+    """
+    Asynchronous version of L{check_output} that doesn't block the event
+    loop while the command runs.
+
+    @param cmd: the command to run
+    @type cmd: list
+    @param cmd_dir: directory where the command will be run
+    @type cmd_dir: str
+    @param fail: whether or not to raise an exception if the command fails
+    @type fail: bool
+    @param quiet: discard stderr when there is no @logfile
+    @type quiet: bool
+    @param cpu_bound: whether the command is limited by the CPU or by I/O
+    @type cpu_bound: bool
+    @return: the output of the command, or the error output if it failed
+             and @fail is False
+    @rtype: str
+    """
+    semaphore = CPU_BOUND_SEMAPHORE if cpu_bound else NON_CPU_BOUND_SEMAPHORE
+
+    async with semaphore:
+        cmd = _cmd_string_to_array(cmd, env)
+        stderr = logfile
+        if quiet and not logfile:
+            stderr = subprocess.DEVNULL
+        if logfile:
+            logfile.write(f'Running command {cmd!r} in {cmd_dir}\n')
+            logfile.flush()
+
+        try:
+            proc = await asyncio.create_subprocess_exec(
+                *cmd, cwd=cmd_dir, env=env, stdout=subprocess.PIPE, stderr=stderr, stdin=subprocess.DEVNULL
+            )
+            o, unused_err = await proc.communicate()
+            returncode = proc.returncode
+        except (FileNotFoundError, PermissionError):
+            o, returncode = b'', -1
+
+        if sys.stdout.encoding:
+            o = o.decode(sys.stdout.encoding, errors='replace')
+        else:
+            o = o.decode()
+        if returncode != 0:
+            if not fail:
+                return o
+            if logfile:
+                o += '\nstderr in logfile {}'.format(logfile.name)
+            raise CommandError(o, cmd, returncode)
+        return o
+
+
 def apply_patch(patch, directory, strip=1, logfile=None):
     """
     Apply a patch
@@ -335,6 +488,21 @@ def apply_patch(patch, directory, strip=1, logfile=None):
     new_call([PATCH, f'-p{strip}', '-f', '-i', patch], cmd_dir=directory, logfile=logfile)
 
 
+async def async_apply_patch(patch, directory, strip=1, logfile=None):
+    """
+    Apply a patch without blocking the event loop
+
+    @param patch: path of the patch file
+    @type patch: str
+    @param directory: directory to apply the apply
+    @type: directory: str
+    @param strip: strip
+    @type strip: int
+    """
+    m.log('Applying patch {}'.format(patch), logfile)
+    await async_new_call([PATCH, f'-p{strip}', '-f', '-i', patch], cmd_dir=directory, logfile=logfile, cpu_bound=False)
+
+
 async def unpack(filepath, output_dir, logfile=None):
     """
     Extracts a tarball
@@ -365,7 +533,17 @@ async def unpack(filepath, output_dir, logfile=None):
         raise FatalError('Unknown tarball format %s' % filepath)
 
 
-async def download(url, dest, check_cert=True, overwrite=False, logfile=None, fallback_urls=None):
+async def download(
+    url,
+    dest,
+    check_cert=True,
+    overwrite=False,
+    logfile=None,
+    fallback_urls=None,
+    checksum=None,
+    segments=1,
+    native=True,
+):
     """
     Downloads a file
 
@@ -379,6 +557,15 @@ async def download(url, dest, check_cert=True, overwrite=False, logfile=None, fa
     @type check_cert: bool
     @param logfile: path to the file to log instead of stdout
     @type logfile: str
+    @param checksum: expected sha256 of the file, checked while downloading
+                     it with the native downloader
+    @type checksum: str
+    @param segments: maximum number of parts of the file downloaded in
+                     parallel with the native downloader
+    @type segments: int
+    @param native: whether to download with L{cerbero.utils.download}
+                   instead of curl or wget
+    @type native: bool
     """
     user_agent = 'GStreamerCerbero/' + CERBERO_VERSION
     urls = [url]
@@ -393,6 +580,22 @@ async def download(url, dest, check_cert=True, overwrite=False, logfile=None, fa
         os.makedirs(os.path.dirname(dest), exist_ok=True)
         m.log('Downloading {}'.format(url), logfile)
 
+    if native:
+        downloader = Downloader(
+            urls, dest, check_cert, checksum, segments, user_agent=user_agent, host_semaphore=host_semaphore
+        )
+        if overwrite:
+            downloader.discard()
+        try:
+            await downloader.download()
+            m.log('Downloaded {} from {}'.format(dest, downloader.summary), logfile)
+            return
+        except CertificateError:
+            m.warning('Could not verify the certificates of {!r} with Python, using the system tools'.format(url))
+        except DownloadError as e:
+            errors = e.errors[0] if len(e.errors) == 1 else e.errors
+            raise FatalError('Failed to download {!r}: {!r}'.format(url, errors))
+
     if sys.platform.startswith('win'):
         cmd = [
             'powershell',
@@ -440,7 +643,8 @@ async def download(url, dest, check_cert=True, overwrite=False, logfile=None, fa
         tries = 2
         while tries > 0:
             try:
-                return await async_call(cmd + [url_fmt % murl], cpu_bound=False, logfile=logfile)
+                async with host_semaphore(murl):
+                    return await async_call(cmd + [url_fmt % murl], cpu_bound=False, logfile=logfile)
             except Exception as ex:
                 if os.path.exists(dest):
                     os.remove(dest)
@@ -482,9 +686,12 @@ def ls_dir(dirpath, prefix):
 
 
 def find_newer_files(prefix, compfile):
-    cmd = ['find', '.', '-type', 'f', '-cnewer', compfile]
-    out = subprocess.check_call(cmd, cmd_dir=prefix, fail=False)
-    return out.strip().split('\n')
+    """
+    Finds the files of @prefix changed after @compfile, relative to @prefix
+    """
+    cmd = ['find', '.', '(', '-type', 'f', '-o', '-type', 'l', ')', '-cnewer', compfile]
+    out = check_output(cmd, cmd_dir=prefix, fail=False)
+    return [os.path.normpath(f) for f in out.strip().split('\n') if f]
 
 
 def replace(filepath, replacements):
@@ -554,19 +761,108 @@ def file_hash(path):
     return hashlib.md5(open(path, 'rb').read()).digest()
 
 
+def _files_stat(paths):
+    stats = []
+    for f in paths:
+        st = os.stat(f)
+        stats.append((st.st_size, st.st_mtime_ns, st.st_ino))
+    return tuple(stats)
+
+
+def _files_md5(paths):
+    m = hashlib.md5()
+    for f in paths:
+        with open(f, 'rb') as fo:
+            # Read in chunks to not load big patches fully in memory
+            for block in iter(lambda: fo.read(512 * 1024), b''):
+                m.update(block)
+    return m.digest()
+
+
 def files_checksum(paths):
     """
     Get the md5 checksum of the files
 
+    The checksums are cached keyed on the size, mtime and inode of the files,
+    so unchanged files are not read again.
+
     @paths: list of paths
     @type: list
     @return: the md5 checksum
     @rtype: str
     """
-    m = hashlib.md5()
-    for f in paths:
-        m.update(open(f, 'rb').read())
-    return m.digest()
+    paths = tuple(paths)
+    stats = _files_stat(paths)
+    cached = FILES_CHECKSUM_CACHE.get(paths)
+    if cached is not None and cached[0] == stats:
+        return cached[1]
+    checksum = _files_md5(paths)
+    FILES_CHECKSUM_CACHE[paths] = (stats, checksum)
+    return checksum
+
+
+def files_checksums(paths_list, jobs=None):
+    """
+    Get the md5 checksum of several lists of files, hashing the ones that
+    are not in the cache in a thread pool
+
+    @paths_list: list of lists of paths
+    @type: list
+    @param jobs: number of threads to use
+    @type jobs: int
+    @return: the md5 checksum of each list of paths
+    @rtype: list
+    """
+    paths_list = [tuple(paths) for paths in paths_list]
+    missing = []
+    for paths in paths_list:
+        cached = FILES_CHECKSUM_CACHE.get(paths)
+        if cached is None or cached[0] != _files_stat(paths):
+            missing.append(paths)
+    if len(missing) > 1:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as executor:
+            results = executor.map(lambda paths: (_files_stat(paths), _files_md5(paths)), missing)
+            for paths, result in zip(missing, results):
+                FILES_CHECKSUM_CACHE[paths] = result
+    return [files_checksum(paths) for paths in paths_list]
+
+
+def load_files_checksum_cache(path):
+    """
+    Loads the checksums saved with L{save_files_checksum_cache}
+
+    @param path: path of the cache file
+    @type path: str
+    """
+    try:
+        with open(path, 'r', encoding='utf-8') as f:
+            entries = json.load(f)
+    except (OSError, ValueError):
+        return
+    for paths, stats, checksum in entries:
+        FILES_CHECKSUM_CACHE.setdefault(tuple(paths), (tuple(tuple(s) for s in stats), bytes.fromhex(checksum)))
+
+
+def save_files_checksum_cache(path):
+    """
+    Saves the cached checksums of the files that still exist
+
+    @param path: path of the cache file
+    @type path: str
+    """
+    entries = []
+    for paths, (stats, checksum) in FILES_CHECKSUM_CACHE.items():
+        if all(os.path.exists(f) for f in paths):
+            entries.append((paths, stats, checksum.hex()))
+    try:
+        dirname = os.path.dirname(path)
+        os.makedirs(dirname, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dirname, prefix=os.path.basename(path))
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            json.dump(entries, f)
+        os.replace(tmp, path)
+    except OSError as ex:
+        m.warning(_('Could not save the files checksum cache: %s') % ex)
 
 
 def enter_build_environment(platform, arch, distro, sourcedir=None, bash_completions=None, env=None):
@@ -714,9 +1010,11 @@ def windows_proof_rename(from_name, to_name):
 
 
 def symlink(src, dst, working_dir=None):
-    prev_wd = os.getcwd()
+    # Don't chdir to working_dir, build steps can run in threads
+    src_path = src
     if working_dir:
-        os.chdir(working_dir)
+        src_path = os.path.join(working_dir, src)
+        dst = os.path.join(working_dir, dst)
     try:
         os.symlink(src, dst)
     except FileExistsError:
@@ -725,12 +1023,10 @@ def symlink(src, dst, working_dir=None):
         raise
     except OSError:
         # if symlinking fails, copy instead
-        if os.path.isdir(src):
-            copy_dir(src, dst)
+        if os.path.isdir(src_path):
+            copy_dir(src_path, dst)
         else:
-            shutil.copy(src, dst)
-    finally:
-        os.chdir(prev_wd)
+            shutil.copy(src_path, dst)
 
 
 class BuildStatusPrinter:
@@ -741,11 +1037,25 @@ class BuildStatusPrinter:
         self.total = 0
         self.count = 0
         self.interactive = interactive
+        # recipe name -> step name -> expected duration in seconds
+        self.estimates = None
+        self._finished = set()
+        self._start_time = time.monotonic()
         # FIXME: Default MSYS shell doesn't handle ANSI escape sequences correctly
         if os.environ.get('TERM') == 'cygwin':
             m.message('Running under MSYS: reverting to basic build status output')
             self.interactive = False
 
+    def set_estimates(self, estimates):
+        """
+        Use the expected duration of each step of each recipe for the
+        completion percent and to show an ETA
+
+        @param estimates: recipe name -> step name -> duration in seconds
+        @type estimates: dict
+        """
+        self.estimates = estimates or None
+
     def remove_recipe(self, recipe_name):
         if recipe_name in self.recipe_to_step:
             self.step_to_recipe[self.recipe_to_step[recipe_name]].remove(recipe_name)
@@ -754,25 +1064,53 @@ class BuildStatusPrinter:
 
     def built(self, count, recipe_name):
         self.count += 1
+        self._finished.add(recipe_name)
         if self.interactive:
             m.build_recipe_done(self.count, self.total, recipe_name, _('built'))
         self.remove_recipe(recipe_name)
 
-    def already_built(self, count, recipe_name):
+    def already_built(self, count, recipe_name, status=None):
+        status = status or _('already built')
         self.count += 1
+        self._finished.add(recipe_name)
+        if self.estimates and recipe_name in self.estimates:
+            # Nothing to wait for, don't let it skew the ETA
+            del self.estimates[recipe_name]
         if self.interactive:
-            m.build_recipe_done(self.count, self.total, recipe_name, _('already built'))
+            m.build_recipe_done(self.count, self.total, recipe_name, status)
         else:
-            m.build_recipe_done(count, self.total, recipe_name, _('already built'))
+            m.build_recipe_done(count, self.total, recipe_name, status)
         self.output_status_line()
 
-    def _get_completion_percent(self):
-        one_recipe = 100.0 / float(self.total)
+    def _get_completion_ratio(self):
+        if self.estimates:
+            total = sum(sum(steps.values()) for steps in self.estimates.values())
+            if total > 0:
+                completed = sum(sum(self.estimates[r].values()) for r in self._finished if r in self.estimates)
+                for recipe_name, step in self.recipe_to_step.items():
+                    if recipe_name not in self.estimates or step not in self.steps:
+                        continue
+                    for s in self.steps[: self.steps.index(step)]:
+                        completed += self.estimates[recipe_name].get(s, 0)
+                return min(completed / total, 1.0)
+        one_recipe = 1.0 / float(self.total)
         one_step = one_recipe / len(self.steps)
         completed = float(self.count) * one_recipe
         for i, step in enumerate(self.steps):
             completed += len(self.step_to_recipe[step]) * (i + 1) * one_step
-        return int(completed)
+        return completed
+
+    def _get_completion_percent(self):
+        return int(self._get_completion_ratio() * 100)
+
+    def _get_eta(self):
+        if not self.estimates:
+            return None
+        ratio = self._get_completion_ratio()
+        if ratio <= 0 or ratio >= 1:
+            return None
+        elapsed = time.monotonic() - self._start_time
+        return int(elapsed * (1 - ratio) / ratio)
 
     def update_recipe_step(self, count, recipe_name, step):
         self.remove_recipe(recipe_name)
@@ -784,7 +1122,11 @@ class BuildStatusPrinter:
             self.output_status_line()
 
     def generate_status_line(self):
-        s = '[(' + str(self.count) + '/' + str(self.total) + ' @ ' + str(self._get_completion_percent()) + '%)'
+        s = '[(' + str(self.count) + '/' + str(self.total) + ' @ ' + str(self._get_completion_percent()) + '%'
+        eta = self._get_eta()
+        if eta is not None:
+            s += ', ETA ' + str(datetime.timedelta(seconds=eta))
+        s += ')'
         for step in self.steps:
             if self.step_to_recipe[step]:
                 s += ' ' + str(step).upper() + ': ' + ', '.join(self.step_to_recipe[step])
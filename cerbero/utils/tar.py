@@ -37,10 +37,15 @@ class Tar:
                 '--exclude=.gitlab-ci.d/meson-cross/*',
             ]
 
-    def configure(self, config, files_prefix, compress=None):
+    def configure(self, config, files_prefix, compress=None, threads=0):
+        """
+        @param threads: number of compression threads, 0 to use all the cores
+        @type threads: int
+        """
         self.distro = config.distro
         self.platform = config.platform
         self.compress = compress
+        self.threads = threads
         if not self.compress:
             self.compress = config.package_tarball_compression
         if self.compress == 'none':
@@ -147,12 +152,12 @@ class Tar:
         if self.compress == Tar.Compression.BZ2:
             compress_cmd = ['bzip2']
         elif self.compress == Tar.Compression.XZ:
-            compress_cmd = ['xz', '--verbose', '--threads', '0']
+            compress_cmd = ['xz', '--verbose', '--threads', str(self.threads)]
         elif self.compress == Tar.Compression.ZSTD:
             # level 18 takes roughly as much (3m 20s) as XZ
             # to compress a whole Windows MinGW tarball pair
             # (Ryzen 7 2700x on Windows 10, NVMe drive)
-            compress_cmd = ['zstd', '-T0', '-18']
+            compress_cmd = ['zstd', '-T{}'.format(self.threads), '-18']
 
         if not compress_cmd:
             raise RuntimeError('Unspecified compression algorithm')
@@ -202,7 +207,10 @@ class Tar:
         if self.compress == Tar.Compression.BZ2:
             # Use lbzip2 when available for parallel compression
             if shutil.which('lbzip2'):
-                tar_cmd += ['--use-compress-program=lbzip2']
+                if self.threads:
+                    tar_cmd += ['--use-compress-program=lbzip2 -n {}'.format(self.threads)]
+                else:
+                    tar_cmd += ['--use-compress-program=lbzip2']
             else:
                 tar_cmd += ['--bzip2']
         elif self.compress == Tar.Compression.XZ:
@@ -216,7 +224,7 @@ class Tar:
                 if shutil.which('xz'):
                     # Use xz when available for parallel compression. This is
                     # supported by both BSD tar and GNU tar.
-                    tar_cmd += ['--use-compress-program=xz -T0']
+                    tar_cmd += ['--use-compress-program=xz -T{}'.format(self.threads)]
                 else:
                     # GNU tar and bsdtar's built-in xz support via liblzma
                     # doesn't use parallel compression. However, GNU tar will
@@ -225,13 +233,13 @@ class Tar:
                     if shell.PLATFORM == Platform.DARWIN:
                         m.warning('Could not find `xz` for parallel lzma compression with bsdtar')
                     tar_cmd += ['--xz']
-                    tar_env['XZ_OPT'] = '-T0'
+                    tar_env['XZ_OPT'] = '-T{}'.format(self.threads)
         elif self.compress == Tar.Compression.ZSTD:
             # zst is MSYS2's default compression algorithm
             if tar == Tar.MSYS_BSD_TAR:
-                tar_cmd += ['--zstd', '--options', 'zstd:threads=0,zstd:compression-level=18']
+                tar_cmd += ['--zstd', '--options', 'zstd:threads={},zstd:compression-level=18'.format(self.threads)]
             elif shutil.which('zstd'):
-                tar_cmd += ['--use-compress-program=zstd -T0 -18']
+                tar_cmd += ['--use-compress-program=zstd -T{} -18'.format(self.threads)]
             else:
                 raise UsageError('zstd is not available in the PATH')
 
@@ -0,0 +1,240 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import http.server
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from types import SimpleNamespace
+
+from cerbero.build import recipe
+from cerbero.build.artifacts import (
+    ArtifactCache,
+    ArtifactKeys,
+    HttpArtifactCache,
+    LocalArtifactCache,
+    pack_artifact,
+    unpack_artifact,
+)
+from cerbero.build.cookbook import RecipeStatus
+from cerbero.build.depgraph import DependencyGraph
+from cerbero.build.source import SourceType
+from cerbero.build.statusstore import StatusStore
+from test.test_common import DummyConfig as Config
+
+
+class TarballRecipe(recipe.Recipe):
+    name = 'tarball'
+    version = '1.0'
+    stype = SourceType.TARBALL
+    url = 'https://example.com/tarball-1.0.tar.xz'
+    tarball_checksum = '0' * 64
+    deps = ['dep']
+
+
+class DepRecipe(recipe.Recipe):
+    name = 'dep'
+    version = '1.0'
+    stype = SourceType.TARBALL
+    url = 'https://example.com/dep-1.0.tar.xz'
+    tarball_checksum = '0' * 64
+
+
+class RuntimeRecipe(recipe.Recipe):
+    name = 'runtime'
+    version = '1.0'
+    stype = SourceType.TARBALL
+    url = 'https://example.com/runtime-1.0.tar.xz'
+    tarball_checksum = '0' * 64
+    runtime_dep = True
+
+
+class GitRecipe(recipe.Recipe):
+    name = 'git'
+    version = '1.0'
+    stype = SourceType.GIT
+    remotes = {'origin': 'https://example.com/git.git'}
+    commit = 'main'
+
+
+class ArtifactStore(http.server.BaseHTTPRequestHandler):
+    files = {}
+
+    def do_GET(self):
+        if self.path not in self.files:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Length', str(len(self.files[self.path])))
+        self.end_headers()
+        self.wfile.write(self.files[self.path])
+
+    def do_PUT(self):
+        self.files[self.path] = self.rfile.read(int(self.headers['Content-Length']))
+        self.send_response(201)
+        self.send_header('Content-Length', '0')
+        self.end_headers()
+
+    def log_message(self, *args):
+        pass
+
+
+class ArtifactsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.tmp, 'prefix')
+        self.write('lib/liba.so.1', 'a')
+        os.symlink('liba.so.1', os.path.join(self.prefix, 'lib/liba.so'))
+        self.write('lib/pkgconfig/a.pc', 'prefix=/usr')
+        self.files = ['lib/liba.so', 'lib/liba.so.1', 'lib/pkgconfig/a.pc']
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, path, content, root=None):
+        path = os.path.join(root or self.prefix, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def pack(self, name, content=''):
+        filename = os.path.join(self.tmp, name)
+        self.write('lib/liba.so.1', content)
+        pack_artifact(filename, self.prefix, self.files, {'name': name})
+        return filename
+
+    def testPackUnpack(self):
+        artifact = self.pack('a.tar.gz', 'a')
+        dest = os.path.join(self.tmp, 'dest')
+        info = unpack_artifact(artifact, dest)
+        self.assertEqual(info, {'name': 'a.tar.gz', 'files': self.files})
+        self.assertEqual(os.readlink(os.path.join(dest, 'lib/liba.so')), 'liba.so.1')
+        with open(os.path.join(dest, 'lib/liba.so')) as f:
+            self.assertEqual(f.read(), 'a')
+        # Nothing is extracted if the check fails
+        shutil.rmtree(dest)
+        self.assertIsNone(unpack_artifact(artifact, dest, check=lambda files: False))
+        self.assertFalse(os.path.exists(dest))
+
+    def testLocalCache(self):
+        cache = LocalArtifactCache(os.path.join(self.tmp, 'cache'))
+        dest = os.path.join(self.tmp, 'fetched')
+        self.assertFalse(cache.fetch('aa11', dest))
+        cache.store('aa11', self.pack('a'))
+        self.assertTrue(cache.fetch('aa11', dest))
+        self.assertEqual(len(cache.entries()), 1)
+
+    def testEviction(self):
+        cache = LocalArtifactCache(os.path.join(self.tmp, 'cache'))
+        for key in ('aa11', 'bb22'):
+            cache.store(key, self.pack(key, key * 100))
+        size = sum(e[1] for e in cache.entries())
+        cache.max_size = size + size // 4
+        past = time.time() - 100
+        for path, unused_size, unused_mtime in cache.entries():
+            os.utime(path, (past, past))
+        # Using an artifact makes it the most recently used
+        self.assertTrue(cache.fetch('aa11', os.path.join(self.tmp, 'fetched')))
+        cache.store('cc33', self.pack('cc33', 'cc33' * 100))
+        names = [os.path.basename(e[0]) for e in cache.entries()]
+        self.assertEqual(names, ['aa11.tar.gz', 'cc33.tar.gz'])
+
+    def testHttpCache(self):
+        server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), ArtifactStore)
+        thread = threading.Thread(target=server.serve_forever)
+        thread.start()
+        try:
+            remote = HttpArtifactCache('http://127.0.0.1:{}/artifacts/'.format(server.server_address[1]))
+            uploader = ArtifactCache(LocalArtifactCache(os.path.join(self.tmp, 'cache1')), remote, upload=True)
+            uploader.save('aa11', self.prefix, self.files, {'name': 'a'})
+            self.assertIn('/artifacts/aa/aa11.tar.gz', ArtifactStore.files)
+            # Another machine gets it from the server and keeps a local copy
+            local = LocalArtifactCache(os.path.join(self.tmp, 'cache2'))
+            cache = ArtifactCache(local, remote)
+            dest = os.path.join(self.tmp, 'dest')
+            self.assertIsNone(cache.restore('bb22', dest))
+            self.assertEqual(cache.restore('aa11', dest)['name'], 'a')
+            self.assertTrue(os.path.isfile(os.path.join(dest, 'lib/pkgconfig/a.pc')))
+            self.assertEqual(len(local.entries()), 1)
+        finally:
+            server.shutdown()
+            server.server_close()
+            thread.join()
+            ArtifactStore.files.clear()
+
+
+class ArtifactKeysTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.config = Config()
+        self.config.build_tools_config.home_dir = self.tmp
+        self.config.build_tools_config.cache_file = 'build-tools.cache'
+        self.recipes = {}
+        for cls in (TarballRecipe, DepRecipe, RuntimeRecipe, GitRecipe):
+            r = cls(self.config, {})
+            self.recipes[r.name] = r
+        self.cookbook = SimpleNamespace(
+            get_recipe=self.recipes.get,
+            get_config=lambda: self.config,
+            get_dependency_graph=lambda: DependencyGraph(self.recipes),
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def keys(self):
+        return ArtifactKeys(self.cookbook)
+
+    def testKeys(self):
+        key = self.keys().get('tarball')
+        self.assertEqual(len(key), 64)
+        self.assertEqual(self.keys().get('tarball'), key)
+        self.assertNotEqual(self.keys().get('dep'), key)
+        # Branches can move without the recipe changing
+        self.assertIsNone(self.keys().get('git'))
+
+    def testDependencyChanges(self):
+        key = self.keys().get('tarball')
+        self.recipes['dep'].version = '1.1'
+        self.assertNotEqual(self.keys().get('tarball'), key)
+
+    def testRuntimeDependencyChanges(self):
+        key = self.keys().get('tarball')
+        self.recipes['runtime'].version = '1.1'
+        self.assertNotEqual(self.keys().get('tarball'), key)
+
+    def testConfigChanges(self):
+        key = self.keys().get('tarball')
+        self.config.variants.override(['nodebug'])
+        self.assertNotEqual(self.keys().get('tarball'), key)
+
+    def testToolchainChanges(self):
+        key = self.keys().get('tarball')
+        self.config.env['CFLAGS'] = self.config.env.get('CFLAGS', '') + ' -O3'
+        self.assertNotEqual(self.keys().get('tarball'), key)
+
+    def testBuildToolsChanges(self):
+        store = StatusStore(os.path.join(self.tmp, 'build-tools.cache'))
+        store.update({'meson': RecipeStatus('meson.recipe', needs_build=False, built_version='1.0')})
+        key = self.keys().get('tarball')
+        store.update({'meson': RecipeStatus('meson.recipe', needs_build=False, built_version='1.1')})
+        self.assertNotEqual(self.keys().get('tarball'), key)
@@ -18,6 +18,9 @@
 
 import unittest
 import os
+import shutil
+import tempfile
+from types import SimpleNamespace
 
 from test.test_common import DummyConfig
 from cerbero.build import build
@@ -68,3 +71,41 @@ class ModifyEnvTest(unittest.TestCase):
         self.assertEqual(val, '%s %s' % (self.val1, self.val2))
         val = self.mk.get_env_var_nested(self.var)
         self.assertEqual(val, '%s %s' % (self.val1, self.val2))
+
+
+class MesonFingerprintTest(unittest.TestCase):
+    def setUp(self):
+        self.build_dir = tempfile.mkdtemp()
+        self.meson = SimpleNamespace(config=DummyConfig(), build_dir=self.build_dir)
+        self.meson.config.meson_incremental_configure = True
+        self.cmd = ['meson', 'setup', '--prefix=/prefix', '-Dintrospection=disabled']
+        self.files = {'meson-native-file.txt': "[binaries]\nc = ['cc']\n"}
+
+    def tearDown(self):
+        shutil.rmtree(self.build_dir)
+
+    def setup_build_dir(self, fingerprint):
+        os.makedirs(os.path.join(self.build_dir, 'meson-private'))
+        open(os.path.join(self.build_dir, 'meson-private', 'coredata.dat'), 'w').close()
+        with open(os.path.join(self.build_dir, build.MESON_FINGERPRINT_FILE), 'w') as f:
+            f.write(fingerprint)
+
+    def is_current(self, fingerprint):
+        return build.Meson._meson_build_dir_is_current(self.meson, fingerprint)
+
+    def testFingerprint(self):
+        fingerprint = build.configure_fingerprint(self.cmd, self.files)
+        self.assertEqual(fingerprint, build.configure_fingerprint(list(self.cmd), dict(self.files)))
+        self.assertNotEqual(fingerprint, build.configure_fingerprint(self.cmd + ['-Dwerror=true'], self.files))
+        files = {'meson-native-file.txt': "[binaries]\nc = ['clang']\n"}
+        self.assertNotEqual(fingerprint, build.configure_fingerprint(self.cmd, files))
+
+    def testReuseBuildDir(self):
+        fingerprint = build.configure_fingerprint(self.cmd, self.files)
+        # Never set up
+        self.assertFalse(self.is_current(fingerprint))
+        self.setup_build_dir(fingerprint)
+        self.assertTrue(self.is_current(fingerprint))
+        self.assertFalse(self.is_current(build.configure_fingerprint(self.cmd[:-1], self.files)))
+        self.meson.config.meson_incremental_configure = False
+        self.assertFalse(self.is_current(fingerprint))
@@ -0,0 +1,112 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cerbero.build.buildstats import BuildStats
+from cerbero.utils.shell import BuildStatusPrinter
+from test.test_common import DummyConfig
+
+
+class BuildStatsTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.config = DummyConfig()
+        self.config.home_dir = self.tmp
+        self.config.cache_file = 'linux_x86_64.cache'
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def testRecord(self):
+        stats = BuildStats(self.config)
+        self.assertEqual(stats.config_key, 'linux_x86_64')
+        self.assertIsNone(stats.step_duration('glib', 'compile'))
+        stats.record('glib', 'configure', 10)
+        stats.record('glib', 'compile', 100)
+        stats.record('glib', 'compile', 50)
+        self.assertEqual(stats.stats['glib']['compile'].last, 50)
+        self.assertEqual(stats.stats['glib']['compile'].count, 2)
+        self.assertEqual(stats.step_duration('glib', 'compile'), 75)
+        self.assertEqual(stats.recipe_duration('glib'), 85)
+        self.assertEqual(stats.recipe_duration('glib', ['configure']), 10)
+
+        # Only saved when asked to
+        self.assertIsNone(BuildStats(self.config).recipe_duration('glib'))
+        stats.save()
+        # Reload from disk
+        stats = BuildStats(self.config)
+        self.assertEqual(stats.recipe_duration('glib'), 85)
+
+    def testSaveOnlyRecorded(self):
+        stats = BuildStats(self.config)
+        stats.save()
+        self.assertFalse(os.path.exists(stats.path))
+        stats.record('glib', 'compile', 10)
+        stats.save()
+        os.remove(stats.path)
+        # Nothing new to save
+        stats.save()
+        self.assertFalse(os.path.exists(stats.path))
+
+    def testConfigs(self):
+        stats = BuildStats(self.config)
+        stats.record('glib', 'compile', 10)
+        stats.save()
+        self.config.cache_file = 'cross_win64.cache'
+        other = BuildStats(self.config)
+        self.assertIsNone(other.recipe_duration('glib'))
+        other.record('glib', 'compile', 20)
+        all_stats = other.all_configs()
+        self.assertEqual(set(all_stats.keys()), {'linux_x86_64', 'cross_win64'})
+        self.assertEqual(all_stats['linux_x86_64']['glib']['compile'].last, 10)
+
+    def testDefaults(self):
+        stats = BuildStats(self.config)
+        stats.record('a', 'compile', 10)
+        stats.record('b', 'compile', 20)
+        stats.record('c', 'compile', 60)
+        durations = stats.recipes_durations(['a', 'b', 'c', 'd'])
+        self.assertEqual(durations['d'], 20)
+        steps = stats.steps_durations(['a', 'd'], ['configure', 'compile'])
+        self.assertEqual(steps['a'], {'configure': 1, 'compile': 10})
+        self.assertEqual(steps['d'], {'configure': 1, 'compile': 10})
+
+
+class BuildStatusPrinterTest(unittest.TestCase):
+    def testCompletionWithEstimates(self):
+        printer = BuildStatusPrinter(['configure', 'compile', 'install'], False)
+        printer.total = 2
+        printer.output_status_line = lambda: None
+        printer.set_estimates(
+            {
+                'a': {'configure': 10, 'compile': 60, 'install': 10},
+                'b': {'configure': 5, 'compile': 10, 'install': 5},
+            }
+        )
+        self.assertEqual(printer._get_completion_percent(), 0)
+        self.assertIsNone(printer._get_eta())
+        printer.update_recipe_step(1, 'a', 'install')
+        self.assertEqual(printer._get_completion_percent(), 70)
+        printer.built(1, 'a')
+        self.assertEqual(printer._get_completion_percent(), 80)
+        self.assertIsNotNone(printer._get_eta())
+        self.assertIn('ETA', printer.generate_status_line())
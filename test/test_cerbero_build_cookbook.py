@@ -16,11 +16,14 @@
 # Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 # Boston, MA 02111-1307, USA.
 
-import unittest
-import tempfile
+import os
 import pickle
+import shutil
+import tempfile
+import unittest
 
-from cerbero.build.cookbook import CookBook
+from cerbero.build.cookbook import CookBook, RecipeStatus, RecipesCodeCache
+from cerbero.build.statusstore import StatusStore, SQLITE_MAGIC
 from cerbero.errors import RecipeNotFoundError
 from test.test_common import DummyConfig as Config
 from test.test_build_common import Recipe1
@@ -42,23 +45,54 @@ class PackageTest(unittest.TestCase):
         self.assertEqual(self.cookbook.status, {})
 
     def testSaveCache(self):
-        tmp = tempfile.NamedTemporaryFile()
-        status = {'test': 'test'}
+        tmpdir = tempfile.mkdtemp()
+        status = {'test': RecipeStatus('test.recipe', steps=['fetch'], built_version='1.0', file_hash=b'1')}
         self.cookbook.set_status(status)
-        self.cookbook.get_config().cache_file = tmp.name
+        self.cookbook.get_config().cache_file = os.path.join(tmpdir, 'cache')
         self.cookbook.save()
-        with open(self.cookbook._cache_file(self.config), 'rb') as f:
-            loaded_status = pickle.load(f)
-            self.assertEqual(status, loaded_status)
+        loaded_status = StatusStore(self.cookbook._cache_file(self.config)).load()
+        self.assertEqual(repr(status), repr(loaded_status))
+        shutil.rmtree(tmpdir)
 
     def testLoad(self):
-        tmp = tempfile.NamedTemporaryFile()
-        status = {'test': 'test'}
-        self.cookbook.get_config().cache_file = tmp.name
-        with open(tmp.name, 'wb') as f:
+        tmpdir = tempfile.mkdtemp()
+        status = {'test': RecipeStatus('test.recipe', steps=['fetch'], built_version='1.0', file_hash=b'1')}
+        self.cookbook.get_config().cache_file = os.path.join(tmpdir, 'cache')
+        StatusStore(self.cookbook._cache_file(self.config)).update(status)
+        self.cookbook._restore_cache()
+        self.assertEqual(repr(status), repr(self.cookbook.status))
+        shutil.rmtree(tmpdir)
+
+    def testLoadPickle(self):
+        # Status saved by older versions is converted
+        tmpdir = tempfile.mkdtemp()
+        status = {'test': RecipeStatus('test.recipe', steps=['fetch'], built_version='1.0', file_hash=b'1')}
+        self.cookbook.get_config().cache_file = os.path.join(tmpdir, 'cache')
+        with open(self.cookbook._cache_file(self.config), 'wb') as f:
             pickle.dump(status, f)
         self.cookbook._restore_cache()
-        self.assertEqual(status, self.cookbook.status)
+        self.assertEqual(repr(status), repr(self.cookbook.status))
+        with open(self.cookbook._cache_file(self.config), 'rb') as f:
+            self.assertEqual(f.read(len(SQLITE_MAGIC)), SQLITE_MAGIC)
+        shutil.rmtree(tmpdir)
+
+    def testIncrementalSave(self):
+        tmpdir = tempfile.mkdtemp()
+        self.cookbook.get_config().cache_file = os.path.join(tmpdir, 'cache')
+        recipe = Recipe1(self.config, {})
+        self.cookbook.add_recipe(recipe)
+        self.cookbook._restore_cache()
+        store = StatusStore(self.cookbook._cache_file(self.config))
+        # Rows of other recipes written by another process are kept
+        store.update({'other': RecipeStatus('other.recipe', file_hash=b'2')})
+        self.cookbook.update_step_status(recipe.name, 'fetch')
+        self.assertEqual(store.get(recipe.name).steps, ['fetch'])
+        self.assertIsNotNone(store.get('other'))
+        self.cookbook.update_build_status(recipe.name, '1.0')
+        self.assertFalse(store.get(recipe.name).needs_build)
+        self.cookbook.reset_recipe_status(recipe.name)
+        self.assertIsNone(store.get(recipe.name))
+        shutil.rmtree(tmpdir)
 
     def testAddGetRecipe(self):
         recipe = Recipe1(self.config, {})
@@ -117,3 +151,50 @@ class PackageTest(unittest.TestCase):
         status = self.cookbook._recipe_status(recipe.name)
         self.assertEqual(status.steps, [])
         self.assertTrue(self.cookbook.status[recipe.name].needs_build)
+
+
+class RecipesCodeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'code.cache')
+        self.recipe = os.path.join(self.tmpdir, 'test.recipe')
+        with open(self.recipe, 'w') as f:
+            f.write("name = 'test'\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def _exec(self, code):
+        d = {}
+        exec(code, d)
+        return d['name']
+
+    def testCache(self):
+        cache = RecipesCodeCache(self.path)
+        code = cache.get_code(self.recipe)
+        self.assertEqual(self._exec(code), 'test')
+        self.assertIs(cache.get_code(self.recipe), code)
+        cache.save()
+
+        cache = RecipesCodeCache(self.path)
+        self.assertEqual(self._exec(cache.get_code(self.recipe)), 'test')
+        self.assertFalse(cache._dirty)
+
+        with open(self.recipe, 'w') as f:
+            f.write("name = 'modified'\n")
+        self.assertEqual(self._exec(cache.get_code(self.recipe)), 'modified')
+        self.assertTrue(cache._dirty)
+
+    def testUnusedEntries(self):
+        cache = RecipesCodeCache(self.path)
+        cache.get_code(self.recipe)
+        cache.save()
+        cache = RecipesCodeCache(self.path)
+        cache.save()
+        self.assertEqual(RecipesCodeCache(self.path)._entries, {})
+
+    def testInvalidCache(self):
+        with open(self.path, 'wb') as f:
+            f.write(b'garbage')
+        cache = RecipesCodeCache(self.path)
+        self.assertEqual(self._exec(cache.get_code(self.recipe)), 'test')
@@ -0,0 +1,114 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import unittest
+
+from cerbero.build.cookbook import CookBook
+from cerbero.build.depgraph import DependencyGraph
+from cerbero.errors import FatalError
+from cerbero.utils import messages as m
+from test.test_common import DummyConfig as Config
+
+
+class FakeRecipe(object):
+    def __init__(self, name, deps=None, runtime_dep=False):
+        self.name = name
+        self.deps = deps or []
+        self.runtime_dep = runtime_dep
+
+    def list_deps(self):
+        return list(self.deps)
+
+
+def make_recipes(*recipes):
+    return {r.name: r for r in recipes}
+
+
+class DependencyGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.recipes = make_recipes(
+            FakeRecipe('runtime', runtime_dep=True),
+            FakeRecipe('glib', ['libffi', 'zlib']),
+            FakeRecipe('libffi'),
+            FakeRecipe('zlib'),
+            FakeRecipe('gstreamer', ['glib']),
+            FakeRecipe('gst-plugins-base', ['gstreamer', 'zlib', 'orc']),
+            FakeRecipe('orc'),
+        )
+        self.graph = DependencyGraph(self.recipes)
+
+    def testOrderedDeps(self):
+        self.assertEqual(self.graph.ordered_deps('zlib'), ('runtime', 'zlib'))
+        self.assertEqual(self.graph.ordered_deps('glib'), ('runtime', 'libffi', 'zlib', 'glib'))
+        self.assertEqual(
+            self.graph.ordered_deps('gst-plugins-base'),
+            ('runtime', 'libffi', 'zlib', 'glib', 'gstreamer', 'orc', 'gst-plugins-base'),
+        )
+        # Runtime dependencies don't depend on themselves
+        self.assertEqual(self.graph.ordered_deps('runtime'), ('runtime',))
+
+    def testClosure(self):
+        self.assertTrue(self.graph.depends_on('gst-plugins-base', 'libffi'))
+        self.assertTrue(self.graph.depends_on('gstreamer', 'runtime'))
+        self.assertFalse(self.graph.depends_on('gstreamer', 'orc'))
+        self.assertFalse(self.graph.depends_on('glib', 'glib'))
+        closure = self.graph.closure('glib')
+        self.assertEqual(closure & self.graph.closure('gstreamer'), closure)
+
+    def testReverseDeps(self):
+        self.assertEqual(self.graph.reverse_deps('zlib'), ['glib', 'gst-plugins-base'])
+        self.assertEqual(self.graph.reverse_deps('libffi'), ['glib'])
+        self.assertEqual(self.graph.reverse_deps('libffi', recursive=True), ['glib', 'gstreamer', 'gst-plugins-base'])
+        self.assertEqual(self.graph.reverse_deps('gst-plugins-base', recursive=True), [])
+
+    def testTopologicalOrder(self):
+        order = self.graph.topological_order()
+        self.assertEqual(sorted(order), sorted(self.recipes))
+        for name in self.recipes:
+            for dep in self.graph.adjacency[name]:
+                self.assertLess(order.index(dep), order.index(name))
+
+    def testErrors(self):
+        m_error = m.error
+        m.error = lambda *args: None
+        try:
+            recipes = make_recipes(FakeRecipe('a', ['b']), FakeRecipe('b', ['a']), FakeRecipe('c', ['missing']))
+            graph = DependencyGraph(recipes)
+            self.assertRaisesRegex(FatalError, 'Dependency Cycle', graph.ordered_deps, 'a')
+            self.assertRaisesRegex(FatalError, 'unknown dependency missing', graph.ordered_deps, 'c')
+        finally:
+            m.error = m_error
+
+
+class CookBookGraphTest(unittest.TestCase):
+    def setUp(self):
+        self.config = Config()
+        self.config.cache_file = '/dev/null'
+        self.cookbook = CookBook(self.config, False)
+
+    def testInvalidation(self):
+        self.cookbook.add_recipe(FakeRecipe('glib', ['zlib']))
+        self.cookbook.add_recipe(FakeRecipe('zlib'))
+        graph = self.cookbook.get_dependency_graph()
+        self.assertIs(self.cookbook.get_dependency_graph(), graph)
+        self.assertEqual([r.name for r in self.cookbook.list_recipe_deps('glib')], ['zlib', 'glib'])
+        self.cookbook.add_recipe(FakeRecipe('gstreamer', ['glib']))
+        self.assertIsNot(self.cookbook.get_dependency_graph(), graph)
+        self.assertEqual([r.name for r in self.cookbook.list_recipe_reverse_deps('zlib')], ['glib'])
+        rdeps = self.cookbook.list_recipe_reverse_deps('zlib', recursive=True)
+        self.assertEqual([r.name for r in rdeps], ['glib', 'gstreamer'])
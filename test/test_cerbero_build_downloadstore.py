@@ -0,0 +1,145 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import asyncio
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+from unittest import mock
+
+from cerbero.bootstrap import BootstrapTarball
+from cerbero.build import downloadstore
+from cerbero.build.downloadstore import DownloadStore
+from cerbero.errors import FatalError
+from test.test_common import DummyConfig
+
+CONTENT = b'tarball' * 1024
+CHECKSUM = hashlib.sha256(CONTENT).hexdigest()
+
+
+class DownloadStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.store = DownloadStore(os.path.join(self.tmp, 'store'))
+        self.src = os.path.join(self.tmp, 'foo-1.0.tar.xz')
+        with open(self.src, 'wb') as f:
+            f.write(CONTENT)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def read(self, path):
+        with open(path, 'rb') as f:
+            return f.read()
+
+    def testAddAndPlace(self):
+        self.assertIsNone(self.store.get(CHECKSUM))
+        self.store.add(self.src, CHECKSUM)
+        blob = self.store.get(CHECKSUM)
+        self.assertEqual(blob, self.store.blob_path(CHECKSUM))
+        self.assertEqual(self.read(blob), CONTENT)
+        dest = os.path.join(self.tmp, 'linux', 'foo', 'foo-1.0.tar.xz')
+        method = self.store.place(CHECKSUM, dest)
+        self.assertIn(method, (downloadstore.REFLINK, downloadstore.HARDLINK, downloadstore.COPY))
+        self.assertEqual(self.read(dest), CONTENT)
+        self.assertEqual(sorted(self.store.references(CHECKSUM)), sorted([self.src, dest]))
+        # Placing again replaces the file and doesn't duplicate the reference
+        self.store.place(CHECKSUM, dest)
+        self.assertEqual(len(self.store.references(CHECKSUM)), 2)
+
+    def testCopyFallback(self):
+        self.store.add(self.src, CHECKSUM, reference=False)
+        dest = os.path.join(self.tmp, 'foo-copy.tar.xz')
+        with mock.patch.object(downloadstore, 'reflink', return_value=False):
+            with mock.patch.object(os, 'link', side_effect=OSError(18, 'Invalid cross-device link')):
+                self.assertEqual(self.store.place(CHECKSUM, dest), downloadstore.COPY)
+        self.assertEqual(self.read(dest), CONTENT)
+        self.assertFalse(os.path.samefile(dest, self.store.blob_path(CHECKSUM)))
+
+    def testGC(self):
+        with mock.patch.object(downloadstore, 'reflink', return_value=False):
+            self.store.add(self.src, CHECKSUM, reference=False)
+            dest = os.path.join(self.tmp, 'foo.tar.xz')
+            self.store.place(CHECKSUM, dest)
+        other = hashlib.sha256(b'other').hexdigest()
+        other_src = os.path.join(self.tmp, 'other')
+        with open(other_src, 'wb') as f:
+            f.write(b'other')
+        self.store.add(other_src, other, reference=False)
+        os.remove(other_src)
+        # The hard link in the download dir keeps the first blob
+        self.assertEqual(self.store.gc(dry_run=True), [(other, 5)])
+        self.assertTrue(self.store.get(other))
+        self.assertEqual(self.store.gc(), [(other, 5)])
+        self.assertIsNone(self.store.get(other))
+        self.assertTrue(self.store.get(CHECKSUM))
+        os.remove(dest)
+        # So does the hard link of the file it was added from
+        self.assertEqual(self.store.gc(), [])
+        os.remove(self.src)
+        self.assertEqual(self.store.gc(), [(CHECKSUM, len(CONTENT))])
+        self.assertEqual(self.store.blobs(), [])
+
+
+class BootstrapTarballStoreTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.config = DummyConfig()
+        self.config.download_store_dir = os.path.join(self.tmp, 'store')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def tarball(self, download_dir, offline=False):
+        return BootstrapTarball(
+            self.config,
+            offline,
+            'foo',
+            'https://foo.org/foo-1.0.tar.xz',
+            CHECKSUM,
+            os.path.join(self.tmp, download_dir),
+        )
+
+    async def download(self, url, dest, **kwargs):
+        self.downloads += 1
+        with open(dest, 'wb') as f:
+            f.write(CONTENT)
+
+    def testFetch(self):
+        self.downloads = 0
+        with mock.patch('cerbero.utils.shell.download', self.download):
+            asyncio.run(self.tarball('linux').fetch())
+            self.assertEqual(self.downloads, 1)
+            # Other download dirs, even offline, get the tarball from the store
+            asyncio.run(self.tarball('android', offline=True).fetch())
+            asyncio.run(self.tarball('windows').fetch())
+            self.assertEqual(self.downloads, 1)
+        store = DownloadStore(self.config.download_store_dir)
+        paths = [os.path.join(self.tmp, d, 'foo-1.0.tar.xz') for d in ('linux', 'android', 'windows')]
+        self.assertEqual(sorted(store.references(CHECKSUM)), sorted(paths))
+
+    def testCorruptedBlob(self):
+        store = DownloadStore(self.config.download_store_dir)
+        os.makedirs(os.path.dirname(store.blob_path(CHECKSUM)))
+        with open(store.blob_path(CHECKSUM), 'wb') as f:
+            f.write(b'corrupted')
+        self.assertRaises(FatalError, asyncio.run, self.tarball('linux', offline=True).fetch())
+        self.assertIsNone(store.get(CHECKSUM))
+        self.assertTrue(os.path.exists(os.path.join(self.tmp, 'linux', 'foo-1.0.tar.xz.failed-checksum')))
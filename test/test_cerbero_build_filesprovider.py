@@ -16,11 +16,13 @@
 # Free Software Foundation, Inc., 59 Temple Place - Suite 330,
 # Boston, MA 02111-1307, USA.
 
+import os
 import shutil
 import unittest
 import tempfile
 
 from cerbero.build import recipe
+from cerbero.build.filesprovider import cached_searches
 from cerbero.config import Platform, License
 from test.test_common import DummyConfig
 
@@ -139,3 +141,26 @@ class PackageTest(unittest.TestCase):
         self.assertEqual(self.linuxrecipe.files_list(False), sorted(linuxfiles))
         self.assertEqual(self.win32recipe.files_list(), [])
         self.assertEqual(self.linuxrecipe.files_list(), [])
+
+    def testCachedSearches(self):
+        os.makedirs(os.path.join(self.tmp, 'bin'))
+        open(os.path.join(self.tmp, 'README'), 'w').close()
+        searches = []
+        search_file = self.linuxrecipe._search_file
+
+        def counted_search_file(f):
+            searches.append(f)
+            return search_file(f)
+
+        counted_search_file.__name__ = '_search_file'
+        self.linuxrecipe._search_file = counted_search_file
+        with cached_searches():
+            self.assertEqual(self.linuxrecipe.files_list(), ['README'])
+            count = len(searches)
+            self.assertEqual(self.linuxrecipe.dist_files_list(), ['README'])
+            self.assertEqual(len(searches), count)
+            # The prefix is not searched again while the cache is active
+            open(os.path.join(self.tmp, 'bin', 'gst-launch'), 'w').close()
+            self.assertEqual(self.linuxrecipe.dist_files_list(), ['README'])
+        self.assertEqual(self.linuxrecipe.dist_files_list(), ['README', 'bin/gst-launch'])
+        self.assertGreater(len(searches), count)
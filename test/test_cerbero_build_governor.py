@@ -0,0 +1,114 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import asyncio
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from cerbero.build import governor
+from cerbero.build.governor import JobGovernor, Jobserver
+from cerbero.utils import run_until_complete
+
+
+GiB = 1 << 30
+
+
+class JobGovernorTest(unittest.TestCase):
+    def setUp(self):
+        self.load = None
+        self.free_ram = None
+        self.governor = JobGovernor(8, load=lambda: self.load, free_ram=lambda: self.free_ram, total_ram=16 * GiB)
+
+    def testFit(self):
+        self.assertEqual(self.governor.can_admit(8), (True, False))
+        self.governor.running['a'] = 8
+        self.assertEqual(self.governor.can_admit(1), (False, False))
+        self.governor.running['a'] = 4
+        self.assertEqual(self.governor.can_admit(4), (True, False))
+        self.assertEqual(self.governor.can_admit(8), (False, False))
+
+    def testIdle(self):
+        self.governor.running['a'] = 8
+        self.load = 7.5
+        self.assertEqual(self.governor.can_admit(8), (False, False))
+        # A parallel compile in a serial tail
+        self.load = 1
+        self.assertEqual(self.governor.can_admit(4), (True, True))
+        self.governor.running['b'] = 8
+        self.assertEqual(self.governor.can_admit(1), (False, False))
+
+    def testFreeRam(self):
+        self.free_ram = 100 << 20
+        self.assertEqual(self.governor.can_admit(1), (True, False))
+        self.governor.running['a'] = 1
+        self.assertEqual(self.governor.can_admit(1), (False, False))
+        self.free_ram = 8 * GiB
+        self.assertEqual(self.governor.can_admit(1), (True, False))
+
+    def testSlot(self):
+        peak = []
+
+        async def step(name, weight):
+            async with self.governor.slot(name, weight):
+                peak.append(self.governor.used())
+                await asyncio.sleep(0.01)
+
+        run_until_complete([step('compile-%d' % i, 8 if i % 2 else 2) for i in range(6)])
+        self.assertEqual(len(peak), 6)
+        self.assertLessEqual(max(peak), 8)
+        self.assertEqual(self.governor.running, {})
+
+
+@unittest.skipUnless(Jobserver.is_supported() and shutil.which('make'), 'make jobserver not available')
+class JobserverTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        with open(os.path.join(self.tmp, 'Makefile'), 'w') as f:
+            f.write('all: a b c d e f\n')
+            f.write('a b c d e f:\n\t@mkdir running.$@ && sleep 0.1 && ls -d running.* | wc -l && rmdir running.$@\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        governor.set_jobserver(None)
+
+    def testMakeflags(self):
+        jobserver = Jobserver(2)
+        try:
+            auth = '-j2 --jobserver-auth={},{}'.format(*jobserver.fds)
+            self.assertEqual(jobserver.env({})['MAKEFLAGS'].split(), auth.split())
+            # The flags of the environment are kept, except the jobs
+            env = jobserver.env({'MAKEFLAGS': 'k -j8 --jobserver-auth=3,4 -- V=1'})
+            self.assertEqual(env['MAKEFLAGS'], 'k {} -- V=1'.format(auth))
+            self.assertEqual(jobserver.env({'MAKEFLAGS': '-- V=1'})['MAKEFLAGS'], ' {} -- V=1'.format(auth))
+        finally:
+            jobserver.close()
+
+    def testMake(self):
+        jobserver = Jobserver(2)
+        try:
+            out = subprocess.check_output(
+                ['make'], cwd=self.tmp, env=jobserver.env(os.environ), pass_fds=jobserver.fds, text=True
+            )
+        finally:
+            jobserver.close()
+        self.assertEqual(len(out.split()), 6)
+        # Never more than the number of tokens at the same time
+        self.assertLessEqual(max(int(x) for x in out.split()), 2)
@@ -0,0 +1,179 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import asyncio
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from cerbero.build.cookbook import CookBook
+from cerbero.build.oven import Oven
+from test.test_build_common import Recipe
+from test.test_common import DummyConfig
+
+
+class RecipeA(Recipe):
+    name = 'a'
+    version = '1.0'
+
+
+class RecipeB(Recipe):
+    name = 'b'
+    version = '1.0'
+    deps = ['a']
+
+
+class RecipeC(Recipe):
+    name = 'c'
+    version = '1.0'
+    deps = ['b']
+
+
+class RecordingOven(Oven):
+    """
+    Oven that records the steps instead of running them
+    """
+
+    def __init__(self, *args, **kwargs):
+        Oven.__init__(self, *args, **kwargs)
+        self.cooked = []
+        self.on_step = None
+
+    async def _cook_recipe_step(self, recipe, step, count):
+        self.cooked.append((recipe.name, step))
+        if self.on_step is not None:
+            self.on_step(recipe, step)
+        self.cookbook.update_step_status(recipe.name, step)
+
+
+class ConcurrencyOven(RecordingOven):
+    """
+    Oven that records how many steps run at the same time
+    """
+
+    def __init__(self, *args, **kwargs):
+        RecordingOven.__init__(self, *args, **kwargs)
+        self.running = 0
+        self.peak = 0
+
+    async def _cook_recipe_step(self, recipe, step, count):
+        self.running += 1
+        self.peak = max(self.peak, self.running)
+        try:
+            await asyncio.sleep(0.01)
+            await RecordingOven._cook_recipe_step(self, recipe, step, count)
+        finally:
+            self.running -= 1
+
+
+class OvenTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.config = DummyConfig()
+        self.config.cache_file = os.path.join(self.tmp, 'cache')
+        self.config.home_dir = self.tmp
+        self.config.prefix = os.path.join(self.tmp, 'prefix')
+        self.config.artifacts_cache_dir = None
+        self.config.interactive = False
+        self.cookbook = CookBook(self.config, False)
+        self.cookbook.set_status({})
+        for klass in [RecipeA, RecipeB, RecipeC]:
+            r = klass(self.config, {})
+            r.__file__ = 'test/test_cerbero_build_oven.py'
+            self.cookbook.add_recipe(r)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _cook(self, jobs):
+        oven = RecordingOven(['c'], self.cookbook, jobs=jobs)
+        # A recipe that is never queued makes the oven wait forever
+        asyncio.run(asyncio.wait_for(oven.start_cooking(), 10))
+        return oven
+
+    def _assertChainBuilt(self, oven):
+        steps = [s[1] for s in self.cookbook.get_recipe('a').steps]
+        built = [name for name, step in oven.cooked if step == steps[-1]]
+        self.assertEqual(built, ['a', 'b', 'c'])
+        for name in ['a', 'b', 'c']:
+            self.assertFalse(self.cookbook.recipe_needs_build(name))
+            self.assertEqual([s for n, s in oven.cooked if n == name], steps)
+        # Each recipe starts after its dependency is done
+        last = {name: oven.cooked.index((name, steps[-1])) for name in ['a', 'b']}
+        first = {name: oven.cooked.index((name, steps[0])) for name in ['b', 'c']}
+        self.assertLess(last['a'], first['b'])
+        self.assertLess(last['b'], first['c'])
+
+    def testDependencyChain(self):
+        self._assertChainBuilt(self._cook(1))
+
+    def testDependencyChainParallel(self):
+        self._assertChainBuilt(self._cook(4))
+
+    def _touch(self, *paths):
+        for path in paths:
+            path = os.path.join(self.config.prefix, path)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'w') as f:
+                f.write(path)
+
+    def testJobs(self):
+        names = []
+        for i in range(6):
+            r = RecipeA(self.config, {})
+            r.name = 'independent-%d' % i
+            r.__file__ = 'test/test_cerbero_build_oven.py'
+            self.cookbook.add_recipe(r)
+            names.append(r.name)
+        oven = ConcurrencyOven(names, self.cookbook, jobs=2)
+        asyncio.run(asyncio.wait_for(oven.start_cooking(), 10))
+        self.assertEqual(len(oven.cooked), 6 * len(RecipeA(self.config, {}).steps))
+        self.assertLessEqual(oven.peak, 2)
+
+    def testJobserverStepWeight(self):
+        oven = RecordingOven(['c'], self.cookbook, jobs=4)
+        recipe = self.cookbook.get_recipe('a')
+        recipe.allow_parallel_build = True
+        recipe.num_of_cpus = lambda: 16
+        recipe.uses_jobserver = lambda: True
+        # The governor is charged with all the tokens the compile can take
+        self.assertEqual(oven._step_weight(recipe, 'compile'), 4)
+        self.assertEqual(oven._step_weight(recipe, 'install'), 1)
+
+    def testPostInstallFiles(self):
+        oven = RecordingOven(['c'], self.cookbook, jobs=1, missing_files=True)
+        recipe = self.cookbook.get_recipe('a')
+        self._touch('lib/libold.so', 'lib/libb.so')
+        self.cookbook.set_recipe_files('a', ['lib/liba.so'])
+        self.cookbook.set_recipe_files('b', ['lib/libb.so'])
+        recipe._oven_post_install_files = set()
+
+        def post_install(recipe, step):
+            # Nothing else can write in the prefix while it runs
+            self.assertTrue(oven._install_lock.locked())
+            time.sleep(0.1)
+            # Created by the step and updated in a file of another recipe
+            self._touch('share/licenses/a/COPYING', 'lib/libb.so')
+
+        oven.on_step = post_install
+        time.sleep(0.1)
+        asyncio.run(oven._cook_post_install_step(recipe, 'post_install', 1))
+        self.assertEqual(oven._installed_files(recipe, None), {'lib/liba.so', 'share/licenses/a/COPYING'})
+        self.assertFalse(oven._install_lock.locked())
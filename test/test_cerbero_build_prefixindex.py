@@ -0,0 +1,137 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cerbero.build import prefixindex
+from cerbero.build.prefixindex import FilesystemIndex, PrefixIndex
+
+
+FILES = [
+    'bin/gst-launch-1.0',
+    'bin/gst-inspect-1.0',
+    'include/gstreamer-1.0/gst/gst.h',
+    'lib/libgstreamer-1.0.so.0.2600.0',
+    'lib/libgstreamer-1.0.a',
+    'lib/.hidden.so',
+    'lib/gstreamer-1.0/libgstcoreelements.so',
+    'lib/gstreamer-1.0/libgstcoreelements.a',
+    'lib/pkgconfig/gstreamer-1.0.pc',
+    'lib/python3.12/site-packages/gi/__init__.py',
+    'lib/python3.12/site-packages/gi/overrides/Gst.py',
+    'share/locale/fr/LC_MESSAGES/gstreamer-1.0.mo',
+    'share/locale/de/LC_MESSAGES/gstreamer-1.0.mo',
+]
+
+PATTERNS = [
+    'bin/gst-launch-1.0',
+    'bin/missing',
+    'bin/*',
+    'lib/*gstreamer-1.0*.so*',
+    'lib/*',
+    'lib/*.a',
+    'lib/lib?streamer-1.0.[as]*',
+    'lib/gstreamer-1.0/*.so',
+    'lib/gstreamer-1.0',
+    'lib/pkgconfig/*.pc',
+    'lib/*/site-packages/gi/**/*.py',
+    'lib/**/*.a',
+    'share/locale/*/LC_MESSAGES/gstreamer-1.0.mo',
+    'lib64/*gstreamer*',
+    'lib64/libgstreamer-1.0.so',
+    'lib/libbroken.so',
+    'include',
+]
+
+
+def set_old_mtimes(root):
+    # Listings of recently modified directories are not trusted
+    for dirpath, dirnames, filenames in os.walk(root):
+        os.utime(dirpath, (1000000000, 1000000000))
+
+
+class PrefixIndexTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        for f in FILES:
+            path = os.path.join(self.tmp, f)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            open(path, 'w').close()
+        os.symlink('libgstreamer-1.0.so.0.2600.0', os.path.join(self.tmp, 'lib', 'libgstreamer-1.0.so'))
+        os.symlink('missing.so', os.path.join(self.tmp, 'lib', 'libbroken.so'))
+        os.symlink('lib', os.path.join(self.tmp, 'lib64'))
+        set_old_mtimes(self.tmp)
+        self.index = PrefixIndex(self.tmp)
+        self.fs = FilesystemIndex(self.tmp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def testGlob(self):
+        for pattern in PATTERNS:
+            for include_hidden in (True, False):
+                self.assertEqual(
+                    sorted(self.index.glob(pattern, include_hidden)),
+                    sorted(self.fs.glob(pattern, include_hidden)),
+                    '%s, include_hidden=%s' % (pattern, include_hidden),
+                )
+
+    def testExists(self):
+        for path in FILES + ['lib', 'lib64/libgstreamer-1.0.so', 'lib/libbroken.so', 'lib/missing', 'foo/bar']:
+            self.assertEqual(self.index.exists(path), self.fs.exists(path), path)
+            self.assertEqual(self.index.isdir(path), self.fs.isdir(path), path)
+
+    def testWalkFiles(self):
+        for path in ('lib', 'share', '', 'lib64'):
+            self.assertEqual(sorted(self.index.walk_files(path)), sorted(self.fs.walk_files(path)), path)
+
+    def testRefresh(self):
+        self.assertEqual(self.index.glob('bin/*'), self.fs.glob('bin/*'))
+        # Adding a file changes the mtime of its directory
+        open(os.path.join(self.tmp, 'bin', 'gst-play-1.0'), 'w').close()
+        self.assertIn('bin/gst-play-1.0', self.index.glob('bin/*'))
+        os.remove(os.path.join(self.tmp, 'bin', 'gst-play-1.0'))
+        self.assertNotIn('bin/gst-play-1.0', self.index.glob('bin/*'))
+        shutil.rmtree(os.path.join(self.tmp, 'bin'))
+        self.assertEqual(self.index.glob('bin/*'), [])
+        self.assertFalse(self.index.isdir('bin'))
+
+    def testFrozen(self):
+        with prefixindex.frozen():
+            self.assertFalse(self.index.exists('bin/gst-play-1.0'))
+            open(os.path.join(self.tmp, 'bin', 'gst-play-1.0'), 'w').close()
+            self.assertFalse(self.index.exists('bin/gst-play-1.0'))
+        self.assertTrue(self.index.exists('bin/gst-play-1.0'))
+
+    def testPersist(self):
+        self.index.glob('lib/*/*')
+        path = os.path.join(self.tmp, 'index')
+        self.index.save(path)
+        index = PrefixIndex(self.tmp)
+        index.load(path)
+        self.assertEqual(index.dirs.keys(), self.index.dirs.keys())
+        # Loaded listings are checked against the prefix too
+        os.remove(os.path.join(self.tmp, 'lib', 'pkgconfig', 'gstreamer-1.0.pc'))
+        self.assertEqual(index.glob('lib/pkgconfig/*'), [])
+        # The index of another prefix is ignored
+        other = PrefixIndex(os.path.join(self.tmp, 'lib'))
+        other.load(path)
+        self.assertEqual(other.dirs, {})
@@ -17,12 +17,15 @@
 # Boston, MA 02111-1307, USA.
 
 import asyncio
+import threading
+import time
 import unittest
 import os
 
 from cerbero.build import recipe, build, source
 from cerbero.config import Platform, License, Architecture
 from cerbero.errors import FatalError
+from cerbero.utils import run_until_complete
 from test.test_common import DummyConfig
 
 # ruff: noqa: E731
@@ -119,6 +122,42 @@ class TestRecipe(unittest.TestCase):
         self.assertEqual(['dep1', 'dep2', 'dep4'], self.recipe.list_deps())
 
 
+class TestRunStep(unittest.TestCase):
+    def testSyncStep(self):
+        ticks = []
+
+        def step():
+            # Blocks like a post-install step rewriting files
+            time.sleep(0.2)
+            return threading.current_thread()
+
+        async def ticker():
+            for _ in range(5):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.02)
+
+        async def main():
+            return await asyncio.gather(recipe.run_step(step), ticker())
+
+        thread, _ = run_until_complete(main())
+        self.assertIsNot(thread, threading.main_thread())
+        # The loop kept running while the step was blocked
+        self.assertEqual(len(ticks), 5)
+        self.assertLess(ticks[-1] - ticks[0], 0.2)
+
+    def testAsyncStep(self):
+        async def step():
+            return threading.current_thread()
+
+        self.assertIs(run_until_complete(recipe.run_step(step)), threading.main_thread())
+
+    def testSyncStepError(self):
+        def step():
+            raise FatalError('failed')
+
+        self.assertRaises(FatalError, run_until_complete, recipe.run_step(step))
+
+
 class TestLicenses(unittest.TestCase):
     def setUp(self):
         self.config = DummyConfig()
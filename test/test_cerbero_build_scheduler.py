@@ -0,0 +1,78 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import unittest
+
+from cerbero.build.scheduler import BuildScheduler
+from cerbero.errors import FatalError
+
+
+# glib <- gstreamer <- gst-plugins-base <- gst-plugins-good
+#  ^                         ^
+#  +---- orc ----------------+
+DEPS = {
+    'glib': [],
+    'orc': ['glib'],
+    'gstreamer': ['glib'],
+    'gst-plugins-base': ['glib', 'gstreamer', 'orc'],
+    'gst-plugins-good': ['glib', 'gstreamer', 'gst-plugins-base', 'orc'],
+    'zlib': [],
+}
+
+
+class BuildSchedulerTest(unittest.TestCase):
+    def testGraph(self):
+        s = BuildScheduler(DEPS)
+        self.assertEqual(s.targets, {'gst-plugins-good', 'zlib'})
+        self.assertEqual(s.rdeps['orc'], {'gst-plugins-base', 'gst-plugins-good'})
+        self.assertEqual(s.levels['glib'], 0)
+        self.assertEqual(s.levels['gst-plugins-base'], 2)
+        self.assertEqual(s.levels['gst-plugins-good'], 3)
+        self.assertEqual(s.order.index('glib'), 0)
+        self.assertLess(s.order.index('gstreamer'), s.order.index('gst-plugins-base'))
+
+    def testCriticalPath(self):
+        s = BuildScheduler(DEPS)
+        self.assertEqual(s.critical_path['gst-plugins-good'], 1)
+        self.assertEqual(s.critical_path['glib'], 4)
+        self.assertEqual(s.critical_path['zlib'], 1)
+        s = BuildScheduler(DEPS, costs={'orc': 10, 'gstreamer': 2})
+        self.assertEqual(s.critical_path['glib'], 13)
+        self.assertGreater(s.priority('orc'), s.priority('gstreamer'))
+
+    def testReady(self):
+        s = BuildScheduler(DEPS)
+        # glib blocks everything, so it must go before zlib
+        self.assertEqual(s.pop_ready(), ['glib', 'zlib'])
+        self.assertEqual(s.pop_ready(), [])
+        self.assertEqual(sorted(s.done('glib')), ['gstreamer', 'orc'])
+        self.assertEqual(s.done('gstreamer'), [])
+        self.assertEqual(s.done('orc'), ['gst-plugins-base'])
+        self.assertFalse(s.all_built())
+        self.assertEqual(s.done('gst-plugins-base'), ['gst-plugins-good'])
+        s.done('gst-plugins-good')
+        s.done('zlib')
+        self.assertTrue(s.all_built())
+
+    def testAlreadyBuilt(self):
+        s = BuildScheduler(DEPS, built=['glib', 'gstreamer'])
+        self.assertEqual(s.pop_ready(), ['orc', 'zlib'])
+        self.assertTrue(s.is_built('glib'))
+
+    def testCycle(self):
+        self.assertRaises(FatalError, BuildScheduler, {'a': ['b'], 'b': ['a']})
@@ -0,0 +1,171 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import hashlib
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+from unittest import mock
+
+from cerbero.build import recipe, source
+from cerbero.build.build import BuildType
+from cerbero.build.sourcecache import SourceTreeCache, copy_tree, source_tree_key
+from cerbero.config import License
+from cerbero.utils import run_until_complete
+from test.test_common import DummyConfig
+
+PATCH = """From 0000000000000000000000000000000000000000 Mon Sep 17 00:00:00 2001
+From: Foo <foo@foo.org>
+Date: Mon, 1 Jan 2024 00:00:00 +0000
+Subject: [PATCH] Change a
+
+---
+ a.txt | 2 +-
+ 1 file changed, 1 insertion(+), 1 deletion(-)
+
+diff --git a/a.txt b/a.txt
+--- a/a.txt
++++ b/a.txt
+@@ -1 +1 @@
+-foo
++bar
+--
+2.0
+"""
+
+
+class Recipe(recipe.Recipe):
+    name = 'foo'
+    version = '1.0'
+    licenses = [License.LGPLv2Plus]
+    stype = source.SourceType.TARBALL
+    btype = BuildType.CUSTOM
+    url = 'https://foo.org/foo-1.0.tar.gz'
+    tarball_dirname = 'foo-1.0'
+
+
+class SourceTreeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, path, content):
+        path = os.path.join(self.tmp, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(path, 'w') as f:
+            f.write(content)
+        return path
+
+    def testCopyTree(self):
+        src = os.path.join(self.tmp, 'src')
+        self.write('src/a.txt', 'a')
+        self.write('src/sub/.git', 'not a repository')
+        self.write('src/.git/HEAD', 'ref: refs/heads/main')
+        os.symlink('a.txt', os.path.join(src, 'link'))
+        os.utime(os.path.join(src, 'a.txt'), (1000000000, 1000000000))
+        dest = os.path.join(self.tmp, 'dest')
+        copy_tree(src, dest, ignore=['.git'])
+        self.assertEqual(sorted(os.listdir(dest)), ['a.txt', 'link', 'sub'])
+        self.assertTrue(os.path.isfile(os.path.join(dest, 'sub', '.git')))
+        self.assertEqual(os.readlink(os.path.join(dest, 'link')), 'a.txt')
+        self.assertEqual(os.stat(os.path.join(dest, 'a.txt')).st_mtime, 1000000000)
+
+    def testKey(self):
+        patch = self.write('0001.patch', 'foo')
+        key = source_tree_key('0' * 64, [patch])
+        self.assertEqual(key, source_tree_key('0' * 64, [patch]))
+        self.assertNotEqual(key, source_tree_key('1' * 64, [patch]))
+        self.assertNotEqual(key, source_tree_key('0' * 64, []))
+        self.assertNotEqual(key, source_tree_key('0' * 64, [patch], strip=2))
+        self.write('0001.patch', 'bar')
+        self.assertNotEqual(key, source_tree_key('0' * 64, [patch]))
+
+    def testAddPlace(self):
+        self.write('src/a.txt', 'a')
+        self.write('src/.git/HEAD', 'ref: refs/heads/main')
+        cache = SourceTreeCache(os.path.join(self.tmp, 'trees'))
+        self.assertFalse(cache.has('key'))
+        cache.add('key', os.path.join(self.tmp, 'src'))
+        self.assertTrue(cache.has('key'))
+        self.assertEqual(os.listdir(cache.path), ['key'])
+        dest = os.path.join(self.tmp, 'sources', 'foo-1.0')
+        cache.place('key', dest)
+        self.assertEqual(os.listdir(dest), ['a.txt'])
+
+
+class TarballTreeCacheTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.config = DummyConfig()
+        self.config.sources = os.path.join(self.tmp, 'sources')
+        self.config.local_sources = os.path.join(self.tmp, 'local')
+        self.config.source_tree_cache = True
+        self.config.source_tree_cache_dir = os.path.join(self.tmp, 'trees')
+        f = io.BytesIO()
+        with tarfile.open(fileobj=f, mode='w:gz') as tar:
+            for name, content in (('foo-1.0/a.txt', b'foo\n'), ('foo-1.0/b.txt', b'b\n')):
+                info = tarfile.TarInfo(name)
+                info.size = len(content)
+                tar.addfile(info, io.BytesIO(content))
+        os.makedirs(os.path.join(self.config.local_sources, 'foo-1.0'))
+        with open(os.path.join(self.config.local_sources, 'foo-1.0', 'foo-1.0.tar.gz'), 'wb') as tarball:
+            tarball.write(f.getvalue())
+        self.patch = os.path.join(self.tmp, '0001-Change-a.patch')
+        with open(self.patch, 'w') as p:
+            p.write(PATCH)
+        Recipe.tarball_checksum = hashlib.sha256(f.getvalue()).hexdigest()
+        Recipe.patches = [self.patch]
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def read(self, recipe, name):
+        with open(os.path.join(recipe.src_dir, name)) as f:
+            return f.read()
+
+    def testExtract(self):
+        recipe = Recipe(self.config, {})
+        run_until_complete(recipe.extract_impl())
+        self.assertEqual(self.read(recipe, 'a.txt'), 'bar\n')
+        # The patches were applied with git am
+        self.assertTrue(os.path.isdir(os.path.join(recipe.src_dir, '.git')))
+        self.assertEqual(len(os.listdir(self.config.source_tree_cache_dir)), 1)
+
+        # Extracting again copies the tree from the cache
+        with open(os.path.join(recipe.src_dir, 'b.txt'), 'w') as f:
+            f.write('modified\n')
+        with mock.patch.object(source.BaseTarball, 'extract_tarball') as extract_tarball:
+            run_until_complete(recipe.extract_impl())
+        extract_tarball.assert_not_called()
+        self.assertEqual(self.read(recipe, 'a.txt'), 'bar\n')
+        self.assertEqual(self.read(recipe, 'b.txt'), 'b\n')
+        self.assertFalse(os.path.exists(os.path.join(recipe.src_dir, '.git')))
+
+        # A different patch series is another tree
+        Recipe.patches = []
+        recipe = Recipe(self.config, {})
+        run_until_complete(recipe.extract_impl())
+        self.assertEqual(self.read(recipe, 'a.txt'), 'foo\n')
+        # No need for git without patches
+        self.assertFalse(os.path.exists(os.path.join(recipe.src_dir, '.git')))
+        self.assertEqual(len(os.listdir(self.config.source_tree_cache_dir)), 2)
@@ -0,0 +1,175 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from cerbero.build import staging
+from cerbero.build import recipe
+from cerbero.build.build import BuildType
+from cerbero.build.statusstore import StatusStore
+from cerbero.build.staging import StagedInstall
+from cerbero.commands.uninstall import Uninstall
+from cerbero.enums import Platform
+from cerbero.errors import FatalError
+from test.test_common import DummyConfig as Config
+
+
+class MesonRecipe(recipe.Recipe):
+    name = 'meson-recipe'
+    version = '1.0'
+    btype = BuildType.MESON
+    allow_staged_install = True
+
+
+class NotStagedRecipe(recipe.Recipe):
+    name = 'not-staged-recipe'
+    version = '1.0'
+    btype = BuildType.MESON
+
+
+class OverriddenInstallRecipe(recipe.Recipe):
+    name = 'overridden-recipe'
+    version = '1.0'
+
+    async def install(self):
+        pass
+
+
+class CustomRecipe(recipe.Recipe):
+    name = 'custom-recipe'
+    version = '1.0'
+    btype = BuildType.CUSTOM
+
+
+class StagedInstallTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.config = Config()
+        self.config.prefix = os.path.join(self.tmp, 'prefix')
+        self.config.sources = os.path.join(self.tmp, 'sources')
+        os.makedirs(self.config.prefix)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, root, path, content='', link=None):
+        path = os.path.join(root, path)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        if link is not None:
+            os.symlink(link, path)
+        else:
+            with open(path, 'w') as f:
+                f.write(content)
+
+    def stage(self, recipe):
+        stage = StagedInstall(recipe)
+        stage.prepare()
+        self.write(stage.root, 'lib/liba.so.1', 'a')
+        self.write(stage.root, 'lib/liba.so', link='liba.so.1')
+        self.write(stage.root, 'include/a/a.h', 'header')
+        os.makedirs(os.path.join(stage.root, 'share/empty'))
+        return stage
+
+    def testCanStage(self):
+        self.assertTrue(staging.can_stage(MesonRecipe(self.config, {})))
+        self.assertFalse(staging.can_stage(OverriddenInstallRecipe(self.config, {})))
+        self.assertFalse(staging.can_stage(CustomRecipe(self.config, {})))
+        # Recipes need to opt in
+        self.assertFalse(staging.can_stage(NotStagedRecipe(self.config, {})))
+        meson_recipe = MesonRecipe(self.config, {})
+        meson_recipe.allow_staged_install = False
+        self.assertFalse(staging.can_stage(meson_recipe))
+        self.config.platform = Platform.WINDOWS
+        self.assertFalse(staging.can_stage(MesonRecipe(self.config, {})))
+
+    def testFilesAndMerge(self):
+        stage = self.stage(MesonRecipe(self.config, {}))
+        files = stage.files()
+        self.assertEqual(files, ['include/a/a.h', 'lib/liba.so', 'lib/liba.so.1'])
+        stage.merge(files)
+        prefix = self.config.prefix
+        self.assertEqual(os.readlink(os.path.join(prefix, 'lib/liba.so')), 'liba.so.1')
+        self.assertTrue(os.path.isfile(os.path.join(prefix, 'include/a/a.h')))
+        self.assertTrue(os.path.isdir(os.path.join(prefix, 'share/empty')))
+        self.assertFalse(os.path.exists(stage.destdir))
+
+    def testMergeSymlinkOverDirectory(self):
+        stage = self.stage(MesonRecipe(self.config, {}))
+        self.write(stage.root, 'share/a', link='a-1.0')
+        self.write(stage.root, 'share/a-1.0/data', 'data')
+        # Left empty by a previous install
+        os.makedirs(os.path.join(self.config.prefix, 'share/a/empty'))
+        stage.merge(stage.files())
+        self.assertEqual(os.readlink(os.path.join(self.config.prefix, 'share/a')), 'a-1.0')
+        self.assertTrue(os.path.isfile(os.path.join(self.config.prefix, 'share/a/data')))
+
+    def testMergeSymlinkOverNonEmptyDirectory(self):
+        stage = self.stage(MesonRecipe(self.config, {}))
+        self.write(stage.root, 'share/a', link='a-1.0')
+        self.write(self.config.prefix, 'share/a/other', 'other')
+        with self.assertRaises(FatalError):
+            stage.merge(stage.files())
+        self.assertTrue(os.path.isfile(os.path.join(self.config.prefix, 'share/a/other')))
+
+    def testCollisions(self):
+        stage = self.stage(MesonRecipe(self.config, {}))
+        files = stage.files()
+        prefix = self.config.prefix
+        # Same content as the staged files
+        self.write(prefix, 'lib/liba.so.1', 'a')
+        self.write(prefix, 'lib/liba.so', link='liba.so.1')
+        self.write(prefix, 'include/a/a.h', 'other header')
+        owners = {'lib/liba.so.1': 'other', 'lib/liba.so': 'other', 'include/a/a.h': 'other'}
+        self.assertEqual(stage.collisions(files, owners), {'include/a/a.h': 'other'})
+        # Files reinstalled by the same recipe never collide
+        owners = {f: stage.recipe_name for f in files}
+        self.assertEqual(stage.collisions(files, owners), {})
+
+    def testUninstall(self):
+        stage = self.stage(MesonRecipe(self.config, {}))
+        files = stage.files()
+        stage.merge(files)
+        self.write(self.config.prefix, 'lib/libother.so', 'other')
+        Uninstall.uninstall(self.config.prefix, files)
+        self.assertEqual(sorted(os.listdir(self.config.prefix)), ['lib', 'share'])
+        self.assertEqual(os.listdir(os.path.join(self.config.prefix, 'lib')), ['libother.so'])
+
+
+class StatusStoreFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.store = StatusStore(os.path.join(self.tmp, 'cache'))
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def testFiles(self):
+        self.assertIsNone(self.store.get_files('a'))
+        self.store.set_files('a', ['lib/b.so', 'lib/a.so'])
+        self.store.set_files('b', ['bin/b'])
+        self.assertEqual(self.store.get_files('a'), ['lib/a.so', 'lib/b.so'])
+        owners = self.store.get_files_owners(['lib/a.so', 'bin/b', 'bin/c'])
+        self.assertEqual(owners, {'lib/a.so': 'a', 'bin/b': 'b'})
+        # A reinstall replaces the previous list of files
+        self.store.set_files('a', ['lib/a.so'])
+        self.assertEqual(self.store.get_files('a'), ['lib/a.so'])
+        self.store.set_files('a', [])
+        self.assertIsNone(self.store.get_files('a'))
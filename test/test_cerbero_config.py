@@ -174,3 +174,31 @@ class ConfigTest(unittest.TestCase):
         config.config_dir = '/tmp/test'
         self.assertEqual(config.config_dir, '/tmp/test')
         config.config_dir = old_config_dir
+
+    def testSetupEnvCached(self):
+        config = Config()
+        config.load()
+        env = config.env
+        config.do_setup_env()
+        self.assertIs(config.env, env)
+        # The environment is computed again when the variants change
+        config.variants.rust = not config.variants.rust
+        config.do_setup_env()
+        self.assertIsNot(config.env, env)
+        self.assertNotEqual(config.env['PATH'], env['PATH'])
+        # or when the config environment changes
+        config.config_env['CERBERO_TEST_VAR'] = 'test'
+        config.do_setup_env()
+        self.assertEqual(config.env['CERBERO_TEST_VAR'], 'test')
+
+    def testBuildEnvValues(self):
+        config = Config()
+        config.load()
+        env = config.env.copy()
+        env['CFLAGS'] = '-O3 -DFOO="a b"'
+        build_env = config.get_build_env(env)
+        self.assertEqual(build_env['CFLAGS'], ['-O3', '-DFOO=a b'])
+        self.assertEqual(build_env['PATH'].get(), env['PATH'])
+        # The values shared with the config environment are copies
+        build_env['PATH'].append('/foo')
+        self.assertEqual(config.get_build_env()['PATH'].get(), config.env['PATH'])
@@ -19,8 +19,11 @@
 
 import unittest
 import os
+import shutil
+import tempfile
 
-from cerbero.ide.pkgconfig import PkgConfig
+from cerbero.errors import FatalError
+from cerbero.ide.pkgconfig import PkgConfig, PkgConfigResolver, version_compare
 
 
 class TestPkgConfig(unittest.TestCase):
@@ -80,3 +83,124 @@ class TestPkgConfig(unittest.TestCase):
     def testPrefix(self):
         self.assertEqual(self.pkgconfig.prefix(), '/usr')
         self.assertEqual(self.pkgconfig2.prefix(), '/usr')
+
+
+PC_TEMPLATE = """prefix=%(prefix)s
+libdir=${prefix}/lib
+includedir=${prefix}/include
+
+Name: %(name)s
+Description: %(name)s \\
+  library # with a comment
+Version: %(version)s
+Requires: %(requires)s
+Libs: -L${libdir} -l%(name)s
+Cflags: -I${includedir}/%(name)s -DFOO=\\#1
+"""
+
+
+class TestPkgConfigResolver(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.libdir = os.path.join(self.tmp, 'lib')
+        self.path = os.path.join(self.tmp, 'path')
+        os.makedirs(self.libdir)
+        os.makedirs(self.path)
+        self.env = {'PKG_CONFIG_LIBDIR': self.libdir}
+        self.mtime = 1000000000
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def write(self, name, dirname=None, prefix='/opt', version='1.0', requires=''):
+        path = os.path.join(dirname or self.libdir, name + '.pc')
+        with open(path, 'w') as f:
+            f.write(PC_TEMPLATE % {'name': name, 'prefix': prefix, 'version': version, 'requires': requires})
+        # Files modified recently are not cached
+        self.mtime += 1
+        os.utime(path, (self.mtime, self.mtime))
+
+    def testParse(self):
+        self.write('foo')
+        pc = PkgConfigResolver(self.env).get('foo')
+        self.assertEqual(pc.description, 'foo   library')
+        self.assertEqual(pc.variables['includedir'], '/opt/include')
+        self.assertEqual(pc.cflags, [('I', '-I/opt/include/foo'), ('cflags', '-DFOO=#1')])
+
+    def testSearchPath(self):
+        self.write('foo', prefix='/libdir')
+        self.write('foo', dirname=self.path, prefix='/path')
+        self.env['PKG_CONFIG_PATH'] = self.path
+        self.assertEqual(PkgConfig('foo', env=self.env).prefix(), '/path')
+        self.assertEqual(PkgConfig.list_all(self.env), ['foo'])
+        self.env['PKG_CONFIG_PATH'] = ''
+        self.assertEqual(PkgConfig('foo', env=self.env).prefix(), '/libdir')
+
+    def testSysroot(self):
+        self.write('foo')
+        self.env['PKG_CONFIG_SYSROOT_DIR'] = '/sysroot'
+        pkgconfig = PkgConfig('foo', env=self.env)
+        self.assertEqual(pkgconfig.include_dirs(), ['/sysroot/opt/include/foo'])
+        self.assertEqual(pkgconfig.libraries_dirs(), ['/sysroot/opt/lib'])
+        self.assertEqual(pkgconfig.prefix(), '/opt')
+
+    def testSystemDirs(self):
+        self.write('foo', prefix='/usr')
+        self.env['PKG_CONFIG_SYSTEM_INCLUDE_PATH'] = '/usr/include/foo'
+        self.assertEqual(PkgConfig('foo', env=self.env).include_dirs(), [])
+        self.env['PKG_CONFIG_ALLOW_SYSTEM_CFLAGS'] = '1'
+        self.assertEqual(PkgConfig('foo', env=self.env).include_dirs(), ['/usr/include/foo'])
+
+    def testRequiredVersion(self):
+        self.write('foo', version='1.10')
+        self.write('bar', requires='foo >= 1.9')
+        self.assertEqual(PkgConfig('bar', env=self.env).libraries(), ['bar', 'foo'])
+        self.write('bar', requires='foo >= 1.11')
+        self.assertRaises(FatalError, PkgConfig('bar', env=self.env).libraries)
+        self.write('bar', requires='baz')
+        self.assertRaises(FatalError, PkgConfig('bar', env=self.env).libraries)
+
+    def testCache(self):
+        self.write('foo', version='1.0')
+        self.assertEqual(PkgConfig('foo', env=self.env).modversion(), '1.0')
+        self.write('foo', version='2.0')
+        self.assertEqual(PkgConfig('foo', env=self.env).modversion(), '2.0')
+
+    def testVersionCompare(self):
+        self.assertEqual(version_compare('1.10', '1.9'), 1)
+        self.assertEqual(version_compare('1.0', '1.0.0'), -1)
+        self.assertEqual(version_compare('1.0a', '1.0.1'), -1)
+        self.assertEqual(version_compare('2.30.0', '2.30.0'), 0)
+        self.assertEqual(version_compare('1_0', '1.0'), 0)
+
+
+@unittest.skipUnless(shutil.which('pkg-config'), 'pkg-config is not installed')
+class TestPkgConfigExecutable(unittest.TestCase):
+    """
+    Checks the resolver against the output of pkg-config
+    """
+
+    def setUp(self):
+        pc_path = os.path.join(os.path.dirname(__file__), 'pkgconfig')
+        self.env = dict(os.environ, PKG_CONFIG_LIBDIR=pc_path, PKG_CONFIG_PATH='')
+
+    def tearDown(self):
+        PkgConfig.native = True
+
+    def query(self, native, name, method):
+        PkgConfig.native = native
+        return getattr(PkgConfig(name, env=self.env), method)()
+
+    def testFixture(self):
+        PkgConfig.native = False
+        names = PkgConfig.list_all(self.env)
+        methods = ['include_dirs', 'cflags', 'libraries_dirs', 'modversion', 'requires', 'prefix']
+        for name in names:
+            for method in methods:
+                self.assertEqual(self.query(True, name, method), self.query(False, name, method), (name, method))
+            # pkgconf removes all the duplicated libraries, not only the
+            # consecutive ones
+            for method in ('libraries', 'static_libraries'):
+                self.assertEqual(
+                    set(self.query(True, name, method)), set(self.query(False, name, method)), (name, method)
+                )
@@ -0,0 +1,159 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import hashlib
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+import unittest
+
+from cerbero.enums import Architecture
+from cerbero.packages.debian import DebianPackager
+from cerbero.packages.debwriter import DebWriter
+from test.test_build_common import add_files
+from test.test_common import DummyConfig
+from test.test_packages_common import create_store
+
+
+def read_ar(path):
+    members = {}
+    with open(path, 'rb') as f:
+        assert f.read(8) == b'!<arch>\n'
+        while True:
+            header = f.read(60)
+            if not header:
+                break
+            name = header[:16].decode().strip()
+            size = int(header[48:58])
+            members[name] = f.read(size)
+            if size % 2:
+                f.read(1)
+    return members
+
+
+class DebWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.prefix = os.path.join(self.tmp, 'prefix')
+        os.makedirs(os.path.join(self.prefix, 'lib', 'pkgconfig'))
+        with open(os.path.join(self.prefix, 'lib', 'libfoo.so.1'), 'wb') as f:
+            f.write(b'\x7fELF' + b'x' * 5000)
+        os.symlink('libfoo.so.1', os.path.join(self.prefix, 'lib', 'libfoo.so'))
+        with open(os.path.join(self.prefix, 'lib', 'pkgconfig', 'foo.pc'), 'w') as f:
+            f.write('Name: foo\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _write(self, compression):
+        path = os.path.join(self.tmp, 'foo_1.0-1_amd64.deb')
+        writer = DebWriter(path, compression, self.tmp)
+        writer.add_files('/opt/foo', self.prefix, ['lib/libfoo.so.1', 'lib/libfoo.so', 'lib/pkgconfig/foo.pc'])
+        control = {
+            'Package': 'foo',
+            'Version': '1.0-1',
+            'Architecture': 'amd64',
+            'Maintainer': 'Pin <pan@p.un>',
+            'Depends': '',
+            'Description': 'Foo library\nThe foo library\n\nwith a blank line',
+        }
+        writer.write(control, {'postinst': b'#!/bin/sh\nldconfig\n'})
+        return path
+
+    def testWrite(self):
+        path = self._write('gz')
+        members = read_ar(path)
+        self.assertEqual(list(members), ['debian-binary', 'control.tar.gz', 'data.tar.gz'])
+        self.assertEqual(members['debian-binary'], b'2.0\n')
+
+        with tempfile.TemporaryFile() as data:
+            data.write(members['data.tar.gz'])
+            data.seek(0)
+            with tarfile.open(fileobj=data, mode='r:gz') as tar:
+                names = [t.name for t in tar.getmembers()]
+                self.assertEqual(names[:3], ['./opt', './opt/foo', './opt/foo/lib'])
+                link = tar.getmember('./opt/foo/lib/libfoo.so')
+                self.assertTrue(link.issym())
+                self.assertEqual(link.linkname, 'libfoo.so.1')
+                self.assertEqual(tar.getmember('./opt/foo/lib/libfoo.so.1').uname, 'root')
+
+        with tempfile.TemporaryFile() as f:
+            f.write(members['control.tar.gz'])
+            f.seek(0)
+            with tarfile.open(fileobj=f, mode='r:gz') as tar:
+                control = tar.extractfile('./control').read().decode()
+                md5sums = tar.extractfile('./md5sums').read().decode()
+                self.assertEqual(tar.getmember('./postinst').mode, 0o755)
+        self.assertIn('Installed-Size: 5\n', control)
+        self.assertNotIn('Depends', control)
+        self.assertTrue(control.endswith('Description: Foo library\n The foo library\n .\n with a blank line\n'))
+        with open(os.path.join(self.prefix, 'lib', 'libfoo.so.1'), 'rb') as f:
+            md5 = hashlib.md5(f.read()).hexdigest()
+        self.assertIn(f'{md5}  opt/foo/lib/libfoo.so.1\n', md5sums)
+        self.assertNotIn('libfoo.so\n', md5sums)
+
+    @unittest.skipUnless(shutil.which('dpkg-deb'), 'dpkg-deb is required')
+    def testDpkgDeb(self):
+        for compression in ('xz', 'gz'):
+            path = self._write(compression)
+            subprocess.check_call(['dpkg-deb', '--info', path], stdout=subprocess.DEVNULL)
+            contents = subprocess.check_output(['dpkg-deb', '--contents', path], text=True)
+            self.assertIn('./opt/foo/lib/libfoo.so -> libfoo.so.1', contents)
+            self.assertEqual(subprocess.check_output(['dpkg-deb', '--field', path, 'Package'], text=True), 'foo\n')
+
+
+class DebianDirectWriterTest(unittest.TestCase):
+    def setUp(self):
+        self.config = DummyConfig()
+        self.tmp = tempfile.mkdtemp()
+        self.config.prefix = self.tmp
+        self.config.home_dir = self.tmp
+        self.config.target_arch = Architecture.X86_64
+        self.config.deb_direct_writer = True
+        self.config.deb_compression = 'gz'
+        self.output_dir = os.path.join(self.tmp, 'output')
+        os.makedirs(self.output_dir)
+        self.store = create_store(self.config)
+        add_files(self.tmp)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def testPack(self):
+        package = self.store.get_package('gstreamer-test1')
+        packager = DebianPackager(self.config, package, self.store)
+        paths = packager.pack(self.output_dir, devel=True, pack_deps=False)
+        self.assertEqual(
+            [os.path.basename(p) for p in paths],
+            ['gstreamer-test1_1.0-1_amd64.deb', 'gstreamer-test1-dev_1.0-1_amd64.deb'],
+        )
+        self.assertTrue(package.has_runtime_package)
+        members = read_ar(paths[1])
+        with tempfile.TemporaryFile() as f:
+            f.write(members['control.tar.gz'])
+            f.seek(0)
+            with tarfile.open(fileobj=f, mode='r:gz') as tar:
+                control = tar.extractfile('./control').read().decode()
+        depends = [line for line in control.splitlines() if line.startswith('Depends: ')][0]
+        depends = depends.split(': ', 1)[1].split(', ')
+        # The runtime package is only listed once, with its version
+        self.assertIn('gstreamer-test1 (= 1.0-1)', depends)
+        self.assertNotIn('gstreamer-test1', depends)
+        self.assertIn('Section: libdevel\n', control)
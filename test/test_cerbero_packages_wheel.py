@@ -0,0 +1,216 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import base64
+import hashlib
+import os
+import shutil
+import struct
+import tempfile
+import unittest
+import zipfile
+from pathlib import Path
+
+from cerbero.packages.wheel import writer
+
+
+PYTHON_INFO = {'version': [3, 12], 'platform': 'win-amd64', 'system': 'Windows', 'gil_disabled': False}
+MACOS_PYTHON_INFO = {'version': [3, 12], 'platform': 'macosx-11.0-arm64', 'system': 'Darwin', 'gil_disabled': False}
+
+
+def macho(version, cmd=writer.LC_BUILD_VERSION, magic=writer.MH_MAGIC_64, cputype=0x01000007):
+    """
+    A Mach-O header with only the load command of the minimum macOS version
+    """
+    encoded = (version[0] << 16) | (version[1] << 8)
+    if cmd == writer.LC_BUILD_VERSION:
+        command = struct.pack('<IIIIII', cmd, 24, 1, encoded, encoded, 0)
+    else:
+        command = struct.pack('<IIII', cmd, 16, encoded, encoded)
+    # A segment before it, which must be skipped
+    segment = struct.pack('<II', 0x19, 72) + bytes(64)
+    header = struct.pack('<IiiIIII', magic, cputype, 3, 6, 2, len(segment) + len(command), 0)
+    if magic == writer.MH_MAGIC_64:
+        header += bytes(4)
+    return header + segment + command
+
+
+def fat_macho(archs):
+    """
+    @param archs: list of (cputype, Mach-O)
+    """
+    offset = 8 + 20 * len(archs)
+    headers = b''
+    for cputype, data in archs:
+        headers += struct.pack('>iiIII', cputype, 3, offset, len(data), 0)
+        offset += len(data)
+    return struct.pack('>II', writer.FAT_MAGIC, len(archs)) + headers + b''.join(d for c, d in archs)
+
+
+def package_info(name, **kwargs):
+    info = {
+        'package_name': name,
+        'version': '1.26.0',
+        'description': 'GStreamer command-line utilities',
+        'long_description': 'Long description\n',
+        'long_description_content_type': 'text/markdown',
+        'url': 'https://gstreamer.freedesktop.org',
+        'vendor': 'GStreamer Project',
+        'spdx_license': 'LGPL-2.1-or-later',
+        'classifiers': ['Programming Language :: Python :: 3'],
+        'python_version': '>= 3.9',
+        'install_requires': ['gstreamer_libs ~= 1.26.0'],
+        'extras_require': {},
+        'entrypoints': {},
+        'needs_environment': False,
+    }
+    info.update(kwargs)
+    return info
+
+
+class WheelTagTest(unittest.TestCase):
+    def testTags(self):
+        self.assertEqual(writer.wheel_tag('gstreamer_meta', PYTHON_INFO), 'py3-none-any')
+        self.assertEqual(writer.wheel_tag('gstreamer_libs', PYTHON_INFO), 'cp39-abi3-win_amd64')
+        self.assertEqual(writer.wheel_tag('gstreamer_python', PYTHON_INFO), 'cp312-cp312-win_amd64')
+        self.assertEqual(writer.wheel_tag('gstreamer_libs', MACOS_PYTHON_INFO), 'cp39-abi3-macosx_10_13_universal2')
+        self.assertEqual(writer.wheel_tag('gstreamer_gtk', MACOS_PYTHON_INFO), 'cp39-abi3-macosx_11_0_arm64')
+        free_threaded = dict(PYTHON_INFO, version=[3, 13], gil_disabled=True)
+        self.assertEqual(writer.wheel_tag('gstreamer_libs', free_threaded), 'cp313-cp313t-win_amd64')
+
+    def testPlatform32Bit(self):
+        linux = dict(PYTHON_INFO, platform='linux-x86_64', system='Linux')
+        self.assertEqual(writer.wheel_tag('gstreamer_libs', linux), 'cp39-abi3-linux_x86_64')
+        linux['pointer_size'] = 4
+        self.assertEqual(writer.wheel_tag('gstreamer_libs', linux), 'cp39-abi3-linux_i686')
+
+    def testMacOSPlatform(self):
+        tmp = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp)
+
+        def binary(name, data):
+            path = os.path.join(tmp, name)
+            with open(path, 'wb') as f:
+                f.write(data)
+            return path
+
+        info = dict(MACOS_PYTHON_INFO, platform='macosx-10.9-universal2')
+        self.assertEqual(writer.wheel_tag('gstreamer_gtk', info), 'cp39-abi3-macosx_10_9_universal2')
+        old = binary('old.so', macho((10, 9), cmd=writer.LC_VERSION_MIN_MACOSX, magic=writer.MH_MAGIC))
+        new = binary('libnew.dylib', macho((12, 3)))
+        self.assertEqual(writer.macho_min_macos_version(new), (12, 3, 0))
+        self.assertIsNone(writer.macho_min_macos_version(binary('not-macho.so', b'\x7fELF' + bytes(60))))
+        self.assertEqual(writer.wheel_tag('gstreamer_gtk', info, [old]), 'cp39-abi3-macosx_10_9_universal2')
+        # The binaries raise the version, which only has a major number
+        # since macOS 11
+        self.assertEqual(writer.wheel_tag('gstreamer_gtk', info, [old, new]), 'cp39-abi3-macosx_12_0_universal2')
+        self.assertEqual(writer.wheel_tag('gstreamer_python', info, [new]), 'cp312-cp312-macosx_12_0_universal2')
+        # As does the deployment target
+        info['deployment_target'] = '10.15'
+        self.assertEqual(writer.wheel_tag('gstreamer_gtk', info, [old]), 'cp39-abi3-macosx_10_15_universal2')
+        # The 11.0 of arm64 is ignored in universal binaries
+        universal = binary(
+            'libuniversal.dylib',
+            fat_macho(
+                [(0x01000007, macho((10, 13))), (writer.CPU_TYPE_ARM64, macho((11, 0), cputype=writer.CPU_TYPE_ARM64))]
+            ),
+        )
+        self.assertEqual(writer.macho_min_macos_version(universal), (10, 13, 0))
+        # The other wheels are always universal2 for 10.13
+        self.assertEqual(writer.wheel_tag('gstreamer_libs', info, [new]), 'cp39-abi3-macosx_10_13_universal2')
+
+    def testImportShim(self):
+        self.assertEqual(writer.import_shim('gstreamer', PYTHON_INFO)[0], 'gstreamer.pth')
+        name, content = writer.import_shim('gstreamer', dict(PYTHON_INFO, version=[3, 15]))
+        self.assertEqual(name, 'gstreamer.start')
+        self.assertTrue(content.startswith(b'\xef\xbb\xbf'))
+
+
+class WriteWheelTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        self.prefix = self.tmp / 'prefix'
+        (self.prefix / 'bin').mkdir(parents=True)
+        (self.prefix / 'lib').mkdir()
+        self.exe = self.prefix / 'bin' / 'gst-launch-1.0'
+        self.exe.write_bytes(b'\x7fELF' + os.urandom(100000))
+        self.exe.chmod(0o755)
+        (self.prefix / 'lib' / 'libgstreamer-1.0.so.0').write_bytes(os.urandom(1000))
+        os.symlink('libgstreamer-1.0.so.0', self.prefix / 'lib' / 'libgstreamer-1.0.so')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def testWriteWheel(self):
+        info = package_info(
+            'gstreamer_cli',
+            extras_require={'gpl': ['gstreamer_plugins_gpl ~= 1.26.0']},
+            entrypoints={'console_scripts': ['gst-launch-1.0 = gstreamer_cli.entrypoints:gst_launch_1_0']},
+        )
+        files = {
+            'gstreamer_cli/__init__.py': b'',
+            'gstreamer_cli/bin/gst-launch-1.0': self.exe,
+            'gstreamer_cli/lib/libgstreamer-1.0.so': self.prefix / 'lib' / 'libgstreamer-1.0.so',
+        }
+        path = writer.write_wheel(self.tmp, info, 'cp39-abi3-win_amd64', files)
+        self.assertEqual(path.name, 'gstreamer_cli-1.26.0-cp39-abi3-win_amd64.whl')
+
+        with zipfile.ZipFile(path) as whl:
+            names = whl.namelist()
+            dist_info = 'gstreamer_cli-1.26.0.dist-info'
+            self.assertEqual(names[-1], f'{dist_info}/RECORD')
+            # Symbolic links are stored as regular files
+            self.assertEqual(
+                whl.read('gstreamer_cli/lib/libgstreamer-1.0.so'),
+                (self.prefix / 'lib' / 'libgstreamer-1.0.so.0').read_bytes(),
+            )
+            self.assertEqual(whl.getinfo('gstreamer_cli/bin/gst-launch-1.0').external_attr >> 16 & 0o777, 0o755)
+
+            # The RECORD lists every other file with its hash and size
+            record = whl.read(f'{dist_info}/RECORD').decode().splitlines()
+            self.assertEqual(len(record), len(names))
+            for line in record:
+                name, digest, size = line.rsplit(',', 2)
+                if name == f'{dist_info}/RECORD':
+                    self.assertEqual((digest, size), ('', ''))
+                    continue
+                data = whl.read(name)
+                expected = base64.urlsafe_b64encode(hashlib.sha256(data).digest()).rstrip(b'=').decode()
+                self.assertEqual(digest, f'sha256={expected}')
+                self.assertEqual(int(size), len(data))
+
+            wheel = whl.read(f'{dist_info}/WHEEL').decode()
+            self.assertIn('Root-Is-Purelib: false\n', wheel)
+            self.assertIn('Tag: cp39-abi3-win_amd64\n', wheel)
+            metadata = whl.read(f'{dist_info}/METADATA').decode()
+            self.assertIn('Name: gstreamer_cli\n', metadata)
+            self.assertIn('Requires-Dist: gstreamer_libs ~= 1.26.0\n', metadata)
+            self.assertIn(
+                'Provides-Extra: gpl\nRequires-Dist: gstreamer_plugins_gpl ~= 1.26.0; extra == "gpl"\n', metadata
+            )
+            self.assertTrue(metadata.endswith('\n\nLong description\n'))
+            entry_points = whl.read(f'{dist_info}/entry_points.txt').decode()
+            self.assertEqual(
+                entry_points, '[console_scripts]\ngst-launch-1.0 = gstreamer_cli.entrypoints:gst_launch_1_0\n\n'
+            )
+
+    def testMissingFile(self):
+        files = {'gstreamer_cli/bin/missing': self.prefix / 'bin' / 'missing'}
+        with self.assertRaises(FileNotFoundError):
+            writer.write_wheel(self.tmp, package_info('gstreamer_cli'), 'py3-none-any', files)
+        self.assertEqual(list(self.tmp.glob('*.whl')), [])
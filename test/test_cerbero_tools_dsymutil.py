@@ -0,0 +1,63 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+from pathlib import Path
+
+from cerbero.tools import dsymutil
+from cerbero.utils import run_until_complete
+
+
+@unittest.skipUnless(all(shutil.which(t) for t in ('gcc', 'objcopy', 'objdump')), 'binutils and gcc are required')
+class SymbolicateGnuFilesTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = Path(tempfile.mkdtemp())
+        src = self.tmp / 'foo.c'
+        src.write_text('int foo (int a) { return a + 1; }\n')
+        self.libs = []
+        for i in range(4):
+            lib = self.tmp / f'libfoo{i}.so.1.0'
+            subprocess.check_call(['gcc', '-g', '-shared', '-fPIC', '-o', str(lib), str(src)])
+            self.libs.append(lib)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def testSymbolicate(self):
+        self.assertEqual(run_until_complete(dsymutil.symbolicate_gnu_files(self.libs)), 4)
+        for lib in self.libs:
+            debuginfo = dsymutil.gnu_symbols_file(lib)
+            self.assertTrue(debuginfo.exists())
+            sections = subprocess.check_output(['objdump', '-h', str(lib)], text=True)
+            self.assertIn('.gnu_debuglink', sections)
+            self.assertNotIn('.debug_info', sections)
+        self.assertEqual(list(self.tmp.glob('*.tmp-cerbero-sym')), [])
+        # Nothing changed, nothing to do
+        self.assertEqual(run_until_complete(dsymutil.symbolicate_gnu_files(self.libs)), 0)
+        # Reinstalled
+        st = os.stat(self.libs[0])
+        os.utime(self.libs[0], ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+        self.assertEqual(run_until_complete(dsymutil.symbolicate_gnu_files(self.libs)), 1)
+
+    def testRefuseSymbols(self):
+        with self.assertRaises(RuntimeError):
+            run_until_complete(dsymutil.symbolicate_gnu_files([self.tmp / 'libfoo.so.debuginfo']))
@@ -0,0 +1,270 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import asyncio
+import glob
+import hashlib
+import os
+import random
+import re
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest import mock
+
+from cerbero.errors import FatalError
+from cerbero.utils import download, shell
+from cerbero.utils.download import DownloadError, Downloader
+
+
+class Handler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.requests.append(self.headers.get('Range'))
+            status = server.statuses.pop(0) if server.statuses else None
+            drop_after = server.drop_after.pop(0) if server.drop_after else None
+            stall = server.stalls.pop(0) if server.stalls else None
+        time.sleep(server.delay)
+        if status:
+            self.send_error(status)
+            return
+        data = server.data
+        start, end = 0, len(data) - 1
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range') or '')
+        if match and server.ranges:
+            start = int(match.group(1))
+            if match.group(2):
+                end = min(end, int(match.group(2)))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end, len(data)))
+        else:
+            self.send_response(200)
+        body = data[start : end + 1]
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        if drop_after is not None:
+            # Close the connection in the middle of the transfer
+            body = body[:drop_after]
+            self.close_connection = True
+        for i in range(0, len(body), 65536):
+            if stall is not None and i >= stall[0]:
+                time.sleep(stall[1])
+                stall = None
+            self.wfile.write(body[i : i + 65536])
+            with server.lock:
+                server.sent += len(body[i : i + 65536])
+            if server.throttle:
+                time.sleep(server.throttle)
+
+
+class Server(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, data, ranges=True, delay=0):
+        ThreadingHTTPServer.__init__(self, ('127.0.0.1', 0), Handler)
+        self.data = data
+        self.ranges = ranges
+        self.delay = delay
+        self.throttle = 0
+        self.statuses = []
+        self.drop_after = []
+        self.stalls = []
+        self.requests = []
+        self.sent = 0
+        self.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.serve_forever, daemon=True)
+        self.thread.start()
+
+    @property
+    def url(self):
+        return 'http://127.0.0.1:%d/foo-1.0.tar.xz' % self.server_address[1]
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    def body_requests(self):
+        # All the requests except the probes
+        return [r for r in self.requests if r != 'bytes=0-0']
+
+
+class DownloaderTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.dest = os.path.join(self.tmp, 'foo-1.0.tar.xz')
+        self.data = random.Random(0).randbytes(1 << 20)
+        self.checksum = hashlib.sha256(self.data).hexdigest()
+        self.servers = []
+        patches = [
+            mock.patch.object(download, 'RETRY_DELAY', 0),
+            mock.patch.object(download, 'TIMEOUT', 0.5),
+            mock.patch.object(download, 'MIN_SEGMENT_SIZE', 128 << 10),
+        ]
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def tearDown(self):
+        for server in self.servers:
+            server.stop()
+        shutil.rmtree(self.tmp)
+
+    def server(self, data=None, **kwargs):
+        server = Server(self.data if data is None else data, **kwargs)
+        self.servers.append(server)
+        return server
+
+    def download(self, urls, checksum=None, segments=1):
+        d = Downloader(urls, self.dest, checksum=checksum or self.checksum, segments=segments)
+        asyncio.run(d.download())
+        return d
+
+    def assertDownloaded(self):
+        with open(self.dest, 'rb') as f:
+            self.assertEqual(f.read(), self.data)
+        self.assertEqual(glob.glob(self.dest + '.part*'), [])
+
+    def testDownload(self):
+        server = self.server()
+        self.download([server.url])
+        self.assertDownloaded()
+        self.assertEqual(server.body_requests(), ['bytes=0-%d' % (len(self.data) - 1)])
+
+    def testResume(self):
+        server = self.server()
+        server.drop_after = [0, 300000]
+        self.download([server.url])
+        self.assertDownloaded()
+        # The second transfer starts where the first one stopped
+        self.assertEqual(server.body_requests()[-1], 'bytes=300000-%d' % (len(self.data) - 1))
+        self.assertLess(server.sent, len(self.data) + 100)
+
+    def testResumeWithoutRanges(self):
+        server = self.server(ranges=False)
+        server.drop_after = [0, 300000]
+        self.download([server.url], segments=4)
+        self.assertDownloaded()
+        # Without ranges, the second transfer starts from the beginning
+        self.assertEqual(server.sent, 300000 + len(self.data))
+
+    def testResumePreviousRun(self):
+        with open(self.dest + '.partial', 'wb') as f:
+            f.write(self.data[:500000])
+        server = self.server()
+        self.download([server.url])
+        self.assertDownloaded()
+        self.assertEqual(server.body_requests(), ['bytes=500000-%d' % (len(self.data) - 1)])
+
+    def testStall(self):
+        server = self.server()
+        # Stop sending in the middle of the body for longer than the timeout
+        server.drop_after = [None]
+        server.stalls = [None, (262144, 1.5)]
+        self.download([server.url])
+        self.assertDownloaded()
+        self.assertTrue(server.body_requests()[-1].startswith('bytes=262144-'), server.requests)
+
+    def testThrottled(self):
+        server = self.server()
+        server.throttle = 0.01
+        self.download([server.url], segments=4)
+        self.assertDownloaded()
+
+    def testSegments(self):
+        server = self.server()
+        # One of the segments fails once and is resumed
+        server.drop_after = [None, None, 100000]
+        d = self.download([server.url], segments=4)
+        self.assertDownloaded()
+        self.assertIn('4 segment(s)', d.summary)
+        step = len(self.data) // 4
+        for i in range(4):
+            self.assertIn('bytes=%d-%d' % (i * step, (i + 1) * step - 1), server.requests)
+
+    def testSegmentFailure(self):
+        server = self.server()
+        server.throttle = 0.1
+        # One of the segments can't be downloaded, the others are stopped
+        server.statuses = [None, None, 403]
+
+        def sizes():
+            return [os.path.getsize(p) for p in sorted(glob.glob(self.dest + '.part*'))]
+
+        async def download():
+            d = Downloader([server.url], self.dest, checksum=self.checksum, segments=4)
+            with self.assertRaises(DownloadError):
+                await d.download()
+            # Nothing keeps running once the download failed
+            requests, before = len(server.requests), sizes()
+            await asyncio.sleep(1)
+            self.assertEqual(len(server.requests), requests)
+            self.assertEqual(sizes(), before)
+
+        asyncio.run(download())
+
+    def testMirrorRacing(self):
+        slow = self.server(delay=0.5)
+        fast = self.server()
+        self.download([slow.url, fast.url])
+        self.assertDownloaded()
+        self.assertEqual(slow.body_requests(), [])
+        self.assertEqual(len(fast.body_requests()), 1)
+
+    def testFallback(self):
+        broken = self.server()
+        broken.statuses = [404] * 2
+        failing = self.server()
+        failing.drop_after = [None, 200000] + [0] * download.RETRIES
+        good = self.server(delay=0.3)
+        self.download([broken.url, failing.url, good.url])
+        self.assertDownloaded()
+        # The rest of the file comes from the next mirror
+        self.assertEqual(good.body_requests(), ['bytes=200000-%d' % (len(self.data) - 1)])
+
+    def testChecksum(self):
+        server = self.server()
+        self.assertRaises(DownloadError, self.download, [server.url], checksum='0' * 64)
+        self.assertFalse(os.path.exists(self.dest))
+        self.assertEqual(glob.glob(self.dest + '.part*'), [])
+        # A mirror with another file is skipped
+        corrupted = self.server(data=self.data[::-1])
+        self.download([corrupted.url, self.server(delay=0.2).url], segments=4)
+        self.assertDownloaded()
+
+    def testNotFound(self):
+        server = self.server()
+        server.statuses = [404]
+        with self.assertRaises(DownloadError) as cm:
+            self.download([server.url])
+        self.assertEqual(cm.exception.errors[0][0], server.url)
+
+    def testShellDownload(self):
+        server = self.server()
+        with self.assertRaises(FatalError):
+            asyncio.run(shell.download(server.url, self.dest, checksum='0' * 64))
+        asyncio.run(shell.download(server.url, self.dest, checksum=self.checksum, segments=2))
+        self.assertDownloaded()
@@ -0,0 +1,133 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import os
+import shutil
+import struct
+import sys
+import tempfile
+import unittest
+
+from cerbero.utils import filetype
+from cerbero.utils.filetype import FileType
+
+
+def elf_header(e_type=3, machine=62):
+    return b'\x7fELF\x02\x01\x01' + b'\0' * 9 + struct.pack('<HH', e_type, machine) + b'\0' * 44
+
+
+def macho_header(filetype=6, cputype=0x0100000C):
+    return struct.pack('<IiII', 0xFEEDFACF, cputype, 0, filetype) + b'\0' * 16
+
+
+def macho_fat(*slices):
+    header = struct.pack('>II', 0xCAFEBABE, len(slices))
+    offset = 4096
+    data = b''
+    for cputype, content in slices:
+        header += struct.pack('>iiIII', cputype, 0, offset + len(data), len(content), 12)
+        data += content
+    return header + b'\0' * (offset - len(header)) + data
+
+
+def pe_header(characteristics=0x2000, machine=0x8664):
+    dos = b'MZ' + b'\0' * 58 + struct.pack('<I', 0x80)
+    dos += b'\0' * (0x80 - len(dos))
+    return dos + b'PE\0\0' + struct.pack('<HHIIIHH', machine, 1, 0, 0, 0, 0xF0, characteristics)
+
+
+class FileTypeTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def _write(self, name, content):
+        path = os.path.join(self.tmp, name)
+        with open(path, 'wb') as f:
+            f.write(content)
+        return path
+
+    def testBinaries(self):
+        path = self._write('libfoo.so', elf_header())
+        self.assertEqual(filetype.sniff(path), (FileType.ELF, 'shared', ('x86_64',)))
+        self.assertTrue(filetype.is_elf(path))
+        self.assertFalse(filetype.is_macho(path))
+        path = self._write('libfoo.dylib', macho_header())
+        self.assertEqual(filetype.sniff(path), (FileType.MACHO, 'dylib', ('arm64',)))
+        self.assertTrue(filetype.is_macho(path))
+        path = self._write('foo.dll', pe_header())
+        self.assertEqual(filetype.sniff(path), (FileType.PE, 'dll', ('x86_64',)))
+        self.assertTrue(filetype.is_pe(path))
+        path = self._write('foo.exe', pe_header(characteristics=0x0102, machine=0x14C))
+        self.assertEqual(filetype.sniff(path), (FileType.PE, 'executable', ('x86',)))
+        path = self._write('libfoo.a', b'!<arch>\n' + b'/ ' * 30)
+        self.assertEqual(filetype.sniff(path).type, FileType.AR)
+        self.assertFalse(filetype.is_macho(path))
+
+    def testRealElf(self):
+        executable = os.path.realpath(sys.executable)
+        with open(executable, 'rb') as f:
+            if f.read(4) != b'\x7fELF':
+                self.skipTest('The Python interpreter is not an ELF binary')
+        self.assertTrue(filetype.is_elf(executable))
+
+    def testUniversalBinaries(self):
+        slices = [(7, macho_header(2, 7)), (0x01000007, macho_header(2, 0x01000007))]
+        path = self._write('foo', macho_fat(*slices))
+        self.assertEqual(filetype.sniff(path), (FileType.MACHO_FAT, 'executable', ('x86', 'x86_64')))
+        self.assertTrue(filetype.is_macho(path))
+        path = self._write('libfoo.a', macho_fat((0x01000007, b'!<arch>\n'), (0x0100000C, b'!<arch>\n')))
+        self.assertEqual(filetype.sniff(path).subtype, 'archive')
+        self.assertFalse(filetype.is_macho(path))
+        # Java classes share the magic of universal binaries
+        path = self._write('Foo.class', struct.pack('>IHH', 0xCAFEBABE, 0, 52) + b'\0' * 64)
+        self.assertEqual(filetype.sniff(path).type, FileType.DATA)
+
+    def testDSYM(self):
+        path = self._write('libfoo.dylib.dSYM', macho_header(filetype=10))
+        self.assertEqual(filetype.sniff(path).subtype, 'dsym')
+        self.assertFalse(filetype.is_macho(path))
+
+    def testText(self):
+        la = b'# libfoo.la - a libtool library file\n# Generated by libtool\n'
+        self.assertEqual(filetype.sniff(self._write('libfoo.la', la)).type, FileType.LIBTOOL_LA)
+        script = self._write('foo-config', b'#!/usr/bin/env python3\nprint()\n')
+        self.assertEqual(filetype.sniff(script), (FileType.SCRIPT, 'env', ()))
+        pc = self._write('foo.pc', 'prefix=/usr\nName: föo\n'.encode())
+        self.assertEqual(filetype.sniff(pc).type, FileType.TEXT)
+        self.assertEqual(filetype.sniff(self._write('foo.bin', b'\x01\x02\0\x03')).type, FileType.DATA)
+        self.assertEqual(filetype.sniff(self._write('empty', b'')).type, FileType.EMPTY)
+
+    def testLinksAndDirs(self):
+        self._write('libfoo.so.1', elf_header())
+        os.symlink('libfoo.so.1', os.path.join(self.tmp, 'libfoo.so'))
+        self.assertEqual(filetype.sniff(os.path.join(self.tmp, 'libfoo.so')).type, FileType.SYMLINK)
+        self.assertEqual(filetype.sniff(self.tmp).type, FileType.DIRECTORY)
+        self.assertEqual(filetype.sniff(os.path.join(self.tmp, 'missing')).type, FileType.MISSING)
+
+    def testCache(self):
+        path = self._write('foo', b'text\n')
+        self.assertEqual(filetype.sniff(path).type, FileType.TEXT)
+        self.assertIn(path, filetype.FILE_TYPE_CACHE)
+        # Replaced by a binary, with a different size and mtime
+        self._write('foo', elf_header())
+        st = os.stat(path)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000))
+        self.assertEqual(filetype.sniff(path).type, FileType.ELF)
@@ -0,0 +1,80 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import os
+import shutil
+import subprocess
+import tempfile
+import unittest
+
+from cerbero.utils import git
+
+
+@unittest.skipUnless(shutil.which('git'), 'git not available')
+class ResolveRefTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.repo = os.path.join(self.tmp, 'repo')
+        os.makedirs(self.repo)
+        self.git('init', '-q', '-b', 'main')
+        self.git('config', 'user.email', 'test@example.com')
+        self.git('config', 'user.name', 'Test')
+        self.commit('first')
+        self.git('tag', '1.0')
+        self.git('tag', '-a', '-m', 'annotated', 'v1.0')
+        self.commit('second')
+        self.git('branch', 'topic')
+        self.git('update-ref', 'refs/remotes/origin/main', 'HEAD~1')
+        self.git('symbolic-ref', 'refs/remotes/origin/HEAD', 'refs/remotes/origin/main')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+
+    def git(self, *args, cwd=None):
+        return subprocess.check_output(['git'] + list(args), cwd=cwd or self.repo, text=True).strip()
+
+    def commit(self, msg):
+        self.git('commit', '-q', '--allow-empty', '-m', msg)
+
+    def checkRefs(self, git_dir):
+        for ref in ('HEAD', 'main', 'topic', '1.0', 'v1.0', 'origin/main', 'origin', 'refs/heads/main'):
+            self.assertEqual(git.resolve_ref(git_dir, ref), self.git('rev-parse', ref, cwd=git_dir), ref)
+
+    def testLooseRefs(self):
+        self.checkRefs(self.repo)
+
+    def testPackedRefs(self):
+        self.git('pack-refs', '--all')
+        self.checkRefs(self.repo)
+        # Loose refs have precedence over packed ones
+        self.commit('third')
+        self.checkRefs(self.repo)
+
+    def testWorktree(self):
+        worktree = os.path.join(self.tmp, 'worktree')
+        self.git('worktree', 'add', '-q', worktree, 'topic')
+        self.checkRefs(worktree)
+
+    def testFallback(self):
+        head = self.git('rev-parse', 'HEAD')
+        self.assertEqual(git.resolve_ref(self.repo, head), head)
+        self.assertIsNone(git.resolve_ref(self.repo, 'HEAD~1'))
+        self.assertIsNone(git.resolve_ref(self.repo, 'FETCH_HEAD'))
+        self.assertIsNone(git.resolve_ref(self.repo, 'missing'))
+        self.assertIsNone(git.resolve_ref(self.tmp, 'HEAD'))
+        self.assertEqual(git.get_hash(self.repo, 'HEAD~1'), self.git('rev-parse', 'HEAD~1'))
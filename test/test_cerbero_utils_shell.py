@@ -0,0 +1,166 @@
+# cerbero - a multi-platform build system for Open Source software
+# Copyright (C) 2012 Andoni Morales Alastruey <ylatuya@gmail.com>
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+import asyncio
+import hashlib
+import os
+import shutil
+import sys
+import tempfile
+import time
+import unittest
+
+from cerbero.errors import CommandError
+from cerbero.utils import shell, run_until_complete
+
+
+class HostSemaphoreTest(unittest.TestCase):
+    def setUp(self):
+        self.max_calls = shell.MAX_CALLS_PER_HOST
+
+    def tearDown(self):
+        shell.set_max_calls_per_host(self.max_calls)
+
+    def testHosts(self):
+        a = shell.host_semaphore('https://download.gnome.org/sources/glib/glib.tar.xz')
+        b = shell.host_semaphore('https://download.gnome.org/sources/pango/pango.tar.xz')
+        c = shell.host_semaphore('https://gitlab.freedesktop.org/gstreamer/gstreamer.git')
+        d = shell.host_semaphore('git@gitlab.freedesktop.org:gstreamer/gstreamer.git')
+        self.assertIs(a, b)
+        self.assertIsNot(a, c)
+        self.assertIs(c, d)
+
+    def testLimit(self):
+        shell.set_max_calls_per_host(2)
+        running = {'a': 0, 'b': 0}
+        peak = {'a': 0, 'b': 0}
+
+        async def download(host):
+            async with shell.host_semaphore(f'https://{host}/file'):
+                running[host] += 1
+                peak[host] = max(peak[host], running[host])
+                await asyncio.sleep(0.01)
+                running[host] -= 1
+
+        run_until_complete([download(h) for h in 'aaaaabbbbb'])
+        self.assertEqual(peak, {'a': 2, 'b': 2})
+
+
+class FilesChecksumTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        self.files = []
+        for i in range(4):
+            path = os.path.join(self.tmp, f'{i}.patch')
+            with open(path, 'w') as f:
+                f.write(f'patch {i}\n' * (i + 1))
+            self.files.append(path)
+        shell.FILES_CHECKSUM_CACHE.clear()
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        shell.FILES_CHECKSUM_CACHE.clear()
+
+    def md5(self, paths):
+        m = hashlib.md5()
+        for p in paths:
+            with open(p, 'rb') as f:
+                m.update(f.read())
+        return m.digest()
+
+    def testChecksum(self):
+        self.assertEqual(shell.files_checksum(self.files), self.md5(self.files))
+        self.assertIn(tuple(self.files), shell.FILES_CHECKSUM_CACHE)
+        with open(self.files[0], 'a') as f:
+            f.write('modified\n')
+        self.assertEqual(shell.files_checksum(self.files), self.md5(self.files))
+
+    def testBatch(self):
+        paths_list = [self.files[:1], self.files[1:3], self.files]
+        checksums = shell.files_checksums(paths_list, jobs=2)
+        self.assertEqual(checksums, [self.md5(p) for p in paths_list])
+
+    def testSaveLoad(self):
+        cache = os.path.join(self.tmp, 'checksums.cache')
+        checksum = shell.files_checksum(self.files)
+        shell.save_files_checksum_cache(cache)
+        shell.FILES_CHECKSUM_CACHE.clear()
+        shell.load_files_checksum_cache(cache)
+        self.assertEqual(shell.FILES_CHECKSUM_CACHE[tuple(self.files)][1], checksum)
+
+
+class AsyncCallTest(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.mkdtemp()
+        # Semaphores get bound to the event loop of the tests that used them
+        self.semaphores = (shell.CPU_BOUND_SEMAPHORE, shell.NON_CPU_BOUND_SEMAPHORE)
+        shell.set_max_cpu_bound_calls(2)
+        shell.set_max_non_cpu_bound_calls(2)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp)
+        shell.CPU_BOUND_SEMAPHORE, shell.NON_CPU_BOUND_SEMAPHORE = self.semaphores
+
+    def python(self, code):
+        return [sys.executable, '-c', code]
+
+    def testLoopResponsive(self):
+        ticks = []
+
+        async def ticker():
+            start = time.monotonic()
+            while time.monotonic() - start < 0.3:
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.01)
+
+        async def main():
+            await asyncio.gather(
+                shell.async_new_call(self.python('import time; time.sleep(0.5)')),
+                shell.async_check_output(self.python('import time; time.sleep(0.5)')),
+                ticker(),
+            )
+
+        run_until_complete(main())
+        # Other tasks keep being serviced while the commands run
+        self.assertGreater(len(ticks), 10)
+        self.assertLess(max(b - a for a, b in zip(ticks, ticks[1:])), 0.2)
+
+    def testNewCall(self):
+        logpath = os.path.join(self.tmp, 'log')
+        with open(logpath, 'w') as logfile:
+            ret = run_until_complete(shell.async_new_call(self.python('print("hello")'), self.tmp, logfile=logfile))
+            self.assertEqual(ret, 0)
+            ret = run_until_complete(shell.async_new_call(self.python('exit(3)'), fail=False, logfile=logfile))
+            self.assertEqual(ret, 3)
+            with self.assertRaises(CommandError) as cm:
+                run_until_complete(shell.async_new_call(self.python('exit(3)'), logfile=logfile))
+            self.assertIn(logpath, str(cm.exception))
+            ret = run_until_complete(shell.async_new_call(['cerbero-missing-command'], fail=False, logfile=logfile))
+            self.assertEqual(ret, -1)
+        with open(logpath) as f:
+            log = f.read()
+        self.assertIn('hello\n', log)
+        self.assertIn('cerbero-missing-command: file not found', log)
+
+    def testCheckOutput(self):
+        cmd = self.python('import os; print(os.getcwd())')
+        self.assertEqual(run_until_complete(shell.async_check_output(cmd, self.tmp)), shell.check_output(cmd, self.tmp))
+        cmd = self.python('print("partial"); exit(1)')
+        self.assertEqual(run_until_complete(shell.async_check_output(cmd, fail=False)), 'partial\n')
+        self.assertRaises(CommandError, run_until_complete, shell.async_check_output(cmd))
+        self.assertRaises(CommandError, run_until_complete, shell.async_check_output(['cerbero-missing-command']))
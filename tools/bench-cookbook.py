@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# cerbero - a multi-platform build system for Open Source software
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+"""
+Measures how long it takes to load the CookBook of a configuration, which is
+paid by every cerbero command at startup.
+
+Prints the load time without the recipes code cache, with a cold cache and
+with a warm cache. The status file and the code cache are written to a
+temporary home dir, so the real ones are not touched.
+
+    ./tools/bench-cookbook.py -c config/cross-win64.cbc -n 5
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('CERBERO_UNINSTALLED', '1')
+
+from cerbero.config import Config  # noqa: E402
+from cerbero.build import cookbook  # noqa: E402
+from cerbero.utils import messages as m  # noqa: E402
+
+
+def load(config):
+    start = time.perf_counter()
+    cb = cookbook.CookBook(config, skip_errors=True)
+    return time.perf_counter() - start, len(cb.recipes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-c', '--config', action='append', default=None, help='configuration file(s) to load')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='number of runs of each case')
+    args = parser.parse_args()
+
+    config = Config()
+    config.load(args.config)
+    config.allow_pc_missing_for_system_recipes = True
+    config.home_dir = tempfile.mkdtemp()
+    code_cache = os.path.join(config.home_dir, cookbook.RECIPES_CODE_CACHE_NAME)
+    # Silence the warnings about overridden recipes
+    m.warning = lambda *args, **kwargs: None
+
+    results = {'no code cache': [], 'cold code cache': [], 'warm code cache': []}
+    count = 0
+    for _ in range(args.repeat):
+        orig = cookbook.RecipesCodeCache.get_code
+        cookbook.RecipesCodeCache.get_code = lambda self, filepath: None
+        try:
+            duration, count = load(config)
+        finally:
+            cookbook.RecipesCodeCache.get_code = orig
+        results['no code cache'].append(duration)
+        if os.path.exists(code_cache):
+            os.remove(code_cache)
+        results['cold code cache'].append(load(config)[0])
+        results['warm code cache'].append(load(config)[0])
+
+    print(f'{count} recipes, {args.repeat} runs')
+    for label, durations in results.items():
+        print(f'{label}: median {statistics.median(durations) * 1000:.1f} ms, min {min(durations) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+# cerbero - a multi-platform build system for Open Source software
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+"""
+Measures the cost of writing .deb packages with dpkg-buildpackage, from a
+debian source tree, and with cerbero.packages.debwriter, straight from the
+files of the prefix.
+
+With a configuration, packs the given packages of a built prefix with both
+paths (the gstreamer-1.0 packages by default):
+
+    ./tools/bench-deb.py -c cerbero/config/linux.config gstreamer-1.0-core
+
+Without one, generates a fixture prefix and compares what dpkg-buildpackage
+does with the files, without the debhelper overhead: the .tar.bz2 of the
+source package, its extraction, the staging of the files in the package tree
+and `dpkg-deb --build`, with the direct writer:
+
+    ./tools/bench-deb.py --fixture 3000 --compression zst
+"""
+
+import argparse
+import glob
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tarfile
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('CERBERO_UNINSTALLED', '1')
+
+from cerbero.config import Config  # noqa: E402
+from cerbero.packages.debian import DebianPackager  # noqa: E402
+from cerbero.packages.debwriter import DebWriter  # noqa: E402
+from cerbero.packages.packagesstore import PackagesStore  # noqa: E402
+
+DPKG_COMPRESSIONS = {'xz': 'xz', 'zst': 'zstd', 'gz': 'gzip'}
+
+
+def generate_prefix(root, count):
+    """
+    Writes @count files in a tree laid out like a prefix and returns their
+    paths relative to @root
+    """
+    kinds = [
+        ('lib', 'libfoo{}.so.0', 262144),
+        ('lib/gstreamer-1.0', 'libgstfoo{}.so', 131072),
+        ('bin', 'foo{}', 65536),
+        ('include/foo', 'foo{}.h', 4096),
+        ('lib/pkgconfig', 'foo{}.pc', 256),
+        ('share/locale/fr/LC_MESSAGES', 'foo{}.mo', 8192),
+    ]
+    files = []
+    for i in range(count):
+        subdir, name, size = kinds[i % len(kinds)]
+        os.makedirs(os.path.join(root, subdir), exist_ok=True)
+        path = os.path.join(subdir, name.format(i))
+        # Half random, half repeated, to compress like binaries do
+        content = random.randbytes(size // 2) + b'\0' * (size // 2)
+        with open(os.path.join(root, path), 'wb') as f:
+            f.write(content)
+        files.append(path)
+    return files
+
+
+def fixture_dpkg_deb(prefix, files, output_dir, compression):
+    tree = tempfile.mkdtemp(dir=output_dir)
+    try:
+        tarball = os.path.join(output_dir, 'foo-1.0.tar.bz2')
+        with tarfile.open(tarball, 'w:bz2') as tar:
+            for f in files:
+                tar.add(os.path.join(prefix, f), os.path.join('foo-1.0', f))
+        with tarfile.open(tarball, 'r:bz2') as tar:
+            tar.extractall(output_dir)
+        srcdir = os.path.join(output_dir, 'foo-1.0')
+        os.makedirs(os.path.join(tree, 'DEBIAN'))
+        with open(os.path.join(tree, 'DEBIAN', 'control'), 'w') as f:
+            f.write('Package: foo\nVersion: 1.0-1\nArchitecture: amd64\nMaintainer: Foo <foo@foo.org>\n')
+            f.write('Description: Foo\n foo\n')
+        install_dir = os.path.join(tree, 'opt', 'foo')
+        for f in files:
+            dest = os.path.join(install_dir, f)
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            shutil.copy2(os.path.join(srcdir, f), dest)
+        path = os.path.join(output_dir, 'foo_1.0-1_amd64.deb')
+        subprocess.check_call(
+            ['dpkg-deb', '--root-owner-group', '-Z' + DPKG_COMPRESSIONS[compression], '--build', tree, path],
+            stdout=subprocess.DEVNULL,
+        )
+        return path
+    finally:
+        shutil.rmtree(tree)
+
+
+def fixture_debwriter(prefix, files, output_dir, compression):
+    path = os.path.join(output_dir, 'foo_1.0-1_amd64.deb')
+    writer = DebWriter(path, compression, output_dir)
+    writer.add_files('/opt/foo', prefix, files)
+    control = {
+        'Package': 'foo',
+        'Version': '1.0-1',
+        'Architecture': 'amd64',
+        'Maintainer': 'Foo <foo@foo.org>',
+        'Description': 'Foo\nfoo',
+    }
+    writer.write(control)
+    return path
+
+
+def run_fixture(args):
+    random.seed(args.seed)
+    root = tempfile.mkdtemp(prefix='cerbero-bench-deb-')
+    try:
+        prefix = os.path.join(root, 'prefix')
+        files = generate_prefix(prefix, args.fixture)
+        size = sum(os.path.getsize(os.path.join(prefix, f)) for f in files)
+        print(f'{len(files)} files, {size / 1048576:.1f} MiB in {prefix}')
+        cases = [('direct writer', fixture_debwriter)]
+        if shutil.which('dpkg-deb'):
+            cases.insert(0, ('source tarball + dpkg-deb', fixture_dpkg_deb))
+        else:
+            print('source tarball + dpkg-deb: skipped, dpkg-deb is not installed')
+        for name, func in cases:
+            output_dir = tempfile.mkdtemp(dir=root)
+            start = time.perf_counter()
+            path = func(prefix, files, output_dir, args.compression)
+            duration = time.perf_counter() - start
+            print(f'{name}: {duration:.2f} s, {os.path.getsize(path) / 1048576:.1f} MiB')
+    finally:
+        shutil.rmtree(root)
+
+
+def run_packages(args):
+    config = Config()
+    config.load(args.config)
+    store = PackagesStore(config)
+    names = args.packages or [
+        os.path.basename(p)[: -len('.package')]
+        for p in sorted(glob.glob(os.path.join(config.packages_dir, 'gstreamer-1.0-*.package')))
+    ]
+    config.deb_compression = args.compression
+    for direct in (False, True):
+        config.deb_direct_writer = direct
+        output_dir = tempfile.mkdtemp(prefix='cerbero-bench-deb-', dir=config.home_dir)
+        try:
+            start = time.perf_counter()
+            count = 0
+            for name in names:
+                package = store.get_package(name)
+                packager = DebianPackager(config, package, store)
+                count += len(packager.pack(output_dir, devel=True, force=True, pack_deps=False) or [])
+            duration = time.perf_counter() - start
+            label = 'direct writer' if direct else 'dpkg-buildpackage'
+            print(f'{label}: {count} packages in {duration:.2f} s')
+        finally:
+            shutil.rmtree(output_dir)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-c', '--config', action='append', default=None, help='configuration file(s) to load')
+    parser.add_argument('packages', nargs='*', help='packages to pack, all the gstreamer-1.0 ones by default')
+    parser.add_argument('--fixture', type=int, default=0, help='number of files of a fixture prefix to pack')
+    parser.add_argument('--compression', choices=('xz', 'zst', 'gz'), default='xz', help='compression')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the fixture generator')
+    args = parser.parse_args()
+    if args.fixture:
+        run_fixture(args)
+    else:
+        run_packages(args)
+
+
+if __name__ == '__main__':
+    main()
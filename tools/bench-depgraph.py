@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+# cerbero - a multi-platform build system for Open Source software
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+"""
+Measures the cost of the dependency queries done by the oven, the packages
+and the deps/rdeps commands over all the recipes of a configuration.
+
+Resolves the dependencies and the reverse dependencies of every recipe with
+the walk done by CookBook before the dependency graph index and with
+DependencyGraph, checking that both give the same results.
+
+    ./tools/bench-depgraph.py -c config/cross-win64.cbc -n 5
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('CERBERO_UNINSTALLED', '1')
+
+from cerbero.config import Config  # noqa: E402
+from cerbero.build.cookbook import CookBook  # noqa: E402
+from cerbero.build.depgraph import DependencyGraph  # noqa: E402
+from cerbero.errors import FatalError  # noqa: E402
+from cerbero.utils import messages as m  # noqa: E402
+
+
+def legacy_deps(recipes, name):
+    """The dependencies as listed by CookBook before DependencyGraph"""
+    runtime_deps = [x.name for x in recipes.values() if x.runtime_dep]
+
+    def find_deps(recipe, state, ordered):
+        if state.get(recipe, 'clean') == 'processed':
+            return
+        if state.get(recipe, 'clean') == 'in-progress':
+            raise FatalError('Dependency Cycle: {0}'.format(recipe.name))
+        state[recipe] = 'in-progress'
+        recipe_deps = recipe.list_deps()
+        if not recipe.runtime_dep:
+            recipe_deps = runtime_deps + recipe_deps
+        for recipe_name in recipe_deps:
+            if recipe_name not in recipes:
+                raise FatalError('Recipe %s has a unknown dependency %s' % (recipe.name, recipe_name))
+            find_deps(recipes[recipe_name], state, ordered)
+        state[recipe] = 'processed'
+        ordered.append(recipe)
+        return ordered
+
+    return [r.name for r in find_deps(recipes[name], {}, [])]
+
+
+def legacy_rdeps(recipes, name):
+    return [r.name for r in recipes.values() if name in r.list_deps()]
+
+
+def run_legacy(recipes):
+    deps = {}
+    for name in recipes:
+        try:
+            deps[name] = legacy_deps(recipes, name)
+        except FatalError:
+            deps[name] = None
+    rdeps = {name: legacy_rdeps(recipes, name) for name in recipes}
+    return deps, rdeps
+
+
+def run_graph(recipes):
+    graph = DependencyGraph(recipes)
+    deps = {}
+    for name in recipes:
+        try:
+            deps[name] = list(graph.ordered_deps(name))
+        except FatalError:
+            deps[name] = None
+    rdeps = {name: graph.reverse_deps(name) for name in recipes}
+    return deps, rdeps
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-c', '--config', action='append', default=None, help='configuration file(s) to load')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='number of runs of each case')
+    args = parser.parse_args()
+
+    config = Config()
+    config.load(args.config)
+    config.allow_pc_missing_for_system_recipes = True
+    config.home_dir = tempfile.mkdtemp()
+    # Silence the warnings about overridden recipes and unknown dependencies
+    m.warning = lambda *args, **kwargs: None
+    m.error = lambda *args, **kwargs: None
+    cookbook = CookBook(config, skip_errors=True, reset_status=False)
+    recipes = cookbook.recipes
+
+    results = {}
+    for label, func in (('legacy walk', run_legacy), ('DependencyGraph', run_graph)):
+        durations = []
+        for _ in range(args.repeat):
+            start = time.perf_counter()
+            results[label] = func(recipes)
+            durations.append(time.perf_counter() - start)
+        print(f'{label}: median {statistics.median(durations) * 1000:.1f} ms, min {min(durations) * 1000:.1f} ms')
+
+    if results['legacy walk'] != results['DependencyGraph']:
+        print('error: the dependency graph does not match the legacy walk')
+        sys.exit(1)
+    print(f'{len(recipes)} recipes, {sum(len(d or []) for d in results["legacy walk"][0].values())} dependencies')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+# cerbero - a multi-platform build system for Open Source software
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+"""
+Measures the cost of classifying the files of a prefix, as done when
+merging universal binaries, relocating, symbolicating and packaging.
+
+Generates a fixture tree with the size and the mix of files of a prefix
+(libraries, executables, static archives, libtool archives, headers,
+pkg-config files, scripts and symlinks) and classifies every file with one
+`file -bh` process per file, as cerbero did before, and with
+cerbero.utils.filetype, with a cold and a warm cache. The classification
+of binaries is checked against the output of `file`.
+
+    ./tools/bench-filetype.py -n 4000 --format macho
+"""
+
+import argparse
+import os
+import random
+import shutil
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('CERBERO_UNINSTALLED', '1')
+
+from cerbero.utils import filetype  # noqa: E402
+from cerbero.utils.filetype import FileType  # noqa: E402
+
+
+def elf_binary(e_type, size):
+    header = b'\x7fELF\x02\x01\x01' + b'\0' * 9 + struct.pack('<HHI', e_type, 62, 1)
+    return header + bytes(random.getrandbits(8) for _ in range(64)) * (size // 64)
+
+
+def macho_binary(filetype, size):
+    header = struct.pack('<IiIIII', 0xFEEDFACF, 0x0100000C, 0, filetype, 0, 0)
+    return header + bytes(random.getrandbits(8) for _ in range(64)) * (size // 64)
+
+
+def generate_prefix(root, count, binary_format):
+    """
+    Writes @count files in a tree laid out like a prefix and returns the
+    paths of the files, in a random order
+    """
+    binary = elf_binary if binary_format == 'elf' else macho_binary
+    libext = '.so' if binary_format == 'elf' else '.dylib'
+    shared, executable = (3, 2) if binary_format == 'elf' else (6, 2)
+    kinds = [
+        ('lib', 'libfoo{}' + libext, lambda: binary(shared, 32768)),
+        ('bin', 'foo{}', lambda: binary(executable, 16384)),
+        ('lib', 'libfoo{}.a', lambda: b'!<arch>\n' + b'\0' * 8192),
+        ('lib', 'libfoo{}.la', lambda: b"# libfoo.la - a libtool library file\ndlname=''\n"),
+        ('lib/pkgconfig', 'foo{}.pc', lambda: b'prefix=/usr\nName: foo\nVersion: 1.0\n'),
+        ('include/foo', 'foo{}.h', lambda: b'#pragma once\nint foo (void);\n' * 40),
+        ('bin', 'foo{}-config', lambda: b'#!/bin/sh\necho foo\n'),
+        ('share/foo', 'foo{}.dat', lambda: bytes(random.getrandbits(8) for _ in range(2048))),
+        ('share/locale', 'foo{}.mo', lambda: b''),
+    ]
+    paths = []
+    for i in range(count):
+        subdir, name, content = kinds[i % len(kinds)]
+        dirpath = os.path.join(root, subdir)
+        os.makedirs(dirpath, exist_ok=True)
+        path = os.path.join(dirpath, name.format(i))
+        with open(path, 'wb') as f:
+            f.write(content())
+        paths.append(path)
+        if subdir == 'lib' and name.endswith(libext):
+            link = path + '.0'
+            os.symlink(os.path.basename(path), link)
+            paths.append(link)
+    random.shuffle(paths)
+    return paths
+
+
+def run_file(paths):
+    return {p: subprocess.check_output(['file', '-bh', p], text=True).strip() for p in paths}
+
+
+def run_sniff(paths):
+    return {p: filetype.sniff(p) for p in paths}
+
+
+def check(file_results, sniff_results):
+    errors = 0
+    for path, desc in file_results.items():
+        info = sniff_results[path]
+        expected = {
+            FileType.ELF: desc.startswith('ELF'),
+            FileType.MACHO: desc.startswith('Mach-O'),
+            FileType.AR: 'ar archive' in desc,
+            FileType.SYMLINK: desc.startswith('symbolic link'),
+        }
+        for ftype, matches in expected.items():
+            if matches != (info.type == ftype):
+                print(f'mismatch: {path}: file says "{desc}", sniff says {info.type}')
+                errors += 1
+                break
+    return errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--files', type=int, default=3000, help='number of files of the fixture prefix')
+    parser.add_argument('--format', choices=('elf', 'macho'), default='elf', help='format of the binaries')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the fixture generator')
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    root = tempfile.mkdtemp(prefix='cerbero-bench-filetype-')
+    try:
+        paths = generate_prefix(root, args.files, args.format)
+        print(f'{len(paths)} files in {root}')
+
+        file_results = None
+        if shutil.which('file'):
+            start = time.perf_counter()
+            file_results = run_file(paths)
+            print(f'file -bh per file: {(time.perf_counter() - start) * 1000:.1f} ms')
+        else:
+            print('file -bh per file: skipped, file is not installed')
+
+        filetype.FILE_TYPE_CACHE.clear()
+        start = time.perf_counter()
+        sniff_results = run_sniff(paths)
+        print(f'filetype.sniff, cold cache: {(time.perf_counter() - start) * 1000:.1f} ms')
+        start = time.perf_counter()
+        run_sniff(paths)
+        print(f'filetype.sniff, warm cache: {(time.perf_counter() - start) * 1000:.1f} ms')
+
+        if file_results is not None and check(file_results, sniff_results):
+            print('error: the classification does not match the output of file')
+            sys.exit(1)
+    finally:
+        shutil.rmtree(root)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,150 @@
+#!/usr/bin/env python3
+# cerbero - a multi-platform build system for Open Source software
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+"""
+Measures the cost of the pkg-config queries cerbero runs over a whole
+prefix, when running the pkg-config executable for each query and when
+resolving the .pc files in process, with a cold and a warm cache of parsed
+files:
+
+  * list-all-include-dirs: the include dirs of every package, like the
+    macOS and iOS packagers do
+  * vsprops: the include dirs, library dirs and libraries of every package
+    without the ones of its dependencies, like `cerbero genvsprops` does
+
+Uses the prefix of the configuration, or with --fixture a temporary prefix
+with that many .pc files, the first ones like the core libraries and the
+rest requiring a few of them, like the plugins:
+
+    ./tools/bench-pkgconfig.py -c cerbero/config/linux.config
+    ./tools/bench-pkgconfig.py --fixture 300
+"""
+
+import argparse
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('CERBERO_UNINSTALLED', '1')
+
+from cerbero.config import Config  # noqa: E402
+from cerbero.ide import pkgconfig  # noqa: E402
+from cerbero.ide.pkgconfig import PkgConfig  # noqa: E402
+
+
+def generate_prefix(prefix, count, seed):
+    """
+    Writes @count .pc files in the pkgconfig directory of @prefix
+    """
+    rand = random.Random(seed)
+    pcdir = os.path.join(prefix, 'lib', 'pkgconfig')
+    os.makedirs(pcdir)
+    core = min(10, max(1, count // 10))
+    for i in range(count):
+        # Core libraries require the few ones below them, like gobject and glib
+        deps = range(max(0, i - 4), i) if i < core else range(core)
+        requires = ['foo%d' % j for j in rand.sample(deps, min(len(deps), 3))]
+        private = ['foo%d' % j for j in rand.sample(deps, min(len(deps), 1))]
+        with open(os.path.join(pcdir, 'foo%d.pc' % i), 'w') as f:
+            f.write('prefix=%s\n' % prefix)
+            f.write('libdir=${prefix}/lib\nincludedir=${prefix}/include\n\n')
+            f.write('Name: foo%d\nDescription: Foo %d\nVersion: 1.%d\n' % (i, i, i))
+            f.write('Requires: %s\nRequires.private: %s\n' % (', '.join(requires), ', '.join(private)))
+            f.write('Libs: -L${libdir} -lfoo%d\nLibs.private: -lm\n' % i)
+            f.write('Cflags: -I${includedir}/foo%d -DFOO%d\n' % (i, i))
+        # Files modified in the last seconds are not cached
+        os.utime(os.path.join(pcdir, 'foo%d.pc' % i), (1000000000, 1000000000))
+    os.utime(pcdir, (1000000000, 1000000000))
+    return {'PKG_CONFIG_LIBDIR': pcdir, 'PKG_CONFIG_PATH': ''}
+
+
+def list_all_include_dirs(env):
+    return len(PkgConfig.list_all_include_dirs(env=env))
+
+
+def vsprops(env):
+    count = 0
+    for pc in PkgConfig.list_all(env=env):
+        p = PkgConfig([pc], False, env=env)
+        count += len(p.include_dirs()) + len(p.libraries_dirs()) + len(p.libraries())
+    return count
+
+
+def measure(func, env, native, warm, repeat):
+    PkgConfig.native = native
+    durations = []
+    result = None
+    for _ in range(repeat):
+        if not warm:
+            pkgconfig._PC_FILES.clear()
+            pkgconfig._PC_DIRS.clear()
+        start = time.perf_counter()
+        result = func(env)
+        durations.append(time.perf_counter() - start)
+    return durations, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-c', '--config', action='append', default=None, help='configuration file(s) to load')
+    parser.add_argument('--fixture', type=int, default=0, help='number of .pc files of a fixture prefix')
+    parser.add_argument('--seed', type=int, default=0, help='seed of the fixture generator')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='number of runs of each case')
+    parser.add_argument('--no-executable', action='store_true', help="don't run the pkg-config executable")
+    args = parser.parse_args()
+
+    tmp = None
+    try:
+        env = os.environ.copy()
+        if args.fixture:
+            tmp = tempfile.mkdtemp(prefix='cerbero-bench-pkgconfig-')
+            env.update(generate_prefix(tmp, args.fixture, args.seed))
+            env.pop('PKG_CONFIG', None)
+        else:
+            config = Config()
+            config.load(args.config)
+            env = config.env.copy()
+            # Use the pkg-config of the system if the build tools aren't built
+            if not os.path.exists(env.get('PKG_CONFIG', '')):
+                env.pop('PKG_CONFIG', None)
+        print('%d packages' % len(PkgConfig.list_all(env=env)))
+
+        cases = []
+        if not args.no_executable:
+            cases.append(('pkg-config executable', False, False))
+        cases += [('native, cold', True, False), ('native, warm', True, True)]
+        for name, func in (('list-all-include-dirs', list_all_include_dirs), ('vsprops', vsprops)):
+            for label, native, warm in cases:
+                durations, result = measure(func, env, native, warm, args.repeat)
+                print(
+                    f'{name}, {label}: {result} results, median {statistics.median(durations) * 1000:.1f} ms, '
+                    f'min {min(durations) * 1000:.1f} ms'
+                )
+    finally:
+        PkgConfig.native = True
+        if tmp:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
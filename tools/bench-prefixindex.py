@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+# cerbero - a multi-platform build system for Open Source software
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+"""
+Measures how long it takes to list the runtime, devel and debug files of a
+package, which `cerbero package` does before creating the packages, when
+the files providers search the prefix directly and when they use the
+prefix index, with a cold and a warm index, and with the directories only
+checked once, like when the packagers list all the splits at once.
+
+Uses the prefix of the configuration, or with --fixture a temporary prefix
+with one file for each file the recipes of the package expect:
+
+    ./tools/bench-prefixindex.py -c cerbero/config/linux.config gstreamer-1.0
+    ./tools/bench-prefixindex.py --fixture --noise 5000
+"""
+
+import argparse
+import os
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('CERBERO_UNINSTALLED', '1')
+
+from cerbero.build import prefixindex  # noqa: E402
+from cerbero.config import Config  # noqa: E402
+from cerbero.packages.package import MetaPackage  # noqa: E402
+from cerbero.packages.packagesstore import PackagesStore  # noqa: E402
+from cerbero.utils import messages as m  # noqa: E402
+
+
+def package_recipes(store, package):
+    packages = store.get_package_deps(package.name, True) if isinstance(package, MetaPackage) else [package]
+    recipes = {}
+    for p in packages:
+        for name in list(p._recipes_files) + list(p._recipes_files_devel):
+            recipe = p.cookbook.get_recipe(name)
+            recipes[recipe.name] = recipe
+    return recipes.values()
+
+
+def fixture_path(pattern):
+    """
+    Turns a search pattern of a recipe into a file that matches it
+    """
+    path = pattern.replace('/*/', '/fr/').replace('.so*', '.so.0').replace('*', '').replace('?', 'x')
+    return path.lstrip('/')
+
+
+def generate_prefix(prefix, recipes, noise):
+    """
+    Creates a file for each file expected by @recipes, and @noise unrelated
+    files next to them
+    """
+    paths = set()
+    for recipe in recipes:
+        for func in (recipe.dist_files_list, recipe.devel_files_list, recipe.debug_files_list):
+            try:
+                paths.update(fixture_path(f) for f in func(only_existing=False))
+            except Exception:
+                pass
+        for f in recipe._list_libraries(recipe._get_category_files_list(recipe.LIBS_CAT)):
+            paths.add(fixture_path(f))
+    dirs = sorted({os.path.dirname(p) for p in paths})
+    for i in range(noise):
+        paths.add(os.path.join(dirs[i % len(dirs)], 'noise-%d.dat' % i))
+    for path in paths:
+        full = os.path.join(prefix, path)
+        if os.path.isdir(full):
+            continue
+        try:
+            os.makedirs(os.path.dirname(full), exist_ok=True)
+            open(full, 'w').close()
+        except (IsADirectoryError, NotADirectoryError, FileExistsError):
+            pass
+    # Listings of directories modified in the last seconds are not cached
+    for dirpath, _, _ in os.walk(prefix):
+        os.utime(dirpath, (1000000000, 1000000000))
+    return len(paths)
+
+
+def list_files(package):
+    return len(package.files_list()) + len(package.devel_files_list()) + len(package.debug_files_list())
+
+
+def measure(config, package, use_index, warm, frozen, repeat):
+    config.prefix_index = use_index
+    durations = []
+    count = 0
+    for _ in range(repeat):
+        if not warm:
+            prefixindex._INDEXES.clear()
+        start = time.perf_counter()
+        if frozen:
+            with prefixindex.frozen():
+                count = list_files(package)
+        else:
+            count = list_files(package)
+        durations.append(time.perf_counter() - start)
+    return durations, count
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-c', '--config', action='append', default=None, help='configuration file(s) to load')
+    parser.add_argument('package', nargs='?', default='gstreamer-1.0', help='package to list')
+    parser.add_argument('--fixture', action='store_true', help='list the files of a generated prefix')
+    parser.add_argument('--noise', type=int, default=3000, help='unrelated files in the generated prefix')
+    parser.add_argument('-n', '--repeat', type=int, default=3, help='number of runs of each case')
+    args = parser.parse_args()
+
+    config = Config()
+    config.load(args.config)
+    # Silence the warnings about overridden recipes and missing files
+    m.warning = lambda *args, **kwargs: None
+    tmp = None
+    if args.fixture:
+        tmp = tempfile.mkdtemp(prefix='cerbero-bench-prefixindex-')
+        config.prefix = tmp
+    try:
+        store = PackagesStore(config)
+        package = store.get_package(args.package)
+        if args.fixture:
+            config.prefix_index = False
+            count = generate_prefix(tmp, package_recipes(store, package), args.noise)
+            print(f'{count} files in {tmp}')
+
+        cases = [
+            ('filesystem', False, False, False),
+            ('prefix index, cold', True, False, False),
+            ('prefix index, warm', True, True, False),
+            # Like the packagers listing all the splits at once
+            ('prefix index, warm, frozen', True, True, True),
+        ]
+        for label, use_index, warm, frozen in cases:
+            durations, count = measure(config, package, use_index, warm, frozen, args.repeat)
+            print(
+                f'{label}: {count} files, median {statistics.median(durations) * 1000:.1f} ms, '
+                f'min {min(durations) * 1000:.1f} ms'
+            )
+    finally:
+        if tmp:
+            shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+# cerbero - a multi-platform build system for Open Source software
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+"""
+Measures the startup cost of cerbero: loading the configuration, loading
+all the recipes, which sets up the environment of the configuration before
+each one, and converting the environment of every recipe to EnvValue
+objects, like the Meson build system does to write its cross files.
+
+The previous behaviour, where the environment was set up again for each
+recipe and converted from scratch for each build, is emulated with
+--legacy to compare:
+
+    ./tools/bench-recipe-loading.py -c cerbero/config/cross-win64.cbc
+    ./tools/bench-recipe-loading.py --legacy
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+from contextlib import contextmanager
+from pathlib import Path
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('CERBERO_UNINSTALLED', '1')
+
+from cerbero.build.cookbook import CookBook  # noqa: E402
+from cerbero.config import Config  # noqa: E402
+from cerbero.enums import Platform  # noqa: E402
+from cerbero.utils import merge_env_value_env  # noqa: E402
+from cerbero.utils import messages as m  # noqa: E402
+
+
+def legacy_do_setup_env(self):
+    self._create_paths()
+    self.rel_libdir = 'lib%s' % self.lib_suffix
+    libdir = Path(self.prefix, self.rel_libdir).as_posix()
+    self.libdir = libdir
+    # get_env() used to be cached for each config, prefix and libdir
+    key = (self.prefix, libdir)
+    if key not in self._env_cache:
+        self._env_cache[key] = (None, self._get_env(self.prefix, libdir))
+    self.env = self._env_cache[key][1]
+
+
+def legacy_get_build_env(self, in_env=None, using_msvc=False):
+    if self.target_platform == Platform.WINDOWS:
+        build_env = dict(self.msvc_env_for_build_system if using_msvc else self.mingw_env_for_build_system)
+    else:
+        build_env = {}
+    return merge_env_value_env(build_env, in_env or self.env)
+
+
+@contextmanager
+def legacy(enabled):
+    if not enabled:
+        yield
+        return
+    saved = (Config.do_setup_env, Config.get_build_env, Config._perl_version)
+    Config.do_setup_env = legacy_do_setup_env
+    Config.get_build_env = legacy_get_build_env
+    # perl was run once for each configuration
+    Config._perl_version = staticmethod(Config._perl_version.__wrapped__)
+    try:
+        yield
+    finally:
+        Config.do_setup_env, Config.get_build_env, perl_version = saved
+        Config._perl_version = staticmethod(perl_version)
+
+
+def run(config_files):
+    timings = {}
+    start = time.perf_counter()
+    config = Config()
+    config.load(config_files)
+    timings['config'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    cookbook = CookBook(config, skip_errors=True)
+    recipes = cookbook.get_recipes_list()
+    timings['recipes'] = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for recipe in recipes:
+        # System recipes don't build anything
+        if hasattr(recipe, 'env'):
+            recipe.config.get_build_env(recipe.env)
+    timings['build env'] = time.perf_counter() - start
+    return timings, len(recipes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-c', '--config', action='append', default=None, help='configuration file(s) to load')
+    parser.add_argument('--legacy', action='store_true', help='also measure the previous behaviour')
+    parser.add_argument('-n', '--repeat', type=int, default=5, help='number of runs of each case')
+    args = parser.parse_args()
+
+    # Silence the messages printed when loading the configuration
+    m.message = m.warning = lambda *args, **kwargs: None
+    cases = [('cached environment', False)]
+    if args.legacy:
+        cases.insert(0, ('legacy', True))
+    for label, use_legacy in cases:
+        runs = []
+        with legacy(use_legacy):
+            # The first run loads the modules and fills the recipes cache
+            run(args.config)
+            if not use_legacy:
+                Config._perl_version.cache_clear()
+            for _ in range(args.repeat):
+                timings, count = run(args.config)
+                runs.append(timings)
+        summary = ', '.join('%s %.1f ms' % (step, statistics.median(r[step] for r in runs) * 1000) for step in runs[0])
+        print(f'{label}: {count} recipes, {summary}')
+
+
+if __name__ == '__main__':
+    main()
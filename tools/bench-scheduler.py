@@ -0,0 +1,170 @@
+#!/usr/bin/env python3
+# cerbero - a multi-platform build system for Open Source software
+#
+# This library is free software; you can redistribute it and/or
+# modify it under the terms of the GNU Library General Public
+# License as published by the Free Software Foundation; either
+# version 2 of the License, or (at your option) any later version.
+#
+# This library is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# Library General Public License for more details.
+#
+# You should have received a copy of the GNU Library General Public
+# License along with this library; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place - Suite 330,
+# Boston, MA 02111-1307, USA.
+
+"""
+Replays the recipes graph of a configuration through the Oven scheduler.
+
+Prints the time spent computing the recipe priorities and finding the
+buildable recipes with the old path-search algorithm and with
+BuildScheduler, and the simulated makespan of the build with each of them.
+
+    ./tools/bench-scheduler.py -c config/cross-win64.cbc -j 8 gstreamer-1.0
+"""
+
+import argparse
+import heapq
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+os.environ.setdefault('CERBERO_UNINSTALLED', '1')
+
+from cerbero.config import Config  # noqa: E402
+from cerbero.build.cookbook import CookBook  # noqa: E402
+from cerbero.build.scheduler import BuildScheduler  # noqa: E402
+from cerbero.errors import CerberoException  # noqa: E402
+
+
+def legacy_priorities(recipe_deps, targets):
+    """The priorities as computed by Oven before BuildScheduler"""
+
+    def find_recipe_dep_path(from_name, to_name):
+        if from_name == to_name:
+            return [to_name]
+        for dep in recipe_deps[from_name]:
+            val = find_recipe_dep_path(dep, to_name)
+            if val:
+                return [from_name] + val
+
+    def find_longest_path(to_name):
+        lengths = []
+        for f in targets:
+            path = find_recipe_dep_path(f, to_name)
+            if path:
+                lengths.append(len(path))
+        return max(lengths)
+
+    rdeps = {r: [x for x, deps in recipe_deps.items() if r in deps] for r in recipe_deps}
+    return {r: find_longest_path(r) * (len(rdeps[r]) + 1) for r in recipe_deps}
+
+
+def legacy_replay(recipe_deps, targets):
+    built = set()
+    building = set()
+
+    def find_buildable_recipes():
+        for name, deps in recipe_deps.items():
+            if name in built or name in building:
+                continue
+            if deps <= built:
+                yield name
+
+    priorities = legacy_priorities(recipe_deps, targets)
+    queue = list(find_buildable_recipes())
+    building.update(queue)
+    while queue:
+        queue.sort(key=lambda x: -priorities[x])
+        name = queue.pop(0)
+        built.add(name)
+        building.remove(name)
+        new = list(find_buildable_recipes())
+        building.update(new)
+        queue.extend(new)
+    return priorities
+
+
+def scheduler_replay(recipe_deps, costs):
+    scheduler = BuildScheduler(recipe_deps, costs=costs)
+    queue = scheduler.pop_ready()
+    while queue:
+        queue.sort(key=lambda x: -scheduler.priority(x))
+        name = queue.pop(0)
+        queue.extend(scheduler.done(name))
+    return scheduler.priorities
+
+
+def makespan(recipe_deps, costs, priorities, jobs):
+    """Simulates a build with @jobs workers picking recipes by priority"""
+    scheduler = BuildScheduler(recipe_deps)
+    ready = [(-priorities[r], r) for r in scheduler.pop_ready()]
+    heapq.heapify(ready)
+    running = []
+    now = 0.0
+    while ready or running:
+        while ready and len(running) < jobs:
+            _, name = heapq.heappop(ready)
+            heapq.heappush(running, (now + costs.get(name, 1), name))
+        now, name = heapq.heappop(running)
+        for r in scheduler.done(name):
+            heapq.heappush(ready, (-priorities[r], r))
+    return now
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-c', '--config', action='append', default=None, help='configuration file(s) to load')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count(), help='jobs used for the simulation')
+    parser.add_argument('--seed', type=int, default=None, help='use random recipe costs with this seed')
+    parser.add_argument('recipes', nargs='*', help='recipes to build (all if none)')
+    args = parser.parse_args()
+
+    config = Config()
+    config.load(args.config)
+    config.allow_pc_missing_for_system_recipes = True
+    config.cache_file = os.path.join(tempfile.mkdtemp(), 'cookbook')
+    cookbook = CookBook(config, skip_errors=True, reset_status=False)
+    names = args.recipes or [r.name for r in cookbook.get_recipes_list()]
+
+    recipe_deps = {}
+    for name in names:
+        try:
+            deps = cookbook.list_recipe_deps(name)
+        except CerberoException:
+            # Recipes not available in this configuration
+            continue
+        for dep in deps:
+            if dep.name not in recipe_deps:
+                recipe_deps[dep.name] = set(d.name for d in cookbook.list_recipe_deps(dep.name)) - {dep.name}
+    all_deps = set().union(*recipe_deps.values())
+    targets = set(recipe_deps) - all_deps
+
+    costs = {}
+    if args.seed is not None:
+        rand = random.Random(args.seed)
+        costs = {r: rand.choice((1, 1, 2, 5, 10, 30)) for r in recipe_deps}
+
+    print(f'{len(recipe_deps)} recipes, {len(targets)} targets, {sum(len(d) for d in recipe_deps.values())} edges')
+
+    start = time.perf_counter()
+    legacy = legacy_replay(recipe_deps, targets)
+    legacy_time = time.perf_counter() - start
+    start = time.perf_counter()
+    new = scheduler_replay(recipe_deps, costs)
+    new_time = time.perf_counter() - start
+    print(f'scheduling overhead: legacy {legacy_time * 1000:.1f} ms, BuildScheduler {new_time * 1000:.1f} ms')
+
+    fifo = {r: 0 for r in recipe_deps}
+    for label, prios in (('fifo', fifo), ('legacy', legacy), ('critical path', new)):
+        print(f'simulated makespan with {args.jobs} jobs ({label}): {makespan(recipe_deps, costs, prios, args.jobs)}')
+
+
+if __name__ == '__main__':
+    main()